@@ -37,6 +37,10 @@ setup(
     ],
     extras_require={
         'scimma': ['tom-scimma>=1.1.0'],
+        'export': ['pyarrow'],
+        'speedups': ['orjson', 'brotli'],
+        'push': ['channels'],
+        'cache': ['msgpack', 'backports.zstd; python_version < "3.14"'],
         'test': ['tom-scimma', 'factory_boy']
     },
     include_package_data=True,
@@ -1,18 +1,53 @@
 from abc import abstractmethod
+from datetime import datetime, time, timezone
 from importlib import import_module
+import json
+import logging
 
 from dash.dependencies import Input
 from dash.exceptions import PreventUpdate
 from django.conf import settings
+from django.utils.dateparse import parse_date, parse_datetime
 
 from tom_alerts.alerts import GenericBroker
+from tom_alerts_dash.columns import AlertRows, compile_columns
+from tom_alerts_dash.generations import check_superseded
+from tom_alerts_dash.resilience import Freshness, get_broker_guard, response_freshness
+from tom_alerts_dash.singleflight import single_flight
 
+logger = logging.getLogger(__name__)
 
 DEFAULT_ALERT_CLASSES = [
     'tom_alerts_dash.brokers.mars.MARSDashBroker',
     'tom_alerts_dash.brokers.alerce.ALeRCEDashBroker',
 ]
 
+CONE_SEARCH_ERROR = 'All of RA, Dec, and Radius are required for a cone search.'
+
+
+def later_bound(bound, since):
+    """
+    Gets the later of the lower time bound of a saved query and a time, for use as the lower time bound of an
+    incremental query. Naive times are taken to be UTC.
+
+    :param bound: Lower time bound of a saved query, as a datetime or an ISO 8601 date or datetime string, if any
+    :type bound: datetime or str
+
+    :param since: Time after which alerts are requested
+    :type since: datetime
+
+    :returns: the later of the two, in UTC
+    :rtype: datetime
+    """
+    if isinstance(bound, str):
+        date = parse_date(bound) if len(bound) == 10 else None
+        bound = datetime.combine(date, time()) if date else parse_datetime(bound)
+    candidates = [since] + ([bound] if bound else [])
+    return max(
+        candidate.astimezone(timezone.utc) if candidate.tzinfo else candidate.replace(tzinfo=timezone.utc)
+        for candidate in candidates
+    )
+
 
 def get_service_classes():
     """
@@ -62,6 +97,31 @@ class GenericDashBroker(GenericBroker):
     and SCIMMA Dash broker modules for implementation examples.
     """
     name = 'Generic Broker'
+    # Set to True by the browse app when the cone search completeness check is performed by a clientside callback
+    clientside_validation = False
+    # Set to True by brokers whose queries can take longer than a web request should, so that they run in the
+    # background and the browse page polls for their results
+    long_callback = False
+    # Columns of the broker's DataTable, as DashColumn objects, from which get_dash_columns() and flatten_dash_alerts()
+    # are derived, unless the broker overrides them
+    dash_columns = []
+    # QueryPlanner that splits the broker's query parameters into those sent to the broker and residual predicates that
+    # are evaluated on the alerts it returns, and that answers narrowing queries from the results of broader ones
+    dash_planner = None
+    # FilterValidator that validates the values of the broker's filters with the fields of its query form, without
+    # constructing the form on each input event
+    dash_validator = None
+    # Set to True by brokers that implement get_dash_parameters(), which builds the parameters of a saved query from the
+    # values of the broker's filters
+    supports_dash_parameters = False
+    # Set to True by brokers that implement fetch_dash_pages(), whose saved queries can be scheduled and exported
+    supports_paging = False
+    # Set to True by brokers that implement fetch_dash_light_curve(), for the light curve preview of the browse page
+    supports_light_curves = False
+    # Set to True by brokers that implement fetch_dash_stamps(), for the stamps displayed below the alerts
+    supports_stamps = False
+    # Set to True by brokers that implement get_dash_sky_coordinates(), for the sky map of the browse page
+    supports_sky_map = False
 
     def callback(self, page_current, page_size):
         """
@@ -84,6 +144,26 @@ class GenericDashBroker(GenericBroker):
         """
         raise PreventUpdate
 
+    def get_dash_parameters(self, page_current, page_size):
+        """
+        Builds the broker query parameters for the values of the inputs returned by ``get_callback_inputs()``, in the
+        format of the parameters of a saved ``BrokerQuery``. This is used to export all of the alerts that match the
+        current filters, and must be implemented, along with setting ``supports_dash_parameters``, for a broker's
+        alerts to be exported from the browse page.
+
+        :param page_current: The page number for the paginated alerts to display
+        :type page_current: int
+
+        :param page_size: The page size used for the pagination
+        :type page_size: int
+
+        All other args need to be specified in the concrete implementation.
+
+        :returns: query parameters for the current page
+        :rtype: dict
+        """
+        return {}
+
     def get_callback_inputs(self):
         """
         Method that provides broker-specific inputs intended to trigger this broker's callback function. Input names
@@ -100,6 +180,206 @@ class GenericDashBroker(GenericBroker):
             Input(f'alerts-table-{self.name}', 'page_size')
         ]
 
+    def get_cone_search_inputs(self):
+        """
+        Method that provides the inputs for the RA, Dec, and radius of this broker's cone search, in that order. If
+        provided, the browse app checks in the browser that either all or none of them are submitted, and displays
+        ``CONE_SEARCH_ERROR`` otherwise, without a request to the server. ``clientside_validation`` is then set to
+        ``True`` so that ``validate_filters()`` can skip the same check.
+
+        Default implementation provides no inputs, in which case no clientside check is performed.
+
+        :returns: list of inputs for the RA, Dec, and radius of a cone search, or an empty list
+        :rtype: list
+        """
+        return []
+
+    def request_dash_alerts(self, parameters, allow_stale=True):
+        """
+        Requests alerts from the broker for a Dash query by calling this broker's ``_request_alerts()`` with the given
+        parameters. Concurrent requests with the same parameters, whether from other threads or other processes, share
+        a single request to the broker, and all of them receive its response.
+
+        Requests are subject to this broker's rate limit and circuit breaker, as configured by
+        ``TOM_ALERT_DASH_BROKER_LIMITS``. If the broker is unavailable or slower than its latency budget, the last
+        successful response for the same parameters is returned instead, and ``response_freshness`` is set to mark it as
+        stale.
+
+        No request is made if the query has been superseded by a newer query for the same broker table.
+
+        If the broker has a ``dash_planner``, the parameters of residual constraints are removed from the request and
+        evaluated on the alerts that the broker returns. Requests that allow stale responses are for a page of a
+        DataTable, which is filled with the alerts that match from as many of the broker's pages as it takes, from the
+        first, so that it holds a full page of matching alerts. Other requests are for each page of a saved query in
+        turn, whose matching alerts are returned as they are. A query that narrows a recent query, whose response held
+        all of its results, is answered from that response without a request to the broker, if stale responses are
+        allowed, and ``response_freshness`` is set to mark it as narrowed, along with the time at which that response
+        was fetched.
+
+        :param parameters: Query parameters, as accepted by ``_request_alerts()``
+        :type parameters: dict
+
+        :param allow_stale: Whether a stale response may be returned, and the response kept to be returned stale later.
+                            Requests made in the background, such as for scheduled queries and exports, are not
+                            displayed to a user who is waiting on them, so they do not need stale responses.
+        :type allow_stale: bool
+
+        :returns: the response returned by ``_request_alerts()``
+
+        :raises: BrokerUnavailable if the broker cannot be queried and there is no previous response to return
+
+        :raises: Superseded if the query has been superseded
+        """
+        check_superseded()
+        plan = self.dash_planner.plan(parameters) if self.dash_planner else None
+        if plan is None:
+            response, freshness = self._request_dash_response(parameters, allow_stale)
+            response_freshness.set(freshness)
+            return response
+        answer = self.dash_planner.answer(self.name, plan) if allow_stale else None
+        if answer is not None:
+            response, fetched_at = answer
+            response_freshness.set(Freshness(fetched_at, narrowed=True))
+            return response
+        if plan.residual and allow_stale:
+            return self._request_dash_page(parameters, plan)
+        response, freshness = self._request_dash_response(plan.parameters, allow_stale)
+        response_freshness.set(freshness)
+        if not freshness.stale:
+            self.dash_planner.keep(self.name, plan, response, freshness.fetched_at)
+        return self.dash_planner.filter_response(response, plan.residual)
+
+    def _request_dash_response(self, parameters, allow_stale):
+        key = single_flight.make_key(self.name, json.dumps(parameters, sort_keys=True, default=str))
+        guard = get_broker_guard(self.name)
+
+        def request():
+            return guard.call(key, lambda: self._request_alerts(parameters), allow_stale=allow_stale)
+
+        # Requests that do not allow stale responses are not coalesced with those that do, which may receive one
+        return single_flight.do(key if allow_stale else f'{key}:fresh', request, namespace=self.name)
+
+    def _request_dash_page(self, parameters, plan):
+        """
+        Fills a page of a DataTable with the alerts that match the residual predicates of a query, by requesting the
+        broker's pages from the first, until they hold the alerts of the requested page, or the broker has no more
+        pages. The size of a page is that of the broker's first page, unless it is also its last. At most
+        ``TOM_ALERT_DASH_RESIDUAL_MAX_PAGES`` pages of the broker are requested, after which the page holds the alerts
+        that have been found.
+
+        :returns: the broker's last response, with the matching alerts of the requested page
+        :rtype: dict
+        """
+        planner = self.dash_planner
+        matches, page_size, freshnesses = [], None, []
+        for page in range(1, planner.max_refill_pages + 1):
+            check_superseded()
+            page_plan = planner.plan({**parameters, 'page': page})
+            response, freshness = self._request_dash_response(page_plan.parameters, True)
+            freshnesses.append(freshness)
+            if not freshness.stale:
+                planner.keep(self.name, page_plan, response, freshness.fetched_at)
+            matches += planner.filter(response[planner.results_key], plan.residual)
+            if planner.is_complete(page_plan.parameters, response):
+                break
+            page_size = page_size or len(response[planner.results_key])
+            if len(matches) >= plan.page * page_size:
+                break
+        else:
+            logger.warning(f'Stopped filling page {plan.page} of a {self.name} query after {page} pages of results')
+        page_size = page_size or len(matches)
+        start = (plan.page - 1) * page_size
+        response_freshness.set(Freshness(min(freshness.fetched_at for freshness in freshnesses),
+                                         stale=any(freshness.stale for freshness in freshnesses)))
+        return {**response, planner.results_key: matches[start:start + page_size]}
+
+    def fetch_dash_pages(self, parameters, max_pages=None):
+        """
+        Generator that requests the alerts for the parameters of a saved ``BrokerQuery`` one page at a time, using
+        ``request_dash_alerts()`` without allowing stale responses. This is used to run saved queries in the background
+        and to export alerts, and must be implemented, along with setting ``supports_paging``, for a broker's saved
+        queries to be scheduled or exported.
+
+        :param parameters: Parameters of a saved query, as stored by the broker's query form
+        :type parameters: dict
+
+        :param max_pages: Maximum number of pages to request, or None to request all pages
+        :type max_pages: int
+
+        :returns: generator of lists of alerts as returned by the broker, one list per page, which can be passed to
+                  ``flatten_dash_alerts()``
+        :rtype: generator
+        """
+        yield from []
+
+    def fetch_dash_block(self, parameters, block_size):
+        """
+        Requests the first ``block_size`` alerts for the parameters of a saved ``BrokerQuery``, using
+        ``fetch_dash_pages()``, and flattens them. This is used by the block fetch mode of the browse app, which sorts,
+        filters, and pages through the block without querying the broker again.
+
+        :param parameters: Parameters of a saved query, as stored by the broker's query form
+        :type parameters: dict
+
+        :param block_size: Maximum number of alerts to request
+        :type block_size: int
+
+        :returns: flattened alerts, as returned by ``flatten_dash_rows()``
+        :rtype: AlertRows
+        """
+        alerts = AlertRows([], [])
+        for page in self.fetch_dash_pages(parameters):
+            alerts.extend(self.flatten_dash_rows(page[:block_size - len(alerts)]))
+            if len(alerts) >= block_size:
+                break
+        return alerts
+
+    def get_incremental_parameters(self, parameters, since):
+        """
+        Rewrites the parameters of a saved query so that only the alerts that are newer than ``since`` are requested,
+        by raising the lower time bound of the query to ``since``. This is used by incremental runs of scheduled
+        queries, and must be implemented for a broker's scheduled queries to run incrementally.
+
+        Default implementation does not support incremental queries.
+
+        :param parameters: Parameters of a saved query, as stored by the broker's query form
+        :type parameters: dict
+
+        :param since: Time after which alerts are requested
+        :type since: datetime
+
+        :returns: a copy of the parameters with the rewritten lower time bound, or None if not supported
+        :rtype: dict
+        """
+        return None
+
+    def get_dash_alert_id(self, alert):
+        """
+        Gets the identifier of an alert returned by the broker, which is used to replace the stored copy of an alert
+        that is fetched again by an incremental run of a scheduled query.
+
+        :param alert: Alert, as returned by the broker
+        :type alert: dict
+
+        :returns: identifier of the alert, or None if it has no identifier
+        """
+        return alert.get('id')
+
+    def get_dash_alert_time(self, alert):
+        """
+        Gets the time of an alert returned by the broker, as compared against the lower time bound set by
+        ``get_incremental_parameters()``. The newest of the times of the alerts fetched by an incremental run of a
+        scheduled query sets the bound of its next run, and must be implemented along with
+        ``get_incremental_parameters()``.
+
+        :param alert: Alert, as returned by the broker
+        :type alert: dict
+
+        :returns: time of the alert, or None if it has no time
+        :rtype: datetime
+        """
+        return None
+
     @abstractmethod
     def get_dash_filters(self):
         """
@@ -112,16 +392,96 @@ class GenericDashBroker(GenericBroker):
         """
         pass
 
-    @abstractmethod
     def get_dash_columns(self):
         """
         Provides the columns that will be displayed in the broker-specific Dash DataTable. Columns must follow the
         format specified in the Dash DataTable documentation: https://dash.plotly.com/datatable/reference
 
+        Default implementation provides the columns declared in ``dash_columns``.
+
         :returns: columns for display in DataTable
         :rtype: list of dicts
         """
-        pass
+        return [column.metadata for column in self.dash_columns]
+
+    def get_dash_summary_fields(self):
+        """
+        Provides the fields of the alerts that are summarized by histograms in the summary panel of the browse page,
+        which is displayed in block fetch mode. Each field is a dict with an ``id``, a ``name``, a ``type`` of either
+        ``numeric`` or ``datetime``, and a ``value`` function that gets the value of the field from an alert as returned
+        by the broker, as a float, or as a number of seconds since the Unix epoch for ``datetime`` fields. The function
+        may return None for an alert without a value.
+
+        Default implementation provides no fields, in which case no summary panel is displayed.
+
+        :returns: summary fields
+        :rtype: list of dicts
+        """
+        return []
+
+    def get_dash_summary_densities(self):
+        """
+        Provides the pairs of ids of summary fields, as returned by ``get_dash_summary_fields()``, whose joint
+        distributions are displayed as 2D density plots in the summary panel.
+
+        :returns: pairs of field ids, as (x, y) tuples
+        :rtype: list of tuples
+        """
+        return []
+
+    def get_dash_object_id(self, alert):
+        """
+        Gets the identifier of the object of an alert returned by the broker, which is used to cache its light curve,
+        and to find the target in the TOM with that name or alias. Defaults to the identifier of the alert, for brokers
+        that do not group alerts by object.
+
+        :param alert: Alert, as returned by the broker
+        :type alert: dict
+
+        :returns: identifier of the object
+        """
+        return self.get_dash_alert_id(alert)
+
+    def fetch_dash_light_curve(self, alert):
+        """
+        Requests the light curve of the object of an alert, for the preview displayed when an alert is selected on the
+        browse page. The preview is only displayed for brokers that set ``supports_light_curves``.
+
+        :param alert: Alert, as returned by the broker
+        :type alert: dict
+
+        :returns: detections and non-detections of the object, as dicts with the ``time`` of the observation as a
+                  Unix timestamp, its ``band``, and either its ``magnitude`` and ``error``, or its upper ``limit``
+        :rtype: list of dicts
+        """
+        return []
+
+    def fetch_dash_stamps(self, alert):
+        """
+        Requests the image stamps of the object of an alert, such as its science, reference, and difference images, for
+        the stamps displayed below the alerts on the browse page. The stamps are only displayed for brokers that set
+        ``supports_stamps``.
+
+        :param alert: Alert, as returned by the broker
+        :type alert: dict
+
+        :returns: PNG images, keyed by the name of the stamp
+        :rtype: dict
+        """
+        return {}
+
+    def get_dash_sky_coordinates(self, alert):
+        """
+        Gets the position of an alert, as returned by the broker, for the sky map of the browse page, which is
+        displayed in block fetch mode. The sky map is only displayed for brokers that set ``supports_sky_map``.
+
+        :param alert: Alert, as returned by the broker
+        :type alert: dict
+
+        :returns: right ascension and declination of the alert, in degrees, or None if it has no position
+        :rtype: tuple
+        """
+        return None
 
     def flatten_dash_alerts(self, alerts):
         """
@@ -131,13 +491,38 @@ class GenericDashBroker(GenericBroker):
         Each flattened alert should also include a key/value pair of {'alert': original_alert}, to be used when
         creating a target from the alert.
 
+        Default implementation flattens the alerts with the columns declared in ``dash_columns``, which are compiled
+        once per broker class, or returns the alerts unchanged if the broker declares no columns.
+
         :param alerts: list of alerts from a broker query
         :type alerts: list
 
         :returns: list of single-level depth dicts
         :rtype: list of dicts
         """
-        return alerts
+        if not self.dash_columns:
+            return alerts
+        return compile_columns(type(self))(alerts).to_dicts()
+
+    def flatten_dash_rows(self, alerts):
+        """
+        Flattens a list of alerts returned by a broker query into ``AlertRows``, which hold the flattened alerts as
+        columns until they are turned into dicts for display. This is used to hold many flattened alerts at once, such
+        as the blocks of block fetch mode and the results of scheduled queries.
+
+        Default implementation flattens the alerts with the columns declared in ``dash_columns``, whose values are only
+        formatted when the rows are turned into dicts, or with ``flatten_dash_alerts()`` if the broker declares no
+        columns.
+
+        :param alerts: list of alerts from a broker query
+        :type alerts: list
+
+        :returns: flattened alerts
+        :rtype: AlertRows
+        """
+        if not self.dash_columns:
+            return AlertRows.from_dicts(self.flatten_dash_alerts(alerts))
+        return compile_columns(type(self))(alerts)
 
     def validate_filters(self, page_current, page_size, errors_state):
         """
@@ -1,5 +1,16 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 
 
 class TomAlertsDashConfig(AppConfig):
     name = 'tom_alerts_dash'
+
+    def ready(self):
+        # Keeps the index of the TOM's targets, used to mark the alerts that are already targets, up to date
+        from tom_targets.models import Target, TargetName
+        from tom_alerts_dash.target_index import (handle_alias_deleted, handle_alias_saved, handle_target_deleted,
+                                                  handle_target_saved)
+        post_save.connect(handle_target_saved, sender=Target, dispatch_uid='tom_alerts_dash_target_saved')
+        post_delete.connect(handle_target_deleted, sender=Target, dispatch_uid='tom_alerts_dash_target_deleted')
+        post_save.connect(handle_alias_saved, sender=TargetName, dispatch_uid='tom_alerts_dash_alias_saved')
+        post_delete.connect(handle_alias_deleted, sender=TargetName, dispatch_uid='tom_alerts_dash_alias_deleted')
@@ -0,0 +1,444 @@
+from collections import OrderedDict
+from contextvars import ContextVar
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+import numpy as np
+
+from tom_alerts_dash.columns import AlertRows
+from tom_alerts_dash.export import export_value, PAGING_PARAMETERS, supports_export
+from tom_alerts_dash.serializers import get_serializer
+
+logger = logging.getLogger(__name__)
+
+# Number of pages of the current filter and sort of a block, as displayed by the DataTable, or None if not known
+response_page_count = ContextVar('response_page_count', default=None)
+
+# A part of a DataTable filter query, as in "{oid} contains ZTF21" or "{probability} >= 0.5"
+FILTER_PART = re.compile(r'^\s*\{(?P<column>[^}]+)\}\s*'
+                         r'(?P<operator>>=|<=|!=|=|<|>|eq|ne|lt|le|gt|ge|contains|datestartswith)\s+(?P<value>.*?)\s*$')
+
+FILTER_OPERATORS = {'eq': '=', 'ne': '!=', 'lt': '<', 'le': '<=', 'gt': '>', 'ge': '>='}
+
+
+def get_block_size():
+    """
+    Gets the number of alerts fetched from a broker at once in block fetch mode, as specified by
+    ``TOM_ALERT_DASH_BLOCK_SIZE`` in ``settings.py``. Defaults to None, which disables block fetch mode.
+
+    :rtype: int
+    """
+    return getattr(settings, 'TOM_ALERT_DASH_BLOCK_SIZE', None)
+
+
+def get_block_dir():
+    """
+    Gets the directory that large blocks are written to, as specified by ``TOM_ALERT_DASH_BLOCK_DIR`` in
+    ``settings.py``. Defaults to a directory in the system's temporary directory.
+
+    :rtype: str
+    """
+    return getattr(settings, 'TOM_ALERT_DASH_BLOCK_DIR', os.path.join(tempfile.gettempdir(), 'tom_alerts_dash_blocks'))
+
+
+def supports_block_fetch(broker):
+    """
+    Whether the alerts of a Dash broker can be fetched in blocks, which requires block fetch mode to be enabled, and the
+    broker to set both ``supports_paging`` and ``supports_dash_parameters``.
+
+    :param broker: The broker
+    :type broker: GenericDashBroker
+
+    :rtype: bool
+    """
+    return bool(get_block_size()) and supports_export(broker) and broker.supports_dash_parameters
+
+
+def get_block_parameters(broker, filters):
+    """
+    Builds the query parameters of the block of alerts for a broker's filters, which are those of its first page
+    without the parameters that select a page.
+
+    :param broker: The broker
+    :type broker: GenericDashBroker
+
+    :param filters: Values of the broker's callback inputs, other than the page number and page size
+    :type filters: list
+
+    :returns: query parameters of the block
+    :rtype: dict
+    """
+    parameters = broker.get_dash_parameters(0, 20, *filters)
+    return {key: value for key, value in parameters.items() if key not in PAGING_PARAMETERS}
+
+
+def parse_filter_query(filter_query):
+    """
+    Parses a DataTable filter query, as written by the DataTable's filter row, into (column, operator, value) tuples.
+    Quoted values are unquoted, and parts that cannot be parsed are ignored.
+
+    :param filter_query: The ``filter_query`` of the DataTable
+    :type filter_query: str
+
+    :returns: list of (column, operator, value) tuples, with operators normalized to their symbols
+    :rtype: list of tuples
+    """
+    filters = []
+    for part in (filter_query or '').split(' && '):
+        match = FILTER_PART.match(part)
+        if not match:
+            continue
+        value = match.group('value')
+        if len(value) > 1 and value[0] == value[-1] and value[0] in '"\'`':
+            value = value[1:-1].replace('\\' + value[0], value[0])
+        operator = match.group('operator')
+        filters.append((match.group('column'), FILTER_OPERATORS.get(operator, operator), value))
+    return filters
+
+
+class ColumnarBuffer:
+    """
+    Block of flattened alerts held in flat NumPy arrays, so that a page of the block can be sorted and filtered by any
+    combination of columns without querying the broker again. Each alert is stored as JSON, encoded by the cache
+    serializer so that it is compressed with the dictionary of its namespace, in a single byte array, located by an
+    array of offsets, and each column is also stored as an array of its displayed text and, if all of its
+    values are numbers, an array of floats, which are the keys that it is sorted and filtered by. The ranks of a
+    column are computed the first time that it is sorted, and the result of the latest sort and filter is kept, so that
+    paging through it only slices an index array and decodes the alerts of the page.
+
+    As none of the arrays hold Python objects, a large block can be spilled to disk with ``spill()``, after which its
+    arrays are memory-mapped, and only the pages of them that are read are loaded into memory.
+
+    :param columns: Columns, as returned by ``get_dash_columns()``
+    :type columns: list of dicts
+
+    :param alerts: Flattened alerts, as returned by ``flatten_dash_rows()`` or ``flatten_dash_alerts()``
+    :type alerts: AlertRows or list of dicts
+
+    :param freshness: Freshness of the broker responses that the alerts came from
+    :type freshness: tom_alerts_dash.resilience.Freshness
+
+    :param summary_fields: Fields to store for the summary panel, as returned by ``get_dash_summary_fields()``
+    :type summary_fields: list of dicts
+
+    :param sky_coordinates: Function that gets the position of an alert for the sky map, such as
+                            ``get_dash_sky_coordinates()``
+    :type sky_coordinates: callable
+
+    :param namespace: Namespace of the alerts for their compression, such as the name of the broker
+    :type namespace: str
+    """
+    def __init__(self, columns, alerts, freshness=None, summary_fields=None, sky_coordinates=None, namespace=None):
+        if not isinstance(alerts, AlertRows):
+            alerts = AlertRows.from_dicts(alerts)
+        self.columns = [column['id'] for column in columns]
+        self.size = len(alerts)
+        self.freshness = freshness
+        self.path = None
+
+        serializer = get_serializer()
+        encoded = [serializer.dumps(json.dumps(alert, cls=DjangoJSONEncoder).encode('utf-8'), namespace)
+                   for alert in alerts.iter_dicts()]
+        self.arrays = {
+            'data': np.frombuffer(b''.join(encoded), dtype=np.uint8),
+            'offsets': np.cumsum([0] + [len(alert) for alert in encoded], dtype=np.int64),
+        }
+        for column in self.columns:
+            text = np.array([export_value(value) for value in alerts.column(column)], dtype=str)
+            self.arrays[f'text-{column}'] = text
+            try:
+                self.arrays[f'numbers-{column}'] = np.where(text == '', 'nan', text).astype(float)
+            except ValueError:
+                pass  # Columns with values that are not numbers are sorted and filtered as text
+        original_alerts = alerts.alerts
+        for field in summary_fields or []:
+            self.arrays[f'summary-{field["id"]}'] = np.array(
+                [self._summary_value(field, alert) for alert in original_alerts], dtype=float
+            )
+        if sky_coordinates:
+            coordinates = np.array([self._sky_coordinates(sky_coordinates, alert) for alert in original_alerts],
+                                   dtype=float).reshape(-1, 2)
+            self.arrays['ra'], self.arrays['dec'] = coordinates[:, 0].copy(), coordinates[:, 1].copy()
+
+        self._ranks = {}
+        self._selection = (None, None)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _summary_value(field, alert):
+        try:
+            value = field['value'](alert)
+        except (KeyError, TypeError, ValueError):
+            value = None
+        return float('nan') if value is None else value
+
+    @staticmethod
+    def _sky_coordinates(sky_coordinates, alert):
+        try:
+            coordinates = sky_coordinates(alert)
+        except (KeyError, TypeError, ValueError):
+            coordinates = None
+        return (float('nan'), float('nan')) if coordinates is None else coordinates
+
+    @property
+    def nbytes(self):
+        """
+        :returns: the number of bytes taken by the arrays of the block, whether in memory or on disk
+        :rtype: int
+        """
+        return sum(array.nbytes for array in self.arrays.values())
+
+    def spill(self, directory):
+        """
+        Writes the arrays of the block to a new directory within ``directory``, and replaces them with read-only
+        memory maps of the written files.
+
+        :param directory: The directory in which to create the block's directory
+        :type directory: str
+        """
+        os.makedirs(directory, exist_ok=True)
+        path = tempfile.mkdtemp(prefix='block-', dir=directory)
+        arrays = {}
+        for name, array in self.arrays.items():
+            filename = os.path.join(path, f'{len(arrays)}.npy')
+            np.save(filename, array)
+            arrays[name] = np.load(filename, mmap_mode='r')
+        self.arrays = arrays
+        self.path = path
+
+    def close(self):
+        """
+        Deletes the files of a spilled block. Its memory maps remain readable until the block is no longer referenced.
+        """
+        if self.path:
+            shutil.rmtree(self.path, ignore_errors=True)
+
+    def text(self, column):
+        """
+        :returns: the values of a column as displayed text, with markdown links replaced by their text
+        :rtype: numpy.ndarray of str
+        """
+        return self.arrays[f'text-{column}']
+
+    def numbers(self, column):
+        """
+        :returns: the values of a column as floats, with NaN for empty values, or None if any value is not a number
+        :rtype: numpy.ndarray of float
+        """
+        return self.arrays.get(f'numbers-{column}')
+
+    def summary_values(self, field):
+        """
+        :returns: the values of a summary field, with NaN for alerts without a value
+        :rtype: numpy.ndarray of float
+        """
+        return self.arrays[f'summary-{field}']
+
+    def sky_coordinates(self):
+        """
+        :returns: the right ascensions and declinations of the alerts, in degrees, with NaN for alerts without a
+                  position, or None if the block was not created with positions
+        :rtype: tuple of numpy.ndarray of float
+        """
+        if 'ra' not in self.arrays:
+            return None
+        return self.arrays['ra'], self.arrays['dec']
+
+    def ranks(self, column):
+        """
+        :returns: the rank of each value of a column in ascending order, numerically if all of its values are numbers
+        :rtype: numpy.ndarray of int
+        """
+        if column not in self._ranks:
+            numbers = self.numbers(column)
+            self._ranks[column] = np.unique(self.text(column) if numbers is None else numbers, return_inverse=True)[1]
+        return self._ranks[column]
+
+    def _filter_mask(self, column, operator, value):
+        text = self.text(column)
+        if operator == 'contains':
+            return np.char.find(text, value) >= 0
+        if operator == 'datestartswith':
+            return np.char.startswith(text, value)
+
+        numbers = self.numbers(column)
+        try:
+            keys, value = (numbers, float(value)) if numbers is not None else (text, value)
+        except ValueError:
+            keys = text
+        if operator == '=':
+            return keys == value
+        if operator == '!=':
+            return keys != value
+        if operator == '<':
+            return keys < value
+        if operator == '<=':
+            return keys <= value
+        if operator == '>':
+            return keys > value
+        return keys >= value
+
+    def match(self, filter_query=''):
+        """
+        Gets the positions of the alerts that match a DataTable filter query, in the order of the block. Filters on
+        columns that are not in the block are ignored.
+
+        :param filter_query: The ``filter_query`` of the DataTable
+        :type filter_query: str
+
+        :returns: positions of the matching alerts
+        :rtype: numpy.ndarray of int
+        """
+        mask = np.ones(self.size, dtype=bool)
+        for column, operator, value in parse_filter_query(filter_query):
+            if column in self.columns:
+                mask &= self._filter_mask(column, operator, value)
+        return np.flatnonzero(mask)
+
+    def select(self, sort_by=None, filter_query=''):
+        """
+        Gets the positions of the alerts that match a DataTable filter query, in the order given by a DataTable sort.
+        Filters and sorts on columns that are not in the block are ignored.
+
+        :param sort_by: The ``sort_by`` of the DataTable, as a list of {'column_id': ..., 'direction': ...} dicts
+        :type sort_by: list of dicts
+
+        :param filter_query: The ``filter_query`` of the DataTable
+        :type filter_query: str
+
+        :returns: positions of the matching alerts, in order
+        :rtype: numpy.ndarray of int
+        """
+        sort_by = [sort for sort in sort_by or [] if sort.get('column_id') in self.columns]
+        key = json.dumps([sort_by, filter_query], sort_keys=True)
+        with self._lock:
+            if self._selection[0] == key:
+                return self._selection[1]
+
+            positions = self.match(filter_query)
+
+            if sort_by:
+                # lexsort sorts by the last key first, and descending columns are sorted by their negated ranks
+                keys = [self.ranks(sort['column_id'])[positions] * (-1 if sort.get('direction') == 'desc' else 1)
+                        for sort in reversed(sort_by)]
+                positions = positions[np.lexsort(keys)]
+
+            self._selection = (key, positions)
+            return positions
+
+    def rows(self, positions):
+        """
+        Decodes the flattened alerts at the given positions. Dates are decoded as ISO 8601 strings, as they are sent to
+        the DataTable.
+
+        :returns: the flattened alerts at the given positions
+        :rtype: list of dicts
+        """
+        data, offsets, serializer = self.arrays['data'], self.arrays['offsets'], get_serializer()
+        return [
+            json.loads(serializer.loads(data[offsets[position]:offsets[position + 1]].tobytes()))
+            for position in positions
+        ]
+
+    def page(self, page_current, page_size, sort_by=None, filter_query=''):
+        """
+        Gets a page of the alerts that match a DataTable filter query, in the order given by a DataTable sort. A page
+        past the last page is returned as the last page.
+
+        :returns: the flattened alerts of the page, and the number of pages
+        :rtype: tuple
+        """
+        positions = self.select(sort_by, filter_query)
+        page_count = max(1, -(-len(positions) // page_size))
+        start = min(page_current or 0, page_count - 1) * page_size
+        return self.rows(positions[start:start + page_size]), page_count
+
+
+class BlockStore:
+    """
+    Least recently used store of the blocks of alerts fetched in block fetch mode, keyed by broker and query
+    parameters, and kept for ``TOM_ALERT_DASH_BLOCK_TTL`` seconds. Blocks are held by each process, up to a total of
+    ``TOM_ALERT_DASH_BLOCK_BUDGET`` bytes, above which the least recently used blocks are evicted. Blocks larger than
+    ``TOM_ALERT_DASH_BLOCK_SPILL_THRESHOLD`` bytes are spilled to ``get_block_dir()`` and memory-mapped, so that they
+    do not take up the memory of the process.
+    """
+    def __init__(self):
+        self._blocks = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def budget(self):
+        return getattr(settings, 'TOM_ALERT_DASH_BLOCK_BUDGET', 512 * 1024 * 1024)
+
+    @property
+    def spill_threshold(self):
+        return getattr(settings, 'TOM_ALERT_DASH_BLOCK_SPILL_THRESHOLD', 16 * 1024 * 1024)
+
+    @property
+    def nbytes(self):
+        """
+        :returns: the number of bytes taken by the stored blocks
+        :rtype: int
+        """
+        with self._lock:
+            return sum(buffer.nbytes for expires, buffer in self._blocks.values())
+
+    @staticmethod
+    def make_key(broker, parameters):
+        return f'{broker}:{json.dumps(parameters, sort_keys=True, default=str)}'
+
+    def get(self, key):
+        """
+        :returns: the block stored for the key, or None if there is none or it has expired
+        :rtype: ColumnarBuffer
+        """
+        with self._lock:
+            if key not in self._blocks:
+                return None
+            expires, buffer = self._blocks[key]
+            if expires < time.monotonic():
+                self._evict(key)
+                return None
+            self._blocks.move_to_end(key)
+            return buffer
+
+    def put(self, key, buffer):
+        """
+        Stores a block, spilling it to disk if it is larger than the spill threshold, and evicts the least recently used
+        blocks until the stored blocks fit in the budget. A block larger than the budget is kept until another block
+        is stored.
+        """
+        if buffer.nbytes > self.spill_threshold and buffer.path is None:
+            try:
+                buffer.spill(get_block_dir())
+            except OSError as e:
+                logger.error(f'Unable to spill block of {buffer.size} alerts to {get_block_dir()} due to error: {e}')
+
+        with self._lock:
+            if key in self._blocks:
+                self._evict(key)
+            self._blocks[key] = (time.monotonic() + getattr(settings, 'TOM_ALERT_DASH_BLOCK_TTL', 600), buffer)
+            total = sum(stored.nbytes for expires, stored in self._blocks.values())
+            while total > self.budget and len(self._blocks) > 1:
+                total -= self._evict(next(iter(self._blocks)))
+
+    def _evict(self, key):
+        expires, buffer = self._blocks.pop(key)
+        buffer.close()
+        return buffer.nbytes
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._blocks.keys()):
+                self._evict(key)
+
+
+block_store = BlockStore()
@@ -1,22 +1,61 @@
+from datetime import datetime, timezone
 import logging
 
-from astropy.time import Time
 from dash.dependencies import Input
 from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
 import dash_core_components as dcc
 import dash_html_components as dhc
+import requests
 
 from tom_alerts_dash.alerts import GenericDashBroker
-from tom_alerts.brokers.alerce import ALeRCEBroker, ALeRCEQueryForm, ALERCE_URL
-from tom_common.templatetags.tom_common_extras import truncate_number
-from tom_targets.templatetags.targets_extras import deg_to_sexigesimal
+from tom_alerts_dash.columns import DashColumn, markdown_link, mjd_to_datetime, sexagesimal, truncate
+from tom_alerts_dash.planner import Constraint, QueryPlanner
+from tom_alerts_dash.stamps import get_stamp_timeout
+from tom_alerts_dash.validators import FilterValidator
+from tom_alerts.brokers.alerce import ALeRCEBroker, ALeRCEQueryForm, ALERCE_SEARCH_URL, ALERCE_URL, FILTERS
 
 logger = logging.getLogger(__name__)
 
+ALERCE_PAGE_SIZE = 20  # Page size of the ALeRCE queries made by tom_alerts.brokers.alerce.ALeRCEBroker
+UNIX_EPOCH_MJD = 40587  # MJD of 1970-01-01, used to convert times to MJD without importing astropy
+ALERCE_STAMP_URL = 'https://avro.alerce.online/get_stamp'
+ALERCE_STAMP_TYPES = {'Science': 'science', 'Reference': 'template', 'Difference': 'difference'}
+
 
 class ALeRCEDashBroker(ALeRCEBroker, GenericDashBroker):
     dash_button_clicks = 0
+    long_callback = True
+    supports_dash_parameters = True
+    supports_paging = True
+    supports_light_curves = True
+    supports_stamps = True
+    supports_sky_map = True
+    # Object IDs link to ALeRCE, positions are converted to sexagesimal, probabilities are truncated to 4 decimal
+    # places, and the first detection MJD is converted to a datetime
+    dash_columns = [
+        DashColumn('oid', 'Object ID', formatter=markdown_link(f'{ALERCE_URL}/object/{{oid}}'),
+                   presentation='markdown'),
+        DashColumn('meanra', 'Right Ascension', formatter=sexagesimal('hms')),
+        DashColumn('meandec', 'Declination', formatter=sexagesimal('dms')),
+        DashColumn('discovery_date', 'Discovery Date', source='firstmjd', formatter=mjd_to_datetime, type='datetime'),
+        DashColumn('classifier', 'Class'),
+        DashColumn('class', 'Classifier Type'),
+        DashColumn('probability', 'Classifier Probability', formatter=truncate),
+    ]
+    # ALeRCE filters objects by the MJDs of their first and last detections, and returns all results once a page is
+    # not full
+    dash_planner = QueryPlanner([
+        Constraint('firstmjd__gt', 'firstmjd', 'gt'),
+        Constraint('firstmjd__lt', 'firstmjd', 'lt'),
+        Constraint('lastmjd__gt', 'lastmjd', 'gt'),
+        Constraint('lastmjd__lt', 'lastmjd', 'lt'),
+    ], results_key='items', is_complete=lambda parameters, response: len(response['items']) < ALERCE_PAGE_SIZE)
+    # The classifier choices are requested from ALeRCE, unless they are cached, when the form is constructed
+    dash_validator = FilterValidator(ALeRCEQueryForm, choices={
+        'lc_classifier': ALeRCEQueryForm._get_light_curve_classifier_choices,
+        'stamp_classifier': ALeRCEQueryForm._get_stamp_classifier_choices,
+    })
 
     def callback(self, page_current, page_size, oid, stamp_classifier, p_stamp_classifier, lc_classifier,
                  p_lc_classifier, ra, dec, radius, button_click):
@@ -75,6 +114,19 @@ class ALeRCEDashBroker(ALeRCEBroker, GenericDashBroker):
         else:
             self.dash_button_clicks = button_click
 
+        parameters = self.get_dash_parameters(page_current, page_size, oid, stamp_classifier, p_stamp_classifier,
+                                              lc_classifier, p_lc_classifier, ra, dec, radius, button_click)
+        alerts = [alert for alert in self.request_dash_alerts(parameters)['items']]
+        return self.flatten_dash_alerts(alerts)
+
+    def get_dash_parameters(self, page_current, page_size, oid, stamp_classifier, p_stamp_classifier, lc_classifier,
+                            p_lc_classifier, ra, dec, radius, button_click):
+        """
+        Builds the ALeRCE query parameters for the DataTable inputs, as cleaned by the ALeRCE query form.
+
+        :returns: query parameters for the current page
+        :rtype: dict
+        """
         form = ALeRCEQueryForm({
             'query_name': 'ALeRCE Dash Query',
             'broker': self.name,
@@ -91,9 +143,52 @@ class ALeRCEDashBroker(ALeRCEBroker, GenericDashBroker):
         parameters = form.cleaned_data
         parameters['page'] = page_current + 1  # Dash pagination is 0-indexed, but Skip is 1-indexed
         parameters['records_per_pages'] = page_size if page_size else 20  # 20 is the Dash default page size
+        return parameters
 
-        alerts = [alert for alert in self._request_alerts(form.cleaned_data)['items']]
-        return self.flatten_dash_alerts(alerts)
+    def fetch_dash_pages(self, parameters, max_pages=None):
+        """
+        Requests the alerts for the parameters of a saved ALeRCE query one page at a time, until ALeRCE returns a page
+        that is not full. As ALeRCE queries are made with ``count=false``, the number of pages is not known in advance.
+
+        :param parameters: Parameters of a saved ALeRCE query
+        :type parameters: dict
+
+        :param max_pages: Maximum number of pages to request, or None to request all pages
+        :type max_pages: int
+
+        :returns: generator of lists of alerts from ALeRCE, one list per page
+        :rtype: generator
+        """
+        page = 1
+        while True:
+            alerts = self.request_dash_alerts({**parameters, 'page': page}, allow_stale=False)['items']
+            yield alerts
+            if len(alerts) < ALERCE_PAGE_SIZE or page == max_pages:
+                return
+            page += 1
+
+    def get_incremental_parameters(self, parameters, since):
+        """
+        Raises the ``lastmjd__gt`` bound of a saved ALeRCE query to the MJD of ``since``, so that only the objects with
+        a detection since then are requested.
+
+        :param parameters: Parameters of a saved ALeRCE query
+        :type parameters: dict
+
+        :param since: Time after which detections are requested
+        :type since: datetime
+
+        :returns: a copy of the parameters with the rewritten lower MJD bound
+        :rtype: dict
+        """
+        since_mjd = since.timestamp() / 86400 + UNIX_EPOCH_MJD
+        return {**parameters, 'lastmjd__gt': max(parameters.get('lastmjd__gt') or since_mjd, since_mjd)}
+
+    def get_dash_alert_id(self, alert):
+        return alert['oid']
+
+    def get_dash_alert_time(self, alert):
+        return datetime.fromtimestamp((alert['lastmjd'] - UNIX_EPOCH_MJD) * 86400, tz=timezone.utc)
 
     def get_callback_inputs(self):
         """
@@ -189,56 +284,80 @@ class ALeRCEDashBroker(ALeRCEBroker, GenericDashBroker):
         ])
         return filters
 
-    def get_dash_columns(self):
+    def get_dash_summary_fields(self):
         """
-        Returns ALeRCE-specific Dash DataTable columns.
+        Returns the classifier probability, and the first and last detection times, of ALeRCE objects for the summary
+        panel.
 
-        :returns: columns for display
+        :returns: summary fields
         :rtype: list of dicts
         """
         return [
-            {'id': 'oid', 'name': 'Object ID', 'type': 'text', 'presentation': 'markdown'},
-            {'id': 'meanra', 'name': 'Right Ascension', 'type': 'text'},
-            {'id': 'meandec', 'name': 'Declination', 'type': 'text'},
-            {'id': 'discovery_date', 'name': 'Discovery Date', 'type': 'datetime'},
-            {'id': 'classifier', 'name': 'Class', 'type': 'text'},
-            {'id': 'class', 'name': 'Classifier Type', 'type': 'text'},
-            {'id': 'probability', 'name': 'Classifier Probability', 'type': 'text'},
+            {'id': 'probability', 'name': 'Classifier Probability', 'type': 'numeric',
+             'value': lambda alert: alert['probability']},
+            {'id': 'firstmjd', 'name': 'Discovery Date', 'type': 'datetime',
+             'value': lambda alert: (alert['firstmjd'] - UNIX_EPOCH_MJD) * 86400},
+            {'id': 'lastmjd', 'name': 'Last Detection Date', 'type': 'datetime',
+             'value': lambda alert: (alert['lastmjd'] - UNIX_EPOCH_MJD) * 86400},
         ]
 
-    def flatten_dash_alerts(self, alerts):
-        """
-        Transforms alerts returned by ALeRCE into a Dash DataTable format. Adds an embedded link to the original alert.
-        Converts decimal degrees to sexagesimal. Truncates decimals to 4 places. Converts MJD value to datetime.
-        Includes light curve classifier if it exists, and stamp classifier otherwise. Displays classifier name instead
-        of classifier number.
+    def get_dash_summary_densities(self):
+        return [('firstmjd', 'probability')]
+
+    def get_dash_object_id(self, alert):
+        return alert['oid']
 
-        :param alerts: dict of alerts from ALeRCE
-        :type alerts: dict of dicts
+    def fetch_dash_light_curve(self, alert):
+        """
+        Requests the detections and non-detections of the object of an ALeRCE alert from the ALeRCE light curve API.
 
-        :returns: flattened alerts
+        :returns: detections and non-detections of the object
         :rtype: list of dicts
         """
-        flattened_alerts = []
-        for alert in alerts:
-            url = f'{ALERCE_URL}/object/{alert["oid"]}'
-            flattened_alerts.append({
-                'oid': f'[{alert["oid"]}]({url})',
-                'meanra': deg_to_sexigesimal(alert['meanra'], 'hms') if alert['meanra'] else None,
-                'meandec': deg_to_sexigesimal(alert['meandec'], 'dms') if alert['meandec'] else None,
-                'discovery_date': Time(alert['firstmjd'], format='mjd', scale='utc').to_datetime(),
-                'class': alert['class'],
-                'classifier': alert['classifier'],
-                'probability': truncate_number(alert['probability']),
-                'alert': alert
-            })
-        return flattened_alerts
+        response = self.fetch_lightcurve(alert['oid'])
+        light_curve = []
+        for detection in response.get('detections') or []:
+            light_curve.append({'time': (detection['mjd'] - UNIX_EPOCH_MJD) * 86400,
+                                'band': FILTERS.get(detection['fid'], str(detection['fid'])),
+                                'magnitude': detection['magpsf'], 'error': detection.get('sigmapsf')})
+        for non_detection in response.get('non_detections') or []:
+            light_curve.append({'time': (non_detection['mjd'] - UNIX_EPOCH_MJD) * 86400,
+                                'band': FILTERS.get(non_detection['fid'], str(non_detection['fid'])),
+                                'limit': non_detection['diffmaglim']})
+        return light_curve
+
+    def fetch_dash_stamps(self, alert):
+        """
+        Requests the science, reference, and difference stamps of the latest detection with stamps of the object of an
+        ALeRCE alert. Each request times out after ``TOM_ALERT_DASH_STAMP_TIMEOUT`` seconds.
+
+        :returns: PNG images, keyed by the name of the stamp
+        :rtype: dict
+        """
+        response = requests.get(f'{ALERCE_SEARCH_URL}/objects/{alert["oid"]}/detections', timeout=get_stamp_timeout())
+        response.raise_for_status()
+        detections = [detection for detection in response.json() if detection.get('has_stamp')]
+        if not detections:
+            return {}
+        candid = max(detections, key=lambda detection: detection['mjd'])['candid']
+        stamps = {}
+        for name, stamp_type in ALERCE_STAMP_TYPES.items():
+            response = requests.get(ALERCE_STAMP_URL,
+                                    params={'oid': alert['oid'], 'candid': candid, 'type': stamp_type, 'format': 'png'},
+                                    timeout=get_stamp_timeout())
+            response.raise_for_status()
+            stamps[name] = response.content
+        return stamps
+
+    def get_dash_sky_coordinates(self, alert):
+        return alert['meanra'], alert['meandec']
 
     def validate_filters(self, page_current, page_size, oid, stamp_classifier, p_stamp_classifier, lc_classifier,
                          p_lc_classifier, ra, dec, radius, button_click, errors_state):
         """
         Validates the input filters for ALeRCE. Returns an error if one, but not all, of RA, Dec, and radius are
-        submitted for cone search. Returns any errors generated by form validation.
+        submitted for cone search. Returns any errors that the ALeRCE query form would generate, as reported by
+        ``dash_validator`` without constructing the form.
 
         :param page_current: The page number for the paginated alerts to display
         :type page_current: int
@@ -284,7 +403,7 @@ class ALeRCEDashBroker(ALeRCEBroker, GenericDashBroker):
         if not button_click or button_click == self.dash_button_clicks:
             raise PreventUpdate
 
-        form = ALeRCEQueryForm({
+        errors += self.dash_validator.validate({
             'query_name': 'ALeRCE Dash Query',
             'broker': self.name,
             'oid': oid,
@@ -296,11 +415,6 @@ class ALeRCEDashBroker(ALeRCEBroker, GenericDashBroker):
             'dec': dec,
             'radius': radius
         })
-        form.is_valid()
-
-        for field, field_errors in form.errors.items():
-            for field_error in field_errors.get_json_data():
-                errors.append(f'{field}: {field_error["message"]}')
 
         for error in errors:
             errors_state.append(dbc.Alert(error, dismissable=True, is_open=True, duration=5000, color='warning'))
@@ -1,4 +1,4 @@
-from datetime import datetime
+from datetime import datetime, timezone
 import logging
 
 from dash.dependencies import Input
@@ -7,16 +7,41 @@ import dash_bootstrap_components as dbc
 import dash_html_components as dhc
 import dash_core_components as dcc
 
-from tom_alerts_dash.alerts import GenericDashBroker
-from tom_alerts.brokers.mars import MARSBroker, MARSQueryForm, MARS_URL
-from tom_common.templatetags.tom_common_extras import truncate_number
-from tom_targets.templatetags.targets_extras import deg_to_sexigesimal
+from tom_alerts_dash.alerts import CONE_SEARCH_ERROR, GenericDashBroker, later_bound
+from tom_alerts_dash.columns import DashColumn, markdown_link, sexagesimal, truncate
+from tom_alerts_dash.planner import Constraint, QueryPlanner
+from tom_alerts_dash.validators import FilterValidator
+from tom_alerts.brokers.mars import filters, MARSBroker, MARSQueryForm, MARS_URL
 
 logger = logging.getLogger(__name__)
 
+UNIX_EPOCH_JD = 2440587.5  # JD of 1970-01-01, used to convert detection times to timestamps
+
 
 class MARSDashBroker(MARSBroker, GenericDashBroker):
     dash_button_clicks = 0
+    supports_dash_parameters = True
+    supports_paging = True
+    supports_light_curves = True
+    supports_sky_map = True
+    # Object IDs link to MARS, positions are converted to sexagesimal, and numbers are truncated to 4 decimal places
+    dash_columns = [
+        DashColumn('objectId', 'Name', formatter=markdown_link(f'{MARS_URL}/{{lco_id}}/'), presentation='markdown'),
+        DashColumn('ra', 'Right Ascension', source='candidate.ra', formatter=sexagesimal('hms')),
+        DashColumn('dec', 'Declination', source='candidate.dec', formatter=sexagesimal('dms')),
+        DashColumn('magpsf', 'Magnitude', source='candidate.magpsf', formatter=truncate),
+        DashColumn('rb', 'Real-Bogus Score', source='candidate.rb', formatter=truncate),
+    ]
+    # MARS filters on all of the constraints of the candidate, and has no next page once it has returned all results
+    dash_planner = QueryPlanner([
+        Constraint('magpsf__gte', 'candidate.magpsf', 'gte'),
+        Constraint('magpsf__lte', 'candidate.magpsf', 'lte'),
+        Constraint('rb__gte', 'candidate.rb', 'gte'),
+        Constraint('drb__gte', 'candidate.drb', 'gte'),
+        Constraint('jd__gt', 'candidate.jd', 'gt'),
+        Constraint('jd__lt', 'candidate.jd', 'lt'),
+    ], results_key='results', is_complete=lambda parameters, response: not response['has_next'])
+    dash_validator = FilterValidator(MARSQueryForm)
 
     def callback(self, page_current, page_size, objectId, cone_ra, cone_dec, cone_radius, magpsf_lte, rb_gte,
                  start_date, end_date, button_click):
@@ -66,12 +91,26 @@ class MARSDashBroker(MARSBroker, GenericDashBroker):
         logger.info('Entering MARS callback...')
         errors = self.validate_filters(page_current, page_size, objectId, cone_ra, cone_dec, cone_radius, magpsf_lte,
                                        rb_gte, start_date, end_date, button_click, [])
+        partial_cone_search = any([cone_ra, cone_dec, cone_radius]) and not all([cone_ra, cone_dec, cone_radius])
 
-        if not button_click or button_click == self.dash_button_clicks or errors:
+        if not button_click or button_click == self.dash_button_clicks or errors or partial_cone_search:
             raise PreventUpdate
         else:
             self.dash_button_clicks = button_click
 
+        parameters = self.get_dash_parameters(page_current, page_size, objectId, cone_ra, cone_dec, cone_radius,
+                                              magpsf_lte, rb_gte, start_date, end_date, button_click)
+        alerts = self.request_dash_alerts(parameters)['results']
+        return self.flatten_dash_alerts(alerts)
+
+    def get_dash_parameters(self, page_current, page_size, objectId, cone_ra, cone_dec, cone_radius, magpsf_lte, rb_gte,
+                            start_date, end_date, button_click):
+        """
+        Builds the MARS query parameters for the DataTable inputs, as cleaned by the MARS query form.
+
+        :returns: query parameters for the current page
+        :rtype: dict
+        """
         cone_search = ''
         if all([cone_ra, cone_dec, cone_radius]):
             cone_search = ','.join([cone_ra, cone_dec, cone_radius])
@@ -89,9 +128,50 @@ class MARSDashBroker(MARSBroker, GenericDashBroker):
 
         parameters = form.cleaned_data
         parameters['page'] = page_current + 1  # Dash pagination is 0-indexed, but MARS is 1-indexed
+        return parameters
 
-        alerts = self._request_alerts(parameters)['results']
-        return self.flatten_dash_alerts(alerts)
+    def fetch_dash_pages(self, parameters, max_pages=None):
+        """
+        Requests the alerts for the parameters of a saved MARS query one page at a time, until MARS reports that there
+        is no next page.
+
+        :param parameters: Parameters of a saved MARS query
+        :type parameters: dict
+
+        :param max_pages: Maximum number of pages to request, or None to request all pages
+        :type max_pages: int
+
+        :returns: generator of lists of alerts from MARS, one list per page
+        :rtype: generator
+        """
+        page = 1
+        while True:
+            response = self.request_dash_alerts({**parameters, 'page': page}, allow_stale=False)
+            yield response['results']
+            if not response['has_next'] or page == max_pages:
+                return
+            page += 1
+
+    def get_incremental_parameters(self, parameters, since):
+        """
+        Raises the ``time__gt`` bound of a saved MARS query to ``since``.
+
+        :param parameters: Parameters of a saved MARS query
+        :type parameters: dict
+
+        :param since: Time after which alerts are requested
+        :type since: datetime
+
+        :returns: a copy of the parameters with the rewritten lower time bound
+        :rtype: dict
+        """
+        return {**parameters, 'time__gt': later_bound(parameters.get('time__gt'), since).strftime('%Y-%m-%d %H:%M:%S')}
+
+    def get_dash_alert_id(self, alert):
+        return alert['lco_id']
+
+    def get_dash_alert_time(self, alert):
+        return datetime.fromtimestamp((alert['candidate']['jd'] - UNIX_EPOCH_JD) * 86400, tz=timezone.utc)
 
     def get_callback_inputs(self):
         """
@@ -114,6 +194,19 @@ class MARSDashBroker(MARSBroker, GenericDashBroker):
         ]
         return inputs
 
+    def get_cone_search_inputs(self):
+        """
+        Returns MARS-specific inputs for the RA, Dec, and radius of a cone search.
+
+        :returns: list of inputs corresponding to the cone search filters
+        :rtype: list
+        """
+        return [
+            Input('mars-cone-ra', 'value'),
+            Input('mars-cone-dec', 'value'),
+            Input('mars-cone-radius', 'value')
+        ]
+
     def get_dash_filters(self):
         """
         Returns MARS-specific filter inputs layout
@@ -181,50 +274,58 @@ class MARSDashBroker(MARSBroker, GenericDashBroker):
         ])
         return filters
 
-    def get_dash_columns(self):
+    def get_dash_summary_fields(self):
         """
-        Returns MARS-specific Dash DataTable columns.
+        Returns the magnitude, real-bogus score, and detection time of MARS alerts for the summary panel.
 
-        :returns: columns for display
+        :returns: summary fields
         :rtype: list of dicts
         """
         return [
-            {'id': 'objectId', 'name': 'Name', 'type': 'text', 'presentation': 'markdown'},
-            {'id': 'ra', 'name': 'Right Ascension', 'type': 'text'},
-            {'id': 'dec', 'name': 'Declination', 'type': 'text'},
-            {'id': 'magpsf', 'name': 'Magnitude', 'type': 'text'},
-            {'id': 'rb', 'name': 'Real-Bogus Score', 'type': 'text'},
+            {'id': 'magpsf', 'name': 'Magnitude', 'type': 'numeric',
+             'value': lambda alert: alert['candidate']['magpsf']},
+            {'id': 'rb', 'name': 'Real-Bogus Score', 'type': 'numeric',
+             'value': lambda alert: alert['candidate']['rb']},
+            {'id': 'jd', 'name': 'Detection Date', 'type': 'datetime',
+             'value': lambda alert: (alert['candidate']['jd'] - UNIX_EPOCH_JD) * 86400},
         ]
 
-    def flatten_dash_alerts(self, alerts):
-        """
-        Transforms alerts returned by MARS into a Dash DataTable format. Adds an embedded link to the original alert.
-        Converts decimal degrees to sexagesimal. Truncates decimals to 4 places.
+    def get_dash_summary_densities(self):
+        return [('magpsf', 'rb')]
+
+    def get_dash_object_id(self, alert):
+        return alert['objectId']
 
-        :param alerts: list of alerts from MARS
-        :type alerts: list of dicts
+    def fetch_dash_light_curve(self, alert):
+        """
+        Gets the light curve of the object of a MARS alert from the alert's candidate and previous candidates, which
+        are requested from MARS if the alert does not include them.
 
-        :returns: flattened alerts
+        :returns: detections and non-detections of the object
         :rtype: list of dicts
         """
-        flattened_alerts = []
-        for alert in alerts:
-            url = f'{MARS_URL}/{alert["lco_id"]}/'
-            flattened_alerts.append({
-                'objectId': f'[{alert["objectId"]}]({url})',
-                'ra': deg_to_sexigesimal(alert['candidate']['ra'], 'hms'),
-                'dec': deg_to_sexigesimal(alert['candidate']['dec'], 'dms'),
-                'magpsf': truncate_number(alert['candidate']['magpsf']),
-                'rb': truncate_number(alert['candidate']['rb']),
-                'alert': alert
-            })
-        return flattened_alerts
+        if not alert.get('prv_candidate'):
+            alert = self.fetch_alert(alert['lco_id'])
+        light_curve = []
+        for candidate in [{'candidate': alert['candidate']}] + (alert.get('prv_candidate') or []):
+            candidate = candidate['candidate']
+            point = {'time': (candidate['jd'] - UNIX_EPOCH_JD) * 86400,
+                     'band': filters.get(candidate['fid'], str(candidate['fid']))}
+            if candidate.get('magpsf') is not None:
+                light_curve.append(dict(point, magnitude=candidate['magpsf'], error=candidate.get('sigmapsf')))
+            elif candidate.get('diffmaglim') is not None:
+                light_curve.append(dict(point, limit=candidate['diffmaglim']))
+        return light_curve
+
+    def get_dash_sky_coordinates(self, alert):
+        return alert['candidate']['ra'], alert['candidate']['dec']
 
     def validate_filters(self, page_current, page_size, objectId, cone_ra, cone_dec, cone_radius, magpsf_lte, rb_gte,
                          start_date, end_date, button_click, errors_state):
         """
         Validates the input filters for MARS. Returns an error if one, but not all, of RA, Dec, and radius are submitted
-        for cone search. Returns any errors generated by form validation.
+        for cone search, unless that check is performed by a clientside callback. Returns any errors that the MARS query
+        form would generate, as reported by ``dash_validator`` without constructing the form.
 
         :param page_current: The page number for the paginated alerts to display
         :type page_current: int
@@ -262,10 +363,10 @@ class MARSDashBroker(MARSBroker, GenericDashBroker):
         if any([cone_ra, cone_dec, cone_radius]):
             if all([cone_ra, cone_dec, cone_radius]):
                 cone_search = ','.join([cone_ra, cone_dec, cone_radius])
-            else:
-                errors.append('All of RA, Dec, and Radius are required for a cone search.')
+            elif not self.clientside_validation:  # Otherwise the error is displayed by a clientside callback
+                errors.append(CONE_SEARCH_ERROR)
 
-        form = MARSQueryForm({
+        errors += self.dash_validator.validate({
             'query_name': 'dash query',
             'broker': self.name,
             'objectId': objectId,
@@ -275,11 +376,6 @@ class MARSDashBroker(MARSBroker, GenericDashBroker):
             'time__lt': end_date,
             'cone': cone_search
         })
-        form.is_valid()
-
-        for field, field_errors in form.errors.items():
-            for field_error in field_errors.get_json_data():
-                errors.append(f'{field}: {field_error["message"]}')
 
         for error in errors:
             errors_state.append(dbc.Alert(error, dismissable=True, is_open=True, duration=5000, color='warning'))
@@ -1,4 +1,4 @@
-from datetime import datetime
+from datetime import datetime, timezone
 import logging
 
 from dash.dependencies import Input
@@ -6,8 +6,13 @@ from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
 import dash_html_components as dhc
 import dash_core_components as dcc
+from django import forms
+from django.utils.dateparse import parse_datetime
 
-from tom_alerts_dash.alerts import GenericDashBroker
+from tom_alerts_dash.alerts import CONE_SEARCH_ERROR, GenericDashBroker, later_bound
+from tom_alerts_dash.columns import DashColumn, markdown_link
+from tom_alerts_dash.planner import Constraint, QueryPlanner
+from tom_alerts_dash.validators import FilterValidator
 from tom_scimma.scimma import SCIMMABroker, SCIMMAQueryForm
 
 logger = logging.getLogger(__name__)
@@ -15,10 +20,45 @@ logger = logging.getLogger(__name__)
 GRACE_DB_URL = 'https://gracedb.ligo.org'
 
 
+def get_alert_timestamp(alert):
+    """
+    Gets the time of a SCIMMA alert as a number of seconds since the Unix epoch. Times without a timezone are UTC.
+
+    :rtype: float
+    """
+    timestamp = parse_datetime(alert['alert_timestamp'])
+    if timestamp is None:
+        return None
+    return (timestamp if timestamp.tzinfo else timestamp.replace(tzinfo=timezone.utc)).timestamp()
+
+
 class SCIMMADashBroker(SCIMMABroker, GenericDashBroker):
+    supports_dash_parameters = True
+    supports_paging = True
+    supports_sky_map = True
+    # Alert identifiers link to the superevent of the alert in GraceDB
+    dash_columns = [
+        DashColumn('alert_identifier', 'Alert Identifier', presentation='markdown',
+                   formatter=markdown_link(f'{GRACE_DB_URL}/superevents/{{message[event_trig_num]}}/view/')),
+        DashColumn('counterpart_identifier', 'Counterpart Identifier',
+                   source='extracted_fields.counterpart_identifier'),
+        DashColumn('ra', 'Right Ascension', source='right_ascension_sexagesimal'),
+        DashColumn('dec', 'Declination', source='declination_sexagesimal'),
+        DashColumn('rank', 'Rank', source='message.rank'),
+        DashColumn('comments', 'Comments', source='extracted_fields.comment_warnings'),
+    ]
+    # SCIMMA does not filter by the rank of counterparts, which is evaluated on the alerts it returns instead, and has
+    # no next page once it has returned all results
+    dash_planner = QueryPlanner([
+        Constraint('rank__lte', 'message.rank', 'lte', pushdown=False),
+    ], results_key='results', is_complete=lambda parameters, response: not response.get('next'))
+    # The topic choices are requested from SCIMMA when the form is constructed, and the maximum rank is not a field of
+    # the form
+    dash_validator = FilterValidator(SCIMMAQueryForm, choices={'topic': SCIMMAQueryForm.get_topic_choices},
+                                     extra_fields={'rank__lte': forms.FloatField(required=False)})
 
     def callback(self, page_current, page_size, event_trigger_number, keyword, cone_ra, cone_dec, cone_radius,
-                 start_date, end_date):
+                 start_date, end_date, rank_max):
         """
         SCIMMA-specific callback function for BrokerQueryBrowseView. Queries SCIMMA based on parameters from DataTable
         inputs. The callback will not modify any bound components if one or more, but not all, cone search inputs are
@@ -51,6 +91,9 @@ class SCIMMADashBroker(SCIMMABroker, GenericDashBroker):
         :param end_date: Latest date to filter by
         :param end_date: string
 
+        :param rank_max: Maximum rank of counterparts to filter by
+        :type rank_max: float
+
         :returns: list of flattened alerts
         :rtype: list of dicts
 
@@ -58,16 +101,30 @@ class SCIMMADashBroker(SCIMMABroker, GenericDashBroker):
         """
         logger.info('Entering SCIMMA callback...')
         errors = self.validate_filters(page_current, page_size, event_trigger_number, keyword, cone_ra, cone_dec,
-                                       cone_radius, start_date, end_date, [])
+                                       cone_radius, start_date, end_date, rank_max, [])
         if errors:
             raise PreventUpdate
 
+        if any([cone_ra, cone_dec, cone_radius]) and not all([cone_ra, cone_dec, cone_radius]):
+            raise PreventUpdate
+
+        parameters = self.get_dash_parameters(page_current, page_size, event_trigger_number, keyword, cone_ra, cone_dec,
+                                              cone_radius, start_date, end_date, rank_max)
+        alerts = self.request_dash_alerts(parameters)['results']
+        return self.flatten_dash_alerts(alerts)
+
+    def get_dash_parameters(self, page_current, page_size, event_trigger_number, keyword, cone_ra, cone_dec,
+                            cone_radius, start_date, end_date, rank_max):
+        """
+        Builds the SCIMMA query parameters for the DataTable inputs, as cleaned by the SCIMMA query form, along with the
+        maximum rank, which is not sent to SCIMMA.
+
+        :returns: query parameters for the current page
+        :rtype: dict
+        """
         cone_search = ''
-        if any([cone_ra, cone_dec, cone_radius]):
-            if all([cone_ra, cone_dec, cone_radius]):
-                cone_search = ','.join([cone_ra, cone_dec, cone_radius])
-            else:
-                raise PreventUpdate
+        if all([cone_ra, cone_dec, cone_radius]):
+            cone_search = ','.join([cone_ra, cone_dec, cone_radius])
 
         form = SCIMMAQueryForm({
             'query_name': 'SCIMMA Dash Query',
@@ -84,8 +141,50 @@ class SCIMMADashBroker(SCIMMABroker, GenericDashBroker):
         parameters['topic'] = 1  # form isn't valid with both topic and event trigger number, so this circumvents that
         parameters['page'] = page_current + 1  # Dash pagination is 0-indexed, but Skip is 1-indexed
         parameters['page_size'] = page_size if page_size else 20  # 20 is the Dash default page size
-        alerts = self._request_alerts(parameters)['results']
-        return self.flatten_dash_alerts(alerts)
+        parameters['rank__lte'] = rank_max
+        return parameters
+
+    def fetch_dash_pages(self, parameters, max_pages=None):
+        """
+        Requests the alerts for the parameters of a saved SCIMMA query one page at a time, until SCIMMA returns no link
+        to a next page.
+
+        :param parameters: Parameters of a saved SCIMMA query
+        :type parameters: dict
+
+        :param max_pages: Maximum number of pages to request, or None to request all pages
+        :type max_pages: int
+
+        :returns: generator of lists of alerts from SCIMMA, one list per page
+        :rtype: generator
+        """
+        page = 1
+        while True:
+            response = self.request_dash_alerts({**parameters, 'page': page, 'page_size': 20}, allow_stale=False)
+            yield response['results']
+            if not response.get('next') or page == max_pages:
+                return
+            page += 1
+
+    def get_incremental_parameters(self, parameters, since):
+        """
+        Raises the ``alert_timestamp_after`` bound of a saved SCIMMA query to ``since``.
+
+        :param parameters: Parameters of a saved SCIMMA query
+        :type parameters: dict
+
+        :param since: Time after which alerts are requested
+        :type since: datetime
+
+        :returns: a copy of the parameters with the rewritten lower time bound
+        :rtype: dict
+        """
+        lower_bound = later_bound(parameters.get('alert_timestamp_after'), since)
+        return {**parameters, 'alert_timestamp_after': lower_bound.isoformat()}
+
+    def get_dash_alert_time(self, alert):
+        timestamp = get_alert_timestamp(alert)
+        return datetime.fromtimestamp(timestamp, tz=timezone.utc) if timestamp is not None else None
 
     def get_callback_inputs(self):
         """
@@ -103,9 +202,23 @@ class SCIMMADashBroker(SCIMMABroker, GenericDashBroker):
             Input('scimma-radius', 'value'),
             Input('date-filter', 'start_date'),
             Input('date-filter', 'end_date'),
+            Input('scimma-rank-max', 'value'),
         ]
         return inputs
 
+    def get_cone_search_inputs(self):
+        """
+        Returns SCIMMA-specific inputs for the RA, Dec, and radius of a cone search.
+
+        :returns: list of inputs corresponding to the cone search filters
+        :rtype: list
+        """
+        return [
+            Input('scimma-ra', 'value'),
+            Input('scimma-dec', 'value'),
+            Input('scimma-radius', 'value')
+        ]
+
     def get_dash_filters(self):
         """
         Returns SCIMMA-specific filter inputs layout
@@ -126,6 +239,12 @@ class SCIMMADashBroker(SCIMMABroker, GenericDashBroker):
                     type='text',
                     placeholder='LVC Trigger Number',
                     debounce=True
+                ), width=3),
+                dbc.Col(dcc.Input(
+                    id='scimma-rank-max',
+                    type='number',
+                    placeholder='Rank Maximum',
+                    debounce=True
                 ), width=3)
             ], style={'padding-bottom': '10px'}, justify='start'),
             dbc.Row([
@@ -159,52 +278,28 @@ class SCIMMADashBroker(SCIMMABroker, GenericDashBroker):
         ])
         return filters
 
-    def get_dash_columns(self):
+    def get_dash_summary_fields(self):
         """
-        Returns SCIMMA-specific Dash DataTable columns.
+        Returns the rank and time of SCIMMA alerts for the summary panel.
 
-        :returns: columns for display
+        :returns: summary fields
         :rtype: list of dicts
         """
         return [
-            {'id': 'alert_identifier', 'name': 'Alert Identifier', 'type': 'text', 'presentation': 'markdown'},
-            {'id': 'counterpart_identifier', 'name': 'Counterpart Identifier', 'type': 'text'},
-            {'id': 'ra', 'name': 'Right Ascension', 'type': 'text'},
-            {'id': 'dec', 'name': 'Declination', 'type': 'text'},
-            {'id': 'rank', 'name': 'Rank', 'type': 'text'},
-            {'id': 'comments', 'name': 'Comments', 'type': 'text'}
+            {'id': 'rank', 'name': 'Rank', 'type': 'numeric', 'value': lambda alert: alert['message']['rank']},
+            {'id': 'alert_timestamp', 'name': 'Alert Date', 'type': 'datetime',
+             'value': get_alert_timestamp},
         ]
 
-    def flatten_dash_alerts(self, alerts):
-        """
-        Transforms alerts returned by SCIMMA into a Dash DataTable format. Adds an embedded link to the original alert.
-        Converts decimal degrees to sexagesimal.
-
-        :param alerts: list of alerts from SCIMMA
-        :type alerts: list of dicts
-
-        :returns: flattened alerts
-        :rtype: list of dicts
-        """
-        flattened_alerts = []
-        for alert in alerts:
-            url = f'{GRACE_DB_URL}/superevents/{alert["message"]["event_trig_num"]}/view/'
-            flattened_alerts.append({
-                'alert_identifier': f'[{alert["alert_identifier"]}]({url})',
-                'counterpart_identifier': alert['extracted_fields']['counterpart_identifier'],
-                'ra': alert['right_ascension_sexagesimal'],
-                'dec': alert['declination_sexagesimal'],
-                'rank': alert['message']['rank'],
-                'comments': alert['extracted_fields']['comment_warnings'],
-                'alert': alert
-            })
-        return flattened_alerts
+    def get_dash_sky_coordinates(self, alert):
+        return alert['right_ascension'], alert['declination']
 
     def validate_filters(self, page_current, page_size, event_trigger_number, keyword, cone_ra, cone_dec, cone_radius,
-                         start_date, end_date, errors_state):
+                         start_date, end_date, rank_max, errors_state):
         """
         Validates the input filters for SCIMMA. Returns an error if one, but not all, of RA, Dec, and radius are
-        submitted for cone search. Returns any errors generated by form validation.
+        submitted for cone search, unless that check is performed by a clientside callback. Returns any errors that the
+        SCIMMA query form would generate, as reported by ``dash_validator`` without constructing the form.
 
         :param page_current: The page number for the paginated alerts to display
         :type page_current: int
@@ -233,6 +328,9 @@ class SCIMMADashBroker(SCIMMABroker, GenericDashBroker):
         :param end_date: Latest date to filter by
         :param end_date: string
 
+        :param rank_max: Maximum rank of counterparts to filter by
+        :type rank_max: float
+
         :param errors_state: The currently displayed errors relating to filters
         :type errors_state: list of dbc.Alert objects
 
@@ -245,10 +343,10 @@ class SCIMMADashBroker(SCIMMABroker, GenericDashBroker):
         if any([cone_ra, cone_dec, cone_radius]):
             if all([cone_ra, cone_dec, cone_radius]):
                 cone_search = ','.join([cone_ra, cone_dec, cone_radius])
-            else:
-                errors.append('All of RA, Dec, and Radius are required for a cone search.')
+            elif not self.clientside_validation:  # Otherwise the error is displayed by a clientside callback
+                errors.append(CONE_SEARCH_ERROR)
 
-        form = SCIMMAQueryForm({
+        errors += self.dash_validator.validate({
             'query_name': 'SCIMMA Dash Query',
             'broker': self.name,
             'keyword': keyword,
@@ -256,12 +354,8 @@ class SCIMMADashBroker(SCIMMABroker, GenericDashBroker):
             'event_trigger_number': event_trigger_number,
             'alert_timestamp_after': start_date,
             'alert_timestamp_before': end_date,
+            'rank__lte': rank_max,
         })
-        form.is_valid()
-
-        for field, field_errors in form.errors.items():
-            for field_error in field_errors.get_json_data():
-                errors.append(f'{field}: {field_error["message"]}')
 
         for error in errors:
             errors_state.append(dbc.Alert(error, dismissable=True, is_open=True, duration=5000, color='warning'))
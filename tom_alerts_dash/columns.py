@@ -0,0 +1,309 @@
+from functools import lru_cache
+from operator import itemgetter
+
+from tom_common.templatetags.tom_common_extras import truncate_number
+
+
+class DashColumn:
+    """
+    Declares a column of a broker's Dash DataTable, along with where its values come from in the alerts returned by the
+    broker, and how they are formatted for display. Brokers list their columns in ``dash_columns``, from which
+    ``get_dash_columns()`` and ``flatten_dash_alerts()`` are derived.
+
+    :param id: The id of the column, which is the key of its values in the flattened alerts
+    :type id: str
+
+    :param name: The name of the column, as displayed in the DataTable header
+    :type name: str
+
+    :param source: The path of the value in the alert, as keys separated by dots, such as ``candidate.magpsf``.
+                   Defaults to the id of the column.
+    :type source: str
+
+    :param formatter: Batch formatter, which takes the values of the column and the alerts they come from, and returns
+                      the formatted values, such as ``truncate`` or ``sexagesimal('hms')``. Defaults to no formatting.
+    :type formatter: callable
+
+    :param type: The type of the column in the DataTable, such as ``text`` or ``datetime``
+    :type type: str
+
+    Any further keyword arguments, such as ``presentation``, are included in the DataTable column.
+    """
+    __slots__ = ('id', 'name', 'source', 'formatter', 'metadata')
+
+    def __init__(self, id, name, source=None, formatter=None, type='text', **metadata):
+        self.id = id
+        self.name = name
+        self.source = source or id
+        self.formatter = formatter
+        self.metadata = {'id': id, 'name': name, 'type': type, **metadata}
+
+    def compile_accessor(self):
+        """
+        Compiles the source path of the column into a function that gets the values of the column from a list of
+        alerts, with a single ``itemgetter`` per level of the path, so that no path is parsed per alert.
+
+        :rtype: callable
+        """
+        getters = [itemgetter(key) for key in self.source.split('.')]
+        if len(getters) == 1:
+            getter = getters[0]
+            return lambda alerts: list(map(getter, alerts))
+
+        def get_values(alerts):
+            values = alerts
+            for getter in getters:
+                values = map(getter, values)
+            return list(values)
+        return get_values
+
+
+def format_present(values, format_values):
+    """
+    Formats the values of a column that are not None as a batch, leaving missing values as None.
+
+    :param values: The values of the column
+    :type values: list
+
+    :param format_values: Function that formats a list of values
+    :type format_values: callable
+
+    :rtype: list
+    """
+    present = [i for i, value in enumerate(values) if value is not None]
+    if not present:
+        return [None] * len(values)
+    if len(present) == len(values):
+        return format_values(values)
+    formatted = [None] * len(values)
+    for i, value in zip(present, format_values([values[i] for i in present])):
+        formatted[i] = value
+    return formatted
+
+
+def truncate(values, alerts):
+    """
+    Formats numbers to four decimal places, as ``truncate_number`` does, leaving values that are not numbers as they
+    are.
+    """
+    try:
+        return ['%.4f' % value for value in values]
+    except TypeError:
+        return [truncate_number(value) for value in values]
+
+
+def sexagesimal(fmt):
+    """
+    Creates a formatter that converts decimal degrees to sexagesimal, as ``deg_to_sexigesimal`` does, with a single
+    conversion for all of the values of the column.
+
+    :param fmt: Either ``hms`` for right ascension, or ``dms`` for declination
+    :type fmt: str
+
+    :rtype: callable
+    """
+    def format_sexagesimal(values, alerts):
+        # astropy is slow to import, so it is only imported when alerts are flattened
+        from astropy.coordinates import Angle
+        import astropy.units as u
+
+        if fmt == 'hms':
+            options = {'unit': u.hourangle, 'sep': ':', 'precision': 3, 'pad': True}
+        else:
+            options = {'unit': u.deg, 'sep': ':', 'precision': 2, 'alwayssign': True, 'pad': True}
+        return format_present(values, lambda values: Angle(values, unit=u.degree).to_string(**options).tolist())
+    return format_sexagesimal
+
+
+def mjd_to_datetime(values, alerts):
+    """
+    Converts MJD values to UTC datetimes, with a single conversion for all of the values of the column.
+    """
+    from astropy.time import Time
+
+    return format_present(values, lambda values: Time(values, format='mjd', scale='utc').to_datetime().tolist())
+
+
+def markdown_link(url):
+    """
+    Creates a formatter that embeds a link in each value, in markdown.
+
+    :param url: The URL of the link, as a format string whose fields are taken from the alert, such as
+                ``https://example.com/{candidate[id]}/``
+    :type url: str
+
+    :rtype: callable
+    """
+    def format_markdown_link(values, alerts):
+        return [f'[{value}]({url.format_map(alert)})' for value, alert in zip(values, alerts)]
+    return format_markdown_link
+
+
+# Placeholder for the keys that are missing from some of the dicts that flattened alerts are built from
+_MISSING = object()
+
+
+class AlertRows:
+    """
+    Flattened alerts held as columns, rather than as a dict per alert that repeats the same keys. Each column holds the
+    values of its source in the alerts, which are only formatted for display, a column at a time, when the rows are
+    turned into dicts at the output boundary, such as for the DataTable, an export, or a saved query's stored results.
+    Until then, the rows take a reference per value, rather than a dict and formatted strings per alert.
+
+    The rows can be indexed and iterated over as dicts, as a list of flattened alerts can.
+
+    :param keys: The keys of the flattened alerts, which are the ids of the columns followed by ``alert``
+    :type keys: list of str
+
+    :param values: The unformatted values of each key, one list per key
+    :type values: list of lists
+
+    :param formatters: The batch formatter of each key, or None for values that are displayed as they are
+    :type formatters: list of callables
+    """
+    __slots__ = ('keys', 'values', 'formatters', 'size', 'sparse')
+
+    def __init__(self, keys, values, formatters=None, sparse=False):
+        self.keys = list(keys)
+        self.values = [list(column_values) for column_values in values]
+        self.formatters = list(formatters) if formatters is not None else [None] * len(self.keys)
+        self.size = len(self.values[0]) if self.values else 0
+        self.sparse = sparse  # Whether some rows are missing some of the keys
+
+    @classmethod
+    def from_dicts(cls, rows):
+        """
+        Creates rows from flattened alerts, as returned by a broker that implements ``flatten_dash_alerts()`` itself.
+
+        :param rows: Flattened alerts
+        :type rows: list of dicts
+
+        :rtype: AlertRows
+        """
+        keys = list(dict.fromkeys(key for row in rows for key in row))
+        values = [[row.get(key, _MISSING) for row in rows] for key in keys]
+        alert_rows = cls(keys, values, sparse=any(len(row) < len(keys) for row in rows))
+        alert_rows.size = len(rows)
+        return alert_rows
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, index):
+        if not isinstance(index, int):
+            raise TypeError('AlertRows indices must be integers')
+        index = index + self.size if index < 0 else index
+        if not 0 <= index < self.size:
+            raise IndexError('AlertRows index out of range')
+        return self.to_dicts(index, index + 1)[0]
+
+    def __iter__(self):
+        return self.iter_dicts()
+
+    @property
+    def alerts(self):
+        """
+        :returns: the alerts that the rows were flattened from, as returned by the broker
+        :rtype: list
+        """
+        if 'alert' not in self.keys:
+            return [None] * self.size
+        return [None if alert is _MISSING else alert for alert in self.values[self.keys.index('alert')]]
+
+    def extend(self, other):
+        """
+        Appends the rows of another page of flattened alerts, such as the next page of a block, to these rows.
+
+        :param other: The rows to append
+        :type other: AlertRows
+        """
+        for key, formatter in zip(other.keys, other.formatters):
+            if key not in self.keys:
+                self.keys.append(key)
+                self.values.append([_MISSING] * self.size)
+                self.formatters.append(formatter)
+                self.sparse = self.sparse or self.size > 0
+        for key, column_values in zip(self.keys, self.values):
+            if key in other.keys:
+                column_values.extend(other.values[other.keys.index(key)])
+            elif other.size:
+                column_values.extend([_MISSING] * other.size)
+                self.sparse = True
+        self.sparse = self.sparse or other.sparse
+        self.size += other.size
+
+    def column(self, key, start=None, stop=None):
+        """
+        Formats the values of a column for display.
+
+        :param key: The key of the column
+        :type key: str
+
+        :returns: the formatted values of the column, with None for the rows that are missing the key
+        :rtype: list
+        """
+        if key not in self.keys:
+            return [None] * len(range(self.size)[start:stop])
+        return [None if value is _MISSING else value for value in self._format(self.keys.index(key), start, stop)]
+
+    def _format(self, index, start, stop):
+        column_values = self.values[index][start:stop]
+        formatter = self.formatters[index]
+        if formatter is None:
+            return column_values
+        if 'alert' in self.keys:
+            alerts = self.values[self.keys.index('alert')][start:stop]
+        else:
+            alerts = [None] * len(column_values)
+        if not self.sparse:
+            return formatter(column_values, alerts)
+        # Only the rows that have the key are formatted, as the rows of pages with other keys are missing it
+        present = [i for i, value in enumerate(column_values) if value is not _MISSING]
+        formatted = [_MISSING] * len(column_values)
+        if present:
+            for i, value in zip(present, formatter([column_values[i] for i in present], [alerts[i] for i in present])):
+                formatted[i] = value
+        return formatted
+
+    def to_dicts(self, start=None, stop=None):
+        """
+        Turns a range of the rows into flattened alerts, formatting each column for the whole range at once.
+
+        :rtype: list of dicts
+        """
+        columns = [self._format(index, start, stop) for index in range(0, len(self.keys))]
+        if not self.sparse:
+            return [dict(zip(self.keys, row)) for row in zip(*columns)]
+        return [{key: value for key, value in zip(self.keys, row) if value is not _MISSING} for row in zip(*columns)]
+
+    def iter_dicts(self, page_size=1000):
+        """
+        Generator of the rows as flattened alerts, which are formatted a page at a time, so that only a page of them is
+        held in memory at once.
+
+        :rtype: generator
+        """
+        for start in range(0, self.size, page_size):
+            yield from self.to_dicts(start, start + page_size)
+
+
+@lru_cache(maxsize=None)
+def compile_columns(broker_class):
+    """
+    Compiles the ``dash_columns`` of a broker class into a function that flattens a list of its alerts into
+    ``AlertRows``. The values of each column are got for all of the alerts at once, and are formatted when the rows are
+    turned into dicts. Columns are compiled once per broker class.
+
+    :param broker_class: The broker class
+    :type broker_class: type
+
+    :returns: function that takes a list of alerts, and returns the flattened alerts
+    :rtype: callable
+    """
+    accessors = [column.compile_accessor() for column in broker_class.dash_columns]
+    keys = [column.id for column in broker_class.dash_columns] + ['alert']
+    formatters = [column.formatter for column in broker_class.dash_columns] + [None]
+
+    def flatten(alerts):
+        return AlertRows(keys, [get_values(alerts) for get_values in accessors] + [alerts], formatters)
+    return flatten
@@ -0,0 +1,48 @@
+import logging
+from threading import Lock
+
+from django_plotly_dash import DjangoDash
+
+logger = logging.getLogger(__name__)
+
+
+class DeferredDjangoDash(DjangoDash):
+    """
+    ``DjangoDash`` app that supports deferring the registration of its callbacks and the construction of its layout
+    until the first time a Dash instance is formed, i.e. until the first request that is served by the app.
+
+    django-plotly-dash forms a new ``WrappedDash`` instance from the registered callbacks and the layout on each
+    request, so nothing is lost by registering them late. Deferring them keeps the broker modules, and any heavy
+    scientific libraries they import, out of the import of ``tom_alerts_dash.urls``.
+    """
+    _deferred_initializers = None
+    _deferred_lock = Lock()
+
+    def defer(self, initializer):
+        """
+        Registers a function to be called once, before the first Dash instance of this app is formed.
+
+        :param initializer: Function that takes no arguments and registers callbacks and/or sets the layout
+        :type initializer: callable
+        """
+        if self._deferred_initializers is None:
+            self._deferred_initializers = []
+        self._deferred_initializers.append(initializer)
+
+    def run_deferred(self):
+        """
+        Calls all deferred initializers that have not yet been called. Safe to call from multiple threads.
+        """
+        if not self._deferred_initializers:
+            return
+        with self._deferred_lock:
+            while self._deferred_initializers:
+                initializer = self._deferred_initializers[0]
+                logger.info(f'Running deferred initializer {initializer.__name__} for Dash app {self._uid}')
+                initializer()
+                # Only discard the initializer once it has succeeded, so that a failure is retried on the next request
+                self._deferred_initializers.pop(0)
+
+    def form_dash_instance(self, *args, **kwargs):
+        self.run_deferred()
+        return super().form_dash_instance(*args, **kwargs)
@@ -1,15 +1,25 @@
+import json
 import logging
+from urllib.parse import parse_qs, urlencode
 
+from dash import no_update
 from dash.dependencies import Input, Output, State
 from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
 import dash_core_components as dcc
 import dash_html_components as dhc
 from dash_table import DataTable
-from django_plotly_dash import DjangoDash
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 from django.shortcuts import reverse
+from dpd_components import Pipe
 
-from tom_alerts_dash.alerts import get_service_class, get_service_classes
+from tom_alerts_dash.alerts import CONE_SEARCH_ERROR, get_service_class, get_service_classes
+from tom_alerts_dash.dash_apps.deferred import DeferredDjangoDash
+from tom_alerts_dash.generations import generation_tracker
+from tom_alerts_dash.models import ScheduledBrokerQuery
+from tom_alerts_dash.push import get_saved_query_channel, get_session_channel, push_enabled, session_notifier
+from tom_alerts_dash.resilience import BrokerUnavailable, Freshness, response_freshness
 
 # This module creates the browseable alert tables for the supported brokers. It does so by creating a Dash container for
 # each registered broker in settings.py. The containers include two messages containers, a create-targets button, a set
@@ -20,17 +30,92 @@ from tom_alerts_dash.alerts import get_service_class, get_service_classes
 # callbacks are registered for each broker for error or success messages. The first uses the broker-specific filters as
 # the inputs, and one of the two broker-specific messages containers as the output. The second uses the broker-specific
 # create-targets button as the input, and the other broker-specific messages container as the output.
+#
+# When TOM_ALERT_DASH_FAST_STARTUP is enabled in settings.py, the callbacks and the layout are not built on import, but
+# on the first request served by the app. This keeps the broker modules, and the libraries that they depend on, from
+# being imported by tom_alerts_dash.urls. The modules of the app's features, such as block fetch mode, light curves,
+# and jobs, are likewise imported by the functions that use them, rather than by this module.
+#
+# Unless TOM_ALERT_DASH_CLIENTSIDE_CALLBACKS is set to False in settings.py, the broker selection callback and the cone
+# search completeness check run in the browser as clientside callbacks, and do not make any requests to the server.
+#
+# The browse page can be opened for a saved query that is scheduled to run in the background, as in ?query=<id>. The
+# broker of the saved query is then selected, and its DataTable displays the stored results until a filter is set.
+#
+# When TOM_ALERT_DASH_BLOCK_SIZE is set in settings.py, brokers that support it fetch a block of that many alerts at
+# once for each set of filters. The DataTable's paging, sorting, and column filters are then answered from the block,
+# which is held on the server, without querying the broker again.
+#
+# The alerts whose objects are already targets in the TOM, by name or by position, link to their targets in the
+# DataTable's In TOM column, and are skipped when targets are created from the selected rows. Targets can also be
+# created from all of the alerts that match the filters, by a job that runs in a background thread, and whose progress
+# is polled by the browser.
+#
+# The queries of brokers in long callback mode, such as ALeRCE, run in a background thread. The callback that is
+# triggered by the filters only starts the query, and the DataTable is updated by a second callback that polls for the
+# result.
+#
+# When TOM_ALERT_DASH_PUSH is enabled in settings.py, the completion of queries in long callback mode, the progress of
+# target creation jobs, and the alerts fetched by the scheduled runs of the saved query that the browse page was opened
+# for are pushed to the browse session over a WebSocket, through django-plotly-dash's Pipe components, and the browse
+# page only falls back to polling at a slow rate while a job runs.
 
 logger = logging.getLogger(__name__)
 
-app = DjangoDash('BrokerQueryListViewDash', external_stylesheets=[dbc.themes.BOOTSTRAP], add_bootstrap_links=True)
+# Clientside equivalent of broker_selection_callback. The list of broker names is substituted on registration.
+BROKER_SELECTION_CLIENTSIDE_CALLBACK = '''
+function(brokerSelection, brokerState) {
+    if (!brokerSelection || brokerSelection === brokerState) {
+        throw window.dash_clientside.PreventUpdate;
+    }
+    const pageHeader = {namespace: 'dash_html_components', type: 'H3', props: {children: brokerSelection + ' Alerts'}};
+    const styles = %(brokers)s.map(broker => ({display: broker === brokerSelection ? 'block' : 'none'}));
+    return [brokerSelection, pageHeader].concat(styles);
+}
+'''
+
+# Clientside check that either all or none of RA, Dec, and radius are submitted for a broker's cone search
+CONE_SEARCH_CLIENTSIDE_CALLBACK = '''
+function(ra, dec, radius) {
+    const values = [ra, dec, radius];
+    if (values.some(value => value) && !values.every(value => value)) {
+        return [{namespace: 'dash_bootstrap_components', type: 'Alert',
+                 props: {children: %(error)s, color: 'warning', dismissable: true, is_open: true, duration: 5000}}];
+    }
+    return [];
+}
+'''
+
+# Column of the DataTable that links to the target of each alert whose object is already a target in the TOM
+IN_TOM_COLUMN = {'id': 'in_tom', 'name': 'In TOM', 'type': 'text', 'presentation': 'markdown'}
+
+# Generates an identifier for the browse session on page load, used to discard the results of superseded queries
+CLIENT_ID_CLIENTSIDE_CALLBACK = '''
+function(id) {
+    return Math.random().toString(36).slice(2) + Date.now().toString(36);
+}
+'''
+
+app = DeferredDjangoDash('BrokerQueryListViewDash', external_stylesheets=[dbc.themes.BOOTSTRAP],
+                         add_bootstrap_links=True)
+
+
+def use_clientside_callbacks():
+    """
+    Whether callbacks that do not need the server should be registered as clientside callbacks, as specified by
+    ``TOM_ALERT_DASH_CLIENTSIDE_CALLBACKS`` in ``settings.py``. Defaults to ``True``.
+
+    :rtype: bool
+    """
+    return getattr(settings, 'TOM_ALERT_DASH_CLIENTSIDE_CALLBACKS', True)
 
 
 def create_targets(create_targets, selected_rows, row_data, broker_state, messages_state):
     """
     Create TOM Toolkit target objects for each selected target for the current broker. Callback is triggered by a click
     of the broker-specific create-targets-{broker_name} button. Upon clicking, the callback gets the current-selected
-    rows in the broker-specific DataTable and calls ``tom_alerts.alerts.to_target`` on each one.
+    rows in the broker-specific DataTable and calls ``tom_alerts.alerts.to_target`` on each one. Rows whose objects are
+    already targets in the TOM, or that are for the same object as an earlier selected row, are skipped.
 
     This fires on page load, but should not. However, the ``prevent_initial_call`` kwargs does not appear to work in
     django-plotly-dash.
@@ -51,11 +136,24 @@ def create_targets(create_targets, selected_rows, row_data, broker_state, messag
     :type messages_state: list of dbc.Alert object
     """
     logger.info(f'Entering create targets callback for broker: {broker_state}')
+    from tom_alerts_dash.target_index import match_alerts
+
     # Ensure the create-targets button has actually been clicked and that there are selected rows
     if create_targets and selected_rows:
         broker_class = get_service_class(broker_state)()
         messages = messages_state
-        for row in selected_rows:
+        matches = match_alerts(broker_class, [row_data[row]['alert'] for row in selected_rows])
+        selected_objects = set()
+        skipped = 0
+        for row, match in zip(selected_rows, matches):
+            try:
+                object_id = broker_class.get_dash_object_id(row_data[row]['alert'])
+            except (AttributeError, KeyError, TypeError):
+                object_id = None
+            if match >= 0 or (object_id is not None and object_id in selected_objects):
+                skipped += 1
+                continue
+            selected_objects.add(object_id)
             try:
                 target = broker_class.to_target(row_data[row]['alert'])  # Get the data for each selected row
                 target_url = reverse('targets:detail', kwargs={'pk': target.id})
@@ -69,12 +167,624 @@ def create_targets(create_targets, selected_rows, row_data, broker_state, messag
                     dbc.Alert('Unable to create target from alert.',  # TODO: how to give the alert name?
                               color='danger', is_open=True, dismissable=True, duration=5000)
                 )
+        if skipped:
+            messages.append(
+                dbc.Alert(f'Skipped {skipped} selected alerts whose objects are already targets in the TOM.',
+                          color='info', is_open=True, dismissable=True, duration=5000)
+            )
 
         return messages
     else:
         raise PreventUpdate
 
 
+def freshness_banner(freshness):
+    """
+    Creates the banner displayed above a broker's DataTable when it shows a stale result, the stored result of a saved
+    query, or a result narrowed from that of a broader query.
+
+    :param freshness: Freshness of the broker response displayed in the DataTable, if any
+    :type freshness: tom_alerts_dash.resilience.Freshness
+
+    :returns: A warning for stale results, a notice for saved query and narrowed results, and nothing otherwise
+    :rtype: list of dbc.Alert objects
+    """
+    if freshness is None or not (freshness.stale or freshness.saved_query or freshness.narrowed):
+        return []
+    fetched_at = freshness.fetched_at_datetime.strftime('%Y-%m-%d %H:%M:%S')
+    if freshness.saved_query:
+        return [dbc.Alert(f'Showing the results of saved query {freshness.saved_query} from {fetched_at} UTC. Set any '
+                          'filter to query the broker instead.', color='info')]
+    if freshness.narrowed:
+        return [dbc.Alert(f'Showing results narrowed from those of a broader query, fetched at {fetched_at} UTC.',
+                          color='info')]
+    return [dbc.Alert(f'The broker is slow or unavailable. Showing results from {fetched_at} UTC, which will be '
+                      'refreshed in the background.', color='warning')]
+
+
+def with_freshness(callback):
+    """
+    Wraps a broker's callback so that, along with the flattened alerts for the DataTable, it returns the freshness
+    banner for the broker response that they came from. If the broker is unavailable, the DataTable is left unchanged
+    and the banner displays the error instead.
+
+    :param callback: The broker-specific callback, as returned by ``GenericDashBroker.callback``
+    :type callback: callable
+
+    :returns: Callback with the same inputs as ``callback``, and outputs for the DataTable data and the banner
+    :rtype: callable
+    """
+    def freshness_callback(*args):
+        token = response_freshness.set(None)
+        try:
+            alerts = callback(*args)
+            freshness = response_freshness.get()
+        except BrokerUnavailable as e:
+            return no_update, [dbc.Alert(str(e), color='danger')]
+        finally:
+            response_freshness.reset(token)
+        return alerts, freshness_banner(freshness)
+    return freshness_callback
+
+
+def start_target_job(broker_class, broker):
+    """
+    Creates the callback that starts a job that creates targets from all of the alerts that match a broker's current
+    filters, on a click of the broker-specific create-all-targets button. The callback returns as soon as the job is
+    started, and enables the polling of its progress.
+
+    :param broker_class: An instance of the broker
+    :type broker_class: GenericDashBroker
+
+    :param broker: The name of the broker
+    :type broker: str
+
+    :returns: Callback that takes the number of clicks of the button, the values of the broker's callback inputs, and
+              the browse session's client id, and returns the id of the job and whether polling is disabled
+    :rtype: callable
+    """
+    from tom_alerts_dash.jobs import start_target_creation_job
+
+    def start_target_job_callback(n_clicks, *args):
+        *args, client_id = args
+        if not n_clicks:
+            raise PreventUpdate
+        job_id = start_target_creation_job(broker, broker_class.get_dash_parameters(*args),
+                                           notify=session_notifier(client_id, f'targets-{broker}'))
+        return {'job_id': job_id}, False
+    return start_target_job_callback
+
+
+def target_job_progress(*args):
+    """
+    Callback triggered by the broker-specific interval while a target creation job is running, and by the progress
+    pushed by the job if updates are pushed, which displays the progress of the job, and disables the interval once
+    the job has finished.
+
+    :param args: The number of times the interval has fired, the progress pushed by the job if updates are pushed, and
+                 the job started by the create-all-targets button, as stored by ``start_target_job``
+    :type args: tuple
+
+    :returns: the progress bar or the outcome of the job, and whether polling is disabled
+    :rtype: tuple
+    """
+    from tom_alerts_dash.jobs import get_job_progress
+
+    *triggers, job = args
+    if not job:
+        raise PreventUpdate
+    progress = get_job_progress(job['job_id'])
+    if progress is None:
+        return [dbc.Alert('The progress of the target creation job is no longer available.', color='warning')], True
+    counts = (f'Created {progress["created"]} targets from {progress["fetched"]} alerts, skipped {progress["skipped"]} '
+              f'that are already targets')
+    if progress['errors']:
+        counts += f', and could not create {progress["errors"]}'
+    if progress['status'] == 'running':
+        return [dbc.Progress(f'{counts}.', value=100, striped=True, animated=True)], False
+    if progress['status'] == 'failed':
+        return [dbc.Alert(f'{counts} before the job failed: {progress["error"]}', color='danger')], True
+    return [dbc.Alert(f'{counts}.', color='success', dismissable=True)], True
+
+
+def with_query_job(callback, broker):
+    """
+    Wraps a table callback for long callback mode, so that it starts a job that calls the table callback in a
+    background thread, and returns the id of the job at once. If updates are pushed, the completion of the job is
+    pushed to the browse session.
+
+    :param callback: The table callback, which takes the browse session's client id as its last argument
+    :type callback: callable
+
+    :param broker: The name of the broker
+    :type broker: str
+
+    :returns: Callback with the same inputs as ``callback``, and an output for the broker-specific query job store
+    :rtype: callable
+    """
+    from tom_alerts_dash.jobs import start_query_job
+
+    def query_job_callback(*args):
+        return {'job_id': start_query_job(callback, *args, notify=session_notifier(args[-1], f'query-{broker}'))}
+    return query_job_callback
+
+
+def query_job_results(broker, output_count):
+    """
+    Creates the callback that updates a broker's DataTable in long callback mode. It is triggered when a query job is
+    started, and then by the broker-specific interval, or the completion pushed by the job if updates are pushed, until
+    the job has finished, when it returns the outputs of the table callback, and disables the interval. While the job
+    runs, the freshness banner shows that the broker is being queried.
+
+    :param broker: The name of the broker
+    :type broker: str
+
+    :param output_count: The number of outputs of the table callback, the second of which is the freshness banner
+    :type output_count: int
+
+    :returns: Callback that takes the query job, the number of times the interval has fired, and the completion pushed
+              by the job if updates are pushed, and returns the outputs of the table callback and whether polling is
+              disabled
+    :rtype: callable
+    """
+    from tom_alerts_dash.jobs import get_query_job
+
+    def unchanged(banner):
+        return (no_update, banner, *[no_update] * (output_count - 2))
+
+    def query_job_results_callback(job, *triggers):
+        if not job:
+            raise PreventUpdate
+        state = get_query_job(job['job_id'])
+        if state is None:
+            return (*unchanged([dbc.Alert('The results of the query are no longer available.', color='warning')]), True)
+        if state['status'] == 'running':
+            return (*unchanged([dbc.Alert([dbc.Spinner(size='sm'), f' Querying {broker}...'], color='info')]), False)
+        if state['status'] == 'prevented':
+            return (*unchanged([]), True)
+        if state['status'] == 'failed':
+            return (*unchanged([dbc.Alert(state['error'], color='danger')]), True)
+        return (*state['outputs'], True)
+    return query_job_results_callback
+
+
+def with_pushed_alerts(callback):
+    """
+    Wraps a table callback so that it is also triggered when the alerts fetched by a scheduled run of the saved query
+    that the browse page was opened for are pushed, which refreshes the stored results displayed in the DataTable.
+
+    :param callback: The table callback
+    :type callback: callable
+
+    :returns: Callback that takes the same arguments as ``callback``, followed by the pushed alerts
+    :rtype: callable
+    """
+    def pushed_alerts_callback(*args):
+        *args, pushed_alerts = args
+        return callback(*args)
+    return pushed_alerts_callback
+
+
+def push_channels(session_pipe_count):
+    """
+    Creates the callback that sets the channels of the ``Pipe`` components of the browse page, once the browse
+    session's client id has been generated: the session's channel for the pipes of the brokers' jobs, and the channel
+    of the saved query that the browse page was opened for, if any, for the pushed alerts.
+
+    :param session_pipe_count: The number of pipes that listen on the session's channel
+    :type session_pipe_count: int
+
+    :returns: Callback that takes the client id and the query string of the browse page, and returns the channel of
+              each pipe
+    :rtype: callable
+    """
+    def push_channels_callback(client_id, search):
+        if not client_id:
+            raise PreventUpdate
+        query_id = get_saved_query_id(search)
+        saved_query_channel = get_saved_query_channel(query_id) if query_id is not None else ''
+        return [get_session_channel(client_id)] * session_pipe_count + [saved_query_channel]
+    return push_channels_callback
+
+
+def get_session_pipes():
+    """
+    Gets the ``Pipe`` components that receive the updates pushed to the browse session by the jobs of the brokers in
+    long callback mode, and of the brokers that support target creation jobs.
+
+    :rtype: list of Pipe
+    """
+    from tom_alerts_dash.jobs import supports_long_callback, supports_target_jobs
+
+    pipes = []
+    for class_name in get_service_classes().keys():
+        broker_class = get_service_class(class_name)()
+        if supports_long_callback(broker_class):
+            pipes.append(Pipe(id=f'push-query-{class_name}', label=f'query-{class_name}', channel_name='', value=''))
+        if supports_target_jobs(broker_class):
+            pipes.append(Pipe(id=f'push-targets-{class_name}', label=f'targets-{class_name}', channel_name='',
+                              value=''))
+    return pipes
+
+
+def get_poll_interval():
+    """
+    Gets the interval, in milliseconds, at which the browse page polls for the results of a running job, which is
+    ``TOM_ALERT_DASH_QUERY_JOB_POLL_INTERVAL``, or the slower ``TOM_ALERT_DASH_PUSH_FALLBACK_INTERVAL`` if updates
+    are pushed, in which case polling only covers updates that were pushed before the page listened for them.
+
+    :rtype: int
+    """
+    if push_enabled():
+        return getattr(settings, 'TOM_ALERT_DASH_PUSH_FALLBACK_INTERVAL', 10000)
+    return getattr(settings, 'TOM_ALERT_DASH_QUERY_JOB_POLL_INTERVAL', 500)
+
+
+def with_target_matches(callback, broker_class):
+    """
+    Wraps a table callback so that each row of the DataTable data that it returns links to the target in the TOM that
+    matches the object of its alert, if any, in the In TOM column. The rows of a page are matched at once against the
+    in-memory index of the TOM's targets.
+
+    :param callback: The table callback, which returns the DataTable data as its first output
+    :type callback: callable
+
+    :param broker_class: The broker
+    :type broker_class: GenericDashBroker
+
+    :returns: Callback with the same inputs and outputs as ``callback``
+    :rtype: callable
+    """
+    from tom_alerts_dash.target_index import match_alerts
+
+    def target_matches_callback(*args):
+        rows, *outputs = callback(*args)
+        if rows is not no_update:
+            annotated = [row for row in rows if 'alert' in row]
+            matches = match_alerts(broker_class, [row['alert'] for row in annotated]) if annotated else []
+            for row, match in zip(annotated, matches):
+                row['in_tom'] = f'[View]({reverse("targets:detail", kwargs={"pk": int(match)})})' if match >= 0 else ''
+        return (rows, *outputs)
+    return target_matches_callback
+
+
+def get_saved_query_id(search):
+    """
+    Gets the id of the saved query to open from the query string of the browse page, as in ``?query=1``.
+
+    :param search: The query string of the browse page
+    :type search: str
+
+    :returns: The id of the saved query, or None
+    :rtype: int
+    """
+    query_id = parse_qs((search or '').lstrip('?')).get('query', [''])[0]
+    return int(query_id) if query_id.isdigit() else None
+
+
+def saved_query_selection_callback(search):
+    """
+    Callback triggered when the browse page is loaded. When the page is opened for a saved query, selects the broker of
+    the saved query so that its stored results are displayed.
+
+    :param search: The query string of the browse page
+    :type search: str
+
+    :returns: The broker of the saved query
+    :rtype: str
+
+    :raises: PreventUpdate if the page was not opened for a saved query of a Dash broker
+    """
+    broker = ScheduledBrokerQuery.objects.filter(query_id=get_saved_query_id(search)).values_list(
+        'query__broker', flat=True
+    ).first()
+    if broker not in get_service_classes():
+        raise PreventUpdate
+    return broker
+
+
+def with_saved_results(callback, broker):
+    """
+    Wraps a broker's callback so that, when the browse page is opened for a saved query of the broker and no filter
+    has been set, the DataTable pages through the results stored by the latest scheduled run of the saved query,
+    instead of querying the broker. The time of that run is reported through ``response_freshness``.
+
+    :param callback: The broker-specific callback, as returned by ``GenericDashBroker.callback``
+    :type callback: callable
+
+    :param broker: The name of the broker
+    :type broker: str
+
+    :returns: Callback that takes the same arguments as ``callback``, followed by the query string of the browse page
+    :rtype: callable
+    """
+    def saved_results_callback(*args):
+        *args, search = args
+        page_current, page_size, *filters = args
+        query_id = get_saved_query_id(search)
+        if query_id is None or any(filters):
+            return callback(*args)
+
+        scheduled_query = ScheduledBrokerQuery.objects.filter(
+            query_id=query_id, query__broker=broker, last_run__isnull=False
+        ).select_related('query').first()
+        if scheduled_query is None:
+            return callback(*args)
+
+        response_freshness.set(Freshness(scheduled_query.last_run.timestamp(), saved_query=scheduled_query.query.name))
+        page_size = page_size or 20
+        start = (page_current or 0) * page_size
+        return scheduled_query.alerts[start:start + page_size]
+    return saved_results_callback
+
+
+def with_generations(callback, broker):
+    """
+    Wraps a table callback so that each call runs as a new generation of the queries for the broker's table in the
+    current browse session. When the filters change while a query is in flight, the older query does not make any
+    further requests to the broker, and its result is discarded, so that only the latest query writes to the table.
+
+    :param callback: The table callback
+    :type callback: callable
+
+    :param broker: The name of the broker
+    :type broker: str
+
+    :returns: Callback that takes the same arguments as ``callback``, followed by the browse session's client id
+    :rtype: callable
+    """
+    def generation_callback(*args):
+        *args, client_id = args
+        if not client_id:  # The client id has not been generated yet, so queries can't be told apart by session
+            return callback(*args)
+        return generation_tracker.run(f'{client_id}:{broker}', callback, *args)
+    return generation_callback
+
+
+def with_block_fetch(broker_class, broker):
+    """
+    Creates the table callback of a broker in block fetch mode. When there is no block for a set of filters, they are
+    validated by the broker's ``validate_filters()``, along with the completeness of its cone search, and a block of
+    ``get_block_size()`` alerts is fetched for the parameters built by ``get_dash_parameters()``. The broker's callback
+    is not called, as it may also decide whether to query the broker from the state of the filter button, which does
+    not change when a block expires while the table is paged or sorted. Pages of the block, sorted and filtered by the
+    DataTable's ``sort_by`` and ``filter_query``, are then returned without querying the broker, until the block expires
+    from ``block_store``. The number of pages is reported through ``response_page_count``.
+
+    :param broker_class: An instance of the broker
+    :type broker_class: GenericDashBroker
+
+    :param broker: The name of the broker
+    :type broker: str
+
+    :returns: Callback that takes the same arguments as the broker's callback, followed by the DataTable's ``sort_by``
+              and ``filter_query``
+    :rtype: callable
+    """
+    from tom_alerts_dash.blocks import (block_store, ColumnarBuffer, get_block_parameters, get_block_size,
+                                        response_page_count)
+    from tom_alerts_dash.skymap import supports_sky_map
+
+    # Positions of the cone search inputs among the filters
+    filter_inputs = [(callback_input.component_id, callback_input.component_property)
+                     for callback_input in broker_class.get_callback_inputs()[2:]]
+    cone_search_positions = [filter_inputs.index((cone_input.component_id, cone_input.component_property))
+                             for cone_input in broker_class.get_cone_search_inputs()]
+
+    def validate(page_size, filters):
+        try:
+            errors = broker_class.validate_filters(0, page_size, *filters, [])
+        except PreventUpdate:  # There are no new errors to display
+            errors = []
+        cone_search = [filters[position] for position in cone_search_positions]
+        if errors or (any(cone_search) and not all(cone_search)):
+            raise PreventUpdate
+
+    def block_callback(*args):
+        *args, sort_by, filter_query = args
+        page_current, page_size, *filters = args
+        page_size = page_size or 20
+        parameters = get_block_parameters(broker_class, filters)
+        key = block_store.make_key(broker, parameters)
+        buffer = block_store.get(key)
+        if buffer is None:
+            validate(page_size, filters)
+            alerts = broker_class.fetch_dash_block(parameters, get_block_size())
+            sky_coordinates = broker_class.get_dash_sky_coordinates if supports_sky_map(broker_class) else None
+            buffer = ColumnarBuffer(broker_class.get_dash_columns(), alerts, freshness=response_freshness.get(),
+                                    summary_fields=broker_class.get_dash_summary_fields(),
+                                    sky_coordinates=sky_coordinates, namespace=f'{broker}:block')
+            block_store.put(key, buffer)
+
+        response_freshness.set(buffer.freshness)
+        rows, page_count = buffer.page(page_current, page_size, sort_by, filter_query)
+        response_page_count.set(page_count)
+        return rows
+    return block_callback
+
+
+def with_page_count(callback):
+    """
+    Wraps a table callback so that, along with its outputs, it returns the number of pages reported through
+    ``response_page_count``, or None if the number of pages is not known.
+
+    :param callback: The table callback
+    :type callback: callable
+
+    :returns: Callback with the same inputs as ``callback``, and an additional output for the DataTable's page count
+    :rtype: callable
+    """
+    from tom_alerts_dash.blocks import response_page_count
+
+    def page_count_callback(*args):
+        token = response_page_count.set(None)
+        try:
+            return (*callback(*args), response_page_count.get())
+        finally:
+            response_page_count.reset(token)
+    return page_count_callback
+
+
+def summary_panel(broker_class, broker):
+    """
+    Creates the callback that updates a broker's summary panel in block fetch mode, whenever its DataTable is updated.
+    The summary fields of all of the alerts in the block that match the DataTable's filter query are binned on the
+    server, and only the binned counts are sent to the browser.
+
+    :param broker_class: An instance of the broker
+    :type broker_class: GenericDashBroker
+
+    :param broker: The name of the broker
+    :type broker: str
+
+    :returns: Callback that takes the DataTable's data, the values of the broker's callback inputs, and the DataTable's
+              filter query, and returns the summary panel
+    :rtype: callable
+    """
+    from tom_alerts_dash.blocks import block_store, get_block_parameters
+    from tom_alerts_dash.summary import create_summary_panel, summarize
+
+    def summary_callback(data, *args):
+        *args, filter_query = args
+        page_current, page_size, *filters = args
+        buffer = block_store.get(block_store.make_key(broker, get_block_parameters(broker_class, filters)))
+        if buffer is None:  # The DataTable is not showing a block, such as when it shows a saved query's results
+            return []
+        fields, densities = broker_class.get_dash_summary_fields(), broker_class.get_dash_summary_densities()
+        return create_summary_panel(fields, densities, summarize(buffer, fields, densities, buffer.match(filter_query)))
+    return summary_callback
+
+
+def sky_map(broker_class, broker):
+    """
+    Creates the callback that updates a broker's sky map in block fetch mode, whenever its DataTable is updated or the
+    map is zoomed or panned. The alerts in the block that match the DataTable's filter query and are in view are binned
+    on the server, so that the size of the figure sent to the browser does not depend on the size of the block, unless
+    few enough of them are in view to be plotted individually.
+
+    :param broker_class: An instance of the broker
+    :type broker_class: GenericDashBroker
+
+    :param broker: The name of the broker
+    :type broker: str
+
+    :returns: Callback that takes the DataTable's data, the sky map's ``relayoutData``, the values of the broker's
+              callback inputs, and the DataTable's filter query, and returns the figure of the sky map
+    :rtype: callable
+    """
+    from tom_alerts_dash.blocks import block_store, get_block_parameters
+    from tom_alerts_dash.skymap import bin_sky, create_sky_map, get_view
+
+    def sky_map_callback(data, relayout_data, *args):
+        *args, filter_query = args
+        page_current, page_size, *filters = args
+        buffer = block_store.get(block_store.make_key(broker, get_block_parameters(broker_class, filters)))
+        if buffer is None or buffer.sky_coordinates() is None:  # The DataTable is not showing a block
+            raise PreventUpdate
+        ra, dec = buffer.sky_coordinates()
+        positions = buffer.match(filter_query)
+        view = get_view(relayout_data)
+        count, binned = bin_sky(ra[positions], dec[positions], view)
+        if isinstance(binned, tuple):
+            return create_sky_map(view, count, binned)
+        positions = positions[binned]
+        names = buffer.text(broker_class.get_dash_columns()[0]['id'])[positions].tolist()
+        return create_sky_map(view, count, binned, ra=ra[positions], dec=dec[positions], names=names)
+    return sky_map_callback
+
+
+def light_curve_preview(broker_class, broker):
+    """
+    Creates the callback that updates the light curve preview of a broker when a cell of its DataTable is selected,
+    with the light curve of the object of the alert in the selected row. Light curves are cached by
+    ``get_light_curve()``, so that selecting an alert again, or another alert of the same object, does not query the
+    broker again.
+
+    :param broker_class: An instance of the broker
+    :type broker_class: GenericDashBroker
+
+    :param broker: The name of the broker
+    :type broker: str
+
+    :returns: Callback that takes the DataTable's active cell and data, and returns the light curve preview
+    :rtype: callable
+    """
+    from tom_alerts_dash.lightcurves import create_light_curve, get_light_curve, LightCurveUnavailable
+
+    def light_curve_callback(active_cell, data):
+        if not active_cell or not data or active_cell['row'] >= len(data) or not data[active_cell['row']].get('alert'):
+            raise PreventUpdate
+        alert = data[active_cell['row']]['alert']
+        try:
+            light_curve = get_light_curve(broker_class, alert)
+        except LightCurveUnavailable as e:
+            return [dbc.Alert(str(e), color='warning')]
+        figure = create_light_curve(broker_class.get_dash_object_id(alert), light_curve)
+        return [dcc.Graph(figure=figure, config={'displayModeBar': False})]
+    return light_curve_callback
+
+
+def stamp_gallery(broker_class, broker):
+    """
+    Creates the callback that updates the image stamps of a broker's alerts whenever its DataTable is updated. The
+    stamps of the alerts on the page are fetched in parallel, and are served from the stamp store, so that displaying a
+    page again does not query the broker.
+
+    :param broker_class: An instance of the broker
+    :type broker_class: GenericDashBroker
+
+    :param broker: The name of the broker
+    :type broker: str
+
+    :returns: Callback that takes the DataTable's data, and returns the stamps of its alerts
+    :rtype: callable
+    """
+    from tom_alerts_dash.stamps import get_page_stamps
+
+    def stamps_callback(data):
+        alerts = [row['alert'] for row in data or [] if row.get('alert')]
+        stamps = []
+        for alert, urls in zip(alerts, get_page_stamps(broker_class, alerts)):
+            if urls:
+                stamps.append(dhc.Div([
+                    dhc.Div(str(broker_class.get_dash_object_id(alert))),
+                    *[dhc.Img(src=url, title=name, alt=name, width=100, height=100) for name, url in urls.items()]
+                ], style={'display': 'inline-block', 'margin': '5px'}))
+        return stamps
+    return stamps_callback
+
+
+def export_links(broker_class, broker):
+    """
+    Creates the callback that updates the links to export all of the alerts that match a broker's current filters, in
+    each of the formats returned by ``get_export_formats()``.
+
+    :param broker_class: An instance of the broker
+    :type broker_class: GenericDashBroker
+
+    :param broker: The name of the broker
+    :type broker: str
+
+    :returns: Callback that takes the values of the broker's callback inputs, and returns the export links
+    :rtype: callable
+    """
+    from tom_alerts_dash.export import get_export_formats, PAGING_PARAMETERS
+
+    def export_links_callback(*args):
+        parameters = {
+            key: value for key, value in broker_class.get_dash_parameters(*args).items()
+            if key not in PAGING_PARAMETERS
+        }
+        url = reverse('tom_alerts_dash:export', kwargs={'broker': broker})
+        parameters = json.dumps(parameters, cls=DjangoJSONEncoder)
+        return ['Export all results as '] + [
+            dhc.A(label, href=f'{url}?{urlencode({"format": export_format, "parameters": parameters})}',
+                  className='btn btn-link', title=f'Export all results as {label}')
+            for export_format, (label, *_) in get_export_formats().items()
+        ]
+    return export_links_callback
+
+
 def create_broker_callbacks():
     """
     Add all broker-specific callbacks to the app callbacks on init, and construct the alerts table
@@ -82,19 +792,84 @@ def create_broker_callbacks():
     this is the only way to support different callbacks per broker.
 
     There are three broker-specific callbacks per broker. The first is a callback that fires on a change in any
-    broker-specific inputs and updates the data in the broker-specific DataTable. The second fires on a click of the
-    broker-specific create-targets button and updates the broker-specific messages container in order to convey success
-    or failure of target creation. The third fires on any change in broker-specific inputs and validates the inputs,
-    then returns Alert objects to display to the user any validation errors.
+    broker-specific inputs and updates the data in the broker-specific DataTable, along with the banner that shows
+    whether the data is stale. Rows whose objects are already targets in the TOM link to their targets. Only the latest
+    of the queries made by this callback in a browse session updates the DataTable. When the browse page is opened for a
+    saved query, the stored results of the saved query are displayed until a filter is set. The second fires on a click
+    of the broker-specific create-targets button and updates the broker-specific messages container in order to convey
+    success or failure of target creation. The third fires on any change in broker-specific inputs and validates the
+    inputs, then returns Alert objects to display to the user any validation errors.
+
+    If the broker provides cone search inputs and clientside callbacks are enabled, a fourth, clientside, callback
+    checks that either all or none of the cone search inputs are submitted.
+
+    If the broker supports exporting alerts, a further callback updates the links to export all of the alerts that
+    match the broker-specific inputs, and two more start a job that creates targets from all of those alerts on a click
+    of the broker-specific create-all-targets button, and poll the progress of the job.
+
+    In long callback mode, the first callback only starts a job that runs the query in a background thread, and the
+    DataTable is updated by a further callback that polls for the result of the job.
+
+    If updates are pushed, the first callback is also triggered by the alerts pushed for the saved query that the browse
+    page was opened for, and the callbacks that poll for the results of jobs are also triggered by the updates that the
+    jobs push. A further callback sets the channels of the browse page's pipes once the session's client id is known.
+
+    In block fetch mode, the first callback also takes the sort and filter of the DataTable, which it applies to a block
+    of alerts held on the server, and updates the DataTable's page count. If the broker provides summary fields, a
+    further callback updates the summary panel whenever the DataTable is updated. If the broker provides the positions
+    of its alerts, another updates the sky map whenever the DataTable is updated or the map is zoomed.
+
+    If the broker provides light curves, a further callback previews the light curve of the alert in a selected row,
+    and if it provides image stamps, another displays the stamps of the alerts on the page.
     """
+    from tom_alerts_dash.blocks import supports_block_fetch
+    from tom_alerts_dash.export import supports_export
+    from tom_alerts_dash.jobs import supports_long_callback, supports_target_jobs
+    from tom_alerts_dash.lightcurves import supports_light_curves
+    from tom_alerts_dash.skymap import supports_sky_map
+    from tom_alerts_dash.stamps import supports_stamps
 
     for class_name in get_service_classes().keys():
         broker_class = get_service_class(class_name)()
-        table_callback = app.callback(  # Create the broker-specific filters callback
-            Output(f'alerts-table-{class_name}', 'data'),
-            broker_class.get_callback_inputs()
-        )
-        table_callback(broker_class.callback)  # Instantiate the broker-specific filters callback
+        if supports_block_fetch(broker_class):  # Create the broker-specific filters callback, in block fetch mode
+            table_outputs = [Output(f'alerts-table-{class_name}', 'data'),
+                             Output(f'freshness-{class_name}', 'children'),
+                             Output(f'alerts-table-{class_name}', 'page_count')]
+            table_inputs = broker_class.get_callback_inputs() + [
+                Input(f'alerts-table-{class_name}', 'sort_by'),
+                Input(f'alerts-table-{class_name}', 'filter_query'),
+                Input('url', 'search')
+            ]
+            table_function = with_page_count(with_target_matches(with_freshness(
+                with_saved_results(with_block_fetch(broker_class, class_name), class_name)
+            ), broker_class))
+        else:  # Create the broker-specific filters callback
+            table_outputs = [Output(f'alerts-table-{class_name}', 'data'),
+                             Output(f'freshness-{class_name}', 'children')]
+            table_inputs = broker_class.get_callback_inputs() + [Input('url', 'search')]
+            table_function = with_target_matches(
+                with_freshness(with_saved_results(broker_class.callback, class_name)), broker_class
+            )
+
+        if push_enabled():  # Refresh the DataTable when the alerts of the saved query are pushed
+            table_inputs.append(Input('push-alerts', 'value'))
+            table_function = with_pushed_alerts(table_function)
+        table_function = with_generations(table_function, class_name)
+
+        if supports_long_callback(broker_class):
+            query_job_callback = app.callback(  # Start the broker-specific filters callback in a query job
+                Output(f'query-job-{class_name}', 'data'), table_inputs, [State('client-id', 'data')]
+            )
+            query_job_callback(with_query_job(table_function, class_name))
+            query_job_results_callback = app.callback(  # Update the DataTable with the results of the query job
+                table_outputs + [Output(f'query-job-interval-{class_name}', 'disabled')],
+                [Input(f'query-job-{class_name}', 'data'), Input(f'query-job-interval-{class_name}', 'n_intervals')] +
+                ([Input(f'push-query-{class_name}', 'value')] if push_enabled() else [])
+            )
+            query_job_results_callback(query_job_results(class_name, len(table_outputs)))
+        else:
+            table_callback = app.callback(table_outputs, table_inputs, [State('client-id', 'data')])
+            table_callback(table_function)  # Instantiate the broker-specific filters callback
 
         filter_validation_callback = app.callback(  # Create the broker-specific filter validation callback
             Output(f'messages-filters-{class_name}', 'children'),
@@ -113,12 +888,83 @@ def create_broker_callbacks():
         )
         create_targets_callback(create_targets)  # Create the broker-specific create-targets callback
 
+        if supports_target_jobs(broker_class):
+            start_target_job_callback = app.callback(  # Create the broker-specific create-all-targets callback
+                [Output(f'target-job-{class_name}', 'data'), Output(f'target-job-interval-{class_name}', 'disabled')],
+                [Input(f'create-all-targets-btn-{class_name}', 'n_clicks')],
+                [State(callback_input.component_id, callback_input.component_property)
+                 for callback_input in broker_class.get_callback_inputs()] + [State('client-id', 'data')]
+            )
+            start_target_job_callback(start_target_job(broker_class, class_name))
+
+            target_job_progress_callback = app.callback(  # Create the broker-specific job progress callback
+                [Output(f'target-job-progress-{class_name}', 'children'),
+                 Output(f'target-job-interval-{class_name}', 'disabled')],
+                [Input(f'target-job-interval-{class_name}', 'n_intervals')] +
+                ([Input(f'push-targets-{class_name}', 'value')] if push_enabled() else []),
+                [State(f'target-job-{class_name}', 'data')]
+            )
+            target_job_progress_callback(target_job_progress)
+
+        if supports_block_fetch(broker_class) and broker_class.get_dash_summary_fields():
+            summary_callback = app.callback(  # Create the broker-specific summary panel callback
+                Output(f'summary-{class_name}', 'children'),
+                [Input(f'alerts-table-{class_name}', 'data')],
+                [State(callback_input.component_id, callback_input.component_property)
+                 for callback_input in broker_class.get_callback_inputs()] +
+                [State(f'alerts-table-{class_name}', 'filter_query')]
+            )
+            summary_callback(summary_panel(broker_class, class_name))
+
+        if supports_block_fetch(broker_class) and supports_sky_map(broker_class):
+            sky_map_callback = app.callback(  # Create the broker-specific sky map callback
+                Output(f'sky-map-{class_name}', 'figure'),
+                [Input(f'alerts-table-{class_name}', 'data'), Input(f'sky-map-{class_name}', 'relayoutData')],
+                [State(callback_input.component_id, callback_input.component_property)
+                 for callback_input in broker_class.get_callback_inputs()] +
+                [State(f'alerts-table-{class_name}', 'filter_query')]
+            )
+            sky_map_callback(sky_map(broker_class, class_name))
+
+        if supports_light_curves(broker_class):
+            light_curve_callback = app.callback(  # Create the broker-specific light curve preview callback
+                Output(f'light-curve-{class_name}', 'children'),
+                [Input(f'alerts-table-{class_name}', 'active_cell')],
+                [State(f'alerts-table-{class_name}', 'data')]
+            )
+            light_curve_callback(light_curve_preview(broker_class, class_name))
+
+        if supports_stamps(broker_class):
+            stamps_callback = app.callback(  # Create the broker-specific stamps callback
+                Output(f'stamps-{class_name}', 'children'),
+                [Input(f'alerts-table-{class_name}', 'data')]
+            )
+            stamps_callback(stamp_gallery(broker_class, class_name))
+
+        if supports_export(broker_class) and broker_class.supports_dash_parameters:
+            export_links_callback = app.callback(  # Create the broker-specific export links callback
+                Output(f'export-links-{class_name}', 'children'),
+                broker_class.get_callback_inputs()
+            )
+            export_links_callback(export_links(broker_class, class_name))
+
+        cone_search_inputs = broker_class.get_cone_search_inputs()
+        if cone_search_inputs and use_clientside_callbacks():
+            broker_class.clientside_validation = True  # The check no longer needs to be performed by validate_filters
+            app.clientside_callback(  # Create the broker-specific cone search check
+                CONE_SEARCH_CLIENTSIDE_CALLBACK % {'error': json.dumps(CONE_SEARCH_ERROR)},
+                Output(f'messages-cone-{class_name}', 'children'),
+                cone_search_inputs
+            )
+
 
 def create_broker_container(broker):
     """
     This method creates the container with the broker-specific components. It is hidden by default. The components are
-    a redirection container, a series of filter input components, a create-targets button, and a Dash DataTable. Each
-    component id includes the name of the broker, in order to distinguish it for use in a specific callback function.
+    a redirection container, a series of filter input components, create-targets buttons, a banner for stale results,
+    a Dash DataTable, the progress of a target creation job, a light curve preview, image stamps, a summary panel, and
+    a sky map. Each component id includes the name of the broker, in order to distinguish it for use in a specific
+    callback function.
 
     :param broker: The name of the broker class for which to create a container
     :type broker: str
@@ -126,30 +972,49 @@ def create_broker_container(broker):
     :returns: The container with the redirection, filter inputs, button, and DataTable
     :rtype: dhc.Div
     """
+    from tom_alerts_dash.blocks import supports_block_fetch
+    from tom_alerts_dash.jobs import supports_long_callback, supports_target_jobs
+    from tom_alerts_dash.lightcurves import supports_light_curves
+    from tom_alerts_dash.skymap import supports_sky_map
+    from tom_alerts_dash.stamps import supports_stamps
+
     broker_class = get_service_class(broker)()
+    # In block fetch mode, the DataTable is sorted and filtered on the server, by any number of columns
+    block_fetch_properties = {
+        'sort_action': 'custom', 'sort_mode': 'multi', 'sort_by': [], 'filter_action': 'custom', 'filter_query': ''
+    } if supports_block_fetch(broker_class) else {}
     return dhc.Div(children=[
         dcc.Loading(children=[
             dhc.Div(
                 broker_class.get_dash_filters()
             ),
             dhc.Div(
-                dhc.P(
+                dhc.P([
                     dbc.Button(
                         'Create targets from selected',
                         id=f'create-targets-btn-{broker}',
                         outline=True,
                         color='info'
                     ),
-                )
+                    *([' ', dbc.Button(
+                        'Create targets from all results',
+                        id=f'create-all-targets-btn-{broker}',
+                        outline=True,
+                        color='info'
+                    )] if supports_target_jobs(broker_class) else []),
+                ])
             ),
+            dhc.Div(children=[], id=f'export-links-{broker}'),
+            dhc.Div(children=[], id=f'freshness-{broker}'),
             DataTable(
                 id=f'alerts-table-{broker}',
-                columns=broker_class.get_dash_columns(),
+                columns=broker_class.get_dash_columns() + [IN_TOM_COLUMN],
                 data=[],
                 row_selectable='multi',
                 page_current=0,
                 page_size=20,
                 page_action='custom',
+                **block_fetch_properties,
                 css=[
                     {'selector': '.dash-cell-value', 'rule': 'backgroundColor: blue;'}
                 ],
@@ -179,21 +1044,30 @@ def create_broker_container(broker):
                 }
             )
         ], id=f'alerts-loading-container-{broker}'),
+        *([dcc.Store(id=f'query-job-{broker}'),
+           dcc.Interval(id=f'query-job-interval-{broker}', interval=get_poll_interval(), disabled=True)]
+          if supports_long_callback(broker_class) else []),
+        *([dcc.Store(id=f'target-job-{broker}'),
+           dcc.Interval(id=f'target-job-interval-{broker}', interval=max(get_poll_interval(), 1000), disabled=True),
+           dhc.Div(children=[], id=f'target-job-progress-{broker}')] if supports_target_jobs(broker_class) else []),
+        *([dcc.Loading(dhc.Div(children=[], id=f'light-curve-{broker}'))]
+          if supports_light_curves(broker_class) else []),
+        *([dcc.Loading(dhc.Div(children=[], id=f'stamps-{broker}'))] if supports_stamps(broker_class) else []),
+        dhc.Div(children=[], id=f'summary-{broker}'),
+        *([dcc.Graph(id=f'sky-map-{broker}')]
+          if supports_block_fetch(broker_class) and supports_sky_map(broker_class) else []),
     ], id=f'alerts-container-{broker}', style={'display': 'none'})
 
 
-@app.callback(
-    [Output('broker-state', 'value'), Output('page-header', 'children')] +
-    [Output(f'alerts-container-{clazz}', 'style') for clazz in get_service_classes().keys()],
-    [Input('broker-selection', 'value')],
-    [State('broker-state', 'value')]
-)
 def broker_selection_callback(broker_selection, broker_state):
     """
     Callback triggered by a selection of the broker dropdown. The callback also takes the previously selected broker.
     The outputs are the broker state container, the header displaying which broker alerts are being viewed,
     and an output bound to the style property of each broker container.
 
+    This callback is only registered if clientside callbacks are disabled. Otherwise, the equivalent
+    ``BROKER_SELECTION_CLIENTSIDE_CALLBACK`` is registered instead.
+
     If the broker selection did not change from the previously selected broker, no update occurs.
 
     If the broker selection did change, the following events occur:
@@ -241,33 +1115,97 @@ def broker_selection_callback(broker_selection, broker_state):
         raise PreventUpdate  # Don't update any components
 
 
-create_broker_callbacks()
+def create_layout():
+    """
+    Constructs the layout of the app. The layout consists of the messages containers, the page header, the broker
+    selection dropdown, and the container for each broker.
 
-app.layout = dbc.Container([
-    dhc.Div(
-        # Messages containers for validation messages related to filter inputs
-        [dhc.Div(children=[], id=f'messages-filters-{class_name}') for class_name in get_service_classes().keys()] +
-        # Messages containers for validation messages related to target creation
-        [dhc.Div(children=[], id=f'messages-targets-{class_name}') for class_name in get_service_classes().keys()] +
-        [
-            dhc.Div(  # Create an initial header. This div will be replaced by the broker_selection callback
-                dhc.H3('View Alerts for a Broker'),
-                id='page-header'
-            ),
-            dhc.Div(children=[
-                # Hidden component to store the currently selected broker. This is used for the create_targets callback.
-                dcc.Input(id='broker-state', type='hidden', value=''),
-                dhc.P(
-                    dcc.Dropdown(  # Dropdown component to select the active broker
-                        id='broker-selection',
-                        placeholder='Select Broker',
-                        options=[{'label': clazz, 'value': clazz} for clazz in get_service_classes().keys()]
+    :returns: The layout of the app
+    :rtype: dbc.Container
+    """
+    return dbc.Container([
+        dhc.Div(
+            # Messages containers for validation messages related to filter inputs
+            [dhc.Div(children=[], id=f'messages-filters-{class_name}') for class_name in get_service_classes().keys()] +
+            # Messages containers for validation messages related to target creation
+            [dhc.Div(children=[], id=f'messages-targets-{class_name}') for class_name in get_service_classes().keys()] +
+            # Messages containers for the clientside cone search check
+            [dhc.Div(children=[], id=f'messages-cone-{class_name}') for class_name in get_service_classes().keys()] +
+            [
+                dhc.Div(  # Create an initial header. This div will be replaced by the broker_selection callback
+                    dhc.H3('View Alerts for a Broker'),
+                    id='page-header'
+                ),
+                # Identifier of the browse session, generated on page load by a clientside callback
+                dcc.Store(id='client-id'),
+                # Location of the browse page, which includes the id of the saved query to open, if any
+                dcc.Location(id='url', refresh=False),
+                # Pipes that receive the updates pushed to the browse session, whose channels are set on page load
+                *([dhc.Div(get_session_pipes() + [Pipe(id='push-alerts', label='alerts', channel_name='', value='')],
+                           id='push-pipes')] if push_enabled() else []),
+                dhc.Div(children=[
+                    # Hidden component to store the currently selected broker. This is used for the create_targets
+                    # callback.
+                    dcc.Input(id='broker-state', type='hidden', value=''),
+                    dhc.P(
+                        dcc.Dropdown(  # Dropdown component to select the active broker
+                            id='broker-selection',
+                            placeholder='Select Broker',
+                            options=[{'label': clazz, 'value': clazz} for clazz in get_service_classes().keys()]
+                        )
                     )
-                )
-            ]),
-            dhc.Div(  # Creates a container for each broker
-                children=[create_broker_container(class_name) for class_name in get_service_classes().keys()],
-            ),
-        ]
+                ]),
+                dhc.Div(  # Creates a container for each broker
+                    children=[create_broker_container(class_name) for class_name in get_service_classes().keys()],
+                ),
+            ]
+        )
+    ])
+
+
+def initialize_app():
+    """
+    Registers the callbacks of the app and sets its layout. All broker modules, and the modules of the features that the
+    brokers support, are imported at this point.
+    """
+    create_broker_callbacks()
+
+    app.clientside_callback(CLIENT_ID_CLIENTSIDE_CALLBACK, Output('client-id', 'data'), [Input('client-id', 'id')])
+
+    if push_enabled():
+        session_pipes = get_session_pipes()
+        push_channels_callback = app.callback(
+            [Output(pipe.id, 'channel_name') for pipe in session_pipes] + [Output('push-alerts', 'channel_name')],
+            [Input('client-id', 'data'), Input('url', 'search')]
+        )
+        push_channels_callback(push_channels(len(session_pipes)))
+
+    saved_query_selection = app.callback(Output('broker-selection', 'value'), [Input('url', 'search')])
+    saved_query_selection(saved_query_selection_callback)
+
+    broker_selection_outputs = (
+        [Output('broker-state', 'value'), Output('page-header', 'children')] +
+        [Output(f'alerts-container-{clazz}', 'style') for clazz in get_service_classes().keys()]
     )
-])
+    if use_clientside_callbacks():
+        app.clientside_callback(
+            BROKER_SELECTION_CLIENTSIDE_CALLBACK % {'brokers': json.dumps(list(get_service_classes().keys()))},
+            broker_selection_outputs,
+            [Input('broker-selection', 'value')],
+            [State('broker-state', 'value')]
+        )
+    else:
+        broker_selection = app.callback(
+            broker_selection_outputs,
+            [Input('broker-selection', 'value')],
+            [State('broker-state', 'value')]
+        )
+        broker_selection(broker_selection_callback)
+
+    app.layout = create_layout()
+
+
+if getattr(settings, 'TOM_ALERT_DASH_FAST_STARTUP', False):
+    app.defer(initialize_app)
+else:
+    initialize_app()
@@ -0,0 +1,227 @@
+import csv
+from datetime import date
+from importlib.util import find_spec
+import logging
+import re
+from xml.sax.saxutils import escape, quoteattr
+
+from django.conf import settings
+
+from tom_alerts_dash.resilience import in_background
+
+logger = logging.getLogger(__name__)
+
+# Parameters that select a single page of results, which are removed from the parameters of an export
+PAGING_PARAMETERS = ['page', 'page_size', 'records_per_pages']
+
+MARKDOWN_LINK = re.compile(r'^\[(.*)\]\((.*)\)$')
+
+
+def supports_export(broker):
+    """
+    Whether the alerts of a Dash broker can be exported, which it declares by setting ``supports_paging``.
+
+    :param broker: The broker
+    :type broker: GenericDashBroker
+
+    :rtype: bool
+    """
+    return broker.supports_paging
+
+
+def get_export_formats():
+    """
+    Gets the available export formats, keyed by the value of the ``format`` query parameter of the export view.
+
+    :returns: dict of (label, content type, file extension, writer) tuples
+    :rtype: dict
+    """
+    export_formats = {
+        'csv': ('CSV', 'text/csv', 'csv', stream_csv),
+        'votable': ('VOTable', 'application/x-votable+xml', 'xml', stream_votable),
+    }
+    if find_spec('pyarrow') is not None:  # Parquet export is only available when pyarrow is installed
+        export_formats['parquet'] = ('Parquet', 'application/vnd.apache.parquet', 'parquet', stream_parquet)
+    return export_formats
+
+
+def export_value(value):
+    """
+    Converts a value of a flattened alert to text. Markdown links, such as the links to an alert on the broker's site,
+    are replaced by their text, and dates are converted to ISO 8601.
+
+    :rtype: str
+    """
+    if value is None:
+        return ''
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, str):
+        match = MARKDOWN_LINK.match(value)
+        return match.group(1) if match else value
+    return str(value)
+
+
+def iter_export_rows(broker, parameters):
+    """
+    Generator that walks all pages of alerts for the given parameters, up to ``TOM_ALERT_DASH_EXPORT_MAX_PAGES`` (1,000
+    by default), and converts each page of alerts to rows of text with one value per column of ``get_dash_columns()``.
+    Only a single page of alerts is held in memory at a time. The pages are requested with the lower priority of
+    ``in_background()``, so that exports do not use up the rate limit of the users of the browse page.
+
+    :param broker: The broker to export alerts from
+    :type broker: GenericDashBroker
+
+    :param parameters: Query parameters, in the format of the parameters of a saved ``BrokerQuery``
+    :type parameters: dict
+
+    :returns: generator of lists of rows, one list per page
+    :rtype: generator
+    """
+    parameters = {key: value for key, value in parameters.items() if key not in PAGING_PARAMETERS}
+    columns = [column['id'] for column in broker.get_dash_columns()]
+    max_pages = getattr(settings, 'TOM_ALERT_DASH_EXPORT_MAX_PAGES', 1000)
+    pages = broker.fetch_dash_pages(parameters, max_pages=max_pages)
+    try:
+        while True:
+            with in_background():  # Set around each request, as the export is streamed between them
+                page = next(pages, None)
+            if page is None:
+                return
+            alerts = broker.flatten_dash_rows(page)
+            values = [[export_value(value) for value in alerts.column(column)] for column in columns]
+            yield [list(row) for row in zip(*values)]
+    except Exception as e:
+        logger.error(f'Export of alerts from {broker.name} with parameters {parameters} failed due to error: {e}')
+        raise
+
+
+class _Echo:
+    """
+    File-like object that returns what is written to it, so that ``csv.writer`` can be used to format single rows.
+    """
+    def write(self, value):
+        return value
+
+
+class _StreamBuffer:
+    """
+    File-like object that holds what is written to it until it is drained, so that a Parquet file can be streamed as
+    it is written.
+    """
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_csv(columns, pages, name):
+    """
+    Streams pages of rows as CSV, with a header row of column names. If the export fails, a final row starting with
+    ``# Export failed`` is written before the error is raised.
+
+    :param columns: Columns, as returned by ``get_dash_columns()``
+    :type columns: list of dicts
+
+    :param pages: Pages of rows, as generated by ``iter_export_rows()``
+    :type pages: generator
+
+    :param name: Name of the exported table
+    :type name: str
+
+    :returns: generator of chunks of the file
+    :rtype: generator
+    """
+    writer = csv.writer(_Echo())
+    yield writer.writerow([column['name'] for column in columns])
+    try:
+        for rows in pages:
+            yield ''.join(writer.writerow(row) for row in rows)
+    except Exception as e:
+        yield writer.writerow([f'# Export failed: {e}'])
+        raise
+
+
+def stream_parquet(columns, pages, name):
+    """
+    Streams pages of rows as a Parquet file with a string column for each column, writing each page as a row group. If
+    the export fails, the file is left without its footer, so that it cannot be read.
+    """
+    import pyarrow  # pyarrow is slow to import, so it is only imported when a Parquet file is exported
+    import pyarrow.parquet
+
+    schema = pyarrow.schema([(column['id'], pyarrow.string()) for column in columns])
+    buffer = _StreamBuffer()
+    writer = pyarrow.parquet.ParquetWriter(buffer, schema)
+    for rows in pages:
+        if rows:
+            writer.write_table(pyarrow.Table.from_arrays(
+                [pyarrow.array(values, pyarrow.string()) for values in zip(*rows)], schema=schema
+            ))
+            yield buffer.drain()
+    writer.close()
+    yield buffer.drain()
+
+
+def stream_votable(columns, pages, name):
+    """
+    Streams pages of rows as a VOTable with a single table in the TABLEDATA serialization, with a unicode string field
+    for each column. If the export fails, the table is closed, followed by a ``QUERY_STATUS`` of ``ERROR``, before the
+    error is raised.
+    """
+    yield ('<?xml version="1.0" encoding="utf-8"?>\n'
+           '<VOTABLE version="1.4" xmlns="http://www.ivoa.net/xml/VOTable/v1.3">\n'
+           f'<RESOURCE type="results">\n<TABLE name={quoteattr(name)}>\n')
+    for column in columns:
+        yield (f'<FIELD name={quoteattr(column["id"])} datatype="unicodeChar" arraysize="*">'
+               f'<DESCRIPTION>{escape(column["name"])}</DESCRIPTION></FIELD>\n')
+    yield '<DATA>\n<TABLEDATA>\n'
+    try:
+        for rows in pages:
+            yield ''.join('<TR>' + ''.join(f'<TD>{escape(value)}</TD>' for value in row) + '</TR>\n' for row in rows)
+    except Exception as e:
+        yield (f'</TABLEDATA>\n</DATA>\n</TABLE>\n<INFO name="QUERY_STATUS" value="ERROR">{escape(str(e))}</INFO>\n'
+               '</RESOURCE>\n</VOTABLE>\n')
+        raise
+    yield '</TABLEDATA>\n</DATA>\n</TABLE>\n</RESOURCE>\n</VOTABLE>\n'
+
+
+def export_alerts(broker, parameters, export_format):
+    """
+    Streams all of the alerts for the given parameters in the given format. If the broker fails partway through, the
+    format's marker of a failed export is written, and the error is raised, so that the response is aborted rather
+    than ending as though it were complete.
+
+    :param broker: The broker to export alerts from
+    :type broker: GenericDashBroker
+
+    :param parameters: Query parameters, in the format of the parameters of a saved ``BrokerQuery``
+    :type parameters: dict
+
+    :param export_format: One of the keys of ``get_export_formats()``
+    :type export_format: str
+
+    :returns: generator of chunks of the exported file
+    :rtype: generator
+    """
+    writer = get_export_formats()[export_format][3]
+    return writer(broker.get_dash_columns(), iter_export_rows(broker, parameters), f'{broker.name} alerts')
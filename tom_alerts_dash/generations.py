@@ -0,0 +1,89 @@
+from collections import OrderedDict
+from contextvars import ContextVar
+import logging
+import threading
+
+from dash.exceptions import PreventUpdate
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of browse sessions for which the current generation is tracked
+MAX_TRACKED_KEYS = 10000
+
+# Generation that the current callback is running as, as a (tracker, key, generation) tuple, or None
+current_generation = ContextVar('current_generation', default=None)
+
+
+class Superseded(PreventUpdate):
+    """
+    Raised when a query has been superseded by a newer query for the same broker table. As a ``PreventUpdate``, it
+    prevents the superseded result from being written to the table.
+    """
+    pass
+
+
+class GenerationTracker:
+    """
+    Tracks the latest generation of the queries submitted for each broker table in each browse session, so that only
+    the latest generation may write its result.
+    """
+    def __init__(self):
+        self._generations = OrderedDict()
+        self._lock = threading.Lock()
+
+    def next(self, key):
+        """
+        Starts a new generation for ``key``, superseding any previous generation.
+
+        :returns: the new generation
+        :rtype: int
+        """
+        with self._lock:
+            generation = self._generations.pop(key, 0) + 1
+            self._generations[key] = generation
+            while len(self._generations) > MAX_TRACKED_KEYS:
+                self._generations.popitem(last=False)
+            return generation
+
+    def is_current(self, key, generation):
+        with self._lock:
+            return self._generations.get(key) == generation
+
+    def run(self, key, func, *args):
+        """
+        Calls ``func`` with ``args`` as a new generation for ``key``, on the calling thread. The generation is checked
+        by ``check_superseded()`` before the call makes a request to the broker, and again once the call has completed,
+        so that a superseded call neither reaches the broker nor returns its result.
+
+        :returns: the return value of ``func``
+
+        :raises: Superseded if a newer generation is started before the call completes
+        """
+        generation = self.next(key)
+        token = current_generation.set((self, key, generation))
+        try:
+            result = func(*args)
+        finally:
+            current_generation.reset(token)
+
+        if not self.is_current(key, generation):
+            logger.info(f'Discarding superseded query {generation} for {key}')
+            raise Superseded
+        return result
+
+
+def check_superseded():
+    """
+    Raises ``Superseded`` if the current callback runs as a generation that has since been superseded. Called before
+    expensive work, such as a request to a broker, so that superseded queries do not reach the broker.
+
+    :raises: Superseded
+    """
+    generation = current_generation.get()
+    if generation is not None:
+        tracker, key, number = generation
+        if not tracker.is_current(key, number):
+            raise Superseded
+
+
+generation_tracker = GenerationTracker()
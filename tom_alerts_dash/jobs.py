@@ -0,0 +1,239 @@
+from contextvars import copy_context
+import logging
+import uuid
+
+from dash.exceptions import PreventUpdate
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections, transaction
+
+from tom_alerts_dash.alerts import get_service_class
+from tom_alerts_dash.export import PAGING_PARAMETERS, supports_export
+from tom_alerts_dash.resilience import in_background, LazyExecutor
+from tom_alerts_dash.serializers import get_serializer
+from tom_alerts_dash.target_index import match_alerts
+
+logger = logging.getLogger(__name__)
+
+# Jobs run in their own pool, so that long jobs do not hold up the background requests made for the browse page
+_executor = LazyExecutor('TOM_ALERT_DASH_TARGET_JOB_WORKERS', 2, 'tom_alerts_dash_jobs')
+
+# Queries of brokers in long callback mode run in a separate pool, as they are started by every change of the filters
+_query_executor = LazyExecutor('TOM_ALERT_DASH_QUERY_JOB_WORKERS', 8, 'tom_alerts_dash_queries')
+
+
+def supports_target_jobs(broker):
+    """
+    Whether targets can be created from all of the alerts that match a Dash broker's filters, which requires it to set
+    both ``supports_paging`` and ``supports_dash_parameters``, to build the query parameters from the filters.
+
+    :param broker: The broker
+    :type broker: GenericDashBroker
+
+    :rtype: bool
+    """
+    return supports_export(broker) and broker.supports_dash_parameters
+
+
+def get_job_cache():
+    return caches[getattr(settings, 'TOM_ALERT_DASH_CACHE', 'default')]
+
+
+def get_job_progress(job_id):
+    """
+    Gets the progress of a target creation job, as last reported by the job. Progress is kept in the
+    ``TOM_ALERT_DASH_CACHE`` cache for ``TOM_ALERT_DASH_TARGET_JOB_TTL`` seconds, so that it can be polled from any
+    process.
+
+    :param job_id: The id of the job, as returned by ``start_target_creation_job()``
+    :type job_id: str
+
+    :returns: the status of the job, which is one of ``running``, ``finished``, or ``failed``, along with the number of
+              alerts fetched, the number of targets created, the number of alerts skipped as duplicates, the number of
+              alerts that targets could not be created from, and the error that stopped a failed job, or None if the
+              job is unknown
+    :rtype: dict
+    """
+    return get_serializer().loads(get_job_cache().get(f'tom_alerts_dash:target_job:{job_id}'))
+
+
+def report_progress(job_id, progress):
+    get_job_cache().set(f'tom_alerts_dash:target_job:{job_id}', get_serializer().dumps(progress, 'target_job'),
+                        getattr(settings, 'TOM_ALERT_DASH_TARGET_JOB_TTL', 60 * 60))
+
+
+def create_target_batch(broker, alerts, progress):
+    """
+    Creates targets from a batch of alerts in a single transaction. Each target is created in a savepoint, so that an
+    alert that a target cannot be created from does not roll back the rest of the batch.
+    """
+    with transaction.atomic():
+        for alert in alerts:
+            try:
+                with transaction.atomic():
+                    broker.to_target(alert)
+                progress['created'] += 1
+            except Exception as e:
+                logger.error(f'Unable to create target from alert {alert} due to exception {e}.')
+                progress['errors'] += 1
+
+
+def run_target_creation_job(job_id, broker_name, parameters, notify=None):
+    """
+    Creates targets from all of the alerts from a Dash broker that match a set of query parameters, up to
+    ``TOM_ALERT_DASH_TARGET_JOB_MAX_PAGES`` pages (100 by default). The broker is queried one page at a time, with the
+    lower priority of ``in_background()``, and the targets are created in transactions of
+    ``TOM_ALERT_DASH_TARGET_JOB_BATCH_SIZE`` alerts. Alerts whose objects are already
+    targets in the TOM, including those created earlier in the job, are skipped. Progress is reported after each page is
+    fetched, and after each batch.
+
+    :param job_id: The id of the job
+    :type job_id: str
+
+    :param broker_name: The name of the broker
+    :type broker_name: str
+
+    :param parameters: Query parameters, in the format of the parameters of a saved ``BrokerQuery``
+    :type parameters: dict
+
+    :param notify: Function called with the id of the job whenever progress is reported, such as to push it to the
+                   browse session that started the job
+    :type notify: callable
+
+    :returns: the final progress of the job
+    :rtype: dict
+    """
+    def report():
+        report_progress(job_id, progress)
+        if notify is not None:
+            notify(job_id)
+
+    progress = {'status': 'running', 'fetched': 0, 'created': 0, 'skipped': 0, 'errors': 0, 'error': ''}
+    report()
+    batch_size = getattr(settings, 'TOM_ALERT_DASH_TARGET_JOB_BATCH_SIZE', 100)
+    max_pages = getattr(settings, 'TOM_ALERT_DASH_TARGET_JOB_MAX_PAGES', 100)
+    parameters = {key: value for key, value in parameters.items() if key not in PAGING_PARAMETERS}
+    try:
+        broker = get_service_class(broker_name)()
+        selected_objects = set()
+        with in_background():
+            for page in broker.fetch_dash_pages(parameters, max_pages=max_pages):
+                progress['fetched'] += len(page)
+                alerts = []
+                for alert, match in zip(page, match_alerts(broker, page)):
+                    object_id = broker.get_dash_object_id(alert)
+                    if match >= 0 or (object_id is not None and object_id in selected_objects):
+                        progress['skipped'] += 1
+                        continue
+                    selected_objects.add(object_id)
+                    alerts.append(alert)
+                report()
+                for start in range(0, len(alerts), batch_size):
+                    create_target_batch(broker, alerts[start:start + batch_size], progress)
+                    report()
+        progress['status'] = 'finished'
+    except Exception as e:
+        logger.error(f'Target creation job {job_id} for {broker_name} failed due to error: {e}')
+        progress.update(status='failed', error=str(e))
+    report()
+    logger.info(f'Target creation job {job_id} for {broker_name} {progress["status"]}: {progress}')
+    return progress
+
+
+def _run_in_background(job_id, broker_name, parameters, notify=None):
+    try:
+        return run_target_creation_job(job_id, broker_name, parameters, notify=notify)
+    finally:
+        connections.close_all()  # The worker thread's database connections are not closed by a request
+
+
+def start_target_creation_job(broker_name, parameters, notify=None):
+    """
+    Starts a job that creates targets from all of the alerts from a Dash broker that match a set of query parameters,
+    in a background thread of the web process, so that the callback that starts it returns at once. ``notify`` is
+    called with the id of the job whenever the job reports progress.
+
+    :returns: the id of the job, for use with ``get_job_progress()``
+    :rtype: str
+    """
+    job_id = uuid.uuid4().hex
+    report_progress(job_id, {'status': 'running', 'fetched': 0, 'created': 0, 'skipped': 0, 'errors': 0, 'error': ''})
+    _executor.submit(_run_in_background, job_id, broker_name, parameters, notify=notify)
+    return job_id
+
+
+def supports_long_callback(broker):
+    """
+    Whether a Dash broker's table callback runs in long callback mode, which is the case if the broker sets
+    ``long_callback``, unless ``TOM_ALERT_DASH_LONG_CALLBACKS`` is set to False in ``settings.py``.
+
+    :param broker: The broker
+    :type broker: GenericDashBroker
+
+    :rtype: bool
+    """
+    return broker.long_callback and getattr(settings, 'TOM_ALERT_DASH_LONG_CALLBACKS', True)
+
+
+def get_query_job(job_id):
+    """
+    Gets the state of a query job. The state is kept in the ``TOM_ALERT_DASH_CACHE`` cache for
+    ``TOM_ALERT_DASH_QUERY_JOB_TTL`` seconds, so that it can be polled from any process.
+
+    :param job_id: The id of the job, as returned by ``start_query_job()``
+    :type job_id: str
+
+    :returns: the status of the job, which is one of ``running``, ``finished``, ``prevented``, or ``failed``, along
+              with the outputs of the callback for a finished job, or the error for a failed job, or None if the job is
+              unknown
+    :rtype: dict
+    """
+    return get_serializer().loads(get_job_cache().get(f'tom_alerts_dash:query_job:{job_id}'))
+
+
+def set_query_job(job_id, state):
+    get_job_cache().set(f'tom_alerts_dash:query_job:{job_id}', get_serializer().dumps(state, 'query_job'),
+                        getattr(settings, 'TOM_ALERT_DASH_QUERY_JOB_TTL', 10 * 60))
+
+
+def run_query_job(job_id, callback, *args, notify=None):
+    """
+    Calls a table callback, and stores its outputs as the result of a query job. A callback that prevents the update
+    of the table, such as a query that was superseded by a newer one, is recorded as ``prevented``. ``notify`` is
+    called with the id of the job once its result is stored.
+    """
+    try:
+        set_query_job(job_id, {'status': 'finished', 'outputs': list(callback(*args))})
+    except PreventUpdate:
+        set_query_job(job_id, {'status': 'prevented'})
+    except Exception as e:
+        logger.error(f'Query job {job_id} failed due to error: {e}')
+        set_query_job(job_id, {'status': 'failed', 'error': str(e)})
+    if notify is not None:
+        notify(job_id)
+
+
+def _run_query_in_background(job_id, callback, *args, notify=None):
+    try:
+        run_query_job(job_id, callback, *args, notify=notify)
+    finally:
+        connections.close_all()
+
+
+def start_query_job(callback, *args, notify=None):
+    """
+    Starts a query job that calls a table callback in a background thread of the web process, so that the callback
+    that starts it returns at once, whatever the latency of the broker. ``notify`` is called with the id of the job
+    once it has finished.
+
+    :param callback: The table callback
+    :type callback: callable
+
+    :returns: the id of the job, for use with ``get_query_job()``
+    :rtype: str
+    """
+    job_id = uuid.uuid4().hex
+    set_query_job(job_id, {'status': 'running'})
+    _query_executor.submit(copy_context().run, _run_query_in_background, job_id, callback, *args, notify=notify)
+    return job_id
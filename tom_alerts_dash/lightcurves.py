@@ -0,0 +1,182 @@
+from collections import OrderedDict
+from concurrent.futures import TimeoutError
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+import numpy as np
+
+from tom_alerts_dash.resilience import _executor, get_broker_guard
+from tom_alerts_dash.serializers import get_serializer
+from tom_alerts_dash.singleflight import single_flight
+
+logger = logging.getLogger(__name__)
+
+
+class LightCurveUnavailable(Exception):
+    """
+    Raised when the light curve of an object cannot be fetched from its broker within
+    ``TOM_ALERT_DASH_LIGHT_CURVE_TIMEOUT`` seconds.
+    """
+    pass
+
+
+def supports_light_curves(broker):
+    """
+    Whether a Dash broker provides light curves for the preview of a selected alert, which it declares by setting
+    ``supports_light_curves``.
+
+    :param broker: The broker
+    :type broker: GenericDashBroker
+
+    :rtype: bool
+    """
+    return broker.supports_light_curves
+
+
+class LightCurveCache:
+    """
+    Least recently used cache of the light curves fetched for the preview of a selected alert, keyed by broker and
+    object, and kept for ``TOM_ALERT_DASH_LIGHT_CURVE_TTL`` seconds. Each process holds up to
+    ``TOM_ALERT_DASH_LIGHT_CURVE_CACHE_SIZE`` light curves, above which the least recently used are evicted, and light
+    curves are also stored in the ``TOM_ALERT_DASH_CACHE`` cache, so that they are shared with other processes.
+    """
+    def __init__(self):
+        self._light_curves = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'TOM_ALERT_DASH_CACHE', 'default')]
+
+    @property
+    def size(self):
+        return getattr(settings, 'TOM_ALERT_DASH_LIGHT_CURVE_CACHE_SIZE', 256)
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'TOM_ALERT_DASH_LIGHT_CURVE_TTL', 600)
+
+    @staticmethod
+    def make_key(broker, object_id):
+        return single_flight.make_key(broker, 'light_curve', str(object_id))
+
+    def get(self, key):
+        """
+        :returns: the light curve cached for the key, or None if there is none or it has expired
+        :rtype: list of dicts
+        """
+        with self._lock:
+            if key in self._light_curves:
+                expires, light_curve = self._light_curves[key]
+                if expires >= time.monotonic():
+                    self._light_curves.move_to_end(key)
+                    return light_curve
+                del self._light_curves[key]
+
+        light_curve = get_serializer().loads(self.cache.get(f'tom_alerts_dash:light_curve:{key}'))
+        if light_curve is not None:
+            self._store(key, light_curve)  # Fetched by another process
+        return light_curve
+
+    def put(self, key, light_curve):
+        self.cache.set(f'tom_alerts_dash:light_curve:{key}', get_serializer().dumps(light_curve, 'light_curve'),
+                       self.ttl)
+        self._store(key, light_curve)
+
+    def _store(self, key, light_curve):
+        with self._lock:
+            self._light_curves.pop(key, None)
+            self._light_curves[key] = (time.monotonic() + self.ttl, light_curve)
+            while len(self._light_curves) > self.size:
+                self._light_curves.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._light_curves.clear()
+
+
+light_curve_cache = LightCurveCache()
+
+
+def get_light_curve(broker, alert):
+    """
+    Gets the light curve of the object of an alert from the cache, or fetches it from the broker. The fetch is made in
+    a background thread, subject to the broker's rate limit and circuit breaker, and is shared with concurrent requests
+    for the same object. If it does not complete within ``TOM_ALERT_DASH_LIGHT_CURVE_TIMEOUT`` seconds, it continues
+    in the background, and the light curve is cached once it is fetched.
+
+    :param broker: The broker that returned the alert
+    :type broker: GenericDashBroker
+
+    :param alert: Alert, as returned by the broker
+    :type alert: dict
+
+    :returns: the detections and non-detections of the object, as returned by ``fetch_dash_light_curve()``
+    :rtype: list of dicts
+
+    :raises: LightCurveUnavailable if the light curve is not fetched in time, or cannot be fetched
+    """
+    key = light_curve_cache.make_key(broker.name, broker.get_dash_object_id(alert))
+    light_curve = light_curve_cache.get(key)
+    if light_curve is not None:
+        return light_curve
+
+    def fetch():
+        light_curve, freshness = get_broker_guard(broker.name).call(
+            key, lambda: broker.fetch_dash_light_curve(alert), allow_stale=False
+        )
+        light_curve_cache.put(key, light_curve)
+        return light_curve
+
+    future = _executor.submit(single_flight.do, key, fetch, namespace='light_curve')
+    try:
+        return future.result(timeout=getattr(settings, 'TOM_ALERT_DASH_LIGHT_CURVE_TIMEOUT', 10))
+    except TimeoutError:
+        logger.info(f'Light curve request to {broker.name} is taking too long, continuing in the background')
+        raise LightCurveUnavailable(f'{broker.name} is taking too long to respond. Please select the alert again.')
+    except Exception as e:
+        logger.error(f'Light curve request to {broker.name} failed due to error: {e}')
+        raise LightCurveUnavailable(f'Unable to fetch the light curve from {broker.name}.')
+
+
+def create_light_curve(object_id, light_curve):
+    """
+    Creates the figure of a light curve, with one trace of detections and one trace of upper limits per band. The figure
+    is built as a dict, so that plotly does not need to be imported on the server.
+
+    :param object_id: Identifier of the object, used as the title of the figure
+    :type object_id: str
+
+    :param light_curve: Detections and non-detections, as returned by ``fetch_dash_light_curve()``
+    :type light_curve: list of dicts
+
+    :returns: the figure of the light curve
+    :rtype: dict
+    """
+    data = []
+    for band in sorted({point['band'] for point in light_curve}):
+        points = sorted((point for point in light_curve if point['band'] == band), key=lambda point: point['time'])
+        detections = [point for point in points if point.get('magnitude') is not None]
+        limits = [point for point in points if point.get('magnitude') is None and point.get('limit') is not None]
+        for trace, name, symbol, value in [(detections, band, 'circle', 'magnitude'),
+                                           (limits, f'{band} limit', 'triangle-down-open', 'limit')]:
+            if not trace:
+                continue
+            data.append({
+                'type': 'scatter', 'mode': 'markers', 'name': name, 'legendgroup': band,
+                'x': np.array([point['time'] for point in trace]).round().astype('datetime64[s]').astype(str).tolist(),
+                'y': [point[value] for point in trace], 'marker': {'symbol': symbol},
+                **({'error_y': {'type': 'data', 'array': [point.get('error') or 0 for point in trace]}}
+                   if value == 'magnitude' else {})
+            })
+    return {
+        'data': data,
+        'layout': {
+            'title': str(object_id), 'height': 300, 'margin': {'l': 50, 'r': 10, 't': 30, 'b': 40},
+            'xaxis': {'title': 'Date', 'type': 'date'},
+            'yaxis': {'title': 'Magnitude', 'autorange': 'reversed'},  # Brighter magnitudes are plotted higher
+        }
+    }
@@ -0,0 +1,45 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+
+from tom_alerts_dash.scheduler import run_due_queries, seconds_until_next_run
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """
+    This management command runs the scheduled Dash broker queries that are due, and stores their flattened alerts for
+    the browse page. It can either be run periodically by a cron job, or with ``--loop`` as a long-running worker that
+    sleeps until the next query is due.
+    """
+
+    help = 'Runs the scheduled Dash broker queries that are due, and stores their results.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep running, and run each query whenever it is due'
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=60,
+            help='Maximum number of seconds to sleep between checks for due queries when running with --loop'
+        )
+
+    def handle(self, *args, **options):
+        if not options['loop']:
+            return f'Ran {run_due_queries()} scheduled queries.'
+
+        try:
+            while True:
+                succeeded = run_due_queries()
+                if succeeded:
+                    self.stdout.write(f'Ran {succeeded} scheduled queries.')
+                wait = seconds_until_next_run()
+                time.sleep(options['poll_interval'] if wait is None else min(wait, options['poll_interval']))
+        except KeyboardInterrupt:
+            self.stdout.write('Exiting...')
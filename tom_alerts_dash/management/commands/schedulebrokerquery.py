@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.timezone import now
+
+from tom_alerts.models import BrokerQuery
+from tom_alerts_dash.alerts import get_service_class, get_service_classes
+from tom_alerts_dash.models import ScheduledBrokerQuery
+
+
+class Command(BaseCommand):
+    """
+    This management command schedules a saved broker query to be run in the background by ``runscheduledqueries``, or
+    removes it from the schedule.
+    """
+
+    help = 'Schedules a saved query for a Dash broker to run every INTERVAL minutes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'query_name',
+            help='Name of the saved query to schedule'
+        )
+        parser.add_argument(
+            'interval',
+            type=int,
+            nargs='?',
+            help='Number of minutes between runs'
+        )
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            help='Only fetch the alerts that are newer than the previous run, and add them to the stored results'
+        )
+        parser.add_argument(
+            '--remove',
+            action='store_true',
+            help='Remove the query from the schedule, along with its stored results'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            query = BrokerQuery.objects.get(name=options['query_name'])
+        except (BrokerQuery.DoesNotExist, BrokerQuery.MultipleObjectsReturned) as e:
+            raise CommandError(f'Unable to find a single saved query named {options["query_name"]}: {e}')
+
+        if options['remove']:
+            ScheduledBrokerQuery.objects.filter(query=query).delete()
+            return f'Removed {query.name} from the schedule.'
+
+        if query.broker not in get_service_classes():
+            raise CommandError(f'{query.broker} is not a Dash broker. Did you add it to TOM_ALERT_DASH_CLASSES?')
+        if not get_service_class(query.broker).supports_paging:
+            raise CommandError(f'{query.broker} does not support running saved queries in the background.')
+        if not options['interval'] or options['interval'] < 1:
+            raise CommandError('An interval of at least 1 minute is required.')
+
+        if options['incremental'] and get_service_class(query.broker)().get_incremental_parameters({}, now()) is None:
+            raise CommandError(f'{query.broker} does not support incremental queries.')
+
+        ScheduledBrokerQuery.objects.update_or_create(
+            query=query, defaults={'interval': options['interval'], 'incremental': options['incremental']}
+        )
+        return f'Scheduled {query.name} to run every {options["interval"]} minutes.'
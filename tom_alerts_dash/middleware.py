@@ -0,0 +1,80 @@
+import gzip
+import re
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # Responses are only compressed with gzip unless brotli is installed
+    brotli = None
+
+# The path of the callback endpoint of the browse app, as routed by django_plotly_dash
+DASH_UPDATE_PATH = re.compile(r'/BrokerQueryListViewDash/_dash-update-component$')
+
+# Responses smaller than this are not compressed, as compression would save little or make them larger
+MIN_COMPRESSED_SIZE = 200
+
+
+def negotiate_encoding(accept_encoding):
+    """
+    Chooses the encoding of a response from the ``Accept-Encoding`` header of its request, preferring brotli, if it is
+    installed, to gzip. Encodings given a quality of 0 are not accepted.
+
+    :param accept_encoding: The ``Accept-Encoding`` header of the request
+    :type accept_encoding: str
+
+    :returns: ``br``, ``gzip``, or None if neither is accepted
+    :rtype: str
+    """
+    accepted = set()
+    for part in accept_encoding.split(','):
+        encoding, _, parameters = part.strip().partition(';')
+        quality = re.match(r'^\s*q\s*=\s*([0-9.]+)\s*$', parameters)
+        if quality is None or float(quality.group(1)) > 0:
+            accepted.add(encoding.strip().lower())
+    if brotli is not None and accepted & {'br', '*'}:
+        return 'br'
+    if accepted & {'gzip', '*'}:
+        return 'gzip'
+    return None
+
+
+def compress(content, encoding):
+    """
+    Compresses the body of a response. The compression levels favor speed, as callback responses are compressed on
+    each request.
+
+    :rtype: bytes
+    """
+    if encoding == 'br':
+        return brotli.compress(content, quality=getattr(settings, 'TOM_ALERT_DASH_BROTLI_QUALITY', 4))
+    return gzip.compress(content, compresslevel=getattr(settings, 'TOM_ALERT_DASH_GZIP_LEVEL', 6))
+
+
+class CompressedDashResponseMiddleware:
+    """
+    Middleware that compresses the responses to the callbacks of the browse app, which carry the pages of alerts shown
+    in its DataTables, with brotli or gzip, as negotiated with the ``Accept-Encoding`` header of the request. Other
+    responses are left to ``django.middleware.gzip.GZipMiddleware``, if it is enabled.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if (not DASH_UPDATE_PATH.search(request.path) or response.streaming or response.has_header('Content-Encoding')
+                or len(response.content) < MIN_COMPRESSED_SIZE):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = negotiate_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+        compressed = compress(response.content, encoding)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        return response
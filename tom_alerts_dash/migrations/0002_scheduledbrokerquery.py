@@ -0,0 +1,31 @@
+# Generated by Django 4.0.10 on 2026-10-19 01:42
+
+import django.core.serializers.json
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('tom_alerts', '0004_auto_20210204_2300'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduledBrokerQuery',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('interval', models.PositiveIntegerField(help_text='Number of minutes between runs')),
+                ('next_run', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('last_run', models.DateTimeField(blank=True, null=True)),
+                ('alerts', models.JSONField(default=list, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('query', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE,
+                                               related_name='dash_schedule', to='tom_alerts.brokerquery')),
+            ],
+        ),
+    ]
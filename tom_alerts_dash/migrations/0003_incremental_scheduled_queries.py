@@ -0,0 +1,23 @@
+# Generated by Django 4.0.10 on 2026-10-19 01:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tom_alerts_dash', '0002_scheduledbrokerquery'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scheduledbrokerquery',
+            name='high_water_mark',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='scheduledbrokerquery',
+            name='incremental',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,54 @@
+from datetime import timedelta
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+from django.utils import timezone
+
+from tom_alerts.models import BrokerQuery
+
+
+class ScheduledBrokerQuery(models.Model):
+    """
+    Schedule on which a saved ``BrokerQuery`` for a Dash broker is run in the background by the ``runscheduledqueries``
+    management command, along with the flattened alerts from its latest run.
+
+    :param query: The saved query to run
+    :type query: BrokerQuery
+
+    :param interval: Number of minutes between runs
+    :type interval: int
+
+    :param next_run: Time at which the query is next due to run
+    :type next_run: datetime
+
+    :param last_run: Time at which the query last ran successfully
+    :type last_run: datetime
+
+    :param alerts: Alerts from the latest run, as returned by the broker's ``flatten_dash_alerts()``
+    :type alerts: list of dicts
+
+    :param last_error: Error raised by the latest run, if it failed
+    :type last_error: str
+
+    :param incremental: Whether each run only fetches the alerts that are newer than the high-water mark, and merges
+                        them into the stored alerts, rather than fetching and replacing all of the alerts
+    :type incremental: bool
+
+    :param high_water_mark: Time of the newest alert fetched by a successful run, less an overlap, used as the lower
+                            time bound of the next incremental run
+    :type high_water_mark: datetime
+    """
+    query = models.OneToOneField(BrokerQuery, on_delete=models.CASCADE, related_name='dash_schedule')
+    interval = models.PositiveIntegerField(help_text='Number of minutes between runs')
+    next_run = models.DateTimeField(default=timezone.now, db_index=True)
+    last_run = models.DateTimeField(null=True, blank=True)
+    alerts = models.JSONField(default=list, encoder=DjangoJSONEncoder)
+    last_error = models.TextField(blank=True, default='')
+    incremental = models.BooleanField(default=False)
+    high_water_mark = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f'{self.query.name} every {self.interval} minutes'
+
+    def get_next_run(self, now):
+        return now + timedelta(minutes=self.interval)
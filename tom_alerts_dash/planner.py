@@ -0,0 +1,301 @@
+from itertools import compress
+import json
+import logging
+import operator
+
+from django.conf import settings
+from django.core.cache import caches
+import numpy as np
+
+from tom_alerts_dash.serializers import get_serializer
+from tom_alerts_dash.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+OPERATORS = {
+    'lt': operator.lt,
+    'lte': operator.le,
+    'gt': operator.gt,
+    'gte': operator.ge,
+    'eq': operator.eq,
+}
+
+
+class Constraint:
+    """
+    Declares a query parameter of a broker as a predicate on the alerts that the broker returns, so that the query
+    planner can evaluate it on alerts that have already been fetched.
+
+    :param parameter: The query parameter, as stored in the parameters of a saved ``BrokerQuery``, such as
+                      ``magpsf__lte``
+    :type parameter: str
+
+    :param source: The path of the value in the alert, as keys separated by dots, such as ``candidate.magpsf``
+    :type source: str
+
+    :param operator: The comparison of the value in the alert with the value of the parameter, one of ``lt``, ``lte``,
+                     ``gt``, ``gte``, or ``eq``
+    :type operator: str
+
+    :param pushdown: Whether the broker's API supports the parameter, so that it is sent to the broker. Constraints that
+                     are not pushed down are removed from the request, and evaluated on the alerts that it returns.
+    :type pushdown: bool
+    """
+    __slots__ = ('parameter', 'source', 'operator', 'pushdown', '_keys')
+
+    def __init__(self, parameter, source, operator, pushdown=True):
+        if operator not in OPERATORS:
+            raise ValueError(f'Unsupported operator {operator} for {parameter}')
+        self.parameter = parameter
+        self.source = source
+        self.operator = operator
+        self.pushdown = pushdown
+        self._keys = source.split('.')
+
+    def get_values(self, alerts):
+        """
+        Gets the values of the constraint's source from a list of alerts, with None for the alerts that are missing it.
+
+        :rtype: list
+        """
+        values = alerts
+        for key in self._keys:
+            values = [value.get(key) if isinstance(value, dict) else None for value in values]
+        return values
+
+    def evaluate(self, alerts, value):
+        """
+        Evaluates the constraint on a list of alerts, comparing the values of all of them with a single array
+        operation where they are numeric. Alerts that are missing the value do not match.
+
+        :param alerts: Alerts, as returned by the broker
+        :type alerts: list of dicts
+
+        :param value: The value of the parameter
+        :type value: float or str
+
+        :returns: whether each alert matches
+        :rtype: numpy.ndarray of bool
+        """
+        compare = OPERATORS[self.operator]
+        values = self.get_values(alerts)
+        try:
+            numbers = np.array(values, dtype=float)  # Missing values become NaN, which does not match
+            return compare(numbers, float(value))
+        except (TypeError, ValueError):
+            return np.array([alert_value is not None and compare(alert_value, value) for alert_value in values],
+                            dtype=bool)
+
+    def implies(self, value, other, other_value):
+        """
+        Checks whether every alert that matches this constraint with ``value`` also matches the ``other`` constraint
+        with ``other_value``, in which case the results of a query with the other constraint are a superset of those of
+        a query with this one.
+
+        :rtype: bool
+        """
+        if self.source != other.source:
+            return False
+        try:
+            if self.operator == 'eq':
+                return OPERATORS[other.operator](value, other_value)
+            if other.operator == 'eq':
+                return False
+            upper = self.operator in ('lt', 'lte')
+            if upper != (other.operator in ('lt', 'lte')):
+                return False
+            if value == other_value:
+                # An inclusive bound only implies an inclusive bound, while an exclusive one implies either
+                return self.operator in ('lt', 'gt') or other.operator in ('lte', 'gte')
+            return value < other_value if upper else value > other_value
+        except TypeError:
+            return False
+
+
+class QueryPlan:
+    """
+    The plan of a query, as made by ``QueryPlanner.plan()``.
+
+    :param parameters: The parameters to send to the broker, without the parameters of residual constraints
+    :type parameters: dict
+
+    :param predicates: The constraints of the query that have values, along with their values
+    :type predicates: list of tuples
+
+    :param base: The parameters of the query that are not constraints or the page number, which must be equal for the
+                 results of one query to be answered from those of another
+    :type base: dict
+
+    :param page: The page of the results that is requested
+    :type page: int
+    """
+    def __init__(self, parameters, predicates, base, page):
+        self.parameters = parameters
+        self.predicates = predicates
+        self.base = base
+        self.page = page
+
+    @property
+    def pushed_down(self):
+        return [(constraint, value) for constraint, value in self.predicates if constraint.pushdown]
+
+    @property
+    def residual(self):
+        return [(constraint, value) for constraint, value in self.predicates if not constraint.pushdown]
+
+
+class QueryPlanner:
+    """
+    Query planner of a Dash broker, which splits the parameters of a query into those that are pushed down to the
+    broker, and residual predicates that the broker's API does not support, which are evaluated on the alerts that it
+    returns. A page of a DataTable is filled from as many of the broker's pages as it takes to hold a full page of
+    alerts that match the residual predicates, while the pages of a saved query hold the alerts of each of the broker's
+    pages that match.
+
+    The planner also answers narrowing queries, such as a tighter magnitude cut, without a request to the broker. The
+    first page of results is kept in the ``TOM_ALERT_DASH_CACHE`` cache for ``TOM_ALERT_DASH_SUPERSET_TIMEOUT`` seconds
+    if it holds all of the results of its query, and a later query whose results are a subset of them, as it has the
+    same parameters other than narrower constraints, is answered by evaluating its constraints on the kept results.
+
+    :param constraints: The parameters of the broker that are predicates on its alerts
+    :type constraints: list of Constraint
+
+    :param results_key: The key of the list of alerts in the broker's responses
+    :type results_key: str
+
+    :param is_complete: Function that takes the parameters of a query for the first page of results and the broker's
+                        response, and returns whether the response holds all of the results of the query
+    :type is_complete: callable
+    """
+    # Number of complete results that are kept for each set of base parameters
+    max_supersets = 8
+
+    def __init__(self, constraints, results_key, is_complete):
+        self.constraints = constraints
+        self.results_key = results_key
+        self.is_complete = is_complete
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'TOM_ALERT_DASH_CACHE', 'default')]
+
+    @property
+    def timeout(self):
+        return getattr(settings, 'TOM_ALERT_DASH_SUPERSET_TIMEOUT', 300)
+
+    @property
+    def max_refill_pages(self):
+        return getattr(settings, 'TOM_ALERT_DASH_RESIDUAL_MAX_PAGES', 10)
+
+    def plan(self, parameters):
+        """
+        Plans a query.
+
+        :param parameters: Query parameters, in the format of the parameters of a saved ``BrokerQuery``
+        :type parameters: dict
+
+        :rtype: QueryPlan
+        """
+        constraints = {constraint.parameter: constraint for constraint in self.constraints}
+        request_parameters, predicates, base = {}, [], {}
+        for parameter, value in parameters.items():
+            constraint = constraints.get(parameter)
+            if constraint is None:
+                request_parameters[parameter] = value
+                if parameter != 'page':
+                    base[parameter] = value
+                continue
+            if constraint.pushdown:
+                request_parameters[parameter] = value
+            if value is not None and value != '':
+                predicates.append((constraint, value))
+        return QueryPlan(request_parameters, predicates, base, parameters.get('page') or 1)
+
+    def filter(self, alerts, predicates):
+        """
+        Filters alerts by predicates, each of which is evaluated on all of the alerts at once.
+
+        :param alerts: Alerts, as returned by the broker
+        :type alerts: list of dicts
+
+        :param predicates: Constraints and their values
+        :type predicates: list of tuples
+
+        :returns: the alerts that match all of the predicates
+        :rtype: list of dicts
+        """
+        if not predicates or not alerts:
+            return alerts
+        mask = np.ones(len(alerts), dtype=bool)
+        for constraint, value in predicates:
+            mask &= constraint.evaluate(alerts, value)
+        return list(compress(alerts, mask))
+
+    def filter_response(self, response, predicates):
+        """
+        Filters the alerts of a broker response by predicates.
+
+        :returns: a copy of the response with the alerts that match all of the predicates
+        :rtype: dict
+        """
+        if not predicates:
+            return response
+        return {**response, self.results_key: self.filter(response[self.results_key], predicates)}
+
+    def _make_key(self, name, plan):
+        base = json.dumps(plan.base, sort_keys=True, default=str)
+        return f'tom_alerts_dash:superset:{SingleFlight.make_key(name, base)}'
+
+    def answer(self, name, plan):
+        """
+        Answers a query from the kept results of a query whose results are a superset of its results, if there are any.
+
+        :param name: The name of the broker
+        :type name: str
+
+        :param plan: The plan of the query
+        :type plan: QueryPlan
+
+        :returns: the response of the query, along with the time at which the superset was fetched, or None
+        :rtype: tuple
+        """
+        if plan.page != 1:
+            return None  # Later pages cannot be told apart from the first once the superset is filtered
+        entries = get_serializer().loads(self.cache.get(self._make_key(name, plan))) or []
+        constraints = {constraint.parameter: constraint for constraint in self.constraints}
+        for entry in entries:
+            superset_predicates = [(constraints[parameter], value) for parameter, value in entry['predicates']
+                                   if parameter in constraints]
+            if all(any(constraint.implies(value, superset_constraint, superset_value)
+                       for constraint, value in plan.predicates)
+                   for superset_constraint, superset_value in superset_predicates):
+                logger.info(f'Answering {name} query from the results of a broader query')
+                return self.filter_response(entry['response'], plan.predicates), entry['fetched_at']
+        return None
+
+    def keep(self, name, plan, response, fetched_at):
+        """
+        Keeps the response to a query to answer narrower queries, if it holds all of the results of the query. The
+        response must be as returned by the broker, before residual predicates are evaluated.
+
+        :param name: The name of the broker
+        :type name: str
+
+        :param plan: The plan of the query
+        :type plan: QueryPlan
+
+        :param response: The broker's response
+        :type response: dict
+
+        :param fetched_at: The Unix time at which the response was fetched
+        :type fetched_at: float
+        """
+        if plan.page != 1 or not self.is_complete(plan.parameters, response):
+            return
+        key = self._make_key(name, plan)
+        serializer = get_serializer()
+        entries = serializer.loads(self.cache.get(key)) or []
+        predicates = [[constraint.parameter, value] for constraint, value in plan.pushed_down]
+        entries = [entry for entry in entries if entry['predicates'] != predicates]
+        entries.insert(0, {'predicates': predicates, 'fetched_at': fetched_at, 'response': response})
+        self.cache.set(key, serializer.dumps(entries[:self.max_supersets], name), self.timeout)
@@ -0,0 +1,86 @@
+from importlib.util import find_spec
+import json
+import logging
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+logger = logging.getLogger(__name__)
+
+
+def push_enabled():
+    """
+    Whether updates are pushed to the browse page over a WebSocket, as specified by ``TOM_ALERT_DASH_PUSH`` in
+    ``settings.py``, which requires channels to be installed, and the app to be served by the ASGI application.
+    Defaults to ``False``, in which case the browse page polls for updates.
+
+    :rtype: bool
+    """
+    return getattr(settings, 'TOM_ALERT_DASH_PUSH', False) and find_spec('channels') is not None
+
+
+def get_session_channel(client_id):
+    """
+    Gets the name of the channel on which updates are pushed to a browse session, such as the completion of its
+    queries and the progress of its target creation jobs.
+
+    :param client_id: The identifier of the browse session
+    :type client_id: str
+
+    :rtype: str
+    """
+    return f'tom_alerts_dash_session_{client_id}'
+
+
+def get_saved_query_channel(query_id):
+    """
+    Gets the name of the channel on which the alerts fetched by the scheduled runs of a saved query are announced to
+    the browse sessions that are open for the saved query.
+
+    :param query_id: The id of the saved query
+    :type query_id: int
+
+    :rtype: str
+    """
+    return f'tom_alerts_dash_query_{query_id}'
+
+
+def push(channel_name, label, value):
+    """
+    Pushes a value to the ``Pipe`` components with the given label that listen on a channel. Pushing is a no-op unless
+    ``push_enabled()``, and failures are logged rather than raised, as the browse page does not depend on them.
+
+    :param channel_name: The name of the channel
+    :type channel_name: str
+
+    :param label: The label of the ``Pipe`` components that receive the value
+    :type label: str
+
+    :param value: The value, which is sent as JSON
+    :type value: dict
+
+    :returns: whether the value was pushed
+    :rtype: bool
+    """
+    if not push_enabled():
+        return False
+    # The consumers module imports channels, which is only imported when updates are pushed
+    from django_plotly_dash.consumers import send_to_pipe_channel
+    try:
+        send_to_pipe_channel(channel_name=channel_name, label=label, value=json.dumps(value, cls=DjangoJSONEncoder))
+    except Exception as e:
+        logger.error(f'Unable to push {label} to channel {channel_name} due to error: {e}')
+        return False
+    return True
+
+
+def session_notifier(client_id, label):
+    """
+    Creates a function that pushes the id of a job to a browse session, for the jobs started by the session.
+
+    :returns: function that takes the id of a job, or None if updates are not pushed or the session is unknown
+    :rtype: callable
+    """
+    if not push_enabled() or not client_id:
+        return None
+    return lambda job_id: push(get_session_channel(client_id), label, {'job_id': job_id})
@@ -0,0 +1,335 @@
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from tom_alerts_dash.serializers import get_serializer
+
+logger = logging.getLogger(__name__)
+
+# Limits applied to each Dash broker's requests, unless overridden in TOM_ALERT_DASH_BROKER_LIMITS, either for all
+# brokers under the 'default' key, or for a single broker under the broker's name.
+DEFAULT_BROKER_LIMITS = {
+    'rate': 5,  # Sustained number of requests per second
+    'burst': 10,  # Number of requests that can be made at once after a quiet period
+    'failure_threshold': 5,  # Number of consecutive failures after which the circuit is opened
+    'reset_timeout': 30,  # Seconds that the circuit stays open before a trial request is allowed
+    'latency_budget': 5,  # Seconds to wait on a request before serving a stale result, if one exists
+    'stale_timeout': 60 * 60 * 24,  # Seconds that the last successful result is kept for serving stale
+    'interactive_reserve': 5,  # Tokens of the burst that background requests leave for users of the browse page
+    'background_timeout': 60,  # Seconds that background requests wait for a token of the rate limit
+}
+
+# Freshness of the last broker response returned to the current callback, as a Freshness object, or None
+response_freshness = ContextVar('response_freshness', default=None)
+
+# Set while making requests that no user is waiting on, such as for exports and target creation jobs, which have a
+# lower priority than the requests of the browse page
+background_request = ContextVar('background_request', default=False)
+
+
+@contextmanager
+def in_background():
+    """
+    Context manager that gives the broker requests made within it the lower priority of ``background_request``.
+    """
+    token = background_request.set(True)
+    try:
+        yield
+    finally:
+        background_request.reset(token)
+
+
+class LazyExecutor:
+    """
+    Thread pool that is created the first time a task is submitted to it, rather than on import, so that its number of
+    workers is read from settings when it is first used.
+
+    :param setting: The setting that specifies the number of workers
+    :type setting: str
+
+    :param default_workers: The number of workers if the setting is not set
+    :type default_workers: int
+
+    :param thread_name_prefix: The prefix of the names of the worker threads
+    :type thread_name_prefix: str
+    """
+    def __init__(self, setting, default_workers, thread_name_prefix):
+        self.setting = setting
+        self.default_workers = default_workers
+        self.thread_name_prefix = thread_name_prefix
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=getattr(settings, self.setting, self.default_workers),
+                                                    thread_name_prefix=self.thread_name_prefix)
+            return self._executor
+
+    def submit(self, fn, *args, **kwargs):
+        return self.executor.submit(fn, *args, **kwargs)
+
+    def map(self, fn, *iterables):
+        return self.executor.map(fn, *iterables)
+
+
+_executor = LazyExecutor('TOM_ALERT_DASH_BACKGROUND_WORKERS', 4, 'tom_alerts_dash')
+
+
+class BrokerUnavailable(Exception):
+    """
+    Raised when a broker cannot be queried, due to its circuit being open or its rate limit being reached, and there is
+    no stale result to serve in its place.
+    """
+    pass
+
+
+class Freshness:
+    """
+    Time at which a broker response was fetched, and whether it is a stale result served in place of a fresh one, the
+    stored result of a scheduled run of the named saved query, or narrowed from the kept result of a broader query.
+    """
+    def __init__(self, fetched_at, stale=False, saved_query=None, narrowed=False):
+        self.fetched_at = fetched_at
+        self.stale = stale
+        self.saved_query = saved_query
+        self.narrowed = narrowed
+
+    @property
+    def fetched_at_datetime(self):
+        return datetime.fromtimestamp(self.fetched_at, tz=timezone.utc)
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter. Tokens are added at ``rate`` per second, up to ``burst`` tokens, and each request takes
+    one token. A request can leave a reserve of tokens for others, so that it only takes a token once there are more.
+    """
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _take(self, reserve):
+        """
+        Takes a token if one is available above the reserve. Returns the number of seconds until the next token
+        otherwise.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1 + reserve:
+                self.tokens -= 1
+                return 0
+            return (1 + reserve - self.tokens) / self.rate
+
+    def acquire(self, timeout=0, reserve=0):
+        """
+        Takes a token, waiting up to ``timeout`` seconds for one to become available.
+
+        :param reserve: Number of tokens to leave for other requests, which is capped so that one token can be taken
+        :type reserve: int
+
+        :returns: whether a token was taken
+        :rtype: bool
+        """
+        reserve = max(0, min(reserve, self.burst - 1))
+        deadline = time.monotonic() + timeout
+        while True:
+            wait = self._take(reserve)
+            if not wait:
+                return True
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker that opens after ``failure_threshold`` consecutive failures. While open, requests are rejected.
+    After ``reset_timeout`` seconds, the circuit is half-open, and a single trial request is allowed: the circuit closes
+    if it succeeds and opens again if it fails.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow_request(self):
+        """
+        :returns: whether a request may be made
+        :rtype: bool
+        """
+        with self._lock:
+            state = self.state
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def release(self):
+        """
+        Gives up a request that was allowed by ``allow_request()`` without making it.
+        """
+        with self._lock:
+            self.trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class BrokerGuard:
+    """
+    Applies a rate limit, a circuit breaker, and a latency budget to the requests made to a single broker, and keeps the
+    last successful result for each query so that it can be served stale when the broker is slow or unavailable.
+
+    When a stale result exists, the request is made in a background thread. If it does not complete within the latency
+    budget, or fails, the stale result is returned, and the request continues in the background to refresh it. While
+    the circuit is open, the stale result is returned immediately.
+
+    Requests made while ``background_request`` is set share the rate limit, but only take a token while more than
+    ``interactive_reserve`` are left, and wait up to ``background_timeout`` for one, so that a long export does not use
+    up the requests of the users of the browse page.
+    """
+    def __init__(self, name, rate, burst, failure_threshold, reset_timeout, latency_budget, stale_timeout,
+                 interactive_reserve=0, background_timeout=60):
+        self.name = name
+        self.latency_budget = latency_budget
+        self.stale_timeout = stale_timeout
+        self.interactive_reserve = interactive_reserve
+        self.background_timeout = background_timeout
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'TOM_ALERT_DASH_CACHE', 'default')]
+
+    def _fetch(self, key, func, keep=True):
+        try:
+            response = func()
+        except Exception as e:
+            logger.warning(f'Request to {self.name} failed: {e}')
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+        fetched_at = time.time()
+        if keep:
+            self.cache.set(f'tom_alerts_dash:last:{key}', get_serializer().dumps((fetched_at, response), self.name),
+                           self.stale_timeout)
+        return response, Freshness(fetched_at)
+
+    def call(self, key, func, allow_stale=True):
+        """
+        Calls ``func`` subject to this broker's limits.
+
+        :param key: Key identifying the query, as returned by ``SingleFlight.make_key()``
+        :type key: str
+
+        :param func: Function that takes no arguments and makes the request to the broker
+        :type func: callable
+
+        :param allow_stale: Whether the last successful result may be returned stale, and the result of this call kept
+                            to be returned stale later. If not, the call waits on the rate limit for up to the latency
+                            budget, and then on the request itself.
+        :type allow_stale: bool
+
+        :returns: the response, and its freshness
+        :rtype: tuple
+
+        :raises: BrokerUnavailable if the request cannot be made and there is no stale result
+        """
+        last = get_serializer().loads(self.cache.get(f'tom_alerts_dash:last:{key}')) if allow_stale else None
+        stale = (last[1], Freshness(last[0], stale=True)) if last else None
+
+        if not self.breaker.allow_request():
+            if stale:
+                logger.info(f'Circuit for {self.name} is open, serving stale result')
+                return stale
+            raise BrokerUnavailable(f'{self.name} is currently unavailable. Please try again later.')
+
+        if background_request.get():
+            acquired = self.bucket.acquire(timeout=self.background_timeout, reserve=self.interactive_reserve)
+        else:
+            acquired = self.bucket.acquire(timeout=0 if stale else self.latency_budget)
+        if not acquired:
+            self.breaker.release()
+            if stale:
+                logger.info(f'Rate limit for {self.name} reached, serving stale result')
+                return stale
+            raise BrokerUnavailable(f'Too many requests to {self.name}. Please try again later.')
+
+        if not stale:
+            return self._fetch(key, func, keep=allow_stale)
+
+        future = _executor.submit(self._fetch, key, func)
+        try:
+            return future.result(timeout=self.latency_budget)
+        except TimeoutError:
+            logger.info(f'Request to {self.name} exceeded latency budget, serving stale result')
+            return stale
+        except Exception:
+            return stale
+
+
+_guards = {}
+_guards_lock = threading.Lock()
+
+
+def get_broker_guard(name):
+    """
+    Gets the guard for a broker, configured from ``DEFAULT_BROKER_LIMITS`` and ``TOM_ALERT_DASH_BROKER_LIMITS``. Guards
+    are shared by all requests to the broker in this process.
+
+    :param name: Name of the broker
+    :type name: str
+
+    :rtype: BrokerGuard
+    """
+    with _guards_lock:
+        if name not in _guards:
+            configured_limits = getattr(settings, 'TOM_ALERT_DASH_BROKER_LIMITS', {})
+            limits = dict(DEFAULT_BROKER_LIMITS)
+            limits.update(configured_limits.get('default', {}))
+            limits.update(configured_limits.get(name, {}))
+            _guards[name] = BrokerGuard(name, **limits)
+        return _guards[name]
@@ -0,0 +1,200 @@
+from datetime import timedelta
+import logging
+
+from django.conf import settings
+from django.utils import timezone
+
+from tom_alerts.models import BrokerQuery
+from tom_alerts_dash.alerts import get_service_class
+from tom_alerts_dash.columns import AlertRows
+from tom_alerts_dash.models import ScheduledBrokerQuery
+from tom_alerts_dash.push import get_saved_query_channel, push
+from tom_alerts_dash.resilience import BrokerUnavailable, response_freshness
+
+logger = logging.getLogger(__name__)
+
+
+def get_max_pages():
+    """
+    Gets the maximum number of broker pages fetched by each run of a scheduled query, as specified by
+    ``TOM_ALERT_DASH_SCHEDULED_QUERY_MAX_PAGES`` in ``settings.py``. Defaults to 10.
+
+    :rtype: int
+    """
+    return getattr(settings, 'TOM_ALERT_DASH_SCHEDULED_QUERY_MAX_PAGES', 10)
+
+
+def get_max_alerts():
+    """
+    Gets the maximum number of alerts stored for each scheduled query, as specified by
+    ``TOM_ALERT_DASH_SCHEDULED_QUERY_MAX_ALERTS`` in ``settings.py``. Defaults to 10,000.
+
+    :rtype: int
+    """
+    return getattr(settings, 'TOM_ALERT_DASH_SCHEDULED_QUERY_MAX_ALERTS', 10000)
+
+
+def get_incremental_overlap():
+    """
+    Gets how far before the newest alert fetched by a run of an incremental query its next run requests alerts from, as
+    specified in seconds by ``TOM_ALERT_DASH_INCREMENTAL_OVERLAP`` in ``settings.py``. Defaults to 10 minutes. The
+    overlap covers alerts that reach the broker after newer ones, and the alerts in it that are fetched again are
+    merged with their stored copy.
+
+    :rtype: timedelta
+    """
+    return timedelta(seconds=getattr(settings, 'TOM_ALERT_DASH_INCREMENTAL_OVERLAP', 600))
+
+
+def merge_alerts(broker, new_alerts, stored_alerts, max_alerts=None):
+    """
+    Merges the flattened alerts fetched by an incremental run into the stored alerts. New alerts are placed first, and
+    replace any stored alert with the same ``get_dash_alert_id()``. Beyond ``max_alerts``, the oldest stored alerts are
+    dropped.
+
+    :param broker: The broker that the alerts are from
+    :type broker: GenericDashBroker
+
+    :param new_alerts: Flattened alerts fetched by the incremental run
+    :type new_alerts: list of dicts
+
+    :param stored_alerts: Flattened alerts stored by previous runs
+    :type stored_alerts: list of dicts
+
+    :param max_alerts: Maximum number of merged alerts, or None to keep all of them
+    :type max_alerts: int
+
+    :returns: merged alerts
+    :rtype: list of dicts
+    """
+    def alert_id(alert):
+        return broker.get_dash_alert_id(alert['alert']) if 'alert' in alert else None
+
+    new_ids = {alert_id(alert) for alert in new_alerts} - {None}
+    return (new_alerts + [alert for alert in stored_alerts if alert_id(alert) not in new_ids])[:max_alerts]
+
+
+def run_scheduled_query(scheduled_query):
+    """
+    Runs a scheduled query against its Dash broker, and stores up to ``get_max_alerts()`` of the flattened alerts from
+    its pages, up to ``get_max_pages()``, in place of the alerts from its previous run. The ``last_run`` of the saved
+    query is updated, as it is when the query is run from the saved query list. If updates are pushed, the browse pages
+    that are open for the saved query are told to refresh their stored results.
+
+    An incremental query that has run before, and whose broker supports incremental queries, only requests the alerts
+    that are newer than its ``high_water_mark``, and merges them into the stored alerts. The high-water mark is moved
+    to the time of the newest alert fetched, by ``get_dash_alert_time()``, less ``get_incremental_overlap()``, as it is
+    compared against the times of the alerts rather than the time of the run. It is left unchanged by a run that fetches
+    no alerts with a time. Incremental runs are also limited to ``get_max_pages()``, and one that reaches it is logged,
+    as it may not have fetched all of the new alerts.
+
+    The pages are requested without allowing stale responses. A run that is given a stale response in place of a fresh
+    one fails, and leaves the stored alerts, ``last_run``, and ``high_water_mark`` unchanged, so that the alerts that
+    the broker did not return are requested again by the next run.
+
+    :param scheduled_query: The scheduled query to run
+    :type scheduled_query: ScheduledBrokerQuery
+
+    :returns: number of alerts fetched
+    :rtype: int
+
+    :raises: BrokerUnavailable if the broker cannot be queried, or only returns stale responses
+    """
+    query = scheduled_query.query
+    broker = get_service_class(query.broker)()
+
+    parameters = None
+    if scheduled_query.incremental and scheduled_query.high_water_mark:
+        parameters = broker.get_incremental_parameters(query.parameters, scheduled_query.high_water_mark)
+
+    rows = AlertRows([], [])
+    newest = None
+    page_count = 0
+    token = response_freshness.set(None)
+    try:
+        for page in broker.fetch_dash_pages(parameters or query.parameters, max_pages=get_max_pages()):
+            freshness = response_freshness.get()
+            if freshness is not None and freshness.stale:
+                raise BrokerUnavailable(f'{broker.name} only returned results from {freshness.fetched_at_datetime}.')
+            rows.extend(broker.flatten_dash_rows(page))
+            for time in filter(None, map(broker.get_dash_alert_time, page)):
+                newest = max(newest, time) if newest else time
+            page_count += 1
+    finally:
+        response_freshness.reset(token)
+    alerts = rows.to_dicts()  # The stored alerts are formatted for display once all pages have been fetched
+    if parameters and page_count == get_max_pages():
+        logger.warning(f'Scheduled query {query.name} fetched the maximum of {page_count} pages of new alerts, so some '
+                       f'new alerts may not have been fetched. Consider running it more often.')
+
+    high_water_mark = scheduled_query.high_water_mark
+    if newest is not None:
+        high_water_mark = newest - get_incremental_overlap()
+        if scheduled_query.high_water_mark:
+            high_water_mark = max(high_water_mark, scheduled_query.high_water_mark)  # The mark never moves back
+
+    now = timezone.now()
+    if parameters:
+        scheduled_query.alerts = merge_alerts(broker, alerts, scheduled_query.alerts, max_alerts=get_max_alerts())
+    else:
+        scheduled_query.alerts = alerts[:get_max_alerts()]
+    scheduled_query.last_run = now
+    scheduled_query.high_water_mark = high_water_mark
+    scheduled_query.last_error = ''
+    scheduled_query.save(update_fields=['alerts', 'last_run', 'high_water_mark', 'last_error'])
+    BrokerQuery.objects.filter(pk=query.pk).update(last_run=now)
+    push(get_saved_query_channel(query.id), 'alerts', {'fetched': len(alerts), 'last_run': now})
+    return len(alerts)
+
+
+def claim(scheduled_query, now):
+    """
+    Moves the next run of a due query forward by its interval, unless another worker has already done so. As the update
+    only succeeds for a single worker, each due run is performed once, however many workers are running.
+
+    :returns: whether this worker claimed the run
+    :rtype: bool
+    """
+    claimed = ScheduledBrokerQuery.objects.filter(pk=scheduled_query.pk, next_run=scheduled_query.next_run).update(
+        next_run=scheduled_query.get_next_run(now)
+    )
+    return claimed == 1
+
+
+def run_due_queries(now=None):
+    """
+    Runs every scheduled query that is due. A query that fails is logged, its error is stored, and it is retried at its
+    next scheduled run.
+
+    :param now: Time against which queries are due, defaults to the current time
+    :type now: datetime
+
+    :returns: number of queries that were run successfully
+    :rtype: int
+    """
+    now = now or timezone.now()
+    succeeded = 0
+    due_queries = ScheduledBrokerQuery.objects.filter(next_run__lte=now).select_related('query').defer('alerts')
+    for scheduled_query in due_queries.order_by('next_run'):
+        if not claim(scheduled_query, now):
+            continue
+        try:
+            count = run_scheduled_query(scheduled_query)
+            logger.info(f'Fetched {count} alerts for scheduled query {scheduled_query.query.name}')
+            succeeded += 1
+        except Exception as e:
+            logger.error(f'Unable to run scheduled query {scheduled_query.query.name} due to error: {e}')
+            ScheduledBrokerQuery.objects.filter(pk=scheduled_query.pk).update(last_error=str(e))
+    return succeeded
+
+
+def seconds_until_next_run(now=None):
+    """
+    :returns: number of seconds until the next scheduled query is due, or None if no queries are scheduled
+    :rtype: float
+    """
+    now = now or timezone.now()
+    next_run = ScheduledBrokerQuery.objects.order_by('next_run').values_list('next_run', flat=True).first()
+    if next_run is None:
+        return None
+    return max(0, (next_run - now).total_seconds())
@@ -0,0 +1,241 @@
+from functools import lru_cache
+import logging
+import pickle
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+try:
+    from compression import zstd  # Python 3.14 and later
+except ImportError:
+    try:
+        from backports import zstd
+    except ImportError:
+        zstd = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+# The first byte of an encoded value records how it was encoded: the codec in the low bits, and whether it is
+# compressed in the high bit
+PICKLE = 0
+MSGPACK = 1
+COMPRESSED = 0x80
+
+
+def get_serializer():
+    """
+    Gets the serializer of the values that ``tom_alerts_dash`` stores in the ``TOM_ALERT_DASH_CACHE`` cache, such as
+    broker responses, light curves, and query results, as specified by ``TOM_ALERT_DASH_CACHE_SERIALIZER`` in
+    ``settings.py``. Defaults to ``tom_alerts_dash.serializers.CompressedSerializer``.
+
+    :rtype: CompressedSerializer
+    """
+    return _load_serializer(getattr(settings, 'TOM_ALERT_DASH_CACHE_SERIALIZER',
+                                    'tom_alerts_dash.serializers.CompressedSerializer'))
+
+
+@lru_cache(maxsize=None)
+def _load_serializer(path):
+    return import_string(path)()
+
+
+class PassthroughSerializer:
+    """
+    Serializer that stores values in the cache as they are, leaving them to be pickled by the cache backend.
+    """
+    def dumps(self, value, namespace=None):
+        return value
+
+    def loads(self, data):
+        return data
+
+
+class CompressionDictionaries:
+    """
+    Zstandard dictionaries shared by the values of each namespace, such as the responses of a broker, which compress
+    the keys and values that recur across its values, so that even a single small value is compressed well.
+
+    A dictionary is trained on the first ``TOM_ALERT_DASH_CACHE_DICTIONARY_SAMPLES`` values encoded for a namespace,
+    and is stored in the ``TOM_ALERT_DASH_CACHE`` cache without expiry, so that all processes share the dictionary of
+    the process that trained one first, and can decode the values that were compressed with it. A value whose
+    dictionary is no longer in the cache cannot be decoded, and is treated as a cache miss.
+    """
+    # Number of seconds between checks of the cache for the dictionary of a namespace trained by another process
+    check_interval = 60
+
+    def __init__(self):
+        self._by_namespace = {}
+        self._by_id = {}
+        self._samples = {}
+        self._checked = {}
+        self._lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'TOM_ALERT_DASH_CACHE', 'default')]
+
+    @property
+    def sample_count(self):
+        return getattr(settings, 'TOM_ALERT_DASH_CACHE_DICTIONARY_SAMPLES', 100)
+
+    @property
+    def size(self):
+        return getattr(settings, 'TOM_ALERT_DASH_CACHE_DICTIONARY_SIZE', 16 * 1024)
+
+    def get(self, namespace):
+        """
+        :returns: the dictionary of a namespace, or None if none has been trained yet
+        :rtype: zstd.ZstdDict
+        """
+        dictionary = self._by_namespace.get(namespace)
+        if dictionary is not None:
+            return dictionary
+        now = time.monotonic()
+        if now - self._checked.get(namespace, -self.check_interval) < self.check_interval:
+            return None
+        self._checked[namespace] = now
+        content = self.cache.get(f'tom_alerts_dash:dictionary:{namespace}')
+        return self._register(namespace, content) if content is not None else None
+
+    def get_by_id(self, dictionary_id):
+        """
+        :returns: the dictionary with the given id, or None if it is not in this process or the cache
+        :rtype: zstd.ZstdDict
+        """
+        dictionary = self._by_id.get(dictionary_id)
+        if dictionary is None:
+            content = self.cache.get(f'tom_alerts_dash:dictionary_id:{dictionary_id}')
+            dictionary = self._register(None, content) if content is not None else None
+        return dictionary
+
+    def add_sample(self, namespace, data):
+        """
+        Adds an encoded value of a namespace to the samples that its dictionary is trained on, and trains the
+        dictionary once there are enough samples.
+        """
+        with self._lock:
+            samples = self._samples.setdefault(namespace, [])
+            if samples is None or len(samples) >= self.sample_count:
+                return  # Training failed for this namespace, or is in progress
+            samples.append(bytes(data))
+            if len(samples) < self.sample_count:
+                return
+        try:
+            content = zstd.train_dict(samples, self.size).dict_content
+        except zstd.ZstdError as e:
+            logger.warning(f'Unable to train a compression dictionary for {namespace} due to error: {e}')
+            self._samples[namespace] = None
+            return
+        dictionary = zstd.ZstdDict(content)
+        self.cache.set(f'tom_alerts_dash:dictionary_id:{dictionary.dict_id}', content, None)
+        # Only the first dictionary trained for the namespace by any process is used
+        if not self.cache.add(f'tom_alerts_dash:dictionary:{namespace}', content, None):
+            content = self.cache.get(f'tom_alerts_dash:dictionary:{namespace}', content)
+        self._register(namespace, content)
+        self._samples.pop(namespace, None)
+
+    def _register(self, namespace, content):
+        dictionary = zstd.ZstdDict(content)
+        with self._lock:
+            dictionary = self._by_id.setdefault(dictionary.dict_id, dictionary)
+            if namespace is not None:
+                self._by_namespace[namespace] = dictionary
+        return dictionary
+
+    def clear(self):
+        with self._lock:
+            self._by_namespace.clear()
+            self._by_id.clear()
+            self._samples.clear()
+            self._checked.clear()
+
+
+compression_dictionaries = CompressionDictionaries()
+
+
+class CompressedSerializer:
+    """
+    Serializer that encodes values with msgpack if it is installed and the value only holds types that msgpack
+    supports, or with pickle otherwise, and compresses encoded values of at least
+    ``TOM_ALERT_DASH_CACHE_COMPRESSION_MIN_SIZE`` bytes with Zstandard, using the dictionary of their namespace once one
+    has been trained. Values are stored uncompressed if no Zstandard module is available, which is the case before
+    Python 3.14 unless ``backports.zstd`` is installed.
+
+    Values encoded with msgpack are decoded with lists in place of tuples.
+    """
+    @property
+    def level(self):
+        return getattr(settings, 'TOM_ALERT_DASH_CACHE_COMPRESSION_LEVEL', 3)
+
+    @property
+    def min_size(self):
+        return getattr(settings, 'TOM_ALERT_DASH_CACHE_COMPRESSION_MIN_SIZE', 256)
+
+    def dumps(self, value, namespace=None):
+        """
+        :param value: The value to encode
+        :type value: object
+
+        :param namespace: The namespace of the value, such as the name of the broker that returned it, whose values are
+                          compressed with a shared dictionary
+        :type namespace: str
+
+        :returns: the encoded value
+        :rtype: bytes
+        """
+        codec, data = self._encode(value)
+        if zstd is None or len(data) < self.min_size:
+            return bytes([codec]) + data
+        dictionary = compression_dictionaries.get(namespace) if namespace else None
+        if namespace and dictionary is None:
+            compression_dictionaries.add_sample(namespace, data)
+        compressed = zstd.compress(data, level=self.level,
+                                   zstd_dict=dictionary.as_digested_dict if dictionary is not None else None)
+        if len(compressed) >= len(data):  # Such as for images, which are already compressed
+            return bytes([codec]) + data
+        return bytes([codec | COMPRESSED]) + compressed
+
+    def loads(self, data):
+        """
+        :param data: The encoded value, or None for a cache miss
+        :type data: bytes
+
+        :returns: the decoded value, or None if it cannot be decoded, such as if its dictionary has been evicted from
+                  the cache
+        """
+        if data is None:
+            return None
+        if not isinstance(data, bytes):
+            return data  # Stored by PassthroughSerializer
+        try:
+            header, data = data[0], memoryview(data)[1:]
+            if header & COMPRESSED:
+                dictionary_id = zstd.get_frame_info(data).dictionary_id
+                dictionary = compression_dictionaries.get_by_id(dictionary_id) if dictionary_id else None
+                if dictionary_id and dictionary is None:
+                    logger.info(f'Compression dictionary {dictionary_id} is no longer cached')
+                    return None
+                data = zstd.decompress(data, zstd_dict=dictionary)
+            if header & ~COMPRESSED == MSGPACK:
+                return msgpack.unpackb(data, raw=False, strict_map_key=False)
+            return pickle.loads(data)
+        except Exception as e:
+            logger.error(f'Unable to decode cached value due to error: {e}')
+            return None
+
+    @staticmethod
+    def _encode(value):
+        if msgpack is not None:
+            try:
+                return MSGPACK, msgpack.packb(value, use_bin_type=True)
+            except (TypeError, ValueError, OverflowError):
+                pass  # Values of types that msgpack does not support are pickled
+        return PICKLE, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
@@ -0,0 +1,172 @@
+from contextlib import contextmanager
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from tom_alerts_dash.serializers import get_serializer
+
+try:
+    import fcntl
+except ImportError:  # fcntl is not available on Windows, where calls are only coalesced within a process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    """
+    A call that is in flight in this process, along with its outcome once it has completed.
+    """
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.exception = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key, so that only one of them is executed and all of them receive its
+    result.
+
+    Within a process, the first caller for a key executes the call, and any other thread that calls with the same key
+    while it is in flight waits for, and receives, the same result or exception. Across processes on the same host, the
+    executing process holds a lock on a file named after the key in ``TOM_ALERT_DASH_LOCK_DIR``, which is removed once
+    the call has completed, so that calls with different keys never wait on each other, and stores its result in the
+    ``TOM_ALERT_DASH_CACHE`` cache. A process that finds the lock held waits for it to be released, and uses the stored
+    result if it was completed after that process started waiting. Results are never reused for calls that were not
+    concurrent, so this does not act as a cache of broker results.
+
+    Coalescing across processes requires a cache backend that is shared between processes, such as the file-based or
+    database cache.
+    """
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'TOM_ALERT_DASH_CACHE', 'default')]
+
+    @property
+    def lock_dir(self):
+        return getattr(settings, 'TOM_ALERT_DASH_LOCK_DIR', os.path.join(tempfile.gettempdir(), 'tom_alerts_dash'))
+
+    @property
+    def timeout(self):
+        """
+        Number of seconds that a result is kept for processes that were waiting on it.
+        """
+        return getattr(settings, 'TOM_ALERT_DASH_SINGLE_FLIGHT_TIMEOUT', 60)
+
+    @staticmethod
+    def make_key(*parts):
+        """
+        Creates a key from a set of normalized strings, such as a broker name and its serialized query parameters.
+
+        :returns: hex digest of the parts
+        :rtype: str
+        """
+        return hashlib.sha256('\x1f'.join(parts).encode('utf-8')).hexdigest()
+
+    def do(self, key, func, namespace=None):
+        """
+        Calls ``func`` unless a call with the same key is already in flight, in which case that call's result is
+        returned instead.
+
+        :param key: Key identifying equivalent calls, as returned by ``make_key()``
+        :type key: str
+
+        :param func: Function that takes no arguments
+        :type func: callable
+
+        :param namespace: Namespace of the result, such as the name of a broker, for its compression in the cache
+        :type namespace: str
+
+        :returns: The return value of ``func``, or of the equivalent call that was in flight
+
+        :raises: The exception raised by ``func``, or by the equivalent call that was in flight
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if leader:
+            try:
+                call.result = self._do_shared(key, func, namespace)
+            except Exception as e:
+                call.exception = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+        else:
+            logger.debug(f'Waiting on in-flight call {key}')
+            call.done.wait()
+
+        if call.exception is not None:
+            raise call.exception
+        return call.result
+
+    def _do_shared(self, key, func, namespace=None):
+        """
+        Calls ``func`` while holding the file lock for ``key``, unless another process completes the same call while
+        this one waits for the lock.
+        """
+        if fcntl is None or not self.timeout:
+            return func()
+
+        cache_key = f'tom_alerts_dash:singleflight:{key}'
+        waiting_since = time.time()
+        with self._file_lock(key) as waited:
+            if waited:
+                completed = get_serializer().loads(self.cache.get(cache_key))
+                if completed is not None and completed[0] >= waiting_since:
+                    logger.debug(f'Using result of call {key} completed by another process')
+                    return completed[1]
+
+            result = func()
+            self.cache.set(cache_key, get_serializer().dumps((time.time(), result), namespace), self.timeout)
+            return result
+
+    @contextmanager
+    def _file_lock(self, key):
+        """
+        Holds an exclusive lock on the lock file for ``key``, which is removed when the lock is released. Yields whether
+        the lock was held by another process, or by another ``SingleFlight``, when it was requested.
+        """
+        os.makedirs(self.lock_dir, exist_ok=True)
+        path = os.path.join(self.lock_dir, f'singleflight-{key}.lock')
+        waited = False
+        while True:
+            lock_file = open(path, 'a')
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                waited = True
+            # The file may have been removed by the previous holder while this process waited on it, in which case the
+            # lock must be taken on the file that is now at the path
+            try:
+                if os.path.samestat(os.fstat(lock_file.fileno()), os.stat(path)):
+                    break
+            except FileNotFoundError:
+                pass
+            lock_file.close()
+        try:
+            yield waited
+        finally:
+            try:
+                os.remove(path)
+            finally:
+                lock_file.close()  # Releases the lock
+
+
+single_flight = SingleFlight()
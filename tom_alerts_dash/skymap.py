@@ -0,0 +1,123 @@
+import numpy as np
+
+FULL_SKY = ((0, 360), (-90, 90))
+
+# Maximum number of alerts in view that are plotted as individual points, above which they are binned
+MAX_POINTS = 2000
+
+# Number of bins along the RA and Dec axes of the view. The binned map has the same size whatever the zoom level, and
+# however many alerts are in view.
+SKY_MAP_BINS = (180, 90)
+
+
+def supports_sky_map(broker):
+    """
+    Whether a Dash broker provides the coordinates of its alerts for the sky map, which it declares by setting
+    ``supports_sky_map``.
+
+    :param broker: The broker
+    :type broker: GenericDashBroker
+
+    :rtype: bool
+    """
+    return broker.supports_sky_map
+
+
+def get_view(relayout_data):
+    """
+    Gets the RA and Dec ranges in view of the sky map from the ``relayoutData`` of its graph, which holds the ranges of
+    the axes after the map is zoomed or panned. The ranges are clipped to the sky, and default to the full sky.
+
+    :param relayout_data: The ``relayoutData`` of the sky map graph
+    :type relayout_data: dict
+
+    :returns: ((lowest RA, highest RA), (lowest Dec, highest Dec)), in degrees
+    :rtype: tuple
+    """
+    relayout_data = relayout_data or {}
+    view = []
+    for axis, (lowest, highest) in zip(['xaxis', 'yaxis'], FULL_SKY):
+        try:
+            bounds = sorted(float(relayout_data[f'{axis}.range[{i}]']) for i in range(0, 2))
+        except (KeyError, TypeError, ValueError):
+            bounds = [lowest, highest]  # Autoranged, or not zoomed along this axis
+        view.append((max(bounds[0], lowest), min(bounds[1], highest)))
+    return tuple(view)
+
+
+def bin_sky(ra, dec, view):
+    """
+    Bins the positions of alerts that are in view into ``SKY_MAP_BINS`` pixels, unless no more than ``MAX_POINTS`` of
+    them are in view.
+
+    :param ra: Right ascensions of the alerts, in degrees, with NaN for alerts without a position
+    :type ra: numpy.ndarray of float
+
+    :param dec: Declinations of the alerts, in degrees, with NaN for alerts without a position
+    :type dec: numpy.ndarray of float
+
+    :param view: Ranges of RA and Dec in view, as returned by ``get_view()``
+    :type view: tuple
+
+    :returns: the number of alerts in view, and either the positions in the block of the alerts in view, or the
+              (counts, RA edges, Dec edges) of the binned alerts
+    :rtype: tuple
+    """
+    (ra_lowest, ra_highest), (dec_lowest, dec_highest) = view
+    in_view = np.flatnonzero((ra >= ra_lowest) & (ra <= ra_highest) & (dec >= dec_lowest) & (dec <= dec_highest))
+    if len(in_view) <= MAX_POINTS:
+        return len(in_view), in_view
+    return len(in_view), np.histogram2d(ra[in_view], dec[in_view], bins=SKY_MAP_BINS, range=view)
+
+
+def create_sky_map(view, count, binned, ra=None, dec=None, names=None):
+    """
+    Creates the figure of the sky map, as a heatmap of binned alerts, or as a scatter plot of individual alerts. The
+    figure is built as a dict, so that plotly does not need to be imported on the server.
+
+    :param view: Ranges of RA and Dec in view, as returned by ``get_view()``
+    :type view: tuple
+
+    :param count: Number of alerts in view
+    :type count: int
+
+    :param binned: Positions or binned alerts, as returned by ``bin_sky()``
+    :type binned: numpy.ndarray or tuple
+
+    :param ra: Right ascensions of the alerts in view, when they are plotted individually
+    :type ra: numpy.ndarray of float
+
+    :param dec: Declinations of the alerts in view, when they are plotted individually
+    :type dec: numpy.ndarray of float
+
+    :param names: Names of the alerts in view, when they are plotted individually
+    :type names: list of str
+
+    :returns: the figure of the sky map
+    :rtype: dict
+    """
+    if isinstance(binned, tuple):
+        counts, ra_edges, dec_edges = binned
+        data = [{
+            'type': 'heatmap', 'x': ((ra_edges[:-1] + ra_edges[1:]) / 2).tolist(),
+            'y': ((dec_edges[:-1] + dec_edges[1:]) / 2).tolist(),
+            'z': [[pixel if pixel else None for pixel in row] for row in counts.T.tolist()],  # Empty pixels are clear
+            'colorscale': 'Viridis', 'hovertemplate': 'RA %{x:.2f}, Dec %{y:.2f}: %{z} alerts<extra></extra>'
+        }]
+        title = f'{count} alerts in view, binned'
+    else:
+        data = [{
+            'type': 'scattergl', 'mode': 'markers', 'x': ra.tolist(), 'y': dec.tolist(), 'text': names,
+            'marker': {'size': 5}, 'hovertemplate': '%{text}<br>RA %{x:.4f}, Dec %{y:.4f}<extra></extra>'
+        }]
+        title = f'{count} alerts in view'
+    (ra_lowest, ra_highest), dec_range = view
+    return {
+        'data': data,
+        'layout': {
+            'title': title, 'height': 400, 'margin': {'l': 50, 'r': 10, 't': 30, 'b': 40},
+            # Right ascension increases to the left, as on the sky
+            'xaxis': {'title': 'Right Ascension', 'range': [ra_highest, ra_lowest]},
+            'yaxis': {'title': 'Declination', 'range': list(dec_range)},
+        }
+    }
@@ -0,0 +1,207 @@
+from concurrent.futures import wait
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+
+from django.conf import settings
+from django.shortcuts import reverse
+
+from tom_alerts_dash.resilience import get_broker_guard, LazyExecutor
+from tom_alerts_dash.singleflight import single_flight
+
+logger = logging.getLogger(__name__)
+
+DIGEST = re.compile(r'^[0-9a-f]{64}$')
+
+_executor = LazyExecutor('TOM_ALERT_DASH_STAMP_WORKERS', 8, 'tom_alerts_dash_stamps')
+
+
+def get_stamp_timeout():
+    """
+    Gets the number of seconds to wait on each request for stamps to a broker, and on the stamps of a page of alerts,
+    as set by ``TOM_ALERT_DASH_STAMP_TIMEOUT``.
+
+    :rtype: float
+    """
+    return getattr(settings, 'TOM_ALERT_DASH_STAMP_TIMEOUT', 10)
+
+
+def supports_stamps(broker):
+    """
+    Whether a Dash broker provides image stamps of its alerts, which it declares by setting ``supports_stamps``.
+
+    :param broker: The broker
+    :type broker: GenericDashBroker
+
+    :rtype: bool
+    """
+    return broker.supports_stamps
+
+
+class StampStore:
+    """
+    Content-addressed store of image stamps on disk, in ``TOM_ALERT_DASH_STAMP_DIR``. Each stamp is written once under
+    the SHA-256 digest of its content, and the digests of the stamps of each object are recorded under a key made from
+    the broker's name and the object's identifier. The store is shared by all processes on a host. Stamps are touched
+    when they are read, and the least recently used stamps are removed once the store exceeds
+    ``TOM_ALERT_DASH_STAMP_BUDGET`` bytes.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._written = False
+
+    @property
+    def directory(self):
+        return getattr(settings, 'TOM_ALERT_DASH_STAMP_DIR',
+                       os.path.join(tempfile.gettempdir(), 'tom_alerts_dash_stamps'))
+
+    @property
+    def budget(self):
+        return getattr(settings, 'TOM_ALERT_DASH_STAMP_BUDGET', 256 * 1024 * 1024)
+
+    @staticmethod
+    def make_key(broker, object_id):
+        return single_flight.make_key(broker, 'stamps', str(object_id))
+
+    def path(self, digest):
+        return os.path.join(self.directory, 'objects', digest[:2], digest)
+
+    def _write(self, path, data):
+        """
+        Writes a file atomically, so that other processes never read a partially written file.
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        with os.fdopen(descriptor, 'wb') as temporary_file:
+            temporary_file.write(data)
+        os.replace(temporary_path, path)
+
+    def get(self, key):
+        """
+        Gets the digests of the stamps recorded for a key, touching the stamps so that they are the most recently used.
+
+        :returns: the digests keyed by stamp name, or None if they are not recorded, or any of the stamps was removed
+        :rtype: dict
+        """
+        try:
+            with open(os.path.join(self.directory, 'refs', key)) as refs_file:
+                digests = json.load(refs_file)
+            for digest in digests.values():
+                os.utime(self.path(digest))
+        except (OSError, ValueError):
+            return None
+        return digests
+
+    def put(self, key, stamps):
+        """
+        Stores stamps, and records their digests for a key. A stamp that is already stored is not written again.
+
+        :param stamps: the images of the stamps, keyed by stamp name
+        :type stamps: dict
+
+        :returns: the digests keyed by stamp name
+        :rtype: dict
+        """
+        digests = {}
+        for name, data in stamps.items():
+            digest = hashlib.sha256(data).hexdigest()
+            if os.path.exists(self.path(digest)):
+                os.utime(self.path(digest))
+            else:
+                self._write(self.path(digest), data)
+            digests[name] = digest
+        self._write(os.path.join(self.directory, 'refs', key), json.dumps(digests).encode('utf-8'))
+        self._written = True
+        return digests
+
+    def evict(self):
+        """
+        Removes the least recently used stamps until the stored stamps fit in the budget. The records of removed stamps
+        are left in place, and are ignored by ``get()``. Nothing is done unless stamps were stored since the last call.
+        """
+        with self._lock:
+            if not self._written:
+                return
+            self._written = False
+            stamps = []
+            for directory, _, file_names in os.walk(os.path.join(self.directory, 'objects')):
+                for file_name in file_names:
+                    try:
+                        stat = os.stat(os.path.join(directory, file_name))
+                    except OSError:
+                        continue  # Removed by another process
+                    stamps.append((stat.st_mtime, stat.st_size, os.path.join(directory, file_name)))
+            total = sum(size for _, size, _ in stamps)
+            for _, size, path in sorted(stamps):
+                if total <= self.budget:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                total -= size
+
+
+stamp_store = StampStore()
+
+
+def get_stamp_url(digest):
+    return reverse('tom_alerts_dash:stamp', kwargs={'digest': digest})
+
+
+def fetch_stamps(broker, alert):
+    """
+    Gets the stamps of the object of an alert from the stamp store, or fetches them from the broker, subject to the
+    broker's rate limit and circuit breaker, and stores them.
+
+    :returns: the digests of the stamps, keyed by stamp name, or None if the stamps could not be fetched
+    :rtype: dict
+    """
+    key = stamp_store.make_key(broker.name, broker.get_dash_object_id(alert))
+    digests = stamp_store.get(key)
+    if digests is not None:
+        return digests
+
+    def fetch():
+        stamps, freshness = get_broker_guard(broker.name).call(
+            key, lambda: broker.fetch_dash_stamps(alert), allow_stale=False
+        )
+        return stamp_store.put(key, stamps)
+
+    try:
+        return single_flight.do(key, fetch)
+    except Exception as e:
+        logger.error(f'Stamp request to {broker.name} failed due to error: {e}')
+        return None
+
+
+def get_page_stamps(broker, alerts):
+    """
+    Gets the stamps of the objects of a page of alerts, fetching those that are not stored in parallel. Stamps that are
+    not fetched within ``TOM_ALERT_DASH_STAMP_TIMEOUT`` seconds continue to be fetched in the background, and are stored
+    once they are fetched, to be displayed the next time the page is.
+
+    :param broker: The broker that returned the alerts
+    :type broker: GenericDashBroker
+
+    :param alerts: Alerts, as returned by the broker
+    :type alerts: list of dicts
+
+    :returns: the local URLs of the stamps of each alert, keyed by stamp name, or None for alerts whose stamps could not
+              be fetched in time
+    :rtype: list of dicts
+    """
+    futures = [_executor.submit(fetch_stamps, broker, alert) for alert in alerts]
+    done, pending = wait(futures, timeout=get_stamp_timeout())
+    if pending:
+        logger.info(f'Stamp requests to {broker.name} are taking too long, continuing in the background')
+    page_digests = [future.result() if future in done else None for future in futures]
+    stamp_store.evict()
+    return [
+        {name: get_stamp_url(digest) for name, digest in digests.items()} if digests is not None else None
+        for digests in page_digests
+    ]
@@ -0,0 +1,98 @@
+import dash_bootstrap_components as dbc
+import dash_core_components as dcc
+import dash_html_components as dhc
+import numpy as np
+
+# Number of bins of each histogram, and of each axis of each 2D density plot, in the summary panel. The payload sent to
+# the browser depends only on these, and not on the number of alerts summarized.
+HISTOGRAM_BINS = 40
+DENSITY_BINS = 30
+
+
+def summarize(buffer, fields, densities, positions):
+    """
+    Bins the summary fields of the alerts at the given positions of a block, with one histogram per field and one 2D
+    histogram per pair of fields. Alerts without a value for a field are left out of its histograms.
+
+    :param buffer: The block of alerts
+    :type buffer: tom_alerts_dash.blocks.ColumnarBuffer
+
+    :param fields: Summary fields, as returned by ``get_dash_summary_fields()``
+    :type fields: list of dicts
+
+    :param densities: Pairs of summary field ids, as returned by ``get_dash_summary_densities()``
+    :type densities: list of tuples
+
+    :param positions: Positions of the alerts to summarize
+    :type positions: numpy.ndarray of int
+
+    :returns: the number of alerts summarized, the (counts, edges) of each field with values, keyed by field id, and
+              the (counts, x edges, y edges) of each pair with values, keyed by pair
+    :rtype: dict
+    """
+    values = {field['id']: buffer.summary_values(field['id'])[positions] for field in fields}
+    summary = {'count': len(positions), 'histograms': {}, 'densities': {}}
+    for field in fields:
+        field_values = values[field['id']]
+        field_values = field_values[np.isfinite(field_values)]
+        if field_values.size:
+            summary['histograms'][field['id']] = np.histogram(field_values, bins=HISTOGRAM_BINS)
+    for x, y in densities:
+        finite = np.isfinite(values[x]) & np.isfinite(values[y])
+        if finite.any():
+            summary['densities'][(x, y)] = np.histogram2d(values[x][finite], values[y][finite], bins=DENSITY_BINS)
+    return summary
+
+
+def bin_centers(field, edges):
+    """
+    :returns: the centers of the bins of a summary field, as ISO 8601 strings for ``datetime`` fields
+    :rtype: list
+    """
+    centers = (edges[:-1] + edges[1:]) / 2
+    if field['type'] == 'datetime':
+        return np.round(centers).astype('int64').astype('datetime64[s]').astype(str).tolist()
+    return centers.tolist()
+
+
+def axis(field):
+    return {'title': field['name'], 'type': 'date' if field['type'] == 'datetime' else 'linear'}
+
+
+def create_summary_panel(fields, densities, summary):
+    """
+    Creates the graphs of the summary panel from the binned summary fields. The figures are built as dicts, so that
+    plotly does not need to be imported on the server.
+
+    :param fields: Summary fields, as returned by ``get_dash_summary_fields()``
+    :type fields: list of dicts
+
+    :param densities: Pairs of summary field ids, as returned by ``get_dash_summary_densities()``
+    :type densities: list of tuples
+
+    :param summary: Binned summary fields, as returned by ``summarize()``
+    :type summary: dict
+
+    :returns: the header and graphs of the summary panel
+    :rtype: list of Dash components
+    """
+    fields = {field['id']: field for field in fields}
+    layout = {'height': 250, 'margin': {'l': 50, 'r': 10, 't': 30, 'b': 40}}
+    figures = []
+    for field_id, (counts, edges) in summary['histograms'].items():
+        field = fields[field_id]
+        figures.append({
+            'data': [{'type': 'bar', 'x': bin_centers(field, edges), 'y': counts.tolist(), 'name': field['name']}],
+            'layout': dict(layout, title=field['name'], bargap=0, xaxis=axis(field), yaxis={'title': 'Alerts'})
+        })
+    for (x, y), (counts, x_edges, y_edges) in summary['densities'].items():
+        figures.append({
+            'data': [{'type': 'heatmap', 'x': bin_centers(fields[x], x_edges), 'y': bin_centers(fields[y], y_edges),
+                      'z': counts.T.tolist(), 'colorscale': 'Viridis'}],
+            'layout': dict(layout, title=f'{fields[y]["name"]} vs. {fields[x]["name"]}', xaxis=axis(fields[x]),
+                           yaxis=axis(fields[y]))
+        })
+    return [
+        dhc.H5(f'Summary of {summary["count"]} alerts'),
+        dbc.Row([dbc.Col(dcc.Graph(figure=figure, config={'displayModeBar': False}), md=6) for figure in figures])
+    ]
@@ -0,0 +1,223 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+import numpy as np
+
+from tom_targets.models import Target, TargetName
+
+logger = logging.getLogger(__name__)
+
+
+class TargetIndex:
+    """
+    In-memory index of the names, aliases, and positions of the ``Target`` objects in the TOM, used to find the alerts
+    on the browse page whose objects are already targets. The index is loaded from the database on first use, and kept
+    up to date with the targets saved and deleted by this process through the ``post_save`` and ``post_delete`` signals
+    connected in ``TomAlertsDashConfig.ready()``. As targets can also be saved by other processes, the index is loaded
+    again once it is ``TOM_ALERT_DASH_TARGET_INDEX_TTL`` seconds old.
+
+    Positions are held in arrays sorted by declination, so that the targets near a set of positions are found with a
+    binary search, and are rebuilt only when a position has changed since the last cross-match.
+    """
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._loaded_at = None
+        self._positions = {}  # Position of each target, keyed by target id
+        self._names = {}  # Target id of each lowercased name and alias
+        self._target_names = {}  # Lowercased name and aliases of each target, keyed by target id
+        self._primary_names = {}  # Lowercased name of each target, keyed by target id
+        self._arrays = None  # Target ids, right ascensions and declinations of the targets, sorted by declination
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'TOM_ALERT_DASH_TARGET_INDEX_TTL', 300)
+
+    @property
+    def radius(self):
+        """
+        Radius of the cross-match, in degrees, as specified in arcseconds by ``TOM_ALERT_DASH_TARGET_MATCH_RADIUS``.
+        """
+        return getattr(settings, 'TOM_ALERT_DASH_TARGET_MATCH_RADIUS', 2) / 3600
+
+    @property
+    def loaded(self):
+        return self._loaded_at is not None
+
+    def _load(self):
+        start = time.perf_counter()
+        self.clear()
+        for target_id, name, ra, dec in Target.objects.values_list('id', 'name', 'ra', 'dec').iterator():
+            self._add_name(target_id, name)
+            self._primary_names[target_id] = name.lower() if name else None
+            if ra is not None and dec is not None:
+                self._positions[target_id] = (ra, dec)
+        for target_id, name in TargetName.objects.values_list('target_id', 'name').iterator():
+            self._add_name(target_id, name)
+        self._loaded_at = time.monotonic()
+        logger.info(f'Loaded index of {len(self._target_names)} targets in {time.perf_counter() - start:.2f}s')
+
+    def _ensure_loaded(self):
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl:
+            self._load()
+
+    def _add_name(self, target_id, name):
+        if name:
+            self._names[name.lower()] = target_id
+            self._target_names.setdefault(target_id, set()).add(name.lower())
+
+    def _remove_name(self, target_id, name):
+        if name and self._names.get(name.lower()) == target_id:
+            del self._names[name.lower()]
+        if name:
+            self._target_names.get(target_id, set()).discard(name.lower())
+
+    def update_target(self, target):
+        """
+        Adds or updates a target, unless the index has not been loaded yet, in which case it will be loaded with the
+        target.
+        """
+        with self._lock:
+            if not self.loaded:
+                return
+            name = target.name.lower() if target.name else None
+            if self._primary_names.get(target.id) != name:
+                self._remove_name(target.id, self._primary_names.get(target.id))
+                self._add_name(target.id, target.name)
+                self._primary_names[target.id] = name
+            position = (target.ra, target.dec) if target.ra is not None and target.dec is not None else None
+            if self._positions.get(target.id) != position:
+                if position is None:
+                    self._positions.pop(target.id, None)
+                else:
+                    self._positions[target.id] = position
+                self._arrays = None
+
+    def remove_target(self, target_id):
+        with self._lock:
+            if not self.loaded:
+                return
+            self._primary_names.pop(target_id, None)
+            for name in list(self._target_names.pop(target_id, set())):
+                if self._names.get(name) == target_id:
+                    del self._names[name]
+            if self._positions.pop(target_id, None) is not None:
+                self._arrays = None
+
+    def update_alias(self, target_id, name):
+        with self._lock:
+            if self.loaded:
+                self._add_name(target_id, name)
+
+    def remove_alias(self, target_id, name):
+        with self._lock:
+            if self.loaded:
+                self._remove_name(target_id, name)
+
+    def _get_arrays(self):
+        if self._arrays is None:
+            ids = np.fromiter(self._positions.keys(), dtype=np.int64, count=len(self._positions))
+            positions = np.array(list(self._positions.values()), dtype=float).reshape(-1, 2)
+            order = np.argsort(positions[:, 1], kind='stable')
+            self._arrays = (ids[order], np.radians(positions[order, 0]), np.radians(positions[order, 1]))
+        return self._arrays
+
+    def match(self, names, ra, dec):
+        """
+        Finds the targets that match a set of objects, first by name, then by position. An object matches a target if
+        its name is the name or an alias of the target, or if it is within the cross-match radius of the target.
+
+        :param names: Names of the objects, with None for objects without a name
+        :type names: list of str
+
+        :param ra: Right ascensions of the objects, in degrees, with NaN for objects without a position
+        :type ra: numpy.ndarray of float
+
+        :param dec: Declinations of the objects, in degrees, with NaN for objects without a position
+        :type dec: numpy.ndarray of float
+
+        :returns: the id of the matching target of each object, or -1 for objects without a matching target
+        :rtype: numpy.ndarray of int
+        """
+        with self._lock:
+            self._ensure_loaded()
+            matches = np.array([self._names.get(str(name).lower(), -1) if name is not None else -1 for name in names],
+                               dtype=np.int64)
+            ids, target_ra, target_dec = self._get_arrays()
+
+        unmatched = np.flatnonzero((matches < 0) & np.isfinite(ra) & np.isfinite(dec))
+        if not len(unmatched) or not len(ids):
+            return matches
+        radius = np.radians(self.radius)
+        object_ra, object_dec = np.radians(ra[unmatched]), np.radians(dec[unmatched])
+
+        # Candidates are the targets within the radius in declination of each object, as contiguous slices of the arrays
+        lowest = np.searchsorted(target_dec, object_dec - radius, side='left')
+        counts = np.searchsorted(target_dec, object_dec + radius, side='right') - lowest
+        objects = np.repeat(np.arange(len(unmatched)), counts)
+        candidates = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(lowest, counts)
+
+        # Haversine separation, compared without taking the arcsine
+        haversine = (np.sin((target_dec[candidates] - object_dec[objects]) / 2) ** 2 +
+                     np.cos(target_dec[candidates]) * np.cos(object_dec[objects]) *
+                     np.sin((target_ra[candidates] - object_ra[objects]) / 2) ** 2)
+        within = haversine <= np.sin(radius / 2) ** 2
+        objects, candidates = objects[within], candidates[within]
+        first = np.unique(objects, return_index=True)[1]  # One matching target per object
+        matches[unmatched[objects[first]]] = ids[candidates[first]]
+        return matches
+
+    def clear(self):
+        with self._lock:
+            self._loaded_at = None
+            self._positions, self._names, self._target_names, self._primary_names = {}, {}, {}, {}
+            self._arrays = None
+
+
+target_index = TargetIndex()
+
+
+def match_alerts(broker, alerts):
+    """
+    Finds the targets in the TOM that match the objects of a broker's alerts, by the identifiers of the objects, and by
+    their positions if the broker provides them.
+
+    :param broker: The broker that returned the alerts
+    :type broker: GenericDashBroker
+
+    :param alerts: Alerts, as returned by the broker
+    :type alerts: list of dicts
+
+    :returns: the id of the matching target of each alert, or -1 for alerts without a matching target
+    :rtype: numpy.ndarray of int
+    """
+    names, positions = [], []
+    for alert in alerts:
+        try:
+            names.append(broker.get_dash_object_id(alert))
+        except (AttributeError, KeyError, TypeError):
+            names.append(None)
+        try:
+            position = broker.get_dash_sky_coordinates(alert)
+        except (AttributeError, KeyError, TypeError, ValueError):
+            position = None
+        positions.append(position if position is not None else (np.nan, np.nan))
+    positions = np.array(positions, dtype=float).reshape(-1, 2)
+    return target_index.match(names, positions[:, 0], positions[:, 1])
+
+
+def handle_target_saved(sender, instance, **kwargs):
+    target_index.update_target(instance)
+
+
+def handle_target_deleted(sender, instance, **kwargs):
+    target_index.remove_target(instance.id)
+
+
+def handle_alias_saved(sender, instance, **kwargs):
+    target_index.update_alias(instance.target_id, instance.name)
+
+
+def handle_alias_deleted(sender, instance, **kwargs):
+    target_index.remove_alias(instance.target_id, instance.name)
@@ -0,0 +1,44 @@
+import time
+import tracemalloc
+
+from django.test import tag, TestCase
+
+from tom_alerts_dash.brokers.alerce import ALeRCEDashBroker
+from tom_alerts_dash.brokers.mars import MARSDashBroker
+from tom_alerts_dash.brokers.scimma import SCIMMADashBroker
+from tom_alerts_dash.tests.factories import create_alerce_alert, create_mars_alert, create_scimma_alert
+
+
+def traced_memory(func):
+    """Calls a function, and returns its result and the memory still allocated by it once it has returned."""
+    tracemalloc.start()
+    try:
+        result = func()
+        return result, tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+
+@tag('benchmark')
+class TestAlertRowsMemory(TestCase):
+    """
+    Benchmarks the memory held by 100,000 flattened alerts from each of the built-in brokers, as rows of columns rather
+    than as a dict per alert. The alerts from the broker are created before memory is traced, as both hold them.
+    """
+    alert_count = 100000
+
+    def test_memory_per_alert(self):
+        for broker, create_alert in [(ALeRCEDashBroker(), create_alerce_alert), (MARSDashBroker(), create_mars_alert),
+                                     (SCIMMADashBroker(), create_scimma_alert)]:
+            alerts = [create_alert() for i in range(0, self.alert_count)]
+            broker.flatten_dash_alerts(alerts[:1])  # Compile the columns, and import astropy, before tracing
+
+            dicts, dicts_memory = traced_memory(lambda: broker.flatten_dash_alerts(alerts))
+            del dicts
+            start = time.perf_counter()
+            rows, rows_memory = traced_memory(lambda: broker.flatten_dash_rows(alerts))
+            timing = time.perf_counter() - start
+            print(f'{broker.name}: {dicts_memory / self.alert_count:.0f} bytes per alert as dicts, '
+                  f'{rows_memory / self.alert_count:.0f} bytes per alert as rows, flattened in {timing * 1000:.0f}ms')
+            self.assertEqual(self.alert_count, len(rows))
+            self.assertLess(rows_memory, dicts_memory / 4)
@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta
+import tempfile
+import time
+import tracemalloc
+
+from django.test import tag, TestCase
+
+from tom_alerts_dash.blocks import ColumnarBuffer
+
+COLUMNS = [
+    {'id': 'oid', 'name': 'Object ID', 'type': 'text', 'presentation': 'markdown'},
+    {'id': 'magpsf', 'name': 'Magnitude', 'type': 'text'},
+    {'id': 'rb', 'name': 'Real-Bogus', 'type': 'text'},
+    {'id': 'discovery_date', 'name': 'Discovery Date', 'type': 'datetime'},
+]
+
+
+@tag('benchmark')
+class TestColumnarBufferBenchmark(TestCase):
+    """
+    Benchmarks a block of 200,000 alerts that is spilled to disk. Sorting and filtering the block should take well under
+    a second, and reading a page of it should neither take longer nor use more memory than for a small block.
+    """
+    size = 200000
+
+    def create_alerts(self, size):
+        start = datetime(2021, 1, 1)
+        return [{
+            'oid': f'[ZTF21{i:07d}](https://mars.lco.global/{i}/)',
+            'magpsf': f'{14 + (i * 7919 % 8000) / 1000:.3f}',
+            'rb': f'{(i * 104729 % 1000) / 1000:.3f}',
+            'discovery_date': start + timedelta(minutes=i),
+            'alert': {'lco_id': i, 'candidate': {'ra': i % 360, 'dec': i % 90, 'wall_time': start.isoformat()}}
+        } for i in range(0, size)]
+
+    def time_page(self, buffer):
+        start = time.perf_counter()
+        buffer.page(500, 20, [{'column_id': 'magpsf', 'direction': 'desc'}], '{rb} >= 0.5')
+        return time.perf_counter() - start
+
+    def test_spilled_block(self):
+        small = ColumnarBuffer(COLUMNS, self.create_alerts(1000))
+        small.select([{'column_id': 'magpsf', 'direction': 'desc'}], '{rb} >= 0.5')
+        small_page = min(self.time_page(small) for i in range(0, 5))
+
+        with tempfile.TemporaryDirectory() as directory:
+            start = time.perf_counter()
+            buffer = ColumnarBuffer(COLUMNS, self.create_alerts(self.size))
+            buffer.spill(directory)
+            build = time.perf_counter() - start
+
+            start = time.perf_counter()
+            buffer.select([{'column_id': 'magpsf', 'direction': 'desc'}], '{rb} >= 0.5')
+            select = time.perf_counter() - start
+
+            tracemalloc.start()
+            page = min(self.time_page(buffer) for i in range(0, 5))
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            buffer.close()
+
+        print(f'{self.size} alerts, {buffer.nbytes / 1e6:.1f}MB: built and spilled in {build:.1f}s, sorted and '
+              f'filtered in {select * 1000:.0f}ms, page in {page * 1000:.2f}ms ({small_page * 1000:.2f}ms for 1000 '
+              f'alerts) with peak memory {peak / 1e3:.0f}KB')
+        self.assertLess(select, 1)
+        self.assertLess(page, small_page * 3 + 0.005)
+        self.assertLess(peak, 1e6)
@@ -0,0 +1,65 @@
+import time
+
+from astropy.time import Time
+from django.test import tag, TestCase
+
+from tom_alerts.brokers.alerce import ALERCE_URL
+from tom_alerts.brokers.mars import MARS_URL
+from tom_alerts_dash.brokers.alerce import ALeRCEDashBroker
+from tom_alerts_dash.brokers.mars import MARSDashBroker
+from tom_alerts_dash.tests.factories import create_alerce_alert, create_mars_alert
+from tom_common.templatetags.tom_common_extras import truncate_number
+from tom_targets.templatetags.targets_extras import deg_to_sexigesimal
+
+
+def flatten_alerce_alerts(alerts):
+    """The hand-written ALeRCE flattener that the declared columns replaced."""
+    return [{
+        'oid': f'[{alert["oid"]}]({ALERCE_URL}/object/{alert["oid"]})',
+        'meanra': deg_to_sexigesimal(alert['meanra'], 'hms') if alert['meanra'] is not None else None,
+        'meandec': deg_to_sexigesimal(alert['meandec'], 'dms') if alert['meandec'] is not None else None,
+        'discovery_date': Time(alert['firstmjd'], format='mjd', scale='utc').to_datetime(),
+        'classifier': alert['classifier'],
+        'class': alert['class'],
+        'probability': truncate_number(alert['probability']),
+        'alert': alert
+    } for alert in alerts]
+
+
+def flatten_mars_alerts(alerts):
+    """The hand-written MARS flattener that the declared columns replaced."""
+    return [{
+        'objectId': f'[{alert["objectId"]}]({MARS_URL}/{alert["lco_id"]}/)',
+        'ra': deg_to_sexigesimal(alert['candidate']['ra'], 'hms'),
+        'dec': deg_to_sexigesimal(alert['candidate']['dec'], 'dms'),
+        'magpsf': truncate_number(alert['candidate']['magpsf']),
+        'rb': truncate_number(alert['candidate']['rb']),
+        'alert': alert
+    } for alert in alerts]
+
+
+@tag('benchmark')
+class TestColumnsBenchmark(TestCase):
+    """
+    Benchmarks the flattening of a block of 2,000 alerts by the columns declared by the ALeRCE and MARS brokers, against
+    the hand-written loops that they replaced. The declared columns should produce the same rows, faster, as each
+    column is converted by astropy in a single call rather than once per alert.
+    """
+    alert_count = 2000
+
+    def time(self, flatten, alerts):
+        start = time.perf_counter()
+        rows = flatten(alerts)
+        return rows, time.perf_counter() - start
+
+    def test_flatten_dash_alerts(self):
+        for broker, create_alert, hand_written in [(ALeRCEDashBroker(), create_alerce_alert, flatten_alerce_alerts),
+                                                   (MARSDashBroker(), create_mars_alert, flatten_mars_alerts)]:
+            alerts = [create_alert() for i in range(0, self.alert_count)]
+            broker.flatten_dash_alerts(alerts[:1])  # Compile the columns, and import astropy, before timing
+            expected, hand_written_timing = self.time(hand_written, alerts)
+            rows, timing = self.time(broker.flatten_dash_alerts, alerts)
+            print(f'{broker.name}: flattened {self.alert_count} alerts in {timing * 1000:.0f}ms, against '
+                  f'{hand_written_timing * 1000:.0f}ms for the hand-written loop')
+            self.assertEqual(expected, rows)
+            self.assertLess(timing, hand_written_timing)
@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta
+from importlib.util import find_spec
+import time
+from unittest import skipUnless
+
+from django.test import tag, TestCase
+from plotly.io.json import to_json_plotly
+
+from tom_alerts_dash.middleware import brotli, compress
+
+
+@tag('benchmark')
+@skipUnless(find_spec('orjson') and brotli, 'orjson and brotli are not installed')
+class TestCallbackResponseBenchmark(TestCase):
+    """
+    Benchmarks the serialization and compression of a callback response carrying a page of 20 alerts, each with its raw
+    alert, as returned by the table callback of the browse app. Serialization with orjson should be faster than with the
+    standard library's JSON encoder, and compression should at least halve the size of the response.
+    """
+    repeats = 50
+
+    def create_response(self):
+        start = datetime(2021, 1, 1)
+        rows = [{
+            'objectId': f'[ZTF21{i:07d}](https://mars.lco.global/{i}/)',
+            'ra': '04:00:0.000', 'dec': '+12:00:0.000', 'magpsf': f'{14 + i / 10:.4f}', 'rb': f'{i / 20:.4f}',
+            'discovery_date': start + timedelta(minutes=i),
+            'alert': {
+                'lco_id': i, 'objectId': f'ZTF21{i:07d}', 'wall_time': start + timedelta(minutes=i),
+                'candidate': {f'field_{j}': j * 1.5 for j in range(0, 100)},
+                'prv_candidate': [{'candidate': {'jd': 2459215.5 + k, 'magpsf': 18.5, 'fid': 1}} for k in range(0, 30)]
+            }
+        } for i in range(0, 20)]
+        return {'multi': True, 'response': {'alerts-table-MARS': {'data': rows}, 'freshness-MARS': {'children': []}}}
+
+    def time_serialization(self, response, engine):
+        timings = []
+        for i in range(0, self.repeats):
+            start = time.perf_counter()
+            body = to_json_plotly(response, engine=engine)
+            timings.append(time.perf_counter() - start)
+        return min(timings), body.encode('utf-8')
+
+    def time_compression(self, body, encoding):
+        timings = []
+        for i in range(0, self.repeats):
+            start = time.perf_counter()
+            compressed = compress(body, encoding)
+            timings.append(time.perf_counter() - start)
+        return min(timings), len(compressed)
+
+    def test_page_response(self):
+        response = self.create_response()
+        json_time, body = self.time_serialization(response, 'json')
+        orjson_time, orjson_body = self.time_serialization(response, 'orjson')
+        gzip_time, gzip_size = self.time_compression(orjson_body, 'gzip')
+        brotli_time, brotli_size = self.time_compression(orjson_body, 'br')
+
+        print(f'Page of 20 alerts: {len(body) / 1e3:.1f}KB serialized in {json_time * 1000:.2f}ms with json and '
+              f'{orjson_time * 1000:.2f}ms with orjson, {gzip_size / 1e3:.1f}KB with gzip in {gzip_time * 1000:.2f}ms, '
+              f'{brotli_size / 1e3:.1f}KB with brotli in {brotli_time * 1000:.2f}ms')
+        self.assertLess(orjson_time, json_time)
+        self.assertLess(gzip_size, len(orjson_body) / 2)
+        self.assertLess(brotli_size, len(orjson_body) / 2)
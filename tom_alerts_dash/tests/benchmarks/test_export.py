@@ -0,0 +1,38 @@
+import time
+import tracemalloc
+from unittest.mock import patch
+
+from django.test import tag, TestCase
+
+from tom_alerts_dash.export import export_alerts, get_export_formats
+from tom_alerts_dash.tests.tests import TestDashBroker
+
+
+@tag('benchmark')
+class TestExportBenchmark(TestCase):
+    """
+    Benchmarks the export of 1,000,000 alerts in 1,000 pages. The peak memory used by the export should be that of a
+    single page of alerts, rather than the whole result set.
+    """
+    pages = 1000
+    page_size = 1000
+
+    def fetch_dash_pages(self, parameters, max_pages=None):
+        for page in range(0, self.pages):
+            yield [{'test_key': f'[ZTF21{page:04d}{i:03d}](https://example.com/{page}/{i}/)'}
+                   for i in range(0, self.page_size)]
+
+    def test_export_memory_is_constant(self):
+        broker = TestDashBroker()
+        with patch.object(TestDashBroker, 'fetch_dash_pages', side_effect=self.fetch_dash_pages):
+            for export_format in get_export_formats().keys():
+                tracemalloc.start()
+                start = time.perf_counter()
+                size = sum(len(chunk) for chunk in export_alerts(broker, {}, export_format))
+                timing = time.perf_counter() - start
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                print(f'{export_format}: {self.pages * self.page_size} alerts, {size / 1e6:.1f}MB in {timing:.1f}s, '
+                      f'peak memory {peak / 1e6:.1f}MB')
+                # The exported file is at least 12MB, while a page of alerts and its rows take a few hundred KB
+                self.assertLess(peak, 5e6, export_format)
@@ -0,0 +1,45 @@
+import threading
+import time
+
+from django.test import tag, TestCase
+
+from tom_alerts_dash.dash_apps.query_list_app import query_job_results, with_query_job
+from tom_alerts_dash.jobs import get_query_job
+
+
+@tag('benchmark')
+class TestQueryJobBenchmark(TestCase):
+    """
+    Benchmarks the callbacks of a broker table in long callback mode, while the broker takes seconds to respond. Both
+    the callback that starts a query and the callback that polls for its result should return within milliseconds.
+    """
+    broker_latency = 2
+    repeats = 20
+
+    def test_callback_latency(self):
+        responded = threading.Event()
+
+        def slow_callback(*args):
+            responded.wait(self.broker_latency)
+            return [{'test_key': 'test'}], []
+
+        start_timings, poll_timings = [], []
+        poll = query_job_results('Test Broker', 2)
+        for i in range(0, self.repeats):
+            start = time.perf_counter()
+            job = with_query_job(slow_callback, 'Test Broker')(0, 20, f'test {i}', '', 'client')
+            start_timings.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            poll(job, 1)
+            poll_timings.append(time.perf_counter() - start)
+        responded.set()
+
+        for i in range(0, 100):
+            if get_query_job(job['job_id'])['status'] == 'finished':
+                break
+            time.sleep(0.01)
+        print(f'With a broker latency of {self.broker_latency}s, queries started in {max(start_timings) * 1000:.2f}ms '
+              f'and polled in {max(poll_timings) * 1000:.2f}ms')
+        self.assertLess(max(start_timings), 0.01)
+        self.assertLess(max(poll_timings), 0.01)
+        self.assertEqual(([{'test_key': 'test'}], [], True), poll(job, 2))
@@ -0,0 +1,68 @@
+import time
+
+from django.db import connection
+from django.test import tag, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from tom_alerts.models import BrokerQuery
+
+
+@tag('benchmark')
+class TestBrokerQueryListBenchmark(TestCase):
+    """
+    Benchmarks the saved query list as the number of saved queries grows. The time to render a page, and the number of
+    database queries made to render it, should not grow with the number of saved queries.
+    """
+    sizes = [1000, 10000, 100000]
+    repeats = 5
+    # The indexes on the broker query table that the README recommends creating by hand
+    indexes = [
+        'CREATE INDEX tom_alerts_dash_bq_broker ON tom_alerts_brokerquery (broker, created DESC)',
+        'CREATE INDEX tom_alerts_dash_bq_created ON tom_alerts_brokerquery (created DESC)',
+        'CREATE INDEX tom_alerts_dash_bq_last_run ON tom_alerts_brokerquery (last_run DESC)',
+        'CREATE INDEX tom_alerts_dash_bq_name ON tom_alerts_brokerquery (name)',
+    ]
+
+    def setUp(self):
+        with connection.cursor() as cursor:
+            for index in self.indexes:
+                cursor.execute(index)
+
+    def time_request(self, params):
+        timings = []
+        for i in range(0, self.repeats):
+            start = time.perf_counter()
+            response = self.client.get(reverse('tom_alerts_dash:list'), params)
+            timings.append(time.perf_counter() - start)
+            self.assertEqual(25, len(response.context['object_list']))
+        return min(timings)
+
+    def test_render_time_is_constant(self):
+        timings = {}
+        query_counts = {}
+        created = 0
+        for size in self.sizes:
+            BrokerQuery.objects.bulk_create([
+                BrokerQuery(name=f'Query {i}', broker=['ALeRCE', 'Lasair', 'Scout'][i % 3],
+                            parameters={'objectId': f'ZTF21{i:07d}', 'ra__gt': 10.5, 'ra__lt': 11.5})
+                for i in range(created, size)
+            ], batch_size=5000)
+            created = size
+
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(reverse('tom_alerts_dash:list'), {'broker': 'ALeRCE', 'sort': '-last_run'})
+            query_counts[size] = len(queries)
+            timings[size] = {
+                'first page': self.time_request({}),
+                'filtered and sorted': self.time_request({'broker': 'ALeRCE', 'sort': '-last_run'}),
+                'sorted by name': self.time_request({'sort': 'name', 'page': 2}),
+            }
+            print(f'{size} saved queries: ' +
+                  ', '.join(f'{name} {timing * 1000:.1f}ms' for name, timing in timings[size].items()))
+
+        smallest, largest = self.sizes[0], self.sizes[-1]
+        self.assertEqual(query_counts[smallest], query_counts[largest])
+        for name, timing in timings[largest].items():
+            # Counting the matching rows is the only step that scales with the table, and takes a few milliseconds
+            self.assertLess(timing, timings[smallest][name] * 3 + 0.05, name)
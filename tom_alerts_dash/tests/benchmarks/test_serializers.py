@@ -0,0 +1,61 @@
+import json
+import pickle
+import time
+from unittest import skipUnless
+
+from django.core.cache import cache
+from django.test import override_settings, tag, TestCase
+
+from tom_alerts_dash import serializers
+from tom_alerts_dash.serializers import CompressedSerializer, compression_dictionaries
+from tom_alerts_dash.tests.factories import create_alerce_alert, create_mars_alert, create_scimma_alert
+
+
+@tag('benchmark')
+@skipUnless(serializers.zstd, 'No Zstandard module is installed')
+@override_settings(TOM_ALERT_DASH_CACHE_DICTIONARY_SAMPLES=100)
+class TestCompressedSerializerBenchmark(TestCase):
+    """
+    Benchmarks the encoding of cached broker responses of 20 alerts from each of the built-in brokers, once the
+    dictionary of the broker has been trained on 100 responses. The values of the factories are random, so they compress
+    less than those of real responses, but the encoded responses should still be at least a third smaller than pickled
+    ones, which is how they were cached before, and smaller than when compressed without a dictionary.
+    """
+    page_size = 20
+    page_count = 200
+
+    def setUp(self):
+        compression_dictionaries.clear()
+        cache.clear()
+
+    def tearDown(self):
+        compression_dictionaries.clear()
+
+    def test_encoding(self):
+        serializer = CompressedSerializer()
+        for namespace, create_alert in [('ALeRCE', create_alerce_alert), ('MARS', create_mars_alert),
+                                        ('SCIMMA', create_scimma_alert)]:
+            pages = [[create_alert() for i in range(0, self.page_size)] for j in range(0, self.page_count)]
+            for page in pages[:100]:
+                serializer.dumps(page, namespace)  # Train the dictionary
+            pages = pages[100:]
+
+            start = time.perf_counter()
+            encoded = [serializer.dumps(page, namespace) for page in pages]
+            encode_timing = time.perf_counter() - start
+            start = time.perf_counter()
+            decoded = [serializer.loads(data) for data in encoded]
+            decode_timing = time.perf_counter() - start
+
+            pickled_size = sum(len(pickle.dumps(page, protocol=pickle.HIGHEST_PROTOCOL)) for page in pages)
+            json_size = sum(len(json.dumps(page).encode('utf-8')) for page in pages)
+            without_dictionary_size = sum(len(serializer.dumps(page)) for page in pages)
+            encoded_size = sum(len(data) for data in encoded)
+            print(f'{namespace}: {pickled_size / encoded_size:.1f}x smaller than pickle, '
+                  f'{json_size / encoded_size:.1f}x smaller than JSON, '
+                  f'{without_dictionary_size / encoded_size:.1f}x smaller than without a dictionary, '
+                  f'encoded at {pickled_size / encode_timing / 1e6:.0f}MB/s, '
+                  f'decoded at {pickled_size / decode_timing / 1e6:.0f}MB/s')
+            self.assertEqual(pages, decoded)
+            self.assertGreater(pickled_size / encoded_size, 1.5)
+            self.assertLess(encoded_size, without_dictionary_size)
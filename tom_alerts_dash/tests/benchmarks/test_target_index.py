@@ -0,0 +1,51 @@
+import time
+
+from django.test import tag, TestCase
+import numpy as np
+
+from tom_targets.models import Target
+
+from tom_alerts_dash.target_index import target_index
+
+
+@tag('benchmark')
+class TestTargetIndexBenchmark(TestCase):
+    """
+    Benchmarks the cross-match of a block of 10,000 alerts against a TOM with 100,000 targets. Once the index is
+    loaded, matching the alerts by name and position should take well under a millisecond per alert.
+    """
+    targets = 100000
+    alerts = 10000
+
+    def setUp(self):
+        rng = np.random.default_rng(42)
+        self.ra = rng.uniform(0, 360, self.targets)
+        self.dec = np.degrees(np.arcsin(rng.uniform(-1, 1, self.targets)))
+        Target.objects.bulk_create([
+            Target(name=f'ZTF21{i:07d}', type=Target.SIDEREAL, ra=ra, dec=dec)
+            for i, (ra, dec) in enumerate(zip(self.ra, self.dec))
+        ], batch_size=5000)
+        target_index.clear()  # Targets created in bulk do not send post_save signals
+
+    def tearDown(self):
+        target_index.clear()
+
+    def test_match(self):
+        start = time.perf_counter()
+        target_index.match([], np.array([]), np.array([]))
+        load = time.perf_counter() - start
+
+        # One in ten alerts is for a target by name, one in ten is 1" from a target, and the rest are unmatched
+        names = [f'ZTF21{i:07d}' if i % 10 == 0 else f'ZTF22{i:07d}' for i in range(0, self.alerts)]
+        ra, dec = np.full(self.alerts, np.nan), np.full(self.alerts, np.nan)
+        ra[1::10], dec[1::10] = self.ra[1:self.alerts:10], self.dec[1:self.alerts:10] + 1 / 3600
+        timings = []
+        for i in range(0, 5):
+            start = time.perf_counter()
+            matches = target_index.match(names, ra, dec)
+            timings.append(time.perf_counter() - start)
+        match = min(timings)
+
+        print(f'{self.targets} targets indexed in {load:.2f}s, {self.alerts} alerts matched in {match * 1000:.1f}ms')
+        self.assertEqual(self.alerts // 5, np.count_nonzero(matches >= 0))
+        self.assertLess(match / self.alerts, 0.001)
@@ -0,0 +1,46 @@
+import time
+from unittest.mock import patch
+
+from django.test import tag, TestCase
+
+from tom_alerts_dash.brokers.alerce import ALeRCEDashBroker
+from tom_alerts_dash.brokers.mars import MARSDashBroker
+from tom_alerts_dash.tests.test_validators import ALERCE_CLASSIFIERS, get_form_errors
+
+
+@tag('benchmark')
+@patch('tom_alerts.brokers.alerce.ALeRCEQueryForm._get_classifiers', return_value=ALERCE_CLASSIFIERS)
+class TestFilterValidatorBenchmark(TestCase):
+    """
+    Benchmarks the validation of the filters of the MARS and ALeRCE brokers on an input event, by their compiled
+    validators, against constructing and validating their query forms. The ALeRCE classifiers are taken to be cached,
+    as they are after the first request for them, so that the forms make no requests. Compiled validation should take
+    microseconds, and report the same errors as the forms.
+    """
+    repeats = 2000
+
+    def time_validation(self, validate, data):
+        start = time.perf_counter()
+        for i in range(0, self.repeats):
+            errors = validate(data)
+        return errors, (time.perf_counter() - start) / self.repeats
+
+    def test_validation(self, mock_get_classifiers):
+        for broker, data in [
+            (MARSDashBroker(), {'query_name': 'dash query', 'broker': 'MARS', 'objectId': 'ZTF21abcdefg',
+                                'magpsf__lte': 'abc', 'rb__gte': 0.5, 'time__gt': None, 'time__lt': None,
+                                'cone': ''}),
+            (ALeRCEDashBroker(), {'query_name': 'ALeRCE Dash Query', 'broker': 'ALeRCE', 'oid': None,
+                                  'stamp_classifier': 'SN', 'p_stamp_classifier': 0.5, 'lc_classifier': None,
+                                  'p_lc_classifier': None, 'ra': None, 'dec': None, 'radius': None}),
+        ]:
+            broker.dash_validator.validate(data)  # Compile the validator and load its choices before timing
+            form_errors, form_timing = self.time_validation(
+                lambda data: get_form_errors(broker.dash_validator.form_class, data), data
+            )
+            errors, timing = self.time_validation(broker.dash_validator.validate, data)
+            print(f'{broker.name}: validated filters in {timing * 1e6:.1f}μs, against {form_timing * 1e6:.1f}μs '
+                  f'with the query form')
+            self.assertEqual(form_errors, errors)
+            self.assertLess(timing, 100e-6)
+            self.assertLess(timing, form_timing / 5)
@@ -1,4 +1,4 @@
-from datetime import datetime
+from datetime import datetime, timezone
 from inspect import signature
 from unittest.mock import patch
 
@@ -75,6 +75,63 @@ class TestALeRCEDashBroker(TestCase):
         self.assertEqual(len(alerts), len(test_alerts))
         self.assertEqual(self.broker.dash_button_clicks, 10)
 
+    @patch('tom_alerts.brokers.alerce.ALeRCEBroker._request_alerts')
+    def test_fetch_dash_pages(self, mock_request_alerts):
+        full_page = [create_alerce_alert() for i in range(0, 20)]
+        mock_request_alerts.side_effect = [{'items': full_page}, {'items': full_page[:5]}]
+        pages = list(self.broker.fetch_dash_pages({'oid': 'ZTF21fetchpages'}))
+        self.assertEqual([full_page, full_page[:5]], pages)  # A page that is not full is the last page
+
+    def test_get_incremental_parameters(self):
+        since = datetime(2021, 1, 1, tzinfo=timezone.utc)  # MJD 59215
+        self.assertEqual({'oid': 'ZTF21abc', 'lastmjd__gt': 59215},
+                         self.broker.get_incremental_parameters({'oid': 'ZTF21abc', 'lastmjd__gt': 59000}, since))
+        self.assertEqual(59300, self.broker.get_incremental_parameters({'lastmjd__gt': 59300}, since)['lastmjd__gt'])
+
+    def test_get_dash_alert_time(self):
+        alert = create_alerce_alert(lastmjd=59215.5)
+        self.assertEqual(datetime(2021, 1, 1, 12, tzinfo=timezone.utc), self.broker.get_dash_alert_time(alert))
+
+    def test_get_dash_summary_fields(self):
+        alert = create_alerce_alert(firstmjd=59215, lastmjd=59215.5, probability=0.75)
+        values = {field['id']: field['value'](alert) for field in self.broker.get_dash_summary_fields()}
+        self.assertEqual({'probability': 0.75, 'firstmjd': datetime(2021, 1, 1, tzinfo=timezone.utc).timestamp(),
+                          'lastmjd': datetime(2021, 1, 1, 12, tzinfo=timezone.utc).timestamp()}, values)
+
+    def test_get_dash_sky_coordinates(self):
+        alert = create_alerce_alert(meanra=150.5, meandec=-20.25)
+        self.assertEqual((150.5, -20.25), self.broker.get_dash_sky_coordinates(alert))
+
+    @patch('tom_alerts_dash.brokers.alerce.ALeRCEDashBroker.fetch_lightcurve')
+    def test_fetch_dash_light_curve(self, mock_fetch_lightcurve):
+        mock_fetch_lightcurve.return_value = {
+            'detections': [{'mjd': 59215, 'fid': 1, 'magpsf': 18.5, 'sigmapsf': 0.1, 'diffmaglim': 20}],
+            'non_detections': [{'mjd': 59214, 'fid': 2, 'diffmaglim': 20.5}]
+        }
+        alert = create_alerce_alert()
+        light_curve = self.broker.fetch_dash_light_curve(alert)
+        mock_fetch_lightcurve.assert_called_once_with(alert['oid'])
+        self.assertEqual([
+            {'time': datetime(2021, 1, 1, tzinfo=timezone.utc).timestamp(), 'band': 'g', 'magnitude': 18.5,
+             'error': 0.1},
+            {'time': datetime(2020, 12, 31, tzinfo=timezone.utc).timestamp(), 'band': 'r', 'limit': 20.5}
+        ], light_curve)
+
+    @patch('tom_alerts_dash.brokers.alerce.requests.get')
+    def test_fetch_dash_stamps(self, mock_get):
+        mock_get.return_value.json.return_value = [
+            {'candid': '1', 'mjd': 59215, 'has_stamp': True},
+            {'candid': '2', 'mjd': 59216, 'has_stamp': True},
+            {'candid': '3', 'mjd': 59217, 'has_stamp': False},
+        ]
+        mock_get.return_value.content = b'stamp'
+        alert = create_alerce_alert()
+        stamps = self.broker.fetch_dash_stamps(alert)
+        self.assertEqual({'Science': b'stamp', 'Reference': b'stamp', 'Difference': b'stamp'}, stamps)
+        self.assertEqual({'oid': alert['oid'], 'candid': '2', 'type': 'difference', 'format': 'png'},
+                         mock_get.call_args.kwargs['params'])  # The latest detection with stamps is used
+        self.assertEqual([10] * 4, [call.kwargs['timeout'] for call in mock_get.call_args_list])
+
     def test_callback_parameters_match_inputs(self):
         """Test that callback function has the same number of parameters as the inputs."""
         callback_num_params = len(signature(self.broker.callback).parameters)
@@ -1,3 +1,4 @@
+from datetime import datetime, timezone
 from inspect import signature
 from unittest.mock import patch
 
@@ -45,10 +46,73 @@ class TestMARSDashBroker(TestCase):
         for key in ['drb', 'test_bad_key']:
             self.assertNotIn(key, alerts[0])  # Test that no unwanted attributes are included
 
+    @patch('tom_alerts.brokers.mars.MARSBroker._request_alerts')
+    def test_fetch_dash_pages(self, mock_request_alerts):
+        mock_request_alerts.side_effect = [
+            {'results': self.test_alerts[:3], 'has_next': True},
+            {'results': self.test_alerts[3:], 'has_next': False}
+        ]
+        pages = list(self.broker.fetch_dash_pages({'objectId': 'ZTF21fetchpages'}))
+        self.assertEqual([self.test_alerts[:3], self.test_alerts[3:]], pages)
+        self.assertEqual(2, mock_request_alerts.call_args.args[0]['page'])
+
+    @patch('tom_alerts.brokers.mars.MARSBroker._request_alerts')
+    def test_fetch_dash_pages_max_pages(self, mock_request_alerts):
+        mock_request_alerts.return_value = {'results': self.test_alerts, 'has_next': True}
+        pages = list(self.broker.fetch_dash_pages({'objectId': 'ZTF21maxpages'}, max_pages=1))
+        self.assertEqual(1, len(pages))
+
+    def test_get_incremental_parameters(self):
+        since = datetime(2021, 3, 1, 12, 30, tzinfo=timezone.utc)
+        with self.subTest('The lower bound is raised to the high-water mark'):
+            parameters = self.broker.get_incremental_parameters({'objectId': 'ZTF21abc', 'time__gt': '2021-01-01'},
+                                                                since)
+            self.assertEqual({'objectId': 'ZTF21abc', 'time__gt': '2021-03-01 12:30:00'}, parameters)
+        with self.subTest('A later lower bound is kept'):
+            parameters = self.broker.get_incremental_parameters({'time__gt': '2021-04-01'}, since)
+            self.assertEqual('2021-04-01 00:00:00', parameters['time__gt'])
+
+    def test_get_dash_alert_time(self):
+        alert = create_mars_alert()
+        alert['candidate']['jd'] = 2459215.5
+        self.assertEqual(datetime(2021, 1, 1, tzinfo=timezone.utc), self.broker.get_dash_alert_time(alert))
+
+    def test_get_dash_summary_fields(self):
+        alert = create_mars_alert(magpsf=18.5, rb=0.9)
+        alert['candidate']['jd'] = 2459215.5
+        values = {field['id']: field['value'](alert) for field in self.broker.get_dash_summary_fields()}
+        self.assertEqual({'magpsf': 18.5, 'rb': 0.9, 'jd': datetime(2021, 1, 1, tzinfo=timezone.utc).timestamp()},
+                         values)
+
+    def test_get_dash_sky_coordinates(self):
+        alert = create_mars_alert(ra=150.5, dec=-20.25)
+        self.assertEqual((150.5, -20.25), self.broker.get_dash_sky_coordinates(alert))
+
+    @patch('tom_alerts_dash.brokers.mars.MARSDashBroker.fetch_alert')
+    def test_fetch_dash_light_curve(self, mock_fetch_alert):
+        alert = create_mars_alert(magpsf=18.5)
+        alert['candidate'].update({'jd': 2459215.5, 'fid': 1, 'sigmapsf': 0.1})
+        mock_fetch_alert.return_value = dict(alert, prv_candidate=[
+            {'candidate': {'jd': 2459214.5, 'fid': 2, 'magpsf': None, 'diffmaglim': 20.5}}
+        ])
+        light_curve = self.broker.fetch_dash_light_curve(alert)
+        mock_fetch_alert.assert_called_once_with(alert['lco_id'])  # Previous candidates are fetched
+        self.assertEqual([
+            {'time': datetime(2021, 1, 1, tzinfo=timezone.utc).timestamp(), 'band': 'g', 'magnitude': 18.5,
+             'error': 0.1},
+            {'time': datetime(2020, 12, 31, tzinfo=timezone.utc).timestamp(), 'band': 'r', 'limit': 20.5}
+        ], light_curve)
+
     def test_validate_filters(self):
         errors = self.broker.validate_filters(1, 20, '', 100, None, None, None, None, None, None, None, [])
         self.assertIn('All of RA, Dec, and Radius are required for a cone search.', errors[0].children)
 
+    def test_validate_filters_clientside_validation(self):
+        """Test that the cone search check is skipped when it is performed by a clientside callback."""
+        self.broker.clientside_validation = True
+        errors = self.broker.validate_filters(1, 20, '', 100, None, None, None, None, None, None, None, [])
+        self.assertEqual([], errors)
+
     def test_callback_parameters_match_inputs(self):
         """Test that callback function has the same number of parameters as the inputs."""
         callback_num_params = len(signature(self.broker.callback).parameters)
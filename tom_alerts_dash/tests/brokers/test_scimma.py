@@ -37,12 +37,12 @@ class TestSCIMMADashBroker(TestCase):
 
     def test_callback_partial_cone_search(self):
         with self.assertRaises(PreventUpdate):
-            self.broker.callback(1, 20, '', '', '100', None, None, None, None)
+            self.broker.callback(1, 20, '', '', '100', None, None, None, None, None)
 
     @patch('tom_scimma.scimma.SCIMMABroker._request_alerts')
     def test_callback_full_cone_search(self, mock_request_alerts):
         mock_request_alerts.return_value = {'results': self.test_alerts}
-        alerts = self.broker.callback(1, 20, '', '', '100', '100', '100', None, None)
+        alerts = self.broker.callback(1, 20, '', '', '100', '100', '100', None, None, None)
 
         self.assertDictContainsSubset({'cone_search': '100,100,100'}, mock_request_alerts.call_args.args[0])
         for key in ['alert_identifier', 'counterpart_identifier', 'ra', 'dec', 'rank', 'comments']:
@@ -51,9 +51,15 @@ class TestSCIMMADashBroker(TestCase):
             self.assertNotIn(key, alerts[0])  # Test that no unwanted attributes are included
 
     def test_validate_filters(self):
-        errors = self.broker.validate_filters(1, 20, '', '', '100', None, None, None, None, [])
+        errors = self.broker.validate_filters(1, 20, '', '', '100', None, None, None, None, None, [])
         self.assertIn('All of RA, Dec, and Radius are required for a cone search.', errors[0].children)
 
+    def test_validate_filters_clientside_validation(self):
+        """Test that the cone search check is skipped when it is performed by a clientside callback."""
+        self.broker.clientside_validation = True
+        errors = self.broker.validate_filters(1, 20, '', '', '100', None, None, None, None, None, [])
+        self.assertEqual([], errors)
+
     def test_callback_parameters_match_inputs(self):
         """Test that callback function has the same number of parameters as the inputs."""
         callback_num_params = len(signature(self.broker.callback).parameters)
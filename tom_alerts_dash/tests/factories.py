@@ -40,6 +40,8 @@ def create_scimma_alert(ra=None, dec=None, rank=None):
         'alert_identifier': fake.pystr_format(string_format='S######y_X##'),
         'right_ascension_sexagesimal': ra if ra else fake.pystr_format(string_format='##:##:##.###'),
         'declination_sexagesimal': dec if dec else fake.pystr_format(string_format='##:##:##.###'),
+        'right_ascension': fake.pyfloat(min_value=0, max_value=360),
+        'declination': fake.pyfloat(min_value=-90, max_value=90),
         'topic': fake.pystr(max_chars=5),
         'message': {
             'rank': rank if rank else fake.pyint(min_value=1, max_value=4),
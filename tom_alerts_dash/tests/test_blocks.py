@@ -0,0 +1,220 @@
+from datetime import datetime
+import os
+import tempfile
+from unittest.mock import patch
+
+from dash.exceptions import PreventUpdate
+from django.test import override_settings, TestCase
+import numpy as np
+
+from tom_alerts_dash.blocks import (block_store, BlockStore, ColumnarBuffer, parse_filter_query,
+                                    response_page_count, supports_block_fetch)
+from tom_alerts_dash.dash_apps.query_list_app import (create_broker_container, initialize_app, with_block_fetch,
+                                                      with_freshness, with_page_count)
+from tom_alerts_dash.tests.tests import TestDashBroker
+
+COLUMNS = [
+    {'id': 'name', 'name': 'Name', 'type': 'text', 'presentation': 'markdown'},
+    {'id': 'mag', 'name': 'Magnitude', 'type': 'text'},
+    {'id': 'date', 'name': 'Date', 'type': 'datetime'},
+]
+
+ALERTS = [
+    {'name': '[ZTF21b](https://example.com/b)', 'mag': '18.5', 'date': datetime(2021, 2, 1), 'alert': {'id': 1}},
+    {'name': '[ZTF21a](https://example.com/a)', 'mag': '9.5', 'date': datetime(2021, 1, 1), 'alert': {'id': 2}},
+    {'name': '[ZTF20c](https://example.com/c)', 'mag': None, 'date': datetime(2020, 1, 1), 'alert': {'id': 3}},
+    {'name': '[ZTF21d](https://example.com/d)', 'mag': '18.5', 'date': datetime(2021, 3, 1), 'alert': {'id': 4}},
+]
+
+
+def alert_ids(rows):
+    return [row['alert']['id'] for row in rows]
+
+
+class TestColumnarBuffer(TestCase):
+
+    def setUp(self):
+        self.buffer = ColumnarBuffer(COLUMNS, ALERTS)
+
+    def test_parse_filter_query(self):
+        self.assertEqual(
+            [('name', 'contains', 'ZTF21'), ('mag', '>=', '10'), ('name', '=', 'ZTF 21')],
+            parse_filter_query('{name} contains ZTF21 && {mag} ge 10 && {name} = "ZTF 21" && nonsense')
+        )
+
+    def test_rows(self):
+        rows = self.buffer.rows([1, 2])
+        self.assertEqual(['[ZTF21a](https://example.com/a)', '[ZTF20c](https://example.com/c)'],
+                         [row['name'] for row in rows])
+        self.assertEqual({'name': '[ZTF21a](https://example.com/a)', 'mag': '9.5', 'date': '2021-01-01T00:00:00',
+                          'alert': {'id': 2}}, rows[0])
+
+    def test_spill(self):
+        with tempfile.TemporaryDirectory() as directory:
+            nbytes = self.buffer.nbytes
+            self.buffer.spill(directory)
+            self.assertTrue(all(isinstance(array, np.memmap) for array in self.buffer.arrays.values()))
+            self.assertEqual(nbytes, self.buffer.nbytes)
+            self.assertEqual([2, 1, 4, 3], alert_ids(self.buffer.rows(self.buffer.select([{'column_id': 'mag',
+                                                                                           'direction': 'asc'}]))))
+            self.assertEqual([1, 4], alert_ids(self.buffer.page(0, 20, [], '{mag} > 10')[0]))
+            self.buffer.close()
+            self.assertEqual([], os.listdir(directory))
+
+    def test_sort(self):
+        with self.subTest('Numeric columns are sorted as numbers, with empty values last'):
+            self.assertEqual([2, 1, 4, 3], alert_ids(self.buffer.rows(self.buffer.select([{'column_id': 'mag',
+                                                                                           'direction': 'asc'}]))))
+        with self.subTest('Markdown links are sorted by their text'):
+            self.assertEqual([4, 1, 2, 3], alert_ids(self.buffer.rows(self.buffer.select([{'column_id': 'name',
+                                                                                           'direction': 'desc'}]))))
+        with self.subTest('Later columns break ties'):
+            sort_by = [{'column_id': 'mag', 'direction': 'desc'}, {'column_id': 'date', 'direction': 'desc'}]
+            self.assertEqual([3, 4, 1, 2], alert_ids(self.buffer.rows(self.buffer.select(sort_by))))
+
+    def test_filter(self):
+        for filter_query, expected in [
+            ('{name} contains ZTF21', [1, 2, 4]),
+            ('{mag} > 10', [1, 4]),
+            ('{mag} = 18.5 && {name} contains d', [4]),
+            ('{date} datestartswith 2021-0', [1, 2, 4]),
+            ('{name} != ZTF21a', [1, 3, 4]),
+            ('{missing} = 1', [1, 2, 3, 4]),
+        ]:
+            with self.subTest(filter_query=filter_query):
+                self.assertEqual(expected, alert_ids(self.buffer.rows(self.buffer.select([], filter_query))))
+
+    def test_page(self):
+        rows, page_count = self.buffer.page(1, 3, [{'column_id': 'date', 'direction': 'asc'}])
+        self.assertEqual(([4], 2), (alert_ids(rows), page_count))
+        rows, page_count = self.buffer.page(5, 3, [], '{name} contains ZTF21')  # Past the last page
+        self.assertEqual(([1, 2, 4], 1), (alert_ids(rows), page_count))
+
+    def test_empty_buffer(self):
+        buffer = ColumnarBuffer(COLUMNS, [])
+        self.assertEqual(([], 1), buffer.page(0, 20, [{'column_id': 'mag', 'direction': 'asc'}], '{mag} > 1'))
+
+
+class TestBlockStore(TestCase):
+
+    def setUp(self):
+        self.store = BlockStore()
+        self.buffers = [ColumnarBuffer(COLUMNS, ALERTS) for i in range(0, 3)]
+
+    def tearDown(self):
+        self.store.clear()
+
+    @patch('tom_alerts_dash.blocks.time.monotonic')
+    def test_block_store_ttl(self, mock_monotonic):
+        mock_monotonic.return_value = 0
+        with override_settings(TOM_ALERT_DASH_BLOCK_TTL=60):
+            self.store.put('a', self.buffers[0])
+        self.assertEqual(self.buffers[0], self.store.get('a'))
+        mock_monotonic.return_value = 61
+        self.assertIsNone(self.store.get('a'))
+        self.assertIsNone(self.store.get('b'))
+
+    def test_block_store_budget(self):
+        with override_settings(TOM_ALERT_DASH_BLOCK_BUDGET=self.buffers[0].nbytes * 2):
+            self.store.put('a', self.buffers[0])
+            self.store.put('b', self.buffers[1])
+            self.assertEqual(self.buffers[0], self.store.get('a'))
+            self.store.put('c', self.buffers[2])  # The least recently used block is evicted
+        self.assertIsNone(self.store.get('b'))
+        self.assertEqual(self.buffers[0], self.store.get('a'))
+        self.assertEqual(self.buffers[0].nbytes * 2, self.store.nbytes)
+
+    def test_block_store_spill(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(TOM_ALERT_DASH_BLOCK_SPILL_THRESHOLD=self.buffers[0].nbytes - 1,
+                                   TOM_ALERT_DASH_BLOCK_DIR=directory):
+                self.store.put('a', self.buffers[0])
+            self.assertTrue(self.buffers[0].path.startswith(directory))
+            self.assertEqual(ALERTS[0]['alert'], self.store.get('a').rows([0])[0]['alert'])
+            self.store.clear()  # Evicted blocks are deleted from disk
+            self.assertEqual([], os.listdir(directory))
+
+
+@override_settings(TOM_ALERT_DASH_CLASSES=['tom_alerts_dash.tests.tests.TestDashBroker'], TOM_ALERT_DASH_BLOCK_SIZE=50)
+class TestBlockFetch(TestCase):
+
+    def setUp(self):
+        block_store.clear()
+        self.broker = TestDashBroker()
+
+    def fetch_dash_pages(self, parameters, max_pages=None):
+        for page in range(0, 10):
+            yield [{'test_key': f'{parameters["test_input"]} {page * 20 + i:03d}'} for i in range(0, 20)]
+
+    def test_supports_block_fetch(self):
+        self.assertTrue(supports_block_fetch(self.broker))
+        with override_settings(TOM_ALERT_DASH_BLOCK_SIZE=None):
+            self.assertFalse(supports_block_fetch(self.broker))
+
+    def test_fetch_dash_block(self):
+        with patch.object(TestDashBroker, 'fetch_dash_pages', side_effect=self.fetch_dash_pages) as mock_pages:
+            alerts = self.broker.fetch_dash_block({'test_input': 'test'}, 50)
+        self.assertEqual(50, len(alerts))
+        self.assertEqual({'test_key': 'test 049'}, alerts[-1])
+        self.assertEqual(1, mock_pages.call_count)
+
+    def test_with_block_fetch(self):
+        callback = with_page_count(with_freshness(with_block_fetch(self.broker, 'Test Broker')))
+        with patch.object(TestDashBroker, 'fetch_dash_pages', side_effect=self.fetch_dash_pages) as mock_pages:
+            with self.subTest('The first page is answered from a new block'):
+                alerts, banner, page_count = callback(0, 20, 'test', [], '')
+                self.assertEqual('test 000', alerts[0]['test_key'])
+                self.assertEqual(3, page_count)
+
+            with self.subTest('Pages, sorts, and filters are answered from the block'):
+                sort_by = [{'column_id': 'test_key', 'direction': 'desc'}]
+                alerts, banner, page_count = callback(1, 20, 'test', sort_by, '')
+                self.assertEqual('test 029', alerts[0]['test_key'])
+                alerts, banner, page_count = callback(0, 20, 'test', [], '{test_key} contains "test 04"')
+                self.assertEqual(10, len(alerts))
+                self.assertEqual(1, page_count)
+                self.assertEqual(1, mock_pages.call_count)
+
+            with self.subTest('New filters fetch a new block'):
+                alerts, banner, page_count = callback(0, 20, 'other', [], '')
+                self.assertEqual('other 000', alerts[0]['test_key'])
+                self.assertEqual(2, mock_pages.call_count)
+
+    @patch('tom_alerts_dash.tests.tests.TestDashBroker.validate_filters', return_value=['test_input: Invalid'])
+    def test_with_block_fetch_prevented(self, mock_validate_filters):
+        with patch.object(TestDashBroker, 'fetch_dash_pages') as mock_pages, self.assertRaises(PreventUpdate):
+            with_block_fetch(self.broker, 'Test Broker')(0, 20, 'test', [], '')
+        mock_pages.assert_not_called()
+
+    @patch('tom_alerts_dash.tests.tests.TestDashBroker.callback', side_effect=PreventUpdate)
+    def test_with_block_fetch_after_expiry(self, mock_callback):
+        """
+        Test that a block that has expired is fetched again when the table is paged, although the broker's callback,
+        which is gated on a new click of the filter button, would not query the broker.
+        """
+        callback = with_block_fetch(self.broker, 'Test Broker')
+        with patch.object(TestDashBroker, 'fetch_dash_pages', side_effect=self.fetch_dash_pages) as mock_pages:
+            callback(0, 20, 'test', [], '')
+            block_store.clear()
+            alerts = callback(1, 20, 'test', [], '')
+        self.assertEqual('test 020', alerts[0]['test_key'])
+        self.assertEqual(2, mock_pages.call_count)
+        mock_callback.assert_not_called()
+
+    def test_with_page_count(self):
+        def callback(*args):
+            response_page_count.set(4)
+            return [], []
+        self.assertEqual(([], [], 4), with_page_count(callback)())
+        self.assertEqual(([], [], None), with_page_count(lambda *args: ([], []))())
+
+    def test_create_broker_container(self):
+        table = create_broker_container('Test Broker').children[0].children[-1]
+        self.assertEqual('custom', table.sort_action)
+        self.assertEqual('custom', table.filter_action)
+
+    @patch('tom_alerts_dash.dash_apps.query_list_app.app')
+    def test_initialize_app(self, mock_app):
+        initialize_app()
+        table_outputs = mock_app.callback.call_args_list[0].args[0]
+        self.assertEqual('page_count', table_outputs[2].component_property)
@@ -0,0 +1,113 @@
+from datetime import datetime
+
+from django.test import TestCase
+
+from tom_alerts_dash.alerts import GenericDashBroker
+from tom_alerts_dash.brokers.alerce import ALeRCEDashBroker
+from tom_alerts_dash.brokers.mars import MARSDashBroker
+from tom_alerts_dash.columns import (AlertRows, compile_columns, DashColumn, markdown_link, mjd_to_datetime,
+                                     sexagesimal, truncate)
+from tom_alerts_dash.tests.factories import create_alerce_alert, create_mars_alert
+from tom_common.templatetags.tom_common_extras import truncate_number
+from tom_targets.templatetags.targets_extras import deg_to_sexigesimal
+
+
+class ColumnBroker(GenericDashBroker):
+    name = 'Column Broker'
+    dash_columns = [
+        DashColumn('name', 'Name', formatter=markdown_link('https://example.com/{candidate[id]}/'),
+                   presentation='markdown'),
+        DashColumn('mag', 'Magnitude', source='candidate.mag', formatter=truncate),
+        DashColumn('kind', 'Kind'),
+    ]
+
+    def fetch_alerts(self):
+        return []
+
+    def get_dash_filters(self):
+        return None
+
+    def to_generic_alert(self):
+        return
+
+
+class TestDashColumns(TestCase):
+
+    def test_get_dash_columns(self):
+        self.assertEqual([{'id': 'name', 'name': 'Name', 'type': 'text', 'presentation': 'markdown'},
+                          {'id': 'mag', 'name': 'Magnitude', 'type': 'text'},
+                          {'id': 'kind', 'name': 'Kind', 'type': 'text'}], ColumnBroker().get_dash_columns())
+
+    def test_flatten_dash_alerts(self):
+        alerts = [{'name': 'a', 'kind': 'SN', 'candidate': {'id': 1, 'mag': 18.123456}},
+                  {'name': 'b', 'kind': 'AGN', 'candidate': {'id': 2, 'mag': None}}]
+        self.assertEqual([{'name': '[a](https://example.com/1/)', 'mag': '18.1235', 'kind': 'SN', 'alert': alerts[0]},
+                          {'name': '[b](https://example.com/2/)', 'mag': None, 'kind': 'AGN', 'alert': alerts[1]}],
+                         ColumnBroker().flatten_dash_alerts(alerts))
+        self.assertEqual([], ColumnBroker().flatten_dash_alerts([]))
+
+    def test_columns_are_compiled_once(self):
+        compile_columns.cache_clear()
+        ColumnBroker().flatten_dash_alerts([])
+        ColumnBroker().flatten_dash_alerts([])
+        self.assertEqual(1, compile_columns.cache_info().misses)
+
+    def test_formatters_match_template_filters(self):
+        """Test that the batch formatters format values as the template filters do for a single value."""
+        degrees = [0.0, 60.0, 120.0, 359.99999, -45.5, 12.3456789]
+        self.assertEqual([deg_to_sexigesimal(value, 'hms') for value in degrees], sexagesimal('hms')(degrees, None))
+        self.assertEqual([deg_to_sexigesimal(value, 'dms') for value in degrees], sexagesimal('dms')(degrees, None))
+        self.assertEqual([None, deg_to_sexigesimal(60.0, 'hms')], sexagesimal('hms')([None, 60.0], None))
+        self.assertEqual([truncate_number(value) for value in [1.23456, 2, 'text', None]],
+                         truncate([1.23456, 2, 'text', None], None))
+        self.assertEqual([datetime(2020, 12, 13, 10, 35, 25), None], mjd_to_datetime([59196.441261574075, None], None))
+
+    def test_broker_columns(self):
+        """Test that the built-in brokers flatten alerts with their declared columns."""
+        mars_alert = create_mars_alert()
+        flattened_alert = MARSDashBroker().flatten_dash_alerts([mars_alert])[0]
+        self.assertEqual(deg_to_sexigesimal(mars_alert['candidate']['dec'], 'dms'), flattened_alert['dec'])
+        self.assertEqual(truncate_number(mars_alert['candidate']['rb']), flattened_alert['rb'])
+
+        alerce_alert = create_alerce_alert()
+        flattened_alert = ALeRCEDashBroker().flatten_dash_alerts([alerce_alert])[0]
+        self.assertEqual(f'[{alerce_alert["oid"]}](https://alerce.online/object/{alerce_alert["oid"]})',
+                         flattened_alert['oid'])
+        self.assertEqual(['oid', 'meanra', 'meandec', 'discovery_date', 'classifier', 'class', 'probability', 'alert'],
+                         list(flattened_alert.keys()))
+
+
+class TestAlertRows(TestCase):
+
+    def test_rows_from_columns(self):
+        """Test that rows flattened by declared columns are formatted when they are turned into dicts."""
+        alerts = [{'name': 'a', 'kind': 'SN', 'candidate': {'id': 1, 'mag': 18.123456}},
+                  {'name': 'b', 'kind': 'AGN', 'candidate': {'id': 2, 'mag': 19.0}}]
+        rows = ColumnBroker().flatten_dash_rows(alerts)
+        self.assertEqual([18.123456, 19.0], rows.values[1])  # Values are held unformatted
+        self.assertEqual(2, len(rows))
+        self.assertEqual({'name': '[b](https://example.com/2/)', 'mag': '19.0000', 'kind': 'AGN', 'alert': alerts[1]},
+                         rows[-1])
+        self.assertEqual(ColumnBroker().flatten_dash_alerts(alerts), list(rows))
+        self.assertEqual(['18.1235', '19.0000'], rows.column('mag'))
+        self.assertEqual(alerts, rows.alerts)
+        with self.assertRaises(IndexError):
+            rows[2]
+
+    def test_rows_from_dicts(self):
+        """Test that flattened alerts with differing keys are turned back into the same dicts."""
+        dicts = [{'test_key': 'a', 'alert': {'id': 1}}, {'test_key': 'b'}, {'other_key': None}]
+        rows = AlertRows.from_dicts(dicts)
+        self.assertEqual(dicts, rows.to_dicts())
+        self.assertEqual(['a', 'b', None], rows.column('test_key'))
+        self.assertEqual([None, None, None], rows.column('missing_key'))
+        self.assertEqual([{'id': 1}, None, None], rows.alerts)
+
+    def test_extend(self):
+        rows = AlertRows([], [])
+        rows.extend(AlertRows.from_dicts([{'test_key': 'a'}]))
+        rows.extend(ColumnBroker().flatten_dash_rows([{'name': 'b', 'kind': 'SN', 'candidate': {'id': 2, 'mag': 1}}]))
+        self.assertEqual([{'test_key': 'a'},
+                          {'name': '[b](https://example.com/2/)', 'mag': '1.0000', 'kind': 'SN',
+                           'alert': {'name': 'b', 'kind': 'SN', 'candidate': {'id': 2, 'mag': 1}}}], list(rows))
+        self.assertEqual(rows.to_dicts(1, 2), list(rows.iter_dicts(page_size=1))[1:])
@@ -0,0 +1,128 @@
+import csv
+from datetime import datetime
+import io
+from itertools import islice
+import json
+from unittest import skipUnless
+from unittest.mock import patch
+
+from astropy.io.votable import parse_single_table
+from django.test import override_settings, TestCase
+from django.urls import reverse
+
+from tom_alerts.models import BrokerQuery
+from tom_alerts_dash.dash_apps.query_list_app import export_links
+from tom_alerts_dash.export import export_alerts, export_value, get_export_formats
+from tom_alerts_dash.resilience import background_request, BrokerUnavailable
+from tom_alerts_dash.tests.tests import TestDashBroker
+
+
+def endless_pages(parameters, max_pages=None):
+    page = 0
+    while True:
+        page += 1
+        yield [{'test_key': f'[alert {page}](https://example.com/{page})'}]
+
+
+def failing_pages(parameters, max_pages=None):
+    yield [{'test_key': 'page 1'}]
+    raise BrokerUnavailable('Test Broker is currently unavailable.')
+
+
+def consume(chunks):
+    """Consumes an export until it raises, returning the chunks that were streamed before the error."""
+    streamed = []
+    try:
+        for chunk in chunks:
+            streamed.append(chunk)
+    except BrokerUnavailable:
+        return streamed
+    raise AssertionError('The export did not raise its error')
+
+
+@override_settings(TOM_ALERT_DASH_CLASSES=['tom_alerts_dash.tests.tests.TestDashBroker'])
+class TestExport(TestCase):
+
+    def setUp(self):
+        self.broker = TestDashBroker()
+
+    def test_export_value(self):
+        self.assertEqual('ZTF21abcdefg', export_value('[ZTF21abcdefg](https://mars.lco.global/1/)'))
+        self.assertEqual('2021-01-01T12:00:00', export_value(datetime(2021, 1, 1, 12)))
+        self.assertEqual('', export_value(None))
+        self.assertEqual('0.5', export_value(0.5))
+
+    def test_export_csv(self):
+        content = ''.join(export_alerts(self.broker, {'test_input': 'page 1', 'page': 3}, 'csv'))
+        self.assertEqual([['Test Key'], ['page 1'], ['page 2']], list(csv.reader(io.StringIO(content))))
+
+    def test_export_votable(self):
+        content = ''.join(export_alerts(self.broker, {'test_input': 'page <1>'}, 'votable'))
+        table = parse_single_table(io.BytesIO(content.encode('utf-8')))
+        self.assertEqual(['page <1>', 'page 2'], list(table.array['test_key']))
+
+    @skipUnless('parquet' in get_export_formats(), 'pyarrow is not installed')
+    def test_export_parquet(self):
+        import pyarrow.parquet
+        content = b''.join(export_alerts(self.broker, {'test_input': 'page 1'}, 'parquet'))
+        table = pyarrow.parquet.read_table(io.BytesIO(content))
+        self.assertEqual(['page 1', 'page 2'], table.column('test_key').to_pylist())
+        self.assertEqual(2, pyarrow.parquet.ParquetFile(io.BytesIO(content)).num_row_groups)  # One per broker page
+
+    @patch('tom_alerts_dash.tests.tests.TestDashBroker.fetch_dash_pages', side_effect=endless_pages)
+    def test_export_is_lazy(self, mock_fetch_dash_pages):
+        """Test that pages are only requested from the broker as the export is consumed."""
+        for export_format in get_export_formats().keys():
+            with self.subTest(export_format=export_format):
+                chunks = list(islice(export_alerts(self.broker, {}, export_format), 5))
+                self.assertEqual(5, len(chunks))
+
+    @patch('tom_alerts_dash.tests.tests.TestDashBroker.fetch_dash_pages', side_effect=failing_pages)
+    def test_export_failure_is_marked(self, mock_fetch_dash_pages):
+        """Test that an export that fails partway through is marked as failed, and raises rather than ending."""
+        content = ''.join(consume(export_alerts(self.broker, {}, 'csv')))
+        self.assertEqual([['Test Key'], ['page 1'], ['# Export failed: Test Broker is currently unavailable.']],
+                         list(csv.reader(io.StringIO(content))))
+
+        content = ''.join(consume(export_alerts(self.broker, {}, 'votable')))
+        self.assertIn('<INFO name="QUERY_STATUS" value="ERROR">Test Broker is currently unavailable.</INFO>', content)
+        self.assertEqual(['page 1'], list(parse_single_table(io.BytesIO(content.encode('utf-8'))).array['test_key']))
+
+    def test_export_pages_are_capped_and_in_background(self):
+        calls = []
+
+        def fetch_dash_pages(parameters, max_pages=None):
+            calls.append(max_pages)
+            yield [{'test_key': str(background_request.get())}]
+
+        with patch.object(TestDashBroker, 'fetch_dash_pages', side_effect=fetch_dash_pages):
+            content = ''.join(export_alerts(self.broker, {}, 'csv'))
+        self.assertEqual([1000], calls)
+        self.assertEqual('Test Key\r\nTrue\r\n', content)
+
+    def test_export_view(self):
+        response = self.client.get(reverse('tom_alerts_dash:export', kwargs={'broker': 'Test Broker'}),
+                                   {'format': 'csv', 'parameters': json.dumps({'test_input': 'page 1'})})
+        self.assertEqual('text/csv', response['Content-Type'])
+        self.assertEqual('attachment; filename="test-broker-alerts.csv"', response['Content-Disposition'])
+        self.assertEqual('Test Key\r\npage 1\r\npage 2\r\n', b''.join(response.streaming_content).decode())
+
+    def test_export_view_saved_query(self):
+        query = BrokerQuery.objects.create(name='Saved Query', broker='Test Broker', parameters={'test_input': 'saved'})
+        response = self.client.get(reverse('tom_alerts_dash:export', kwargs={'broker': 'Test Broker'}),
+                                   {'format': 'votable', 'query': query.id})
+        self.assertIn('<TD>saved</TD>', b''.join(response.streaming_content).decode())
+
+    def test_export_view_errors(self):
+        url = reverse('tom_alerts_dash:export', kwargs={'broker': 'Test Broker'})
+        self.assertEqual(400, self.client.get(url, {'format': 'xlsx'}).status_code)
+        self.assertEqual(400, self.client.get(url, {'parameters': '[1, 2]'}).status_code)
+        self.assertEqual(400, self.client.get(url, {'query': 'abc'}).status_code)
+        self.assertEqual(404, self.client.get(url, {'query': 1000}).status_code)
+        missing_url = reverse('tom_alerts_dash:export', kwargs={'broker': 'Missing'})
+        self.assertEqual(404, self.client.get(missing_url).status_code)
+
+    def test_export_links(self):
+        links = export_links(self.broker, 'Test Broker')(0, 20, 'test')
+        self.assertEqual(len(get_export_formats()) + 1, len(links))
+        self.assertIn('format=csv&parameters=%7B%22test_input%22%3A+%22test%22%7D', links[1].href)
@@ -0,0 +1,62 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+from django.test import TestCase
+
+from tom_alerts_dash.generations import check_superseded, GenerationTracker, Superseded
+
+
+class TestGenerationTracker(TestCase):
+
+    def setUp(self):
+        self.tracker = GenerationTracker()
+
+    def test_run(self):
+        self.assertEqual(3, self.tracker.run('client:MARS', lambda x, y: x + y, 1, 2))
+
+    def test_run_on_calling_thread(self):
+        self.assertIs(threading.current_thread(), self.tracker.run('client:MARS', threading.current_thread))
+
+    def test_superseded_query_is_discarded(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow_query(filter_value):
+            started.set()
+            release.wait(5)
+            return filter_value
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            older = executor.submit(self.tracker.run, 'client:ALeRCE', slow_query, 'older')
+            started.wait(5)
+            newer = executor.submit(self.tracker.run, 'client:ALeRCE', lambda filter_value: filter_value, 'newer')
+            self.assertEqual('newer', newer.result())
+
+            # The older query's result is discarded once the broker responds
+            release.set()
+            with self.assertRaises(Superseded):
+                older.result(timeout=2)
+
+    def test_queries_for_other_sessions_are_not_superseded(self):
+        def slow_query(filter_value):
+            time.sleep(0.2)
+            return filter_value
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            first = executor.submit(self.tracker.run, 'first:MARS', slow_query, 'first')
+            second = executor.submit(self.tracker.run, 'second:MARS', slow_query, 'second')
+            self.assertEqual('first', first.result())
+            self.assertEqual('second', second.result())
+
+    def test_check_superseded(self):
+        checks = []
+
+        def query():
+            checks.append(check_superseded())
+            self.tracker.next('client:SCIMMA')  # A newer query is submitted
+            check_superseded()
+
+        with self.assertRaises(Superseded):
+            self.tracker.run('client:SCIMMA', query)
+        self.assertEqual([None], checks)
@@ -0,0 +1,185 @@
+from unittest.mock import MagicMock, patch
+
+from dash import no_update
+from dash.exceptions import PreventUpdate
+from django.test import override_settings, TestCase
+
+from tom_targets.models import Target
+
+from tom_alerts_dash.dash_apps.query_list_app import (create_broker_callbacks, create_broker_container,
+                                                      query_job_results, start_target_job, target_job_progress,
+                                                      with_query_job)
+from tom_alerts_dash.generations import Superseded
+from tom_alerts_dash.jobs import (_run_in_background, get_job_progress, get_query_job, report_progress, run_query_job,
+                                  run_target_creation_job, set_query_job, start_target_creation_job,
+                                  supports_long_callback, supports_target_jobs)
+from tom_alerts_dash.target_index import target_index
+from tom_alerts_dash.tests.factories import SiderealTargetFactory
+from tom_alerts_dash.tests.tests import TestDashBroker
+
+
+def fetch_pages(parameters, max_pages=None):
+    yield [{'id': 'existing'}, {'id': 'a'}, {'id': 'b'}, {'id': 'a'}]
+    yield [{'id': 'b'}, {'id': 'c'}, {'id': 'd'}]
+
+
+def create_target(alert):
+    return SiderealTargetFactory.create(name=alert['id'])
+
+
+@override_settings(TOM_ALERT_DASH_CLASSES=['tom_alerts_dash.tests.tests.TestDashBroker'])
+@patch.object(TestDashBroker, 'fetch_dash_pages', side_effect=fetch_pages)
+@patch.object(TestDashBroker, 'to_target', side_effect=create_target)
+class TestTargetCreationJob(TestCase):
+
+    def setUp(self):
+        SiderealTargetFactory.create(name='existing')
+        target_index.clear()
+
+    def tearDown(self):
+        target_index.clear()
+
+    def test_supports_target_jobs(self, mock_to_target, mock_fetch):
+        self.assertTrue(supports_target_jobs(TestDashBroker()))
+        with patch.object(TestDashBroker, 'supports_paging', False):
+            self.assertFalse(supports_target_jobs(TestDashBroker()))
+        with patch.object(TestDashBroker, 'supports_dash_parameters', False):
+            self.assertFalse(supports_target_jobs(TestDashBroker()))
+
+    def test_run_target_creation_job(self, mock_to_target, mock_fetch):
+        """Test that targets are created from the alerts on all pages, skipping existing targets and duplicates."""
+        progress = run_target_creation_job('job', 'Test Broker', {'test_input': 'value', 'page': 2})
+        self.assertEqual({'status': 'finished', 'fetched': 7, 'created': 4, 'skipped': 3, 'errors': 0, 'error': ''},
+                         progress)
+        self.assertEqual(progress, get_job_progress('job'))
+        mock_fetch.assert_called_once_with({'test_input': 'value'}, max_pages=100)
+        self.assertEqual(['a', 'b', 'c', 'd', 'existing'], sorted(Target.objects.values_list('name', flat=True)))
+
+    @override_settings(TOM_ALERT_DASH_TARGET_JOB_BATCH_SIZE=2)
+    def test_batches(self, mock_to_target, mock_fetch):
+        """Test that progress is reported after each batch, and that failed alerts do not roll back their batch."""
+        mock_to_target.side_effect = lambda alert: (create_target(alert) if alert['id'] != 'c'
+                                                    else Target.objects.create(name=None))
+        reported = []
+        with patch('tom_alerts_dash.jobs.report_progress', side_effect=lambda job_id, progress: reported.append(
+                (progress['fetched'], progress['created'], progress['errors']))):
+            progress = run_target_creation_job('job', 'Test Broker', {})
+        self.assertEqual([(0, 0, 0), (4, 0, 0), (4, 2, 0), (7, 2, 0), (7, 3, 1), (7, 3, 1)], reported)
+        self.assertEqual(3, progress['created'])
+        self.assertEqual(1, progress['errors'])
+        self.assertEqual(['a', 'b', 'd', 'existing'], sorted(Target.objects.values_list('name', flat=True)))
+
+    def test_run_target_creation_job_failure(self, mock_to_target, mock_fetch):
+        mock_fetch.side_effect = Exception('test error')
+        progress = run_target_creation_job('job', 'Test Broker', {})
+        self.assertEqual('failed', progress['status'])
+        self.assertEqual('test error', progress['error'])
+
+    @patch('tom_alerts_dash.jobs._executor')
+    def test_start_target_creation_job(self, mock_executor, mock_to_target, mock_fetch):
+        job_id = start_target_creation_job('Test Broker', {'test_input': 'value'})
+        self.assertEqual('running', get_job_progress(job_id)['status'])
+        mock_executor.submit.assert_called_once_with(_run_in_background, job_id, 'Test Broker', {'test_input': 'value'},
+                                                     notify=None)
+
+    @patch('tom_alerts_dash.jobs._executor')
+    def test_start_target_job(self, mock_executor, mock_to_target, mock_fetch):
+        callback = start_target_job(TestDashBroker(), 'Test Broker')
+        with self.assertRaises(PreventUpdate):
+            callback(None, 0, 20, 'value', 'client')
+        job, disabled = callback(1, 0, 20, 'value', 'client')
+        self.assertFalse(disabled)
+        self.assertEqual({'test_input': 'value', 'page': 1}, mock_executor.submit.call_args.args[3])
+        self.assertEqual('running', get_job_progress(job['job_id'])['status'])
+
+    def test_target_job_progress(self, mock_to_target, mock_fetch):
+        with self.assertRaises(PreventUpdate):
+            target_job_progress(1, None)
+        with self.subTest('Progress is displayed while the job is running'):
+            report_progress('job', {'status': 'running', 'fetched': 10, 'created': 5, 'skipped': 2, 'errors': 0,
+                                    'error': ''})
+            children, disabled = target_job_progress(1, {'job_id': 'job'})
+            self.assertFalse(disabled)
+            self.assertEqual('Created 5 targets from 10 alerts, skipped 2 that are already targets.',
+                             children[0].children)
+        with self.subTest('Polling stops once the job has finished'):
+            run_target_creation_job('job', 'Test Broker', {})
+            children, disabled = target_job_progress(2, {'job_id': 'job'})
+            self.assertTrue(disabled)
+            self.assertEqual('success', children[0].color)
+        with self.subTest('Polling stops if the progress of the job has expired'):
+            children, disabled = target_job_progress(3, {'job_id': 'unknown'})
+            self.assertTrue(disabled)
+
+    def test_create_broker_container(self, mock_to_target, mock_fetch):
+        container = create_broker_container('Test Broker')
+        for key in ['create-all-targets-btn-Test Broker', 'target-job-Test Broker', 'target-job-interval-Test Broker',
+                    'target-job-progress-Test Broker']:
+            self.assertIn(key, container)
+
+
+class TestQueryJob(TestCase):
+
+    def setUp(self):
+        self.callback = query_job_results('Test Broker', 3)
+
+    def test_supports_long_callback(self):
+        self.assertFalse(supports_long_callback(TestDashBroker()))
+        with patch.object(TestDashBroker, 'long_callback', True):
+            self.assertTrue(supports_long_callback(TestDashBroker()))
+            with override_settings(TOM_ALERT_DASH_LONG_CALLBACKS=False):
+                self.assertFalse(supports_long_callback(TestDashBroker()))
+
+    def test_run_query_job(self):
+        with self.subTest('The outputs of the callback are stored'):
+            run_query_job('job', lambda *args: ([{'test_key': args[0]}], []), 'test')
+            self.assertEqual({'status': 'finished', 'outputs': [[{'test_key': 'test'}], []]}, get_query_job('job'))
+        with self.subTest('A callback that prevents the update is recorded'):
+            run_query_job('job', MagicMock(side_effect=Superseded))
+            self.assertEqual({'status': 'prevented'}, get_query_job('job'))
+        with self.subTest('A callback that fails is recorded with its error'):
+            run_query_job('job', MagicMock(side_effect=Exception('test error')))
+            self.assertEqual({'status': 'failed', 'error': 'test error'}, get_query_job('job'))
+
+    @patch('tom_alerts_dash.jobs._query_executor')
+    def test_with_query_job(self, mock_executor):
+        """Test that the query job callback returns the job id without calling the table callback."""
+        table_callback = MagicMock()
+        job = with_query_job(table_callback, 'Test Broker')(0, 20, 'test', '', 'client')
+        table_callback.assert_not_called()
+        self.assertEqual({'status': 'running'}, get_query_job(job['job_id']))
+        self.assertEqual((job['job_id'], table_callback, 0, 20, 'test', '', 'client'),
+                         mock_executor.submit.call_args.args[2:])
+
+    def test_query_job_results(self):
+        with self.assertRaises(PreventUpdate):
+            self.callback(None, None)
+        with self.subTest('The DataTable is unchanged while the job is running'):
+            set_query_job('job', {'status': 'running'})
+            data, banner, page_count, disabled = self.callback({'job_id': 'job'}, None)
+            self.assertEqual((no_update, no_update, False), (data, page_count, disabled))
+            self.assertIn(' Querying Test Broker...', banner[0].children)
+        with self.subTest('The outputs of the finished job are returned and polling stops'):
+            set_query_job('job', {'status': 'finished', 'outputs': [[{'test_key': 'test'}], [], 1]})
+            self.assertEqual(([{'test_key': 'test'}], [], 1, True), self.callback({'job_id': 'job'}, 1))
+        with self.subTest('The error of a failed job is displayed'):
+            set_query_job('job', {'status': 'failed', 'error': 'test error'})
+            data, banner, page_count, disabled = self.callback({'job_id': 'job'}, 2)
+            self.assertEqual(('test error', True), (banner[0].children, disabled))
+        with self.subTest('A prevented update clears the banner'):
+            set_query_job('job', {'status': 'prevented'})
+            self.assertEqual((no_update, [], no_update, True), self.callback({'job_id': 'job'}, 3))
+        with self.subTest('Polling stops if the job has expired'):
+            self.assertTrue(self.callback({'job_id': 'unknown'}, 4)[-1])
+
+    @override_settings(TOM_ALERT_DASH_CLASSES=['tom_alerts_dash.tests.tests.TestDashBroker'])
+    @patch.object(TestDashBroker, 'long_callback', True)
+    @patch('tom_alerts_dash.dash_apps.query_list_app.app')
+    def test_create_broker_callbacks(self, mock_app):
+        """Test that in long callback mode, the DataTable is only updated by the callback that polls for results."""
+        create_broker_callbacks()
+        outputs = [str(output) for call in mock_app.callback.call_args_list
+                   for output in (call.args[0] if isinstance(call.args[0], list) else [call.args[0]])]
+        self.assertEqual(1, outputs.count('alerts-table-Test Broker.data'))
+        self.assertIn('query-job-Test Broker.data', outputs)
+        self.assertIn('query-job-interval-Test Broker', create_broker_container('Test Broker'))
@@ -0,0 +1,117 @@
+import threading
+import time
+from unittest.mock import patch
+
+from dash.exceptions import PreventUpdate
+from django.test import override_settings, TestCase
+
+from tom_alerts_dash.dash_apps.query_list_app import create_broker_container, light_curve_preview
+from tom_alerts_dash.lightcurves import (create_light_curve, get_light_curve, light_curve_cache, LightCurveCache,
+                                         LightCurveUnavailable, supports_light_curves)
+from tom_alerts_dash.tests.tests import TestDashBroker
+
+LIGHT_CURVE = [
+    {'time': 1609459200, 'band': 'g', 'magnitude': 18.5, 'error': 0.1},
+    {'time': 1609545600, 'band': 'r', 'magnitude': 18.2, 'error': 0.05},
+    {'time': 1609372800, 'band': 'g', 'limit': 20.1},
+]
+
+
+class TestLightCurves(TestCase):
+
+    def setUp(self):
+        self.broker = TestDashBroker()
+        self.alert = {'id': 'test alert'}
+        light_curve_cache.clear()
+        light_curve_cache.cache.clear()
+
+    @override_settings(TOM_ALERT_DASH_LIGHT_CURVE_CACHE_SIZE=2)
+    def test_cache_size(self):
+        cache = LightCurveCache()
+        for object_id in ['a', 'b', 'c']:
+            cache._store(object_id, [object_id])
+        cache.get('b')  # Makes 'a' the least recently used
+        cache._store('d', ['d'])
+        self.assertEqual(['b', 'd'], list(cache._light_curves.keys()))
+
+    @override_settings(TOM_ALERT_DASH_LIGHT_CURVE_TTL=60)
+    def test_cache_ttl(self):
+        cache = LightCurveCache()
+        with patch('tom_alerts_dash.lightcurves.time.monotonic', return_value=0):
+            cache._store('a', ['a'])
+        with patch('tom_alerts_dash.lightcurves.time.monotonic', return_value=61):
+            self.assertIsNone(cache.get('a'))
+
+    def test_cache_shared_between_processes(self):
+        """Test that light curves stored by another process are used, and kept by this process."""
+        light_curve_cache.put('a', ['a'])
+        light_curve_cache.clear()
+        self.assertEqual(['a'], light_curve_cache.get('a'))
+        self.assertIn('a', light_curve_cache._light_curves)
+
+    def test_supports_light_curves(self):
+        self.assertFalse(supports_light_curves(self.broker))
+        with patch.object(TestDashBroker, 'supports_light_curves', True):
+            self.assertTrue(supports_light_curves(self.broker))
+
+    @patch.object(TestDashBroker, 'fetch_dash_light_curve', return_value=LIGHT_CURVE)
+    def test_get_light_curve(self, mock_fetch):
+        self.assertEqual(LIGHT_CURVE, get_light_curve(self.broker, self.alert))
+        self.assertEqual(LIGHT_CURVE, get_light_curve(self.broker, self.alert))
+        mock_fetch.assert_called_once_with(self.alert)
+
+    @patch.object(TestDashBroker, 'fetch_dash_light_curve', side_effect=Exception('test error'))
+    def test_get_light_curve_failure(self, mock_fetch):
+        with self.assertRaisesRegex(LightCurveUnavailable, 'Unable to fetch the light curve from Test Broker.'):
+            get_light_curve(self.broker, self.alert)
+
+    @override_settings(TOM_ALERT_DASH_LIGHT_CURVE_TIMEOUT=0.01)
+    def test_get_light_curve_timeout(self):
+        """Test that a slow fetch continues in the background, and that its light curve is cached once fetched."""
+        fetched = threading.Event()
+
+        def slow_fetch(alert):
+            fetched.wait(5)
+            return LIGHT_CURVE
+
+        with patch.object(TestDashBroker, 'fetch_dash_light_curve', side_effect=slow_fetch):
+            with self.assertRaisesRegex(LightCurveUnavailable, 'taking too long'):
+                get_light_curve(self.broker, self.alert)
+            fetched.set()
+            key = light_curve_cache.make_key('Test Broker', 'test alert')
+            for i in range(0, 100):
+                if light_curve_cache.get(key) is not None:
+                    break
+                time.sleep(0.01)
+            self.assertEqual(LIGHT_CURVE, light_curve_cache.get(key))
+
+    def test_create_light_curve(self):
+        figure = create_light_curve('test alert', LIGHT_CURVE)
+        self.assertEqual(['g', 'g limit', 'r'], [trace['name'] for trace in figure['data']])
+        self.assertEqual(['2021-01-01T00:00:00'], figure['data'][0]['x'])
+        self.assertEqual([0.1], figure['data'][0]['error_y']['array'])
+        self.assertEqual([20.1], figure['data'][1]['y'])
+        self.assertEqual('reversed', figure['layout']['yaxis']['autorange'])
+
+    @patch.object(TestDashBroker, 'fetch_dash_light_curve', return_value=LIGHT_CURVE)
+    def test_light_curve_preview(self, mock_fetch):
+        callback = light_curve_preview(self.broker, 'Test Broker')
+        data = [{'test_key': 'test value', 'alert': self.alert}]
+        with self.subTest('The preview is not updated until a cell is selected'):
+            with self.assertRaises(PreventUpdate):
+                callback(None, data)
+        with self.subTest('The light curve of the alert in the selected row is displayed'):
+            preview = callback({'row': 0, 'column': 0, 'column_id': 'test_key'}, data)
+            self.assertEqual('test alert', preview[0].figure['layout']['title'])
+        with self.subTest('An error is displayed if the light curve cannot be fetched'):
+            light_curve_cache.clear()
+            light_curve_cache.cache.clear()
+            mock_fetch.side_effect = Exception('test error')
+            preview = callback({'row': 0, 'column': 0, 'column_id': 'test_key'}, data)
+            self.assertEqual('Unable to fetch the light curve from Test Broker.', preview[0].children)
+
+    @override_settings(TOM_ALERT_DASH_CLASSES=['tom_alerts_dash.tests.tests.TestDashBroker'])
+    @patch.object(TestDashBroker, 'supports_light_curves', True)
+    def test_create_broker_container(self):
+        container = create_broker_container('Test Broker')
+        self.assertIn('light-curve-Test Broker', container)
@@ -0,0 +1,60 @@
+import gzip
+import json
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase
+
+from tom_alerts_dash.middleware import brotli, CompressedDashResponseMiddleware, negotiate_encoding
+
+UPDATE_PATH = '/django_plotly_dash/app/BrokerQueryListViewDash/_dash-update-component'
+
+
+class TestCompressedDashResponseMiddleware(TestCase):
+
+    def setUp(self):
+        self.content = json.dumps({'response': {'alerts-table-MARS': {'data': [{'objectId': 'ZTF21abcdefg'}] * 50}}})
+        self.middleware = CompressedDashResponseMiddleware(
+            lambda request: HttpResponse(self.content, content_type='application/json')
+        )
+
+    def get_response(self, path=UPDATE_PATH, accept_encoding='gzip, deflate, br'):
+        request = RequestFactory().post(path, HTTP_ACCEPT_ENCODING=accept_encoding)
+        return self.middleware(request)
+
+    @skipUnless(brotli, 'brotli is not installed')
+    def test_negotiate_encoding(self):
+        self.assertEqual('br', negotiate_encoding('gzip, deflate, br'))
+        self.assertEqual('gzip', negotiate_encoding('gzip, br;q=0'))
+        self.assertEqual('gzip', negotiate_encoding('GZIP;q=0.5'))
+        self.assertEqual('br', negotiate_encoding('*'))
+        self.assertIsNone(negotiate_encoding('deflate'))
+        self.assertIsNone(negotiate_encoding(''))
+        with patch('tom_alerts_dash.middleware.brotli', None):
+            self.assertEqual('gzip', negotiate_encoding('gzip, deflate, br'))
+
+    @skipUnless(brotli, 'brotli is not installed')
+    def test_brotli(self):
+        response = self.get_response()
+        self.assertEqual('br', response['Content-Encoding'])
+        self.assertEqual(self.content.encode('utf-8'), brotli.decompress(response.content))
+        self.assertEqual(str(len(response.content)), response['Content-Length'])
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_gzip(self):
+        response = self.get_response(accept_encoding='gzip')
+        self.assertEqual('gzip', response['Content-Encoding'])
+        self.assertEqual(self.content.encode('utf-8'), gzip.decompress(response.content))
+
+    def test_not_compressed(self):
+        with self.subTest('Compression is not accepted'):
+            response = self.get_response(accept_encoding='identity')
+            self.assertFalse(response.has_header('Content-Encoding'))
+            self.assertIn('Accept-Encoding', response['Vary'])
+        with self.subTest('The response is not a callback response of the browse app'):
+            response = self.get_response(path='/django_plotly_dash/app/OtherDash/_dash-update-component')
+            self.assertFalse(response.has_header('Content-Encoding'))
+        with self.subTest('The response is too small'):
+            self.content = '{}'
+            self.assertFalse(self.get_response().has_header('Content-Encoding'))
@@ -0,0 +1,147 @@
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import override_settings, TestCase
+
+from tom_alerts_dash.alerts import GenericDashBroker
+from tom_alerts_dash.brokers.mars import MARSDashBroker
+from tom_alerts_dash.planner import Constraint, QueryPlanner
+from tom_alerts_dash.resilience import response_freshness
+from tom_alerts_dash.tests.factories import create_mars_alert
+
+
+class PlannerBroker(GenericDashBroker):
+    name = 'Planner Broker'
+    dash_planner = QueryPlanner([
+        Constraint('mag__lte', 'candidate.mag', 'lte'),
+        Constraint('rank__lte', 'rank', 'lte', pushdown=False),
+    ], results_key='results', is_complete=lambda parameters, response: not response['has_next'])
+
+    def _request_alerts(self, parameters):
+        return {'results': [], 'has_next': False}
+
+    def fetch_alerts(self):
+        return []
+
+    def get_dash_filters(self):
+        return None
+
+    def to_generic_alert(self):
+        return
+
+
+class TestConstraint(TestCase):
+
+    def test_evaluate(self):
+        alerts = [{'candidate': {'mag': 18}}, {'candidate': {'mag': 20.5}}, {'candidate': {'mag': None}}, {}]
+        self.assertEqual([True, False, False, False],
+                         Constraint('mag__lte', 'candidate.mag', 'lte').evaluate(alerts, 19).tolist())
+        self.assertEqual([False, True, False, False],
+                         Constraint('mag__gt', 'candidate.mag', 'gt').evaluate(alerts, '19').tolist())
+        self.assertEqual([True, False],
+                         Constraint('kind', 'kind', 'eq').evaluate([{'kind': 'SN'}, {'kind': 'AGN'}], 'SN').tolist())
+
+    def test_implies(self):
+        lte, lt = Constraint('mag__lte', 'mag', 'lte'), Constraint('mag__lt', 'mag', 'lt')
+        gte, eq = Constraint('mag__gte', 'mag', 'gte'), Constraint('mag', 'mag', 'eq')
+        self.assertTrue(lte.implies(19, lte, 20))
+        self.assertTrue(lte.implies(20, lte, 20))
+        self.assertFalse(lte.implies(20, lte, 19))
+        self.assertFalse(lte.implies(20, lt, 20))
+        self.assertTrue(lt.implies(20, lte, 20))
+        self.assertFalse(lte.implies(19, gte, 18))
+        self.assertTrue(eq.implies(19, lte, 20))
+        self.assertFalse(lte.implies(19, eq, 19))
+        self.assertFalse(lte.implies(19, Constraint('rb__lte', 'rb', 'lte'), 20))
+
+
+class TestQueryPlanner(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.broker = PlannerBroker()
+        self.alerts = [{'id': i, 'rank': i % 4, 'candidate': {'mag': 16 + i / 10}} for i in range(0, 40)]
+
+    def test_plan(self):
+        plan = PlannerBroker.dash_planner.plan({'kind': 'SN', 'mag__lte': 20, 'rank__lte': 2, 'page': 2})
+        self.assertEqual({'kind': 'SN', 'mag__lte': 20, 'page': 2}, plan.parameters)
+        self.assertEqual([('mag__lte', 20)], [(c.parameter, value) for c, value in plan.pushed_down])
+        self.assertEqual([('rank__lte', 2)], [(c.parameter, value) for c, value in plan.residual])
+        self.assertEqual({'kind': 'SN'}, plan.base)
+        self.assertEqual(2, plan.page)
+
+    def test_residual_predicates(self):
+        """Test that residual predicates are not sent to the broker, and are evaluated on the alerts it returns."""
+        with patch.object(PlannerBroker, '_request_alerts', return_value={'results': self.alerts, 'has_next': True}) \
+                as mock_request_alerts:
+            response = self.broker.request_dash_alerts({'mag__lte': 20, 'rank__lte': 1, 'page': 1}, allow_stale=False)
+        self.assertEqual({'mag__lte': 20, 'page': 1}, mock_request_alerts.call_args.args[0])
+        self.assertEqual([alert for alert in self.alerts if alert['rank'] <= 1], response['results'])
+        self.assertTrue(response['has_next'])
+
+    def test_residual_predicates_fill_page(self):
+        """Test that a page of a DataTable is filled with matching alerts from as many pages of the broker as needed."""
+        def request_alerts(parameters):
+            page = parameters['page']
+            return {'results': self.alerts[(page - 1) * 10:page * 10], 'has_next': page < 4}
+
+        matches = [alert for alert in self.alerts if alert['rank'] <= 1]
+        with patch.object(PlannerBroker, '_request_alerts', side_effect=request_alerts) as mock_request_alerts:
+            response = self.broker.request_dash_alerts({'mag__lte': 20, 'rank__lte': 1, 'page': 1})
+            self.assertEqual(matches[:10], response['results'])
+            self.assertEqual([{'mag__lte': 20, 'page': page} for page in range(1, 3)],
+                             [call.args[0] for call in mock_request_alerts.call_args_list])
+            self.assertFalse(response_freshness.get().stale)
+
+            response = self.broker.request_dash_alerts({'mag__lte': 20, 'rank__lte': 1, 'page': 2})
+            self.assertEqual(matches[10:20], response['results'])
+            self.assertFalse(response['has_next'])
+
+            response = self.broker.request_dash_alerts({'mag__lte': 20, 'rank__lte': 1, 'page': 3})
+            self.assertEqual([], response['results'])
+
+    @override_settings(TOM_ALERT_DASH_RESIDUAL_MAX_PAGES=2)
+    def test_residual_predicates_max_pages(self):
+        page = {'results': self.alerts[:10], 'has_next': True}
+        with patch.object(PlannerBroker, '_request_alerts', return_value=page) as mock_request_alerts:
+            response = self.broker.request_dash_alerts({'rank__lte': 0, 'page': 1})
+        self.assertEqual(2, mock_request_alerts.call_count)
+        self.assertEqual([alert for alert in self.alerts[:10] if alert['rank'] == 0] * 2, response['results'])
+
+    def test_narrowing_query_answered_from_superset(self):
+        with patch.object(PlannerBroker, '_request_alerts', return_value={'results': self.alerts, 'has_next': False}) \
+                as mock_request_alerts:
+            self.broker.request_dash_alerts({'kind': 'SN', 'mag__lte': 20, 'page': 1})
+            first_freshness = response_freshness.get()
+            self.assertFalse(first_freshness.narrowed)
+            response = self.broker.request_dash_alerts({'kind': 'SN', 'mag__lte': 18, 'rank__lte': 2, 'page': 1})
+            self.assertEqual(1, mock_request_alerts.call_count)
+            self.assertEqual([alert for alert in self.alerts if alert['candidate']['mag'] <= 18 and alert['rank'] <= 2],
+                             response['results'])
+            self.assertTrue(response_freshness.get().narrowed)
+            self.assertEqual(first_freshness.fetched_at, response_freshness.get().fetched_at)
+
+            # Broader queries, other base parameters, later pages, and fresh requests are sent to the broker
+            self.broker.request_dash_alerts({'kind': 'SN', 'mag__lte': 21, 'page': 1})
+            self.broker.request_dash_alerts({'kind': 'SN', 'page': 1})
+            self.broker.request_dash_alerts({'kind': 'AGN', 'mag__lte': 18, 'page': 1})
+            self.broker.request_dash_alerts({'kind': 'SN', 'mag__lte': 18, 'page': 2})
+            self.broker.request_dash_alerts({'kind': 'SN', 'mag__lte': 18, 'page': 1}, allow_stale=False)
+            self.assertEqual(6, mock_request_alerts.call_count)
+
+    def test_incomplete_response_not_kept(self):
+        with patch.object(PlannerBroker, '_request_alerts', return_value={'results': self.alerts, 'has_next': True}) \
+                as mock_request_alerts:
+            self.broker.request_dash_alerts({'mag__lte': 20, 'page': 1})
+            self.broker.request_dash_alerts({'mag__lte': 18, 'page': 1})
+            self.assertEqual(2, mock_request_alerts.call_count)
+
+    @patch('tom_alerts.brokers.mars.MARSBroker._request_alerts')
+    def test_mars_tighter_magnitude_cut(self, mock_request_alerts):
+        alerts = [create_mars_alert(magpsf=16 + i / 4) for i in range(0, 20)]
+        mock_request_alerts.return_value = {'results': alerts, 'has_next': False}
+        broker = MARSDashBroker()
+        broker.request_dash_alerts(broker.get_dash_parameters(0, 20, '', '', '', '', 20, None, None, None, 1))
+        parameters = broker.get_dash_parameters(0, 20, '', '', '', '', 18, None, None, None, 2)
+        response = broker.request_dash_alerts(parameters)
+        self.assertEqual(1, mock_request_alerts.call_count)
+        self.assertEqual([alert for alert in alerts if alert['candidate']['magpsf'] <= 18], response['results'])
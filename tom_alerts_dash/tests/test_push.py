@@ -0,0 +1,101 @@
+from importlib.util import find_spec
+import json
+from unittest import skipUnless
+from unittest.mock import MagicMock, patch
+
+from dash.exceptions import PreventUpdate
+from django.test import override_settings, TestCase
+
+from tom_alerts.models import BrokerQuery
+from tom_alerts_dash.dash_apps.query_list_app import (create_broker_callbacks, create_layout, get_poll_interval,
+                                                      push_channels, query_job_results, with_pushed_alerts)
+from tom_alerts_dash.jobs import run_query_job, run_target_creation_job, set_query_job
+from tom_alerts_dash.models import ScheduledBrokerQuery
+from tom_alerts_dash.push import push, push_enabled, session_notifier
+from tom_alerts_dash.scheduler import run_scheduled_query
+from tom_alerts_dash.tests.tests import TestDashBroker
+
+
+class TestPush(TestCase):
+
+    def test_push_disabled(self):
+        """Test that nothing is pushed unless push is enabled in settings."""
+        self.assertFalse(push_enabled())
+        self.assertFalse(push('tom_alerts_dash_session_client', 'query-Test Broker', {'job_id': 'job'}))
+        self.assertIsNone(session_notifier('client', 'query-Test Broker'))
+
+    @patch('tom_alerts_dash.push.push')
+    @patch('tom_alerts_dash.push.push_enabled', return_value=True)
+    def test_session_notifier(self, mock_enabled, mock_push):
+        session_notifier('client', 'query-Test Broker')('job')
+        mock_push.assert_called_once_with('tom_alerts_dash_session_client', 'query-Test Broker', {'job_id': 'job'})
+        self.assertIsNone(session_notifier(None, 'query-Test Broker'))
+
+    def test_jobs_notify(self):
+        """Test that query jobs notify once their result is stored, and target jobs whenever they report progress."""
+        notify = MagicMock()
+        run_query_job('job', lambda *args: ([], []), notify=notify)
+        notify.assert_called_once_with('job')
+
+        notify.reset_mock()
+        run_target_creation_job('job', 'Unknown Broker', {}, notify=notify)
+        self.assertEqual(2, notify.call_count)
+
+    def test_push_channels(self):
+        callback = push_channels(2)
+        with self.assertRaises(PreventUpdate):
+            callback(None, '')
+        self.assertEqual(['tom_alerts_dash_session_client'] * 2 + [''], callback('client', ''))
+        self.assertEqual('tom_alerts_dash_query_3', callback('client', '?query=3')[-1])
+
+    def test_pushed_triggers(self):
+        """Test that callbacks triggered by pushed updates ignore the value pushed."""
+        table_callback = MagicMock(return_value=([], []))
+        with_pushed_alerts(table_callback)(0, 20, 'test', '', '{"fetched": 1}')
+        table_callback.assert_called_once_with(0, 20, 'test', '')
+
+        set_query_job('job', {'status': 'finished', 'outputs': [[{'test_key': 'test'}], []]})
+        self.assertEqual(([{'test_key': 'test'}], [], True),
+                         query_job_results('Test Broker', 2)({'job_id': 'job'}, None, '{"job_id": "job"}'))
+
+    @override_settings(TOM_ALERT_DASH_PUSH_FALLBACK_INTERVAL=5000)
+    def test_poll_interval(self):
+        self.assertEqual(500, get_poll_interval())
+        with patch('tom_alerts_dash.dash_apps.query_list_app.push_enabled', return_value=True):
+            self.assertEqual(5000, get_poll_interval())
+
+    @override_settings(TOM_ALERT_DASH_CLASSES=['tom_alerts_dash.tests.tests.TestDashBroker'])
+    @patch.object(TestDashBroker, 'long_callback', True)
+    @patch('tom_alerts_dash.dash_apps.query_list_app.push_enabled', return_value=True)
+    @patch('tom_alerts_dash.dash_apps.query_list_app.app')
+    def test_create_broker_callbacks(self, mock_app, mock_enabled):
+        """Test that the DataTable and the query job results are triggered by the updates pushed to their pipes."""
+        create_broker_callbacks()
+        inputs = [str(callback_input) for call in mock_app.callback.call_args_list for callback_input in call.args[1]]
+        self.assertIn('push-alerts.value', inputs)
+        self.assertIn('push-query-Test Broker.value', inputs)
+        self.assertIn('push-alerts', create_layout())
+
+    @override_settings(TOM_ALERT_DASH_CLASSES=['tom_alerts_dash.tests.tests.TestDashBroker'])
+    @patch('tom_alerts_dash.scheduler.push')
+    def test_scheduled_query_pushes_alerts(self, mock_push):
+        query = BrokerQuery.objects.create(name='Scheduled Query', broker='Test Broker',
+                                           parameters={'test_input': 'page 1'})
+        run_scheduled_query(ScheduledBrokerQuery.objects.create(query=query, interval=30))
+        channel_name, label, value = mock_push.call_args.args
+        self.assertEqual((f'tom_alerts_dash_query_{query.id}', 'alerts', 2), (channel_name, label, value['fetched']))
+
+    @skipUnless(find_spec('channels'), 'channels is not installed')
+    @override_settings(TOM_ALERT_DASH_PUSH=True,
+                       CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+    def test_push_to_channel_layer(self):
+        """Test that pushed values reach the pipes listening on the channel."""
+        from asgiref.sync import async_to_sync
+        from channels.layers import get_channel_layer
+
+        channel_layer = get_channel_layer()
+        channel = async_to_sync(channel_layer.new_channel)()
+        async_to_sync(channel_layer.group_add)('dpd_pipe_tom_alerts_dash_session_client', channel)
+        self.assertTrue(push('tom_alerts_dash_session_client', 'query-Test Broker', {'job_id': 'job'}))
+        message = async_to_sync(channel_layer.receive)(channel)
+        self.assertEqual({'job_id': 'job'}, json.loads(message['value']))
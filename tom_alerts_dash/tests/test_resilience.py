@@ -0,0 +1,154 @@
+import threading
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import override_settings, TestCase
+
+from tom_alerts_dash.resilience import (BrokerGuard, BrokerUnavailable, CircuitBreaker, get_broker_guard, in_background,
+                                        LazyExecutor, TokenBucket)
+from tom_alerts_dash.serializers import get_serializer
+from tom_alerts_dash.tests.factories import create_alerce_alert
+
+
+class TestTokenBucket(TestCase):
+
+    def test_acquire(self):
+        bucket = TokenBucket(rate=10, burst=2)
+        self.assertTrue(bucket.acquire())
+        self.assertTrue(bucket.acquire())
+        self.assertFalse(bucket.acquire())  # Burst is exhausted
+        self.assertTrue(bucket.acquire(timeout=0.5))  # A token is added every 0.1 seconds
+
+    def test_acquire_with_reserve(self):
+        bucket = TokenBucket(rate=0.01, burst=3)
+        self.assertTrue(bucket.acquire(reserve=2))
+        self.assertFalse(bucket.acquire(reserve=2))  # Two tokens are left for requests without a reserve
+        self.assertTrue(bucket.acquire())
+        self.assertTrue(bucket.acquire())
+
+
+class TestCircuitBreaker(TestCase):
+
+    @patch('tom_alerts_dash.resilience.time.monotonic')
+    def test_circuit_breaker(self, mock_monotonic):
+        mock_monotonic.return_value = 100
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+
+        breaker.record_failure()
+        self.assertEqual(CircuitBreaker.CLOSED, breaker.state)
+        breaker.record_failure()
+        self.assertEqual(CircuitBreaker.OPEN, breaker.state)
+        self.assertFalse(breaker.allow_request())
+
+        mock_monotonic.return_value = 130
+        self.assertEqual(CircuitBreaker.HALF_OPEN, breaker.state)
+        self.assertTrue(breaker.allow_request())
+        self.assertFalse(breaker.allow_request())  # Only a single trial request is allowed
+
+        breaker.record_failure()  # A failed trial opens the circuit again
+        self.assertEqual(CircuitBreaker.OPEN, breaker.state)
+
+        mock_monotonic.return_value = 160
+        self.assertTrue(breaker.allow_request())
+        breaker.record_success()
+        self.assertEqual(CircuitBreaker.CLOSED, breaker.state)
+
+
+class TestBrokerGuard(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.guard = BrokerGuard('ALeRCE', rate=100, burst=100, failure_threshold=1, reset_timeout=30,
+                                 latency_budget=0.1, stale_timeout=60)
+        self.response = {'items': [create_alerce_alert()]}
+
+    def test_fresh_result(self):
+        response, freshness = self.guard.call('key', lambda: self.response)
+        self.assertEqual(self.response, response)
+        self.assertFalse(freshness.stale)
+
+    def test_slow_request_serves_stale_result(self):
+        self.guard.call('key', lambda: self.response)
+
+        release = threading.Event()
+        refreshed_response = {'items': [create_alerce_alert()]}
+
+        def slow_request():
+            release.wait(5)
+            return refreshed_response
+
+        response, freshness = self.guard.call('key', slow_request)
+        self.assertEqual(self.response, response)
+        self.assertTrue(freshness.stale)
+
+        # The request completes in the background and refreshes the stale result
+        release.set()
+        for i in range(0, 50):
+            if get_serializer().loads(cache.get('tom_alerts_dash:last:key'))[1] == refreshed_response:
+                break
+            threading.Event().wait(0.1)
+        self.assertEqual(refreshed_response, get_serializer().loads(cache.get('tom_alerts_dash:last:key'))[1])
+
+    def test_fresh_result_required(self):
+        self.guard.call('key', lambda: self.response)
+
+        refreshed_response = {'items': [create_alerce_alert()]}
+        response, freshness = self.guard.call('key', lambda: refreshed_response, allow_stale=False)
+        self.assertEqual(refreshed_response, response)
+        self.assertFalse(freshness.stale)
+        # The fresh result is not stored as the last result
+        self.assertEqual(self.response, get_serializer().loads(cache.get('tom_alerts_dash:last:key'))[1])
+
+    def test_background_requests_leave_reserve(self):
+        """Test that background requests only take tokens while more than the reserve are left for other requests."""
+        guard = BrokerGuard('ALeRCE', rate=0.01, burst=3, failure_threshold=1, reset_timeout=30, latency_budget=0.1,
+                            stale_timeout=60, interactive_reserve=2, background_timeout=0.1)
+        with in_background():
+            guard.call('key', lambda: self.response, allow_stale=False)
+            with self.assertRaises(BrokerUnavailable):
+                guard.call('key', lambda: self.response, allow_stale=False)
+        for i in range(0, 2):
+            response, freshness = guard.call('key', lambda: self.response, allow_stale=False)
+            self.assertEqual(self.response, response)
+
+    def test_open_circuit_serves_stale_result(self):
+        self.guard.call('key', lambda: self.response)
+
+        def failing_request():
+            raise ConnectionError('ALeRCE is down')
+
+        response, freshness = self.guard.call('key', failing_request)  # Failure is covered by the stale result
+        self.assertTrue(freshness.stale)
+        self.assertEqual(CircuitBreaker.OPEN, self.guard.breaker.state)
+
+        with patch.object(self.guard, '_fetch') as mock_fetch:
+            response, freshness = self.guard.call('key', failing_request)
+            mock_fetch.assert_not_called()
+        self.assertEqual(self.response, response)
+        self.assertTrue(freshness.stale)
+
+    def test_open_circuit_without_stale_result(self):
+        def failing_request():
+            raise ConnectionError('ALeRCE is down')
+
+        with self.assertRaises(ConnectionError):
+            self.guard.call('key', failing_request)
+        with self.assertRaises(BrokerUnavailable):
+            self.guard.call('key', failing_request)
+
+    @override_settings(TOM_ALERT_DASH_BROKER_LIMITS={'default': {'rate': 1}, 'Test Limits Broker': {'burst': 3}})
+    def test_get_broker_guard(self):
+        guard = get_broker_guard('Test Limits Broker')
+        self.assertEqual(1, guard.bucket.rate)
+        self.assertEqual(3, guard.bucket.burst)
+        self.assertIs(guard, get_broker_guard('Test Limits Broker'))
+
+
+class TestLazyExecutor(TestCase):
+
+    def test_created_on_first_use(self):
+        """Test that the number of workers is read from the settings in effect when the pool is first used."""
+        executor = LazyExecutor('TOM_ALERT_DASH_BACKGROUND_WORKERS', 4, 'tom_alerts_dash_test')
+        with override_settings(TOM_ALERT_DASH_BACKGROUND_WORKERS=1):
+            self.assertEqual(2, executor.submit(lambda value: value + 1, 1).result())
+            self.assertEqual(1, executor.executor._max_workers)
@@ -0,0 +1,175 @@
+from datetime import datetime, timedelta
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command, CommandError
+from django.test import override_settings, TestCase
+from django.utils import timezone
+
+from tom_alerts.models import BrokerQuery
+from tom_alerts_dash.models import ScheduledBrokerQuery
+from tom_alerts_dash.resilience import Freshness, response_freshness
+from tom_alerts_dash.scheduler import (claim, get_incremental_overlap, merge_alerts, run_due_queries,
+                                       run_scheduled_query, seconds_until_next_run)
+from tom_alerts_dash.tests.tests import TestDashBroker
+
+
+@override_settings(TOM_ALERT_DASH_CLASSES=['tom_alerts_dash.tests.tests.TestDashBroker'])
+class TestScheduler(TestCase):
+
+    def setUp(self):
+        self.query = BrokerQuery.objects.create(name='Scheduled Query', broker='Test Broker',
+                                                parameters={'test_input': 'page 1'})
+        self.scheduled_query = ScheduledBrokerQuery.objects.create(query=self.query, interval=30)
+
+    def fetch_dash_pages(self, parameters, max_pages=None):
+        for page in range(0, 5)[:max_pages]:
+            yield [{'test_key': f'page {page}'}]
+
+    def test_run_due_queries(self):
+        now = timezone.now()
+        self.assertEqual(1, run_due_queries(now))
+
+        self.scheduled_query.refresh_from_db()
+        self.query.refresh_from_db()
+        self.assertEqual([{'test_key': 'page 1'}, {'test_key': 'page 2'}], self.scheduled_query.alerts)
+        self.assertEqual(now + timedelta(minutes=30), self.scheduled_query.next_run)
+        self.assertIsNotNone(self.scheduled_query.last_run)
+        self.assertEqual(self.scheduled_query.last_run, self.query.last_run)
+
+        self.assertEqual(0, run_due_queries(now + timedelta(minutes=29)))  # The query is not due again yet
+
+    @patch.object(TestDashBroker, 'get_dash_alert_time', return_value=timezone.make_aware(datetime(2021, 1, 2)))
+    def test_run_incremental_query(self, mock_alert_time):
+        ScheduledBrokerQuery.objects.filter(pk=self.scheduled_query.pk).update(
+            incremental=True, alerts=[{'test_key': 'stored'}], high_water_mark=timezone.make_aware(datetime(2021, 1, 1))
+        )
+        self.scheduled_query.refresh_from_db()
+        run_scheduled_query(self.scheduled_query)
+
+        self.scheduled_query.refresh_from_db()
+        self.assertEqual([{'test_key': 'since 2021'}, {'test_key': 'page 2'}, {'test_key': 'stored'}],
+                         self.scheduled_query.alerts)
+        # The high-water mark is the time of the newest alert, less the overlap, rather than the time of the run
+        self.assertEqual(timezone.make_aware(datetime(2021, 1, 2)) - get_incremental_overlap(),
+                         self.scheduled_query.high_water_mark)
+
+    @patch.object(TestDashBroker, 'get_dash_alert_time', return_value=timezone.make_aware(datetime(2021, 1, 2)))
+    def test_run_incremental_query_first_run(self, mock_alert_time):
+        """Test that the first run of an incremental query fetches all alerts."""
+        ScheduledBrokerQuery.objects.filter(pk=self.scheduled_query.pk).update(incremental=True)
+        self.scheduled_query.refresh_from_db()
+        run_scheduled_query(self.scheduled_query)
+        self.assertEqual([{'test_key': 'page 1'}, {'test_key': 'page 2'}], self.scheduled_query.alerts)
+        self.assertIsNotNone(self.scheduled_query.high_water_mark)
+
+    def test_high_water_mark_does_not_move_back(self):
+        """Test that a run that only fetches older alerts, or alerts without a time, keeps the high-water mark."""
+        high_water_mark = timezone.make_aware(datetime(2021, 1, 1))
+        ScheduledBrokerQuery.objects.filter(pk=self.scheduled_query.pk).update(incremental=True,
+                                                                               high_water_mark=high_water_mark)
+        self.scheduled_query.refresh_from_db()
+        for alert_time in [None, high_water_mark]:
+            with self.subTest(alert_time=alert_time):
+                with patch.object(TestDashBroker, 'get_dash_alert_time', return_value=alert_time):
+                    run_scheduled_query(self.scheduled_query)
+                self.scheduled_query.refresh_from_db()
+                self.assertEqual(high_water_mark, self.scheduled_query.high_water_mark)
+
+    @override_settings(TOM_ALERT_DASH_SCHEDULED_QUERY_MAX_PAGES=1)
+    def test_run_incremental_query_max_pages(self):
+        """Test that incremental runs are limited to the maximum number of pages, and that reaching it is logged."""
+        ScheduledBrokerQuery.objects.filter(pk=self.scheduled_query.pk).update(
+            incremental=True, high_water_mark=timezone.make_aware(datetime(2021, 1, 1))
+        )
+        self.scheduled_query.refresh_from_db()
+        with patch.object(TestDashBroker, 'fetch_dash_pages', side_effect=self.fetch_dash_pages):
+            with self.assertLogs('tom_alerts_dash.scheduler', 'WARNING'):
+                run_scheduled_query(self.scheduled_query)
+        self.assertEqual([{'test_key': 'page 0'}], self.scheduled_query.alerts)
+
+    @override_settings(TOM_ALERT_DASH_SCHEDULED_QUERY_MAX_ALERTS=3)
+    def test_run_scheduled_query_max_alerts(self):
+        with patch.object(TestDashBroker, 'fetch_dash_pages', side_effect=self.fetch_dash_pages):
+            run_scheduled_query(self.scheduled_query)
+        self.assertEqual([{'test_key': f'page {page}'} for page in range(0, 3)], self.scheduled_query.alerts)
+
+    def test_merge_alerts(self):
+        stored_alerts = [{'test_key': 'stored 1', 'alert': {'id': 1}}, {'test_key': 'stored 2', 'alert': {'id': 2}}]
+        new_alerts = [{'test_key': 'new 2', 'alert': {'id': 2}}, {'test_key': 'new 3', 'alert': {'id': 3}}]
+        self.assertEqual(['new 2', 'new 3', 'stored 1'],
+                         [alert['test_key'] for alert in merge_alerts(TestDashBroker(), new_alerts, stored_alerts)])
+        self.assertEqual(['new 2', 'new 3'], [alert['test_key'] for alert in
+                                              merge_alerts(TestDashBroker(), new_alerts, stored_alerts, max_alerts=2)])
+
+    def test_run_due_queries_error(self):
+        with patch('tom_alerts_dash.tests.tests.TestDashBroker.fetch_dash_pages') as mock_fetch_dash_pages:
+            mock_fetch_dash_pages.side_effect = ConnectionError('Test Broker is down')
+            self.assertEqual(0, run_due_queries())
+
+        self.scheduled_query.refresh_from_db()
+        self.assertEqual('Test Broker is down', self.scheduled_query.last_error)
+        self.assertIsNone(self.scheduled_query.last_run)
+        self.assertGreater(self.scheduled_query.next_run, timezone.now())  # The query is retried at its next run
+
+    def test_run_with_stale_results_fails(self):
+        """Test that a run that is only given a stale response does not replace the stored alerts or move last_run."""
+        def stale_pages(parameters, max_pages=None):
+            response_freshness.set(Freshness(0, stale=True))
+            yield [{'test_key': 'stale'}]
+
+        ScheduledBrokerQuery.objects.filter(pk=self.scheduled_query.pk).update(alerts=[{'test_key': 'stored'}])
+        with patch('tom_alerts_dash.tests.tests.TestDashBroker.fetch_dash_pages', side_effect=stale_pages):
+            self.assertEqual(0, run_due_queries())
+
+        self.scheduled_query.refresh_from_db()
+        self.assertEqual([{'test_key': 'stored'}], self.scheduled_query.alerts)
+        self.assertIsNone(self.scheduled_query.last_run)
+        self.assertIsNone(self.scheduled_query.high_water_mark)
+        self.assertIn('only returned results from', self.scheduled_query.last_error)
+
+    def test_claim(self):
+        """Test that a due run can only be claimed by a single worker."""
+        now = timezone.now()
+        other_worker_copy = ScheduledBrokerQuery.objects.get(pk=self.scheduled_query.pk)
+        self.assertTrue(claim(self.scheduled_query, now))
+        self.assertFalse(claim(other_worker_copy, now))
+
+    def test_seconds_until_next_run(self):
+        now = timezone.now()
+        ScheduledBrokerQuery.objects.filter(pk=self.scheduled_query.pk).update(next_run=now + timedelta(seconds=90))
+        self.assertEqual(90, seconds_until_next_run(now))
+        ScheduledBrokerQuery.objects.all().delete()
+        self.assertIsNone(seconds_until_next_run(now))
+
+
+@override_settings(TOM_ALERT_DASH_CLASSES=['tom_alerts_dash.tests.tests.TestDashBroker'])
+class TestSchedulerCommands(TestCase):
+
+    def setUp(self):
+        self.query = BrokerQuery.objects.create(name='Scheduled Query', broker='Test Broker', parameters={})
+
+    def test_schedulebrokerquery(self):
+        call_command('schedulebrokerquery', 'Scheduled Query', '15', stdout=StringIO())
+        self.assertEqual(15, ScheduledBrokerQuery.objects.get(query=self.query).interval)
+
+        call_command('schedulebrokerquery', 'Scheduled Query', '--remove', stdout=StringIO())
+        self.assertFalse(ScheduledBrokerQuery.objects.filter(query=self.query).exists())
+
+    def test_schedulebrokerquery_incremental(self):
+        call_command('schedulebrokerquery', 'Scheduled Query', '15', '--incremental', stdout=StringIO())
+        self.assertTrue(ScheduledBrokerQuery.objects.get(query=self.query).incremental)
+
+    def test_schedulebrokerquery_errors(self):
+        BrokerQuery.objects.create(name='Lasair Query', broker='Lasair', parameters={})
+        for args in [['Missing Query', '15'], ['Lasair Query', '15'], ['Scheduled Query']]:
+            with self.subTest(args=args), self.assertRaises(CommandError):
+                call_command('schedulebrokerquery', *args, stdout=StringIO())
+        with patch.object(TestDashBroker, 'supports_paging', False), self.assertRaises(CommandError):
+            call_command('schedulebrokerquery', 'Scheduled Query', '15', stdout=StringIO())
+
+    def test_runscheduledqueries(self):
+        ScheduledBrokerQuery.objects.create(query=self.query, interval=15)
+        out = StringIO()
+        call_command('runscheduledqueries', stdout=out)
+        self.assertIn('Ran 1 scheduled queries.', out.getvalue())
@@ -0,0 +1,75 @@
+from unittest import skipUnless
+
+from django.core.cache import cache
+from django.test import override_settings, TestCase
+
+from tom_alerts_dash import serializers
+from tom_alerts_dash.serializers import (CompressedSerializer, CompressionDictionaries, compression_dictionaries,
+                                         get_serializer, PassthroughSerializer)
+from tom_alerts_dash.tests.factories import create_mars_alert
+
+
+@skipUnless(serializers.zstd, 'No Zstandard module is installed')
+class TestCompressedSerializer(TestCase):
+    def setUp(self):
+        compression_dictionaries.clear()
+        cache.clear()
+        self.serializer = CompressedSerializer()
+
+    def tearDown(self):
+        compression_dictionaries.clear()
+
+    def test_round_trip(self):
+        response = {'results': [create_mars_alert() for i in range(0, 10)], 'has_next': False}
+        data = self.serializer.dumps(response, 'MARS')
+        self.assertTrue(data[0] & serializers.COMPRESSED)
+        self.assertEqual(response, self.serializer.loads(data))
+        self.assertIsNone(self.serializer.loads(None))
+
+    def test_small_values_not_compressed(self):
+        data = self.serializer.dumps({'has_next': False}, 'MARS')
+        self.assertFalse(data[0] & serializers.COMPRESSED)
+        self.assertEqual({'has_next': False}, self.serializer.loads(data))
+
+    @skipUnless(serializers.msgpack is None, 'Tuples are decoded as lists by msgpack')
+    def test_tuples_preserved(self):
+        value = ('2021-01-01', {'results': [create_mars_alert()]})
+        self.assertEqual(value, self.serializer.loads(self.serializer.dumps(value, 'MARS')))
+
+    @override_settings(TOM_ALERT_DASH_CACHE_DICTIONARY_SAMPLES=20)
+    def test_dictionary_shared_between_processes(self):
+        """Test that a dictionary is trained on the samples of a namespace, and used by another process to decode."""
+        for i in range(0, 20):
+            self.serializer.dumps([create_mars_alert() for j in range(0, 3)], 'MARS')
+        dictionary = compression_dictionaries.get('MARS')
+        self.assertIsNotNone(dictionary)
+
+        value = [create_mars_alert() for i in range(0, 3)]
+        data = self.serializer.dumps(value, 'MARS')
+        self.assertEqual(dictionary.dict_id, serializers.zstd.get_frame_info(data[1:]).dictionary_id)
+
+        other_process = CompressionDictionaries()
+        with self.settings(TOM_ALERT_DASH_CACHE_DICTIONARY_SAMPLES=20):
+            self.assertEqual(dictionary.dict_id, other_process.get('MARS').dict_id)
+        self.assertEqual(value, self.serializer.loads(data))
+
+    @override_settings(TOM_ALERT_DASH_CACHE_DICTIONARY_SAMPLES=20)
+    def test_evicted_dictionary(self):
+        """Test that a value whose dictionary is no longer cached is treated as a cache miss."""
+        for i in range(0, 21):
+            data = self.serializer.dumps([create_mars_alert() for j in range(0, 3)], 'MARS')
+        compression_dictionaries.clear()
+        cache.clear()
+        self.assertIsNone(self.serializer.loads(data))
+
+
+class TestGetSerializer(TestCase):
+    def test_default_serializer(self):
+        self.assertIsInstance(get_serializer(), CompressedSerializer)
+
+    @override_settings(TOM_ALERT_DASH_CACHE_SERIALIZER='tom_alerts_dash.serializers.PassthroughSerializer')
+    def test_passthrough_serializer(self):
+        serializer = get_serializer()
+        self.assertIsInstance(serializer, PassthroughSerializer)
+        value = {'results': [create_mars_alert()]}
+        self.assertIs(value, serializer.loads(serializer.dumps(value, 'MARS')))
@@ -0,0 +1,121 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+import tempfile
+import threading
+import time
+from unittest.mock import patch
+
+from django.test import override_settings, TestCase
+
+from tom_alerts_dash.singleflight import SingleFlight
+from tom_alerts_dash.tests.factories import create_mars_alert
+from tom_alerts_dash.tests.tests import TestDashBroker
+
+
+class SlowRequest:
+    """Callable that counts its calls, and blocks until released so that concurrent callers can pile up."""
+    def __init__(self, result):
+        self.result = result
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self):
+        self.calls += 1
+        self.started.set()
+        self.release.wait(5)
+        return self.result
+
+
+@override_settings(TOM_ALERT_DASH_LOCK_DIR=tempfile.mkdtemp())
+class TestSingleFlight(TestCase):
+
+    def setUp(self):
+        self.single_flight = SingleFlight()
+        self.key = SingleFlight.make_key('MARS', '{"objectId": "ZTF21abcdefg"}')
+
+    def test_concurrent_calls_are_coalesced(self):
+        request = SlowRequest({'results': [create_mars_alert()]})
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            futures = [executor.submit(self.single_flight.do, self.key, request)]
+            request.started.wait(5)
+            futures += [executor.submit(self.single_flight.do, self.key, request) for i in range(0, 4)]
+            time.sleep(0.1)
+            request.release.set()
+            results = [future.result() for future in futures]
+
+        self.assertEqual(1, request.calls)
+        for result in results:
+            self.assertIs(request.result, result)
+
+    def test_exception_is_shared(self):
+        def failing_request():
+            time.sleep(0.1)
+            raise ConnectionError('Broker unavailable')
+
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            futures = [executor.submit(self.single_flight.do, self.key, failing_request) for i in range(0, 3)]
+            for future in futures:
+                with self.assertRaises(ConnectionError):
+                    future.result()
+
+    def test_sequential_calls_are_not_coalesced(self):
+        request = SlowRequest({'results': []})
+        request.release.set()
+        self.single_flight.do(self.key, request)
+        self.single_flight.do(self.key, request)
+        self.assertEqual(2, request.calls)
+
+    def test_calls_are_coalesced_across_processes(self):
+        """Test that a separate SingleFlight, standing in for another process, waits on the file lock for the result."""
+        other_single_flight = SingleFlight()
+        request = SlowRequest({'results': [create_mars_alert()]})
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            leader = executor.submit(self.single_flight.do, self.key, request)
+            request.started.wait(5)
+            follower = executor.submit(other_single_flight.do, self.key, request)
+            time.sleep(0.1)
+            request.release.set()
+
+            self.assertEqual(leader.result(), follower.result())
+        self.assertEqual(1, request.calls)
+
+    def test_other_keys_do_not_wait(self):
+        """Test that a call in another process is not held up by a slow call with a different key."""
+        other_single_flight = SingleFlight()
+        request = SlowRequest({'results': [create_mars_alert()]})
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            leader = executor.submit(self.single_flight.do, self.key, request)
+            request.started.wait(5)
+            for i in range(0, 300):
+                other_single_flight.do(SingleFlight.make_key('MARS', str(i)), lambda: {'results': []})
+            self.assertFalse(leader.done())
+            request.release.set()
+            leader.result()
+        self.assertEqual([], os.listdir(self.single_flight.lock_dir))
+
+    @override_settings(TOM_ALERT_DASH_SINGLE_FLIGHT_TIMEOUT=0)
+    def test_calls_are_coalesced_within_process_without_timeout(self):
+        request = SlowRequest({'results': []})
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            futures = [executor.submit(self.single_flight.do, self.key, request)]
+            request.started.wait(5)
+            futures.append(executor.submit(self.single_flight.do, self.key, request))
+            time.sleep(0.1)
+            request.release.set()
+            [future.result() for future in futures]
+        self.assertEqual(1, request.calls)
+
+    @patch('tom_alerts_dash.tests.tests.TestDashBroker._request_alerts', create=True)
+    def test_request_dash_alerts_normalizes_parameters(self, mock_request_alerts):
+        request = SlowRequest({'results': []})
+        mock_request_alerts.side_effect = lambda parameters: request()
+        broker = TestDashBroker()
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            futures = [executor.submit(broker.request_dash_alerts, {'page': 1, 'objectId': 'ZTF21abcdefg'})]
+            request.started.wait(5)
+            futures.append(executor.submit(broker.request_dash_alerts, {'objectId': 'ZTF21abcdefg', 'page': 1}))
+            time.sleep(0.1)
+            request.release.set()
+            [future.result() for future in futures]
+        self.assertEqual(1, request.calls)
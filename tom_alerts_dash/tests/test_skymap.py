@@ -0,0 +1,109 @@
+import json
+from unittest.mock import patch
+
+from dash.exceptions import PreventUpdate
+from django.test import override_settings, TestCase
+import numpy as np
+from plotly.utils import PlotlyJSONEncoder
+
+from tom_alerts_dash.blocks import block_store, ColumnarBuffer
+from tom_alerts_dash.dash_apps.query_list_app import create_broker_container, sky_map
+from tom_alerts_dash.skymap import bin_sky, create_sky_map, FULL_SKY, get_view, MAX_POINTS, SKY_MAP_BINS
+from tom_alerts_dash.tests.tests import TestDashBroker
+
+COLUMNS = [{'id': 'test_key', 'name': 'Test Key', 'type': 'text'}]
+
+
+def get_sky_coordinates(alert):
+    return alert['ra'], alert['dec']
+
+
+def create_alerts(size):
+    return [
+        {'test_key': f'alert {i}', 'alert': {'ra': i * 360 / size, 'dec': i * 180 / size - 90} if i % 10 else {}}
+        for i in range(0, size)
+    ]
+
+
+class TestSkyMap(TestCase):
+
+    def setUp(self):
+        self.buffer = ColumnarBuffer(COLUMNS, create_alerts(10000), sky_coordinates=get_sky_coordinates)
+
+    def test_sky_coordinates(self):
+        ra, dec = self.buffer.sky_coordinates()
+        self.assertEqual((1001 * 360 / 10000, 1001 * 180 / 10000 - 90), (ra[1001], dec[1001]))
+        self.assertTrue(np.isnan(ra[0]))  # Alerts without a position are NaN
+        self.assertIsNone(ColumnarBuffer(COLUMNS, create_alerts(10)).sky_coordinates())
+
+    def test_get_view(self):
+        self.assertEqual(FULL_SKY, get_view(None))
+        self.assertEqual(FULL_SKY, get_view({'autosize': True}))
+        self.assertEqual(((10, 20), (-90, 90)), get_view({'xaxis.range[0]': 20, 'xaxis.range[1]': 10}))
+        self.assertEqual(((0, 360), (-90, 5)), get_view({'yaxis.range[0]': -100, 'yaxis.range[1]': 5}))
+
+    def test_bin_sky(self):
+        ra, dec = self.buffer.sky_coordinates()
+        with self.subTest('The alerts are binned when too many are in view'):
+            count, (counts, ra_edges, dec_edges) = bin_sky(ra, dec, FULL_SKY)
+            self.assertEqual(9000, count)
+            self.assertEqual(SKY_MAP_BINS, counts.shape)
+            self.assertEqual(9000, counts.sum())
+        with self.subTest('The alerts are plotted individually once few enough are in view'):
+            count, positions = bin_sky(ra, dec, ((0, 36), (-90, 90)))
+            self.assertLessEqual(count, MAX_POINTS)
+            self.assertEqual(count, len(positions))
+            self.assertTrue((ra[positions] <= 36).all())
+
+    def test_sky_map_payload_is_constant(self):
+        """Test that the size of the binned sky map does not depend on the number of alerts in view."""
+        sizes = []
+        for size in [5000, 100000]:
+            buffer = ColumnarBuffer(COLUMNS, create_alerts(size), sky_coordinates=get_sky_coordinates)
+            ra, dec = buffer.sky_coordinates()
+            figure = create_sky_map(FULL_SKY, *bin_sky(ra, dec, FULL_SKY))
+            sizes.append(len(json.dumps(figure, cls=PlotlyJSONEncoder)))
+        self.assertLess(sizes[1], sizes[0] * 1.5)
+
+    def test_create_sky_map(self):
+        figure = create_sky_map(FULL_SKY, 2, np.array([0, 1]), ra=np.array([10., 20.]), dec=np.array([0., 5.]),
+                                names=['a', 'b'])
+        self.assertEqual('scattergl', figure['data'][0]['type'])
+        self.assertEqual(['a', 'b'], figure['data'][0]['text'])
+        self.assertEqual([360, 0], figure['layout']['xaxis']['range'])
+
+    @override_settings(TOM_ALERT_DASH_CLASSES=['tom_alerts_dash.tests.tests.TestDashBroker'],
+                       TOM_ALERT_DASH_BLOCK_SIZE=50)
+    @patch.object(TestDashBroker, 'get_dash_sky_coordinates', side_effect=get_sky_coordinates, create=True)
+    def test_sky_map(self, mock_sky_coordinates):
+        callback = sky_map(TestDashBroker(), 'Test Broker')
+        with self.subTest('The sky map is not updated without a block'):
+            with self.assertRaises(PreventUpdate):
+                callback([], None, 0, 20, 'test', '')
+
+        block_store.put(block_store.make_key('Test Broker', {'test_input': 'test'}), self.buffer)
+        try:
+            with self.subTest('The alerts in the block are binned'):
+                figure = callback([], None, 0, 20, 'test', '')
+                self.assertEqual('heatmap', figure['data'][0]['type'])
+                self.assertEqual('9000 alerts in view, binned', figure['layout']['title'])
+            with self.subTest('Only the alerts in the block that match the filter query are plotted'):
+                figure = callback([], None, 0, 20, 'test', '{test_key} contains "alert 1"')
+                self.assertEqual('1000 alerts in view', figure['layout']['title'])
+            with self.subTest('The alerts are plotted individually when the map is zoomed in'):
+                figure = callback([], {'xaxis.range[0]': 36, 'xaxis.range[1]': 37}, 0, 20, 'test', '')
+                self.assertEqual('scattergl', figure['data'][0]['type'])
+                self.assertIn('alert 1001', figure['data'][0]['text'])
+        finally:
+            block_store.clear()
+
+    @override_settings(TOM_ALERT_DASH_CLASSES=['tom_alerts_dash.tests.tests.TestDashBroker'],
+                       TOM_ALERT_DASH_BLOCK_SIZE=50)
+    def test_create_broker_container(self):
+        """Test that the sky map is only displayed for brokers that provide the positions of their alerts."""
+        def component_ids(container):
+            return [getattr(component, 'id', None) for component in container.children]
+
+        self.assertNotIn('sky-map-Test Broker', component_ids(create_broker_container('Test Broker')))
+        with patch.object(TestDashBroker, 'supports_sky_map', True):
+            self.assertIn('sky-map-Test Broker', component_ids(create_broker_container('Test Broker')))
@@ -0,0 +1,123 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from unittest.mock import patch
+
+from django.test import override_settings, TestCase
+from django.urls import reverse
+
+from tom_alerts_dash.dash_apps.query_list_app import create_broker_container, stamp_gallery
+from tom_alerts_dash.stamps import get_page_stamps, stamp_store, supports_stamps
+from tom_alerts_dash.tests.tests import TestDashBroker
+
+
+def create_stamps(alert):
+    return {name: f'{name} stamp of {alert["id"]}'.encode('utf-8') for name in ['Science', 'Difference']}
+
+
+class TestStamps(TestCase):
+
+    def setUp(self):
+        self.broker = TestDashBroker()
+        self.alerts = [{'id': f'alert {i}'} for i in range(0, 5)]
+        self.directory = tempfile.mkdtemp()
+        self.settings = override_settings(TOM_ALERT_DASH_STAMP_DIR=self.directory)
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+        shutil.rmtree(self.directory)
+
+    def test_supports_stamps(self):
+        self.assertFalse(supports_stamps(self.broker))
+        with patch.object(TestDashBroker, 'supports_stamps', True):
+            self.assertTrue(supports_stamps(self.broker))
+
+    def test_put(self):
+        """Test that stamps are stored under the digest of their content, and that identical stamps are stored once."""
+        digests = stamp_store.put('a', {'Science': b'stamp', 'Difference': b'stamp'})
+        digest = hashlib.sha256(b'stamp').hexdigest()
+        self.assertEqual({'Science': digest, 'Difference': digest}, digests)
+        self.assertEqual(digests, stamp_store.get('a'))
+        stored = [file_name for _, _, file_names in os.walk(os.path.join(self.directory, 'objects'))
+                  for file_name in file_names]
+        self.assertEqual([digest], stored)
+
+    def test_get_removed_stamp(self):
+        digests = stamp_store.put('a', {'Science': b'stamp'})
+        os.remove(stamp_store.path(digests['Science']))
+        self.assertIsNone(stamp_store.get('a'))
+
+    def test_evict(self):
+        """Test that the least recently used stamps are removed once the store exceeds its budget."""
+        with override_settings(TOM_ALERT_DASH_STAMP_BUDGET=10):
+            for i, key in enumerate(['a', 'b', 'c']):
+                digests = stamp_store.put(key, {'Science': f'stamp {key}'.encode('utf-8')})  # 7 bytes per stamp
+                os.utime(stamp_store.path(digests['Science']), (i, i))
+            stamp_store.evict()
+        self.assertIsNone(stamp_store.get('a'))
+        self.assertIsNone(stamp_store.get('b'))
+        self.assertIsNotNone(stamp_store.get('c'))
+
+    @patch.object(TestDashBroker, 'fetch_dash_stamps', side_effect=create_stamps)
+    def test_get_page_stamps(self, mock_fetch):
+        with self.subTest('The stamps of the page are fetched'):
+            urls = get_page_stamps(self.broker, self.alerts)
+            self.assertEqual(5, mock_fetch.call_count)
+            self.assertEqual(['Science', 'Difference'], list(urls[0].keys()))
+        with self.subTest('The stamps are served from the store when the page is displayed again'):
+            self.assertEqual(urls, get_page_stamps(self.broker, self.alerts))
+            self.assertEqual(5, mock_fetch.call_count)
+
+    @patch.object(TestDashBroker, 'fetch_dash_stamps', side_effect=Exception('test error'))
+    def test_get_page_stamps_failure(self, mock_fetch):
+        self.assertEqual([None], get_page_stamps(self.broker, self.alerts[:1]))
+
+    @override_settings(TOM_ALERT_DASH_STAMP_TIMEOUT=0.1)
+    def test_get_page_stamps_timeout(self):
+        """Test that stamps that are not fetched in time are left out of the page, and stored once they are fetched."""
+        released = threading.Event()
+
+        def fetch_slowly(alert):
+            released.wait(5)
+            return create_stamps(alert)
+
+        with patch.object(TestDashBroker, 'fetch_dash_stamps', side_effect=fetch_slowly):
+            self.assertEqual([None], get_page_stamps(self.broker, self.alerts[:1]))
+            released.set()
+            for i in range(0, 50):
+                urls = get_page_stamps(self.broker, self.alerts[:1])
+                if urls[0] is not None:
+                    break
+        self.assertEqual(['Science', 'Difference'], list(urls[0].keys()))
+
+    @patch.object(TestDashBroker, 'fetch_dash_stamps', side_effect=create_stamps)
+    def test_stamp_view(self, mock_fetch):
+        url = get_page_stamps(self.broker, self.alerts[:1])[0]['Science']
+        response = self.client.get(url)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(b'Science stamp of alert 0', b''.join(response.streaming_content))
+        self.assertEqual('image/png', response['Content-Type'])
+        self.assertIn('immutable', response['Cache-Control'])
+
+    def test_stamp_view_not_found(self):
+        for digest in ['a' * 64, '..']:
+            response = self.client.get(reverse('tom_alerts_dash:stamp', kwargs={'digest': digest}))
+            self.assertEqual(404, response.status_code)
+
+    @patch.object(TestDashBroker, 'fetch_dash_stamps', side_effect=create_stamps)
+    def test_stamp_gallery(self, mock_fetch):
+        callback = stamp_gallery(self.broker, 'Test Broker')
+        self.assertEqual([], callback([]))
+        stamps = callback([{'test_key': 'test value', 'alert': alert} for alert in self.alerts])
+        self.assertEqual(5, len(stamps))
+        self.assertEqual('alert 0', stamps[0].children[0].children)
+        self.assertEqual(['Science', 'Difference'], [image.title for image in stamps[0].children[1:]])
+
+    @override_settings(TOM_ALERT_DASH_CLASSES=['tom_alerts_dash.tests.tests.TestDashBroker'])
+    @patch.object(TestDashBroker, 'supports_stamps', True)
+    def test_create_broker_container(self):
+        container = create_broker_container('Test Broker')
+        self.assertIn('stamps-Test Broker', container)
@@ -0,0 +1,95 @@
+from datetime import datetime, timezone
+import json
+from unittest.mock import patch
+
+from django.test import override_settings, TestCase
+import numpy as np
+from plotly.utils import PlotlyJSONEncoder
+
+from tom_alerts_dash.blocks import block_store, ColumnarBuffer
+from tom_alerts_dash.dash_apps.query_list_app import summary_panel
+from tom_alerts_dash.summary import create_summary_panel, DENSITY_BINS, HISTOGRAM_BINS, summarize
+from tom_alerts_dash.tests.tests import TestDashBroker
+
+COLUMNS = [{'id': 'test_key', 'name': 'Test Key', 'type': 'text'}]
+
+SUMMARY_FIELDS = [
+    {'id': 'mag', 'name': 'Magnitude', 'type': 'numeric', 'value': lambda alert: alert['mag']},
+    {'id': 'date', 'name': 'Date', 'type': 'datetime', 'value': lambda alert: alert['date']},
+]
+
+SUMMARY_DENSITIES = [('date', 'mag')]
+
+
+def create_alerts(size):
+    start = datetime(2021, 1, 1, tzinfo=timezone.utc).timestamp()
+    return [
+        {'test_key': f'alert {i}', 'alert': {'mag': 14 + i % 80 / 10 if i % 10 else None, 'date': start + i * 3600}}
+        for i in range(0, size)
+    ]
+
+
+class TestSummary(TestCase):
+
+    def setUp(self):
+        self.buffer = ColumnarBuffer(COLUMNS, create_alerts(1000), summary_fields=SUMMARY_FIELDS)
+
+    def test_summarize(self):
+        summary = summarize(self.buffer, SUMMARY_FIELDS, SUMMARY_DENSITIES, self.buffer.match(''))
+        self.assertEqual(1000, summary['count'])
+        counts, edges = summary['histograms']['mag']
+        self.assertEqual(900, counts.sum())  # Alerts without a magnitude are left out
+        self.assertEqual((HISTOGRAM_BINS + 1, 14.1, 21.9), (len(edges), edges[0], edges[-1]))
+        counts, x_edges, y_edges = summary['densities'][('date', 'mag')]
+        self.assertEqual((DENSITY_BINS, DENSITY_BINS), counts.shape)
+        self.assertEqual(900, counts.sum())
+
+    def test_summarize_filtered(self):
+        summary = summarize(self.buffer, SUMMARY_FIELDS, SUMMARY_DENSITIES, self.buffer.match('{test_key} = "alert 5"'))
+        self.assertEqual(1, summary['count'])
+        self.assertEqual(1, summary['histograms']['date'][0].sum())
+
+    def test_summarize_without_values(self):
+        buffer = ColumnarBuffer(COLUMNS, [{'test_key': 'alert', 'alert': {}}], summary_fields=SUMMARY_FIELDS)
+        summary = summarize(buffer, SUMMARY_FIELDS, SUMMARY_DENSITIES, buffer.match(''))
+        self.assertEqual({}, summary['histograms'])
+        self.assertEqual({}, summary['densities'])
+        self.assertTrue(np.isnan(buffer.summary_values('mag')[0]))
+
+    def test_create_summary_panel(self):
+        panel = create_summary_panel(
+            SUMMARY_FIELDS, SUMMARY_DENSITIES,
+            summarize(self.buffer, SUMMARY_FIELDS, SUMMARY_DENSITIES, self.buffer.match(''))
+        )
+        self.assertEqual('Summary of 1000 alerts', panel[0].children)
+        figures = [column.children.figure for column in panel[1].children]
+        self.assertEqual(3, len(figures))
+        self.assertEqual('2021-01-01T12:29:15', figures[1]['data'][0]['x'][0])
+        self.assertEqual('heatmap', figures[2]['data'][0]['type'])
+
+    def test_summary_payload_is_constant(self):
+        """Test that the size of the summary panel does not depend on the number of alerts summarized."""
+        sizes = []
+        for size in [100, 100000]:
+            buffer = ColumnarBuffer(COLUMNS, create_alerts(size), summary_fields=SUMMARY_FIELDS)
+            panel = create_summary_panel(SUMMARY_FIELDS, SUMMARY_DENSITIES,
+                                         summarize(buffer, SUMMARY_FIELDS, SUMMARY_DENSITIES, buffer.match('')))
+            sizes.append(len(json.dumps(panel, cls=PlotlyJSONEncoder)))
+        self.assertLess(sizes[1], sizes[0] * 1.5)
+
+    @override_settings(TOM_ALERT_DASH_CLASSES=['tom_alerts_dash.tests.tests.TestDashBroker'],
+                       TOM_ALERT_DASH_BLOCK_SIZE=50)
+    @patch.object(TestDashBroker, 'get_dash_summary_densities', return_value=SUMMARY_DENSITIES)
+    @patch.object(TestDashBroker, 'get_dash_summary_fields', return_value=SUMMARY_FIELDS)
+    def test_summary_panel(self, mock_fields, mock_densities):
+        callback = summary_panel(TestDashBroker(), 'Test Broker')
+        with self.subTest('No summary is displayed without a block'):
+            self.assertEqual([], callback([], 0, 20, 'test', ''))
+
+        block_store.put(block_store.make_key('Test Broker', {'test_input': 'test'}), self.buffer)
+        try:
+            with self.subTest('The alerts in the block that match the filter query are summarized'):
+                panel = callback([], 0, 20, 'test', '{test_key} contains "alert 1"')
+                self.assertEqual('Summary of 111 alerts', panel[0].children)
+        finally:
+            block_store.clear()
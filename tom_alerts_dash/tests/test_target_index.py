@@ -0,0 +1,116 @@
+from unittest.mock import patch
+
+from django.test import override_settings, TestCase
+from django.urls import reverse
+import numpy as np
+
+from tom_targets.models import Target, TargetName
+
+from tom_alerts_dash.dash_apps.query_list_app import create_targets, with_target_matches
+from tom_alerts_dash.target_index import match_alerts, target_index, TargetIndex
+from tom_alerts_dash.tests.factories import SiderealTargetFactory
+from tom_alerts_dash.tests.tests import TestDashBroker
+
+
+def get_sky_coordinates(alert):
+    return alert.get('ra'), alert.get('dec')
+
+
+class TestTargetIndex(TestCase):
+
+    def setUp(self):
+        self.target = SiderealTargetFactory.create(name='ZTF21aaaaaaa', ra=150.0, dec=-20.0)
+        TargetName.objects.create(target=self.target, name='AT 2021abc')
+        self.broker = TestDashBroker()
+        target_index.clear()
+
+    def tearDown(self):
+        target_index.clear()
+
+    def match(self, names, positions):
+        positions = np.array(positions, dtype=float).reshape(-1, 2)
+        return target_index.match(names, positions[:, 0], positions[:, 1]).tolist()
+
+    def test_match_by_name(self):
+        """Test that objects are matched to targets by name or alias, regardless of case."""
+        self.assertEqual([self.target.id, self.target.id, -1, -1],
+                         self.match(['ztf21aaaaaaa', 'AT 2021abc', 'ZTF21bbbbbbb', None], [(np.nan, np.nan)] * 4))
+
+    def test_match_by_position(self):
+        """Test that objects are matched to targets within the match radius, including across RA 0."""
+        near_zero = SiderealTargetFactory.create(ra=359.9999, dec=10.0)
+        positions = [(150.0, -20.0 + 1 / 3600), (150.0, -20.0 + 3 / 3600), (0.0001, 10.0), (np.nan, np.nan)]
+        self.assertEqual([self.target.id, -1, near_zero.id, -1], self.match([None] * 4, positions))
+        with override_settings(TOM_ALERT_DASH_TARGET_MATCH_RADIUS=4):
+            self.assertEqual(self.target.id, self.match([None], positions[1:2])[0])
+
+    def test_match_at_high_declination(self):
+        """Test that the separation in RA is scaled by declination."""
+        target = SiderealTargetFactory.create(ra=0.0, dec=89.9)
+        positions = [(0.5 / 3600 / np.cos(np.radians(89.9)), 89.9), (5 / 3600 / np.cos(np.radians(89.9)), 89.9)]
+        self.assertEqual([target.id, -1], self.match([None, None], positions))
+
+    @override_settings(HOOKS={})
+    def test_signals(self):
+        """Test that targets and aliases saved or deleted after the index is loaded are matched accordingly."""
+        self.match([None], [(0.0, 0.0)])
+        self.assertTrue(target_index.loaded)
+
+        with self.subTest('Created targets are matched'):
+            target = SiderealTargetFactory.create(name='new target', ra=10.0, dec=10.0)
+            self.assertEqual([target.id, target.id], self.match(['New Target', None], [(np.nan, np.nan), (10, 10)]))
+
+        with self.subTest('Renamed and moved targets are matched by their new name and position'):
+            target.name, target.ra = 'renamed target', 20.0
+            target.save()
+            self.assertEqual([-1, target.id, -1, target.id],
+                             self.match(['new target', 'renamed target', None, None],
+                                        [(np.nan, np.nan), (np.nan, np.nan), (10, 10), (20, 10)]))
+
+        with self.subTest('Aliases are matched until they are deleted'):
+            alias = TargetName.objects.create(target=target, name='alias')
+            self.assertEqual([target.id], self.match(['alias'], [(np.nan, np.nan)]))
+            alias.delete()
+            self.assertEqual([-1], self.match(['alias'], [(np.nan, np.nan)]))
+
+        with self.subTest('Deleted targets are not matched'):
+            target.delete()
+            self.assertEqual([-1, -1], self.match(['renamed target', None], [(np.nan, np.nan), (20, 10)]))
+
+    @override_settings(TOM_ALERT_DASH_TARGET_INDEX_TTL=60)
+    def test_ttl(self):
+        """Test that the index is loaded again once it expires, to find targets saved by other processes."""
+        index = TargetIndex()
+        with patch('tom_alerts_dash.target_index.time.monotonic', return_value=0):
+            index.match([None], np.array([0.0]), np.array([0.0]))
+        Target.objects.filter(id=self.target.id).update(name='updated elsewhere')
+        with patch('tom_alerts_dash.target_index.time.monotonic', return_value=30):
+            self.assertEqual([-1], index.match(['updated elsewhere'], np.array([np.nan]), np.array([np.nan])).tolist())
+        with patch('tom_alerts_dash.target_index.time.monotonic', return_value=61):
+            self.assertEqual([self.target.id],
+                             index.match(['updated elsewhere'], np.array([np.nan]), np.array([np.nan])).tolist())
+
+    @patch.object(TestDashBroker, 'get_dash_sky_coordinates', side_effect=get_sky_coordinates)
+    def test_match_alerts(self, mock_coordinates):
+        alerts = [{'id': 'ZTF21aaaaaaa'}, {'id': 'other', 'ra': 150.0, 'dec': -20.0}, {'id': 'other'}, None]
+        self.assertEqual([self.target.id, self.target.id, -1, -1], match_alerts(self.broker, alerts).tolist())
+
+    def test_with_target_matches(self):
+        rows = [{'test_key': 'a', 'alert': {'id': 'ZTF21aaaaaaa'}}, {'test_key': 'b', 'alert': {'id': 'b'}}]
+        callback = with_target_matches(lambda *args: (rows, ['banner']), self.broker)
+        data, banner = callback()
+        self.assertEqual(f'[View]({reverse("targets:detail", kwargs={"pk": self.target.id})})', data[0]['in_tom'])
+        self.assertEqual('', data[1]['in_tom'])
+        self.assertEqual(['banner'], banner)
+
+    @override_settings(TOM_ALERT_DASH_CLASSES=['tom_alerts_dash.tests.tests.TestDashBroker'])
+    @patch('tom_alerts_dash.tests.tests.TestDashBroker.to_target')
+    def test_create_targets_skips_existing(self, mock_to_target):
+        """Test that alerts whose objects are already targets, or were selected more than once, are skipped."""
+        mock_to_target.side_effect = lambda alert: SiderealTargetFactory.create(name=alert['id'])
+        rows = [{'alert': {'id': 'AT 2021abc'}}, {'alert': {'id': 'new'}}, {'alert': {'id': 'new'}}]
+        messages = create_targets(1, [0, 1, 2], rows, 'Test Broker', [])
+        mock_to_target.assert_called_once_with({'id': 'new'})
+        self.assertIn('Successfully created ', messages[0].children)
+        self.assertEqual('Skipped 2 selected alerts whose objects are already targets in the TOM.',
+                         messages[1].children)
@@ -0,0 +1,88 @@
+from unittest.mock import patch
+
+from django import forms
+from django.test import TestCase
+
+from tom_alerts.brokers.alerce import ALeRCEQueryForm
+from tom_alerts.brokers.mars import MARSQueryForm
+from tom_alerts_dash.brokers.mars import MARSDashBroker
+from tom_alerts_dash.validators import FilterValidator
+from tom_scimma.scimma import SCIMMAQueryForm
+
+ALERCE_CLASSIFIERS = [
+    {'classifier_name': 'lc_classifier_transient', 'classifier_version': 'hierarchical_rf_1.1.0',
+     'classes': ['SNIa', 'SNII']},
+    {'classifier_name': 'stamp_classifier', 'classifier_version': 'stamp_classifier_1.0.4',
+     'classes': ['SN', 'AGN', 'bogus']},
+]
+
+
+def get_form_errors(form_class, data):
+    """Gets the errors of a query form, in the format reported by the brokers' validate_filters()."""
+    form = form_class(data)
+    form.is_valid()
+    return [f'{field}: {field_error["message"]}'
+            for field, field_errors in form.errors.items() for field_error in field_errors.get_json_data()]
+
+
+class TestFilterValidator(TestCase):
+
+    def assertSameErrors(self, form_class, validator, data):
+        with self.subTest(data=data):
+            self.assertEqual(get_form_errors(form_class, data), validator.validate(data))
+
+    def test_mars_errors_match_form(self):
+        validator = FilterValidator(MARSQueryForm)
+        base = {'query_name': 'dash query', 'broker': 'MARS'}
+        for data in [base, {**base, 'magpsf__lte': 'abc', 'rb__gte': 'inf'}, {**base, 'magpsf__lte': 18.5},
+                     {**base, 'objectId': 'ZTF21abcdefg', 'cone': '1,2,3', 'time__gt': '2021-01-01'},
+                     {'broker': 'MARS', 'rb__gte': 'nan'}, {}]:
+            self.assertSameErrors(MARSQueryForm, validator, data)
+
+    @patch('tom_alerts.brokers.alerce.ALeRCEQueryForm._get_classifiers', return_value=ALERCE_CLASSIFIERS)
+    def test_alerce_errors_match_form(self, mock_get_classifiers):
+        validator = FilterValidator(ALeRCEQueryForm, choices={
+            'lc_classifier': ALeRCEQueryForm._get_light_curve_classifier_choices,
+            'stamp_classifier': ALeRCEQueryForm._get_stamp_classifier_choices,
+        })
+        base = {'query_name': 'ALeRCE Dash Query', 'broker': 'ALeRCE', 'ra': None, 'dec': None, 'radius': None}
+        for data in [base, {**base, 'stamp_classifier': 'SN', 'p_stamp_classifier': 0.5},
+                     {**base, 'stamp_classifier': 'XYZ'}, {**base, 'lc_classifier': 'SNIa', 'stamp_classifier': 'SN'},
+                     {**base, 'ra': 10, 'dec': 20}, {**base, 'ra': 10, 'dec': 20, 'radius': 2},
+                     {**base, 'p_lc_classifier': 'abc'}]:
+            self.assertSameErrors(ALeRCEQueryForm, validator, data)
+
+    @patch('tom_scimma.scimma.SCIMMAQueryForm.get_topic_choices', return_value=[(1, 'lvc.lvc-counterpart')])
+    def test_scimma_errors_match_form(self, mock_get_topic_choices):
+        validator = FilterValidator(SCIMMAQueryForm, choices={'topic': SCIMMAQueryForm.get_topic_choices})
+        base = {'query_name': 'SCIMMA Dash Query', 'broker': 'SCIMMA'}
+        for data in [base, {**base, 'timestamp_after': 'yesterday'}, {**base, 'topic': ['2']},
+                     {**base, 'topic': ['1'], 'event_trigger_number': 'S190426c'}]:
+            self.assertSameErrors(SCIMMAQueryForm, validator, data)
+
+    @patch('tom_alerts.brokers.alerce.ALeRCEQueryForm._get_classifiers', return_value=ALERCE_CLASSIFIERS)
+    def test_choices_loaded_once(self, mock_get_classifiers):
+        """Test that choices are only loaded once a value of their field is validated, and then only once."""
+        validator = FilterValidator(ALeRCEQueryForm, choices={
+            'stamp_classifier': ALeRCEQueryForm._get_stamp_classifier_choices,
+        })
+        validator.validate({'query_name': 'ALeRCE Dash Query', 'broker': 'ALeRCE', 'ra': None, 'dec': None,
+                            'radius': None})
+        mock_get_classifiers.assert_not_called()
+        for i in range(0, 2):
+            validator.validate({'query_name': 'ALeRCE Dash Query', 'broker': 'ALeRCE', 'stamp_classifier': 'SN',
+                                'ra': None, 'dec': None, 'radius': None})
+        self.assertEqual(1, mock_get_classifiers.call_count)
+        self.assertEqual([], ALeRCEQueryForm.base_fields['stamp_classifier'].choices)  # The form's field is unchanged
+
+    def test_extra_fields(self):
+        validator = FilterValidator(MARSQueryForm, extra_fields={'rank__lte': forms.FloatField(required=False)})
+        self.assertEqual(['rank__lte: Enter a number.'],
+                         validator.validate({'query_name': 'dash query', 'broker': 'MARS', 'rank__lte': 'abc'}))
+
+    def test_validate_filters(self):
+        """Test that the MARS filters are validated without constructing the MARS query form."""
+        with patch('tom_alerts_dash.brokers.mars.MARSQueryForm.__init__') as mock_init:
+            errors = MARSDashBroker().validate_filters(0, 20, '', '', '', '', 'abc', None, None, None, 1, [])
+        mock_init.assert_not_called()
+        self.assertEqual(['magpsf__lte: Enter a number.'], [error.children for error in errors])
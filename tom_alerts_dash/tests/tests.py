@@ -1,5 +1,10 @@
+from datetime import datetime, timezone
 from http import HTTPStatus
-from unittest.mock import patch
+import json
+import os
+import subprocess
+import sys
+from unittest.mock import MagicMock, patch
 
 from dash.dependencies import Input
 from dash.exceptions import PreventUpdate
@@ -9,12 +14,21 @@ from django.test import override_settings, TestCase
 from django.urls import reverse
 
 from tom_alerts_dash.alerts import GenericDashBroker
-from tom_alerts_dash.dash_apps.query_list_app import broker_selection_callback, create_broker_container, create_targets
+from tom_alerts_dash.dash_apps.deferred import DeferredDjangoDash
+from tom_alerts_dash.dash_apps.query_list_app import (broker_selection_callback, CLIENT_ID_CLIENTSIDE_CALLBACK,
+                                                      create_broker_container, create_targets, freshness_banner,
+                                                      initialize_app, saved_query_selection_callback, with_freshness,
+                                                      with_generations, with_saved_results)
+from tom_alerts_dash.models import ScheduledBrokerQuery
+from tom_alerts_dash.resilience import BrokerUnavailable, Freshness, response_freshness
+from tom_alerts.models import BrokerQuery
 from tom_targets.models import Target
 
 
 class TestDashBroker(GenericDashBroker):
     name = 'Test Broker'
+    supports_dash_parameters = True
+    supports_paging = True
 
     def callback(self, page_current, page_size, test_input):
         return [
@@ -24,6 +38,19 @@ class TestDashBroker(GenericDashBroker):
     def fetch_alerts(self):
         return []
 
+    def fetch_dash_pages(self, parameters, max_pages=None):
+        yield [{'test_key': parameters.get('test_input')}]
+        yield [{'test_key': 'page 2'}]
+
+    def get_dash_parameters(self, page_current, page_size, test_input):
+        return {'test_input': test_input, 'page': page_current + 1}
+
+    def validate_filters(self, page_current, page_size, test_input, errors_state):
+        return errors_state
+
+    def get_incremental_parameters(self, parameters, since):
+        return {**parameters, 'test_input': f'since {since.year}'}
+
     def get_callback_inputs(self):
         inputs = super().get_callback_inputs()
         return inputs + [Input('test-input', 'value')]
@@ -53,6 +80,51 @@ class TestDashViews(TestCase):
         response = self.client.get(reverse('tom_alerts_dash:list'))
         self.assertContains(response, 'Browse Alerts')
 
+    def test_broker_query_list_view_pagination(self):
+        """Test that saved queries are paginated, sorted, and filtered by the database."""
+        BrokerQuery.objects.bulk_create([
+            BrokerQuery(name=f'Query {i:02d}', broker='ALeRCE' if i % 2 else 'Lasair', parameters={})
+            for i in range(0, 30)
+        ])
+
+        response = self.client.get(reverse('tom_alerts_dash:list'), {'sort': 'name'})
+        self.assertEqual(25, len(response.context['object_list']))
+        self.assertEqual('Query 00', response.context['object_list'][0].name)
+        self.assertTrue(response.context['is_paginated'])
+
+        response = self.client.get(reverse('tom_alerts_dash:list'), {'sort': 'name', 'page': 2})
+        self.assertEqual(['Query 25', 'Query 26', 'Query 27', 'Query 28', 'Query 29'],
+                         [query.name for query in response.context['object_list']])
+
+        response = self.client.get(reverse('tom_alerts_dash:list'), {'sort': '-name', 'broker': 'ALeRCE'})
+        self.assertEqual(15, response.context['paginator'].count)
+        self.assertEqual('Query 29', response.context['object_list'][0].name)
+
+    def test_broker_query_list_view_deferred_fields(self):
+        """Test that the query parameters are not fetched, and that an invalid sort falls back to the default."""
+        BrokerQuery.objects.create(name='Query', broker='MARS', parameters={'objectId': 'ZTF21abcdefg'})
+        response = self.client.get(reverse('tom_alerts_dash:list'), {'sort': 'parameters'})
+        self.assertEqual('-created', response.context['sort'])
+        self.assertEqual({'parameters', 'modified'}, response.context['object_list'][0].get_deferred_fields())
+
+    def test_broker_query_list_view_saved_results(self):
+        """Test that a link to the browse page is displayed for queries with stored results."""
+        query = BrokerQuery.objects.create(name='Scheduled Query', broker='MARS', parameters={})
+        BrokerQuery.objects.create(name='Unscheduled Query', broker='MARS', parameters={})
+        ScheduledBrokerQuery.objects.create(query=query, interval=60, last_run=datetime.now(tz=timezone.utc))
+        response = self.client.get(reverse('tom_alerts_dash:list'))
+        self.assertContains(response, f'{reverse("tom_alerts_dash:browse")}?query={query.id}', count=1)
+
+    def test_broker_query_list_view_schedules_fetched_with_queries(self):
+        """Test that the schedules of the listed queries are fetched along with them, rather than one query per row."""
+        for i in range(0, 10):
+            query = BrokerQuery.objects.create(name=f'Query {i}', broker='MARS', parameters={})
+            if i % 2:
+                ScheduledBrokerQuery.objects.create(query=query, interval=60, last_run=datetime.now(tz=timezone.utc))
+        with self.assertNumQueries(2):  # The count of the matching queries, and the page of queries
+            response = self.client.get(reverse('tom_alerts_dash:list'))
+        self.assertContains(response, 'Browse results', count=5)
+
     def test_broker_query_browse_view(self):
         """Test that the BrokerQueryBrowseView loads."""
         response = self.client.get(reverse('tom_alerts_dash:browse'))
@@ -67,7 +139,8 @@ class TestQueryListApp(TestCase):
 
     def test_create_broker_container(self):
         broker_container = create_broker_container('Test Broker')
-        for key in ['create-targets-btn-Test Broker', 'alerts-table-Test Broker']:
+        for key in ['create-targets-btn-Test Broker', 'export-links-Test Broker', 'freshness-Test Broker',
+                    'alerts-table-Test Broker']:
             self.assertIn(key, broker_container)
         self.assertEqual(broker_container.style, {'display': 'none'})
 
@@ -108,3 +181,131 @@ class TestQueryListApp(TestCase):
         with self.subTest():
             callback_return_values = broker_selection_callback('Other Broker', 'Test Broker')
             self.assertDictEqual({'display': 'none'}, callback_return_values[2])
+
+    def test_freshness_banner_saved_query(self):
+        banner = freshness_banner(Freshness(0, saved_query='Saved Query'))
+        self.assertIn('Showing the results of saved query Saved Query from 1970-01-01 00:00:00 UTC', banner[0].children)
+
+    def test_freshness_banner_narrowed(self):
+        banner = freshness_banner(Freshness(0, narrowed=True))
+        self.assertIn('narrowed from those of a broader query, fetched at 1970-01-01 00:00:00 UTC', banner[0].children)
+
+    def test_with_freshness(self):
+        def stale_callback(page_current, page_size, test_input):
+            response_freshness.set(Freshness(0, stale=True))
+            return [{'test_key': test_input}]
+
+        def unavailable_callback(page_current, page_size, test_input):
+            raise BrokerUnavailable('Test Broker is currently unavailable.')
+
+        with self.subTest():
+            alerts, banner = with_freshness(TestDashBroker().callback)(0, 20, 'test')
+            self.assertEqual([{'test_key': 'test'}], alerts)
+            self.assertEqual([], banner)
+
+        with self.subTest():
+            alerts, banner = with_freshness(stale_callback)(0, 20, 'test')
+            self.assertEqual([{'test_key': 'test'}], alerts)
+            self.assertIn('Showing results from 1970-01-01 00:00:00 UTC', banner[0].children)
+
+        with self.subTest():
+            alerts, banner = with_freshness(unavailable_callback)(0, 20, 'test')
+            self.assertEqual('Test Broker is currently unavailable.', banner[0].children)
+
+    def test_with_saved_results(self):
+        query = BrokerQuery.objects.create(name='Saved Query', broker='Test Broker', parameters={})
+        ScheduledBrokerQuery.objects.create(query=query, interval=60,
+                                            last_run=datetime(2021, 1, 1, tzinfo=timezone.utc),
+                                            alerts=[{'test_key': f'saved {i}'} for i in range(0, 30)])
+        callback = with_saved_results(TestDashBroker().callback, 'Test Broker')
+
+        with self.subTest('Stored results are paged without querying the broker'):
+            token = response_freshness.set(None)
+            alerts = callback(1, 20, None, f'?query={query.id}')
+            self.assertEqual([{'test_key': 'saved 20'}, {'test_key': 'saved 21'}], alerts[:2])
+            self.assertEqual(10, len(alerts))
+            self.assertEqual('Saved Query', response_freshness.get().saved_query)
+            response_freshness.reset(token)
+
+        with self.subTest('Setting a filter queries the broker'):
+            self.assertEqual([{'test_key': 'test'}], callback(0, 20, 'test', f'?query={query.id}'))
+
+        with self.subTest('The broker is queried without a saved query'):
+            self.assertEqual([{'test_key': None}], callback(0, 20, None, ''))
+
+        with self.subTest('The saved query of another broker is ignored'):
+            other_callback = with_saved_results(TestDashBroker().callback, 'Other Broker')
+            self.assertEqual([{'test_key': None}], other_callback(0, 20, None, f'?query={query.id}'))
+
+    def test_saved_query_selection_callback(self):
+        query = BrokerQuery.objects.create(name='Saved Query', broker='Test Broker', parameters={})
+        ScheduledBrokerQuery.objects.create(query=query, interval=60)
+        self.assertEqual('Test Broker', saved_query_selection_callback(f'?query={query.id}'))
+        for search in ['', '?query=abc', f'?query={query.id + 1}']:
+            with self.subTest(search=search), self.assertRaises(PreventUpdate):
+                saved_query_selection_callback(search)
+
+    def test_with_generations(self):
+        callback = with_generations(TestDashBroker().callback, 'Test Broker')
+        with self.subTest():
+            self.assertEqual([{'test_key': 'test'}], callback(0, 20, 'test', 'client'))
+        with self.subTest():
+            self.assertEqual([{'test_key': 'test'}], callback(0, 20, 'test', None))
+
+    @patch('tom_alerts_dash.dash_apps.query_list_app.app')
+    def test_initialize_app_clientside_callbacks(self, mock_app):
+        initialize_app()
+        broker_selection_function = mock_app.clientside_callback.call_args.args[0]
+        self.assertIn('["Test Broker"]', broker_selection_function)
+        registered_callbacks = [call.args[0] for call in mock_app.callback.return_value.mock_calls]
+        self.assertNotIn(broker_selection_callback, registered_callbacks)
+
+    @override_settings(TOM_ALERT_DASH_CLIENTSIDE_CALLBACKS=False)
+    @patch('tom_alerts_dash.dash_apps.query_list_app.app')
+    def test_initialize_app_server_callbacks(self, mock_app):
+        initialize_app()
+        clientside_functions = [call.args[0] for call in mock_app.clientside_callback.call_args_list]
+        self.assertEqual([CLIENT_ID_CLIENTSIDE_CALLBACK], clientside_functions)
+        registered_callbacks = [call.args[0] for call in mock_app.callback.return_value.mock_calls]
+        self.assertIn(broker_selection_callback, registered_callbacks)
+
+
+class TestFastStartup(TestCase):
+    # Modules of this app that importing tom_alerts_dash.urls may import in fast startup mode, after Django setup. The
+    # broker modules, and the modules of the app's features, must only be imported once the Dash app is initialized.
+    URLS_MODULES = {
+        'tom_alerts_dash.alerts', 'tom_alerts_dash.columns', 'tom_alerts_dash.dash', 'tom_alerts_dash.dash_apps',
+        'tom_alerts_dash.dash_apps.deferred', 'tom_alerts_dash.dash_apps.query_list_app', 'tom_alerts_dash.generations',
+        'tom_alerts_dash.push', 'tom_alerts_dash.resilience', 'tom_alerts_dash.serializers',
+        'tom_alerts_dash.singleflight', 'tom_alerts_dash.urls', 'tom_alerts_dash.views',
+    }
+
+    def test_deferred_initializers_run_once(self):
+        app = DeferredDjangoDash('TestDeferredDash')
+        initializer = MagicMock(__name__='initializer')
+        app.defer(initializer)
+        initializer.assert_not_called()
+
+        with patch('django_plotly_dash.DjangoDash.form_dash_instance'):
+            app.form_dash_instance()
+            app.form_dash_instance()
+        initializer.assert_called_once()
+
+    def test_cold_import_of_urls(self):
+        """Test that importing the urls in fast startup mode only imports the modules needed to route requests."""
+        script = (
+            'import json, sys\n'
+            'import django\n'
+            'django.setup()\n'
+            'from django.conf import settings\n'
+            'settings.TOM_ALERT_DASH_FAST_STARTUP = True\n'
+            'loaded = set(sys.modules)\n'
+            'import tom_alerts_dash.urls\n'
+            'modules = [m for m in set(sys.modules) - loaded if m.startswith((\'tom_alerts_dash.\', \'tom_scimma\'))]\n'
+            'print(json.dumps(modules))\n'
+        )
+        result = subprocess.run([sys.executable, '-W', 'ignore', '-c', script], capture_output=True, text=True,
+                                env=os.environ.copy(), check=True)
+        modules = set(json.loads(result.stdout.strip().splitlines()[-1]))
+
+        self.assertEqual(self.URLS_MODULES, modules)
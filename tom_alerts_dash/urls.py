@@ -3,11 +3,13 @@ from django.urls import path
 # This import is necessary for Dash to run, likely because it imports and runs the staticfiles finders
 # as defined in settings.STATICFILES_FINDERS
 from tom_alerts_dash import dash  # noqa
-from tom_alerts_dash.views import BrokerQueryBrowseView, BrokerQueryListView
+from tom_alerts_dash.views import BrokerQueryBrowseView, BrokerQueryExportView, BrokerQueryListView, StampView
 
 app_name = 'tom_alerts_dash'
 
 urlpatterns = [
     path('query/list/', BrokerQueryListView.as_view(), name='list'),
     path('query/browse/', BrokerQueryBrowseView.as_view(), name='browse'),
+    path('query/export/<str:broker>/', BrokerQueryExportView.as_view(), name='export'),
+    path('stamps/<str:digest>.png', StampView.as_view(), name='stamp'),
 ]
@@ -0,0 +1,96 @@
+from copy import deepcopy
+import threading
+
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
+
+
+class FilterValidator:
+    """
+    Validates the values of a Dash broker's filters with the fields of its query form, with the same error messages as
+    the form, but without constructing the form on each input event. Constructing a query form copies all of its
+    fields, builds its crispy layout, and, for the ALeRCE and SCIMMA forms, requests the choices of some of its fields
+    from the broker. Instead, the form's fields are compiled once, and the values are cleaned by them directly, followed
+    by the form's ``clean_<field>()`` and ``clean()`` methods, as the form would.
+
+    The form itself is still used to build the parameters of a query when it is dispatched to the broker.
+
+    :param form_class: The broker's query form
+    :type form_class: type
+
+    :param choices: Functions that return the choices of the form's fields whose choices are populated when the form
+                    is constructed, keyed by the name of the field. They are called once, the first time that a value
+                    of the field is validated.
+    :type choices: dict
+
+    :param extra_fields: Form fields that validate filters that are not fields of the form, keyed by the name of the
+                         parameter, which are validated after the fields of the form
+    :type extra_fields: dict
+    """
+    def __init__(self, form_class, choices=None, extra_fields=None):
+        self.form_class = form_class
+        self.choices = choices or {}
+        self.extra_fields = extra_fields or {}
+        self._compiled = None
+        self._lock = threading.Lock()
+
+    def compile(self):
+        """
+        Compiles the fields of the form into a list of the fields that must be cleaned for each set of values, and the
+        cleaned values of the other fields, which are the same for every set of values that leaves them empty.
+
+        :returns: the fields, as tuples of their name, the field, and their ``clean_<field>()`` method if any, and the
+                  cleaned values of empty fields
+        :rtype: tuple
+        """
+        if self._compiled is not None:
+            return self._compiled
+        fields, empty = [], {}
+        for name, field in {**self.form_class.base_fields, **self.extra_fields}.items():
+            if name in self.choices:
+                field = deepcopy(field)  # The choices are loaded into a copy, rather than the form's field
+            clean_method = getattr(self.form_class, f'clean_{name}', None)
+            if not field.required:
+                empty[name] = field.clean(None)
+            fields.append((name, field, clean_method))
+        self._compiled = fields, empty
+        return self._compiled
+
+    def _load_choices(self, name, field):
+        with self._lock:
+            if name in self.choices:
+                field.choices = self.choices[name]()
+                self.choices = {key: value for key, value in self.choices.items() if key != name}
+
+    def validate(self, data):
+        """
+        Validates the values of a broker's filters, as they would be passed to its query form.
+
+        :param data: The values of the form's fields
+        :type data: dict
+
+        :returns: the errors, as ``<field>: <message>``, in the order that the form reports them
+        :rtype: list of str
+        """
+        fields, empty = self.compile()
+        # The form's clean methods are called on an instance that is not constructed, which holds the cleaned values
+        form = self.form_class.__new__(self.form_class)
+        form.cleaned_data = dict(empty)
+        errors = {}
+        for name, field, clean_method in fields:
+            value = data.get(name)
+            if value is None and name in empty and clean_method is None:
+                continue  # Already cleaned
+            try:
+                if name in self.choices and value not in field.empty_values:
+                    self._load_choices(name, field)
+                form.cleaned_data[name] = field.clean(value)
+                if clean_method is not None:
+                    form.cleaned_data[name] = clean_method(form)
+            except ValidationError as e:
+                errors.setdefault(name, []).extend(e.messages)
+                form.cleaned_data.pop(name, None)
+        try:
+            form.clean()
+        except ValidationError as e:
+            errors.setdefault(NON_FIELD_ERRORS, []).extend(e.messages)
+        return [f'{name}: {message}' for name, messages in errors.items() for message in messages]
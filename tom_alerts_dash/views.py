@@ -1,11 +1,130 @@
-from django.views.generic import TemplateView
+import json
 
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponseBadRequest, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.text import slugify
+from django.views.generic import TemplateView, View
+
+from tom_alerts.models import BrokerQuery
 from tom_alerts.views import BrokerQueryListView
+from tom_alerts_dash.alerts import get_service_class
+from tom_alerts_dash.push import push_enabled
 
 
 class BrokerQueryBrowseView(TemplateView):
     template_name = 'tom_alerts_dash/brokerquery_browse.html'
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['push_enabled'] = push_enabled()
+        return context
+
 
 class BrokerQueryListView(BrokerQueryListView):
+    """
+    View that displays the saved ``BrokerQuery`` objects one page at a time. Filtering, sorting, and pagination are done
+    by the database, using the indexes described in the README, and only the displayed columns are fetched, so that the
+    cost of rendering a page does not grow with the number of saved queries.
+    """
     template_name = 'tom_alerts_dash/brokerquery_list.html'
+    paginate_by = 25
+    sort_fields = ['name', 'broker', 'created', 'last_run']
+    default_sort = '-created'
+    list_fields = ['id', 'name', 'broker', 'created', 'last_run']
+
+    def get_paginate_by(self, queryset):
+        return getattr(settings, 'TOM_ALERT_DASH_QUERIES_PER_PAGE', self.paginate_by)
+
+    def get_sort(self):
+        """
+        Gets the sort requested in the ``sort`` query parameter, which is a field name optionally prefixed with ``-``
+        for descending order, falling back to ``default_sort`` if no valid sort is requested.
+
+        :rtype: str
+        """
+        sort = self.request.GET.get('sort', self.default_sort)
+        return sort if sort.lstrip('-') in self.sort_fields else self.default_sort
+
+    def get_ordering(self):
+        # The primary key breaks ties, so that pages are stable when many queries share a value of the sort field
+        sort = self.get_sort()
+        return [sort, '-pk' if sort.startswith('-') else 'pk']
+
+    def get_queryset(self):
+        # The schedule is fetched for the link to a query's stored results, but not the stored results themselves
+        return super().get_queryset().select_related('dash_schedule').only(
+            *self.list_fields, 'dash_schedule__query', 'dash_schedule__last_run'
+        )
+
+    def get_context_data(self, *args, **kwargs):
+        context = super().get_context_data(*args, **kwargs)
+        query_params = self.request.GET.copy()
+        query_params.pop('page', None)
+        context['sort'] = self.get_sort()
+        context['query_params'] = query_params.urlencode()
+        query_params.pop('sort', None)
+        context['filter_params'] = query_params.urlencode()
+        return context
+
+
+class BrokerQueryExportView(View):
+    """
+    View that streams all of the alerts from a Dash broker that match a set of query parameters, in one of the formats
+    returned by ``get_export_formats()``, as selected by the ``format`` query parameter. The query parameters are either
+    those of the saved query given by the ``query`` query parameter, or are given as JSON by the ``parameters`` query
+    parameter. The broker is queried one page at a time as the response is streamed, so that the export does not hold
+    all of the alerts in memory.
+    """
+    def get(self, request, *args, **kwargs):
+        # Imported here rather than by the urls, so that fast startup does not import the app's features
+        from tom_alerts_dash.export import export_alerts, get_export_formats, supports_export
+
+        try:
+            broker = get_service_class(kwargs['broker'])()
+        except ImportError:
+            raise Http404
+        if not supports_export(broker):
+            return HttpResponseBadRequest(f'{broker.name} does not support exporting alerts.')
+
+        export_formats = get_export_formats()
+        export_format = request.GET.get('format', 'csv')
+        if export_format not in export_formats:
+            return HttpResponseBadRequest(f'Export format must be one of {", ".join(export_formats.keys())}.')
+
+        if request.GET.get('query'):
+            if not request.GET['query'].isdigit():
+                return HttpResponseBadRequest('Query must be the id of a saved query.')
+            parameters = get_object_or_404(BrokerQuery, pk=request.GET['query'], broker=broker.name).parameters
+        else:
+            try:
+                parameters = json.loads(request.GET.get('parameters', '{}'))
+            except ValueError:
+                parameters = None
+            if not isinstance(parameters, dict):
+                return HttpResponseBadRequest('Parameters must be a JSON object.')
+
+        label, content_type, extension, writer = export_formats[export_format]
+        response = StreamingHttpResponse(export_alerts(broker, parameters, export_format), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{slugify(broker.name)}-alerts.{extension}"'
+        return response
+
+
+class StampView(View):
+    """
+    View that serves an image stamp from the stamp store. Stamps are addressed by the digest of their content, so they
+    never change, and are served with headers that let browsers cache them indefinitely.
+    """
+    def get(self, request, *args, **kwargs):
+        from tom_alerts_dash.stamps import DIGEST, stamp_store
+
+        if not DIGEST.match(kwargs['digest']):
+            raise Http404
+        try:
+            stamp = open(stamp_store.path(kwargs['digest']), 'rb')
+        except OSError:
+            raise Http404
+        response = FileResponse(stamp, content_type='image/png')
+        response['Cache-Control'] = 'public, max-age=31536000, immutable'
+        response['ETag'] = f'"{kwargs["digest"]}"'
+        return response
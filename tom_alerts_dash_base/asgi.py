@@ -1,7 +1,9 @@
 """
 ASGI config for tom_alerts_dash project.
 
-It exposes the ASGI callable as a module-level variable named ``application``.
+It exposes the ASGI callable as a module-level variable named ``application``. If channels is installed, WebSocket
+connections to django-plotly-dash's pipe endpoint are routed to its message consumer, so that updates can be pushed
+to the browse page when ``TOM_ALERT_DASH_PUSH`` is enabled.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/3.1/howto/deployment/asgi/
@@ -14,3 +16,16 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tom_alerts_dash_base.settings')
 
 application = get_asgi_application()
+
+try:
+    from channels.routing import ProtocolTypeRouter, URLRouter
+    from django.urls import re_path
+    from django_plotly_dash.consumers import MessageConsumer
+    from django_plotly_dash.util import pipe_ws_endpoint_name
+except ImportError:
+    pass
+else:
+    application = ProtocolTypeRouter({
+        'http': application,
+        'websocket': URLRouter([re_path(pipe_ws_endpoint_name(), MessageConsumer.as_asgi())]),
+    })
@@ -84,6 +84,15 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'tom_alerts_dash_base.wsgi.application'
+ASGI_APPLICATION = 'tom_alerts_dash_base.asgi.application'
+
+# Channel layer used to push updates to the browse page when TOM_ALERT_DASH_PUSH is enabled, which requires channels.
+# Use a shared layer, such as channels_redis, when the app is served by more than one process.
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': 'channels.layers.InMemoryChannelLayer'
+    }
+}
 
 
 # Database